@@ -0,0 +1,3 @@
+"""
+benchmarks package.
+"""
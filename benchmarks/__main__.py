@@ -0,0 +1,10 @@
+"""Run the offline benchmark, see `benchmarks.harness`."""
+
+import sys
+
+from benchmarks.harness import (
+    main,
+)
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,605 @@
+"""🎭 Benchmarks Fakes Module 🧪
+
+This module contains the local stand-ins of the external APIs, for benchmarks and load
+tests that must not reach, nor be slowed down by, the real services.
+
+- Nylas: an HTTPS server replaying a recording of Nylas API exchanges, by default the
+  mailbox of `fixtures/nylas.json`, see `benchmarks.recorder` to record another one.
+  The Nylas SDK only accepts `https://` servers, so a throwaway certificate authority
+  is created and written out for the clients to trust through `REQUESTS_CA_BUNDLE`.
+  `Faults` slow down or fail some of its replies, to reproduce an upstream incident.
+- OpenAI: answers every chat completion with a short tutorial.
+- Judge0: accepts batches of submissions and reports them accepted on the first poll,
+  echoing their expected output.
+
+MongoDB is not faked here: the benchmark harness runs the application in-process on an
+in-memory stand-in, and the compose load test runs a throwaway `mongod`.
+
+Usage:
+    python -m benchmarks.fakes [--nylas-port 8443] [--openai-port 8001] [--judge0-port 8002]
+        [--recording benchmarks/fixtures/nylas.json] [--ca-file fakes-ca.pem]
+        [--nylas-latency 0.2] [--nylas-jitter 0.1] [--nylas-recorded-latency]
+        [--nylas-error-rate 0.05] [--nylas-error-status 503] [--nylas-fault-path /threads]
+
+Classes:
+    - Recording: Recorded Nylas API exchanges.
+    - Faults: The slowness and failures injected in the Nylas replies.
+    - JSONHandler: A request handler replying with JSON.
+    - FakeServer: A threaded HTTP server running in the background.
+
+Functions:
+    - create_tls_context(ca_file: str, hostnames: Sequence[str]) -> ssl.SSLContext: Issue a throwaway
+        certificate.
+    - start_fakes(...) -> List[FakeServer]: Start the three fakes.
+    - add_fault_arguments(parser: argparse.ArgumentParser) -> None: Add the Nylas fault options.
+    - faults_from_arguments(args: argparse.Namespace) -> Optional[Faults]: Build the Nylas faults.
+    - main(argv: Optional[List[str]]) -> None: Run the fakes until interrupted.
+
+Dependencies:
+    - http.server: For the servers.
+    - trustme: For the throwaway certificate authority.
+
+"""
+
+import argparse
+from dataclasses import (
+    dataclass,
+)
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer,
+)
+import json
+import os
+import random
+import signal
+import ssl
+import sys
+import threading
+import time
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+)
+from urllib.parse import (
+    parse_qsl,
+    urlsplit,
+)
+import uuid
+
+FIXTURES_PATH = os.path.join(os.path.dirname(__file__), "fixtures")
+NYLAS_RECORDING_PATH = os.path.join(FIXTURES_PATH, "nylas.json")
+
+# The account of the recordings, and the access token the fake grants it.
+ACCOUNT_EMAIL = "ada@example.com"
+ACCESS_TOKEN = "bench-access-token"
+
+TUTORIAL = (
+    "<html><body><h1>Binary search</h1><p>Binary search halves the search "
+    "interval at every step, finding an item of a sorted array in "
+    "O(log n) comparisons.</p><pre><code>def search(items, target):\n"
+    "    low, high = 0, len(items) - 1\n</code></pre></body></html>"
+)
+
+
+class Recording:
+    """
+    Recorded Nylas API exchanges, matched by method and path, then by the
+    number of equal query parameters.
+
+    Args:
+        exchanges (List[Dict[str, Any]]): The exchanges, each one with a
+            `method`, `path`, `query`, `status`, `headers` and `body`.
+    """
+
+    def __init__(self, exchanges: List[Dict[str, Any]]) -> None:
+        self.exchanges: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        for exchange in exchanges:
+            key = (exchange["method"], exchange["path"])
+            self.exchanges.setdefault(key, []).append(exchange)
+
+    @classmethod
+    def load(cls, path: str) -> "Recording":
+        """
+        Load a recording file.
+
+        Args:
+            path (str): The JSON file.
+
+        Returns:
+            Recording: The recording.
+        """
+        with open(path, "r", encoding="utf-8") as file:
+            return cls(json.load(file)["exchanges"])
+
+    def match(
+        self, method: str, path: str, query: Dict[str, str]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Find the recorded exchange answering a request.
+
+        Args:
+            method (str): The request method.
+            path (str): The request path.
+            query (Dict[str, str]): The query parameters.
+
+        Returns:
+            Optional[Dict[str, Any]]: The exchange, or None.
+        """
+        candidates = self.exchanges.get((method, path.rstrip("/") or "/"))
+        if not candidates:
+            return None
+        return max(
+            candidates,
+            key=lambda exchange: sum(
+                query.get(name) == value
+                for name, value in exchange["query"].items()
+            ),
+        )
+
+
+@dataclass
+class Faults:
+    """
+    The slowness and failures injected in the Nylas replies.
+
+    Attributes:
+        latency (float): The number of seconds added to every reply.
+        jitter (float): Up to as many random seconds added on top.
+        recorded_latency (bool): Whether to also wait as long as the real
+            API took to answer, when the recording has it.
+        error_rate (float): The fraction of the requests failed.
+        error_status (int): The status of the failed requests, 0 closes the
+            connection without replying.
+        paths (Tuple[str, ...]): The path prefixes affected, all of them when
+            empty.
+    """
+
+    latency: float = 0.0
+    jitter: float = 0.0
+    recorded_latency: bool = False
+    error_rate: float = 0.0
+    error_status: int = 503
+    paths: Tuple[str, ...] = ()
+
+    def applies(self, path: str) -> bool:
+        """
+        Whether a request path is affected.
+
+        Args:
+            path (str): The request path.
+
+        Returns:
+            bool: True if the faults apply to it.
+        """
+        return not self.paths or path.startswith(self.paths)
+
+    def delay(self, exchange: Optional[Dict[str, Any]]) -> float:
+        """
+        Draw the number of seconds a reply waits.
+
+        Args:
+            exchange (Optional[Dict[str, Any]]): The replayed exchange.
+
+        Returns:
+            float: The delay.
+        """
+        delay = self.latency + random.uniform(0, self.jitter)
+        if self.recorded_latency and exchange is not None:
+            delay += exchange.get("elapsed", 0.0)
+        return delay
+
+    def fails(self) -> bool:
+        """
+        Draw whether a request fails.
+
+        Returns:
+            bool: True if it fails.
+        """
+        return random.random() < self.error_rate
+
+
+class JSONHandler(BaseHTTPRequestHandler):
+    """
+    A request handler replying with JSON, on kept alive connections.
+    """
+
+    protocol_version = "HTTP/1.1"
+    # The headers and the body are written separately: without this, the
+    # body waits for the client's delayed acknowledgement.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def read_json(self) -> Any:
+        try:
+            return json.loads(self.read_body() or b"null")
+        except ValueError:
+            return None
+
+    def reply(
+        self,
+        status: int,
+        body: Any,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> None:
+        headers = {"Content-Type": "application/json", **(headers or {})}
+        self.send_content(status, json.dumps(body).encode("utf-8"), headers)
+
+    def send_content(
+        self, status: int, content: bytes, headers: Dict[str, str]
+    ) -> None:
+        self.send_response(status)
+        for name, value in headers.items():
+            if name.lower() not in ("content-length", "transfer-encoding"):
+                self.send_header(name, value)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class NylasHandler(JSONHandler):
+    """
+    Replays the recording of its server, with its faults.
+
+    An authorization code holding an email address signs that address in
+    instead of the recorded account, so that a load test can sign in as many
+    users.
+    """
+
+    server: "FakeServer"
+
+    def handle_request(self) -> None:
+        # Read the body even when unused, so the connection can be reused.
+        body = self.read_body() if self.command != "GET" else b""
+        url = urlsplit(self.path)
+        exchange = self.server.recording.match(  # type: ignore
+            self.command, url.path, dict(parse_qsl(url.query))
+        )
+        faults = self.server.faults
+        if faults is not None and faults.applies(url.path):
+            time.sleep(faults.delay(exchange))
+            if faults.fails():
+                if not faults.error_status:
+                    self.close_connection = True
+                    return
+                self.reply(
+                    faults.error_status,
+                    {"message": "Injected failure", "type": "api_error"},
+                )
+                return
+        if exchange is None:
+            self.reply(
+                404,
+                {
+                    "message": f"No recorded {self.command} {url.path}",
+                    "type": "invalid_request_error",
+                },
+            )
+            return
+        reply = exchange["body"]
+        if url.path == "/oauth/token":
+            code = dict(parse_qsl(body.decode("utf-8"))).get("code", "")
+            if "@" in code:
+                reply = {**reply, "email_address": code}
+        self.reply(exchange["status"], reply, exchange["headers"])
+
+    do_GET = do_POST = do_PUT = do_DELETE = handle_request
+
+
+class OpenAIHandler(JSONHandler):
+    """
+    Answers every chat completion with the same tutorial.
+    """
+
+    def do_POST(self) -> None:
+        request = self.read_json() or {}
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.reply(404, {"error": {"message": "Not found"}})
+            return
+        self.reply(
+            200,
+            {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "gpt-3.5-turbo"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": TUTORIAL},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": 120,
+                    "completion_tokens": 380,
+                    "total_tokens": 500,
+                },
+            },
+        )
+
+
+class Judge0Handler(JSONHandler):
+    """
+    Accepts submissions and reports them accepted, echoing their expected
+    output.
+    """
+
+    server: "FakeServer"
+
+    def do_POST(self) -> None:
+        submissions = (self.read_json() or {}).get("submissions", [])
+        tokens = []
+        for submission in submissions:
+            token = uuid.uuid4().hex
+            self.server.submissions[token] = submission  # type: ignore
+            tokens.append({"token": token})
+        self.reply(201, tokens)
+
+    def do_GET(self) -> None:
+        query = dict(parse_qsl(urlsplit(self.path).query))
+        results = []
+        for token in query.get("tokens", "").split(","):
+            submission = self.server.submissions.pop(token, {})  # type: ignore
+            results.append(
+                {
+                    "token": token,
+                    "stdout": submission.get("expected_output", ""),
+                    "stderr": None,
+                    "compile_output": None,
+                    "message": None,
+                    "status": {"id": 3, "description": "Accepted"},
+                    "time": "0.012",
+                    "memory": 3200,
+                }
+            )
+        self.reply(200, {"submissions": results})
+
+
+class FakeServer(ThreadingHTTPServer):
+    """
+    A threaded HTTP server running in the background.
+
+    Args:
+        name (str): The faked service.
+        port (int): The port, 0 picks a free one.
+        handler (Type[BaseHTTPRequestHandler]): The request handler.
+        tls (Optional[ssl.SSLContext]): Serves HTTPS when given.
+        host (str): The address to bind to.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        name: str,
+        port: int,
+        handler: Type[BaseHTTPRequestHandler],
+        tls: Optional[ssl.SSLContext] = None,
+        host: str = "127.0.0.1",
+    ) -> None:
+        super().__init__((host, port), handler)
+        if tls is not None:
+            # The handshakes run in the request threads, not the accept loop.
+            self.socket = tls.wrap_socket(
+                self.socket, server_side=True, do_handshake_on_connect=False
+            )
+        self.name = name
+        self.scheme = "https" if tls is not None else "http"
+        self.recording: Optional[Recording] = None
+        self.faults: Optional[Faults] = None
+        self.submissions: Dict[str, Dict[str, Any]] = {}
+        self._thread = threading.Thread(
+            target=self.serve_forever, name=f"fake-{name}", daemon=True
+        )
+
+    @property
+    def url(self) -> str:
+        """
+        The base URL of the server.
+
+        Returns:
+            str: e.g. "https://localhost:8443".
+        """
+        return f"{self.scheme}://localhost:{self.server_address[1]}"
+
+    def start(self) -> "FakeServer":
+        """
+        Serve in a background thread.
+
+        Returns:
+            FakeServer: The server.
+        """
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Stop serving.
+        """
+        self.shutdown()
+        self.server_close()
+
+
+def create_tls_context(
+    ca_file: str, hostnames: Sequence[str] = ("localhost", "127.0.0.1")
+) -> ssl.SSLContext:
+    """
+    Issue a server certificate from a throwaway certificate authority, whose
+    certificate is written for the clients to trust.
+
+    Args:
+        ca_file (str): Where to write the authority's certificate.
+        hostnames (Sequence[str]): The names the certificate is valid for.
+
+    Returns:
+        ssl.SSLContext: The server TLS context.
+    """
+    import trustme  # pylint: disable=C0415
+
+    authority = trustme.CA()
+    authority.cert_pem.write_to_path(ca_file)
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    authority.issue_cert(*hostnames).configure_cert(context)
+    return context
+
+
+def start_fakes(
+    ca_file: str,
+    nylas_port: int = 0,
+    openai_port: int = 0,
+    judge0_port: int = 0,
+    recording: str = NYLAS_RECORDING_PATH,
+    host: str = "127.0.0.1",
+    hostnames: Sequence[str] = ("localhost", "127.0.0.1"),
+    faults: Optional[Faults] = None,
+) -> List[FakeServer]:
+    """
+    Start the Nylas, OpenAI and Judge0 fakes in background threads.
+
+    Args:
+        ca_file (str): Where to write the certificate the Nylas clients trust.
+        nylas_port (int): The Nylas fake port, 0 picks a free one.
+        openai_port (int): The OpenAI fake port.
+        judge0_port (int): The Judge0 fake port.
+        recording (str): The Nylas recording replayed.
+        host (str): The address to bind to.
+        hostnames (Sequence[str]): The names the Nylas certificate is valid for.
+        faults (Optional[Faults]): The faults of the Nylas replies.
+
+    Returns:
+        List[FakeServer]: The Nylas, OpenAI and Judge0 servers.
+    """
+    nylas = FakeServer(
+        "nylas",
+        nylas_port,
+        NylasHandler,
+        tls=create_tls_context(ca_file, hostnames),
+        host=host,
+    )
+    nylas.recording = Recording.load(recording)
+    nylas.faults = faults
+    openai = FakeServer("openai", openai_port, OpenAIHandler, host=host)
+    judge0 = FakeServer("judge0", judge0_port, Judge0Handler, host=host)
+    return [server.start() for server in (nylas, openai, judge0)]
+
+
+def add_fault_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Add the options of the Nylas faults to a command line.
+
+    Args:
+        parser (argparse.ArgumentParser): The command line parser.
+    """
+    group = parser.add_argument_group("Nylas faults")
+    group.add_argument(
+        "--nylas-latency",
+        type=float,
+        default=0.0,
+        help="Seconds added to every reply.",
+    )
+    group.add_argument(
+        "--nylas-jitter",
+        type=float,
+        default=0.0,
+        help="Up to as many random seconds added on top.",
+    )
+    group.add_argument(
+        "--nylas-recorded-latency",
+        action="store_true",
+        help="Also wait as long as the real API took to answer.",
+    )
+    group.add_argument(
+        "--nylas-error-rate",
+        type=float,
+        default=0.0,
+        help="The fraction of the requests failed.",
+    )
+    group.add_argument(
+        "--nylas-error-status",
+        type=int,
+        default=503,
+        help="The status of the failed requests, 0 drops the connection.",
+    )
+    group.add_argument(
+        "--nylas-fault-path",
+        action="append",
+        default=[],
+        help="A path prefix affected, all of them by default.",
+    )
+
+
+def faults_from_arguments(args: argparse.Namespace) -> Optional[Faults]:
+    """
+    Build the Nylas faults of a command line.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments.
+
+    Returns:
+        Optional[Faults]: The faults, or None if there is none.
+    """
+    faults = Faults(
+        latency=args.nylas_latency,
+        jitter=args.nylas_jitter,
+        recorded_latency=args.nylas_recorded_latency,
+        error_rate=args.nylas_error_rate,
+        error_status=args.nylas_error_status,
+        paths=tuple(args.nylas_fault_path),
+    )
+    return None if faults == Faults(paths=faults.paths) else faults
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Run the fakes until interrupted.
+
+    Args:
+        argv (Optional[List[str]]): The arguments, defaults to sys.argv.
+    """
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.fakes")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--hostname", action="append", default=[])
+    parser.add_argument("--nylas-port", type=int, default=8443)
+    parser.add_argument("--openai-port", type=int, default=8001)
+    parser.add_argument("--judge0-port", type=int, default=8002)
+    parser.add_argument("--recording", default=NYLAS_RECORDING_PATH)
+    parser.add_argument("--ca-file", default="fakes-ca.pem")
+    add_fault_arguments(parser)
+    args = parser.parse_args(argv)
+    servers = start_fakes(
+        args.ca_file,
+        nylas_port=args.nylas_port,
+        openai_port=args.openai_port,
+        judge0_port=args.judge0_port,
+        recording=args.recording,
+        host=args.host,
+        hostnames=["localhost", "127.0.0.1", *args.hostname],
+        faults=faults_from_arguments(args),
+    )
+    for server in servers:
+        print(f"{server.name:<6} {server.url}", flush=True)
+    print(f"Trust {os.path.abspath(args.ca_file)} for Nylas.", flush=True)
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    try:
+        stopped.wait()
+    except KeyboardInterrupt:
+        pass
+    for server in servers:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
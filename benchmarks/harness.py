@@ -0,0 +1,588 @@
+"""⏱️ Benchmarks Harness Module 🏁
+
+This module contains the offline benchmark of the hot routes.
+
+The harness starts the fakes of `benchmarks.fakes` in a child process, so that they do
+not compete with the application for the interpreter, and points the settings at them.
+It then boots `code_app` in-process on an in-memory MongoDB (mongomock), logs a user in,
+and drives each scenario through the ASGI interface at a controlled concurrency: the
+numbers cover the application, its middlewares and its calls to the fakes, not the HTTP
+server in front of it. Each scenario reports its p50 and p99 latency and its throughput,
+and can be checked against a baseline to catch regressions in CI. The Nylas fake options
+replay another recording, or slow down and fail the Nylas calls.
+
+Usage:
+    python -m benchmarks [--requests 200] [--concurrency 10] [--scenario nylas:read-emails]
+        [--output results.json] [--baseline baseline.json] [--tolerance 0.5]
+        [--recording benchmarks/fixtures/nylas.json] [--nylas-latency 0.2] [...]
+
+Classes:
+    - Scenario: A request driven by the benchmark.
+    - Result: The measures of a scenario.
+
+Functions:
+    - percentile(values: Sequence[float], fraction: float) -> float: A nearest-rank percentile.
+    - configure_environment(urls: Dict[str, str], ca_file: str, directory: str) -> None: Point the settings
+        at the fakes.
+    - offline_mongo() -> ContextManager: Run the application on an in-memory MongoDB.
+    - run_scenario(client, scenario, requests, concurrency) -> Result: Drive a scenario.
+    - compare(results, baseline, tolerance) -> List[str]: Find the regressions.
+    - main(argv: Optional[List[str]]) -> int: Run the benchmark.
+
+Dependencies:
+    - httpx: For driving the application through ASGI.
+    - mongomock_motor: For the in-memory MongoDB.
+
+"""
+
+import argparse
+import asyncio
+from contextlib import (
+    ExitStack,
+    contextmanager,
+)
+from dataclasses import (
+    asdict,
+    dataclass,
+    field,
+)
+import httpx
+import json
+import logging
+import math
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import time
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+)
+from unittest import (
+    mock,
+)
+from urllib.parse import (
+    urlencode,
+)
+
+from benchmarks import (
+    fakes,
+)
+
+AUTHORIZATION_CODE = "bench-authorization-code"
+
+
+@dataclass
+class Scenario:
+    """
+    A request driven by the benchmark.
+
+    Attributes:
+        name (str): The route name.
+        method (str): The HTTP method.
+        path (str): The path, with its query string.
+        body (Optional[Dict[str, Any]]): The JSON body.
+        authenticated (bool): Whether the logged in user's headers are sent.
+    """
+
+    name: str
+    method: str
+    path: str
+    body: Optional[Dict[str, Any]] = None
+    authenticated: bool = True
+
+
+@dataclass
+class Result:
+    """
+    The measures of a scenario.
+
+    Attributes:
+        name (str): The scenario name.
+        requests (int): The number of measured requests.
+        concurrency (int): The number of requests in flight.
+        errors (int): The number of responses that were not a 2xx.
+        p50 (float): The median latency, in milliseconds.
+        p99 (float): The 99th percentile latency, in milliseconds.
+        throughput (float): The number of requests per second.
+    """
+
+    name: str
+    requests: int
+    concurrency: int
+    errors: int
+    p50: float
+    p99: float
+    throughput: float
+    status_codes: Dict[str, int] = field(default_factory=dict)
+
+
+def percentile(values: Sequence[float], fraction: float) -> float:
+    """
+    Compute a nearest-rank percentile.
+
+    Args:
+        values (Sequence[float]): The values.
+        fraction (float): The percentile, between 0 and 1.
+
+    Returns:
+        float: The smallest value greater than or equal to `fraction` of
+            the values.
+    """
+    ordered = sorted(values)
+    rank = max(math.ceil(fraction * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def hot_scenarios(recording_path: str) -> List[Scenario]:
+    """
+    Build the scenarios of the hot routes, on a recorded mailbox: the mail
+    opened is the first one of the inbox, and the search is the recorded one.
+
+    Args:
+        recording_path (str): The Nylas recording.
+
+    Returns:
+        List[Scenario]: The scenarios.
+    """
+    recording = fakes.Recording.load(recording_path)
+    threads = recording.match(
+        "GET", "/threads", {"limit": "20", "view": "expanded"}
+    )
+    searches = recording.exchanges.get(("GET", "/messages/search"), [])
+    if threads is None or not threads["body"] or not searches:
+        raise ValueError(
+            f"{recording_path} does not record the inbox and a search."
+        )
+    message_id = threads["body"][0]["message_ids"][0]
+    search = urlencode({"search": searches[0]["query"].get("q", "")})
+    return [
+        Scenario(
+            "nylas:exchange-mailbox-token",
+            "POST",
+            "/api/v1/nylas/exchange-mailbox-token",
+            body={"token": AUTHORIZATION_CODE},
+            authenticated=False,
+        ),
+        Scenario("nylas:read-emails", "GET", "/api/v1/nylas/read-emails"),
+        Scenario(
+            "nylas:search-emails",
+            "GET",
+            f"/api/v1/nylas/search-emails?{search}",
+        ),
+        Scenario(
+            "nylas:mail", "GET", f"/api/v1/nylas/mail?mailId={message_id}"
+        ),
+    ]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return int(sock.getsockname()[1])
+
+
+def _serve_fakes(
+    ca_file: str,
+    ports: Dict[str, int],
+    recording_path: str,
+    faults: Optional[fakes.Faults],
+) -> None:
+    fakes.start_fakes(
+        ca_file,
+        nylas_port=ports["nylas"],
+        openai_port=ports["openai"],
+        judge0_port=ports["judge0"],
+        recording=recording_path,
+        faults=faults,
+    )
+    while True:
+        time.sleep(3600)
+
+
+def start_fakes_process(
+    ca_file: str,
+    recording_path: str = fakes.NYLAS_RECORDING_PATH,
+    faults: Optional[fakes.Faults] = None,
+) -> Dict[str, Any]:
+    """
+    Start the fakes in a child process and wait until they accept
+    connections.
+
+    Args:
+        ca_file (str): Where the fake Nylas certificate authority is written.
+        recording_path (str): The Nylas recording replayed.
+        faults (Optional[fakes.Faults]): The faults of the Nylas replies.
+
+    Returns:
+        Dict[str, Any]: The child `process` and the fake `urls`.
+    """
+    ports = {name: _free_port() for name in ("nylas", "openai", "judge0")}
+    process = multiprocessing.get_context("spawn").Process(
+        target=_serve_fakes,
+        args=(ca_file, ports, recording_path, faults),
+        daemon=True,
+    )
+    process.start()
+    deadline = time.monotonic() + 30
+    for port in ports.values():
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), 0.5).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline or not process.is_alive():
+                    raise RuntimeError("The fakes did not start.")
+                time.sleep(0.05)
+    return {
+        "process": process,
+        "urls": {
+            "nylas": f"https://localhost:{ports['nylas']}",
+            "openai": f"http://localhost:{ports['openai']}/v1",
+            "judge0": f"http://localhost:{ports['judge0']}",
+        },
+    }
+
+
+def configure_environment(
+    urls: Dict[str, str], ca_file: str, directory: str
+) -> None:
+    """
+    Point the settings at the fakes. Runs before `src` is imported, since
+    the settings read the environment once.
+
+    Args:
+        urls (Dict[str, str]): The `nylas`, `openai` and `judge0` fake URLs.
+        ca_file (str): The certificate authority of the fake Nylas.
+        directory (str): A scratch directory for the local storage.
+    """
+    os.environ.update(
+        {
+            "MONGODB_HOST": "localhost",
+            "MONGODB_USERNAME": "bench",
+            "MONGODB_PASSWORD": "bench",
+            "MONGODB_DATABASE": "bench",
+            "DEBUG": "",
+            "NYLAS_CLIENT_ID": "bench-client-id",
+            "NYLAS_CLIENT_SECRET": "bench-client-secret",
+            "NYLAS_SYSTEM_TOKEN": "bench-system-token",
+            "NYLAS_API_SERVER": urls["nylas"],
+            "REQUESTS_CA_BUNDLE": ca_file,
+            "OPENAI_API_KEY": "bench-openai-key",
+            "OPENAI_API_BASE": urls["openai"],
+            "RAPIDAPI_KEY": "bench-rapidapi-key",
+            "JUDGE0_API_URL": urls["judge0"],
+            "CODE_EXECUTOR": "judge0",
+            "STORAGE_BACKEND": "local",
+            "STORAGE_LOCAL_PATH": os.path.join(directory, "storage"),
+            "DETA_PROJECT_KEY": "bench-deta-key",
+            "HEALTH_CACHE_TTL": "60",
+        }
+    )
+
+
+@contextmanager
+def offline_mongo() -> Iterator[None]:
+    """
+    Run the application on an in-memory MongoDB, shared by the asynchronous
+    client and the scheduler's job store. Sessions are accepted and ignored.
+
+    Yields:
+        None: The clients are replaced while the context is open.
+    """
+    import mongomock  # pylint: disable=C0415
+    from mongomock_motor import (  # pylint: disable=C0415
+        AsyncMongoMockClient,
+        AsyncMongoMockCollection,
+    )
+
+    from src.config import (  # pylint: disable=C0415
+        settings,
+    )
+
+    name = settings().MONGODB_DATABASE
+    url = f"mongodb://localhost/{name}"
+
+    class OfflineSession:
+        async def end_session(self) -> None:
+            pass
+
+    class OfflineClient(AsyncMongoMockClient):
+        def get_default_database(self, *args: Any, **kwargs: Any) -> Any:
+            return self.get_database(name)
+
+        async def start_session(self, *args: Any, **kwargs: Any) -> Any:
+            return OfflineSession()
+
+    aggregate = AsyncMongoMockCollection.aggregate
+
+    def aggregate_without_session(
+        self: Any, *args: Any, session: Any = None, **kwargs: Any
+    ) -> Any:
+        return aggregate(self, *args, **kwargs)
+
+    # mongomock has no sessions: the operations run outside of them.
+    mongomock.ignore_feature("session")
+    with ExitStack() as stack:
+        stack.enter_context(
+            mock.patch(
+                "src.utils.engine.AsyncIOMotorClient",
+                lambda *args, **kwargs: OfflineClient(url),
+            )
+        )
+        stack.enter_context(
+            mock.patch(
+                "src.utils.scheduler.MongoClient",
+                lambda *args, **kwargs: mongomock.MongoClient(url),
+            )
+        )
+        stack.enter_context(
+            mock.patch.object(
+                AsyncMongoMockCollection,
+                "aggregate",
+                aggregate_without_session,
+            )
+        )
+        yield
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    requests: int,
+    concurrency: int,
+    headers: Dict[str, str],
+) -> Result:
+    """
+    Send a scenario's request a number of times, keeping a number of them in
+    flight.
+
+    Args:
+        client (httpx.AsyncClient): The client bound to the application.
+        scenario (Scenario): The scenario.
+        requests (int): The number of requests.
+        concurrency (int): The number of requests in flight.
+        headers (Dict[str, str]): The headers of the logged in user.
+
+    Returns:
+        Result: The measures.
+    """
+    latencies: List[float] = []
+    status_codes: Dict[str, int] = {}
+    remaining = iter(range(requests))
+
+    async def worker() -> None:
+        for _ in remaining:
+            started = time.perf_counter()
+            response = await client.request(
+                scenario.method,
+                scenario.path,
+                json=scenario.body,
+                headers=headers if scenario.authenticated else None,
+            )
+            latencies.append(time.perf_counter() - started)
+            code = str(response.status_code)
+            status_codes[code] = status_codes.get(code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return Result(
+        name=scenario.name,
+        requests=requests,
+        concurrency=concurrency,
+        errors=sum(
+            count
+            for code, count in status_codes.items()
+            if not code.startswith("2")
+        ),
+        p50=percentile(latencies, 0.5) * 1000,
+        p99=percentile(latencies, 0.99) * 1000,
+        throughput=requests / elapsed,
+        status_codes=status_codes,
+    )
+
+
+async def run_benchmark(
+    scenarios: Sequence[Scenario], requests: int, concurrency: int, warmup: int
+) -> List[Result]:
+    """
+    Boot the application, log the benchmark user in and run the scenarios.
+
+    Args:
+        scenarios (Sequence[Scenario]): The scenarios.
+        requests (int): The number of measured requests per scenario.
+        concurrency (int): The number of requests in flight.
+        warmup (int): The number of unmeasured requests per scenario.
+
+    Returns:
+        List[Result]: The measures of each scenario.
+    """
+    from src.main import (  # pylint: disable=C0415
+        code_app,
+    )
+
+    await code_app.router.startup()
+    try:
+        async with httpx.AsyncClient(
+            # Unhandled errors are answered with a 500, as by a server.
+            transport=httpx.ASGITransport(
+                app=code_app, raise_app_exceptions=False  # type: ignore
+            ),
+            base_url="http://benchmark",
+            timeout=60,
+        ) as client:
+            login = await client.post(
+                "/api/v1/nylas/exchange-mailbox-token",
+                json={"token": AUTHORIZATION_CODE},
+            )
+            if "token" not in login.json():
+                raise RuntimeError(f"The sign in failed: {login.text}")
+            headers = {
+                "Authorization": login.json()["token"],
+                "Email": fakes.ACCOUNT_EMAIL,
+            }
+            results = []
+            for scenario in scenarios:
+                if warmup:
+                    await run_scenario(
+                        client, scenario, warmup, concurrency, headers
+                    )
+                results.append(
+                    await run_scenario(
+                        client, scenario, requests, concurrency, headers
+                    )
+                )
+            return results
+    finally:
+        await code_app.router.shutdown()
+
+
+def compare(
+    results: Sequence[Result],
+    baseline: Dict[str, Dict[str, Any]],
+    tolerance: float,
+) -> List[str]:
+    """
+    Find the scenarios that regressed against a baseline.
+
+    Args:
+        results (Sequence[Result]): The measures.
+        baseline (Dict[str, Dict[str, Any]]): The baseline measures, by
+            scenario name.
+        tolerance (float): The allowed slowdown, e.g. 0.5 for 50%.
+
+    Returns:
+        List[str]: A description of each regression.
+    """
+    regressions = []
+    for result in results:
+        reference = baseline.get(result.name)
+        if reference is None:
+            continue
+        if result.errors > reference.get("errors", 0):
+            regressions.append(
+                f"{result.name}: {result.errors} errors "
+                f"(baseline {reference.get('errors', 0)})"
+            )
+        for metric in ("p50", "p99"):
+            limit = reference[metric] * (1 + tolerance)
+            if getattr(result, metric) > limit:
+                regressions.append(
+                    f"{result.name}: {metric} {getattr(result, metric):.1f}ms "
+                    f"> {limit:.1f}ms"
+                )
+        floor = reference["throughput"] / (1 + tolerance)
+        if result.throughput < floor:
+            regressions.append(
+                f"{result.name}: {result.throughput:.1f} req/s "
+                f"< {floor:.1f} req/s"
+            )
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Run the benchmark.
+
+    Args:
+        argv (Optional[List[str]]): The arguments, defaults to sys.argv.
+
+    Returns:
+        int: The exit status, 1 if a scenario regressed.
+    """
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        default=[],
+        help="A route name to run, all of them by default.",
+    )
+    parser.add_argument("--output", help="Write the results to a JSON file.")
+    parser.add_argument(
+        "--baseline", help="Fail if the results regress against this file."
+    )
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    parser.add_argument(
+        "--recording",
+        default=fakes.NYLAS_RECORDING_PATH,
+        help="The Nylas recording replayed.",
+    )
+    fakes.add_fault_arguments(parser)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as directory:
+        ca_file = os.path.join(directory, "fakes-ca.pem")
+        fakes_process = start_fakes_process(
+            ca_file, args.recording, fakes.faults_from_arguments(args)
+        )
+        try:
+            configure_environment(fakes_process["urls"], ca_file, directory)
+            scenarios = [
+                scenario
+                for scenario in hot_scenarios(args.recording)
+                if not args.scenario or scenario.name in args.scenario
+            ]
+            with offline_mongo():
+                results = asyncio.run(
+                    run_benchmark(
+                        scenarios, args.requests, args.concurrency, args.warmup
+                    )
+                )
+        finally:
+            fakes_process["process"].terminate()
+
+    print(
+        f"{'scenario':<32} {'requests':>8} {'errors':>6} {'p50 ms':>8}"
+        f" {'p99 ms':>8} {'req/s':>8}"
+    )
+    for result in results:
+        print(
+            f"{result.name:<32} {result.requests:>8} {result.errors:>6}"
+            f" {result.p50:>8.1f} {result.p99:>8.1f}"
+            f" {result.throughput:>8.1f}"
+        )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(
+                {result.name: asdict(result) for result in results},
+                file,
+                indent=2,
+            )
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
@@ -0,0 +1,490 @@
+"""🏋️ Benchmarks Load Test Module 🌐
+
+This module contains the load test of the deployment topology of `loadtest-compose.yml`:
+HAProxy balancing over the four app replicas, which run against MongoDB and the fakes of
+`benchmarks.fakes`.
+
+Virtual users replay sessions through HAProxy: each one signs in as its own user, opens
+the inbox, then goes through a mix of actions (opening a mail, refreshing the inbox,
+searching, sending an email and running code), pausing for a random think time between
+two of them, and signs in again after a number of actions. Users are started gradually
+over the ramp up, and the test lasts a given duration.
+
+While the load runs, the HAProxy statistics and the Prometheus metrics of every replica
+are sampled every second. The report gives the latency and throughput of each action,
+seen by the users, and the saturation of each replica: its peak sessions against its
+`maxconn`, its peak queue, its response time, errors and retries, and the peak use of
+its MongoDB pool, its waits for a connection, its event loop lag and its requests in
+flight. A queue in front of a replica means `maxconn` is too low for it; connections
+waited for mean the MongoDB pool is too small for the load, and a growing event loop
+lag means the replica, not its limits, is the bottleneck.
+
+Usage:
+    python -m benchmarks.loadtest [--users 200] [--duration 120] [--ramp-up 30]
+        [--think-time 1] [--base-url http://lb:8080] [--stats-url http://lb:8404/stats]
+        [--replica s1=http://app1:8000 ...] [--output report.json]
+
+Classes:
+    - ReplicaMonitor: Samples the saturation of the replicas.
+
+Functions:
+    - run_user(...) -> None: Replay the sessions of a virtual user.
+    - run_load(...) -> Dict[str, Any]: Run the load test.
+    - main(argv: Optional[List[str]]) -> None: Run the load test and print its report.
+
+Dependencies:
+    - httpx: For the virtual users.
+    - prometheus_client: For parsing the replica metrics.
+
+"""
+
+import argparse
+import asyncio
+import csv
+import httpx
+import io
+import json
+import random
+import sys
+import time
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+import uuid
+
+from benchmarks import (
+    harness,
+)
+
+# The actions of a session after the inbox is opened, and their weights.
+ACTIONS: Sequence[Tuple[str, int]] = (
+    ("open", 40),
+    ("inbox", 20),
+    ("search", 15),
+    ("execute-code", 15),
+    ("send", 10),
+)
+SEARCHES = ("sort", "graph", "review", "invoice", "deploy")
+PROGRAMS = (
+    "print(sum(range(10)))",
+    "print(sorted([3, 1, 2]))",
+    "print('hello, world')",
+)
+
+# The HAProxy statistics kept, as their peak or their last value.
+PEAK_STATISTICS = ("scur", "qcur", "rate")
+LAST_STATISTICS = (
+    "slim",
+    "stot",
+    "hrsp_5xx",
+    "wretr",
+    "wredis",
+    "rtime",
+    "ttime",
+)
+
+
+class ReplicaMonitor:
+    """
+    Samples the saturation of the replicas from the HAProxy statistics and
+    the replica metrics.
+
+    Args:
+        client (httpx.AsyncClient): The client of the samples.
+        stats_url (str): The HAProxy statistics page.
+        replicas (Dict[str, str]): The replica URLs, by HAProxy server name.
+        backend (str): The HAProxy backend of the replicas.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        stats_url: str,
+        replicas: Dict[str, str],
+        backend: str = "all",
+    ) -> None:
+        self.client = client
+        self.stats_url = stats_url
+        self.replicas = replicas
+        self.backend = backend
+        self.servers: Dict[str, Dict[str, Any]] = {}
+
+    def server(self, name: str) -> Dict[str, Any]:
+        """
+        Get the samples of a replica.
+
+        Args:
+            name (str): The HAProxy server name.
+
+        Returns:
+            Dict[str, Any]: The peaks and last values sampled.
+        """
+        return self.servers.setdefault(name, {"down_samples": 0, "samples": 0})
+
+    @staticmethod
+    def peak(server: Dict[str, Any], name: str, value: float) -> None:
+        """
+        Keep the highest value sampled.
+
+        Args:
+            server (Dict[str, Any]): The samples of a replica.
+            name (str): The sample name.
+            value (float): The sampled value.
+        """
+        server[name] = max(server.get(name, value), value)
+
+    async def sample_statistics(self) -> None:
+        """
+        Sample the sessions, queues and counters of the HAProxy servers.
+        """
+        response = await self.client.get(self.stats_url + ";csv")
+        rows = csv.DictReader(io.StringIO(response.text.lstrip("# ")))
+        for row in rows:
+            if row["pxname"] != self.backend or row["svname"] in (
+                "FRONTEND",
+                "BACKEND",
+            ):
+                continue
+            server = self.server(row["svname"])
+            server["samples"] += 1
+            if not row["status"].startswith("UP"):
+                server["down_samples"] += 1
+            for name in PEAK_STATISTICS:
+                self.peak(server, f"{name}_max", float(row[name] or 0))
+            for name in LAST_STATISTICS:
+                server[name] = float(row[name] or 0)
+
+    async def sample_metrics(self, name: str, url: str) -> None:
+        """
+        Sample the MongoDB pool, event loop lag and requests in flight of a
+        replica.
+
+        Args:
+            name (str): The HAProxy server name.
+            url (str): The replica URL.
+        """
+        from prometheus_client.parser import (  # pylint: disable=C0415
+            text_string_to_metric_families,
+        )
+
+        response = await self.client.get(url + "/metrics")
+        values: Dict[str, float] = {}
+        for family in text_string_to_metric_families(response.text):
+            for sample in family.samples:
+                if sample.name == "mongodb_pool_connections":
+                    key = f"mongodb_{sample.labels['state']}"
+                    values[key] = values.get(key, 0) + sample.value
+                elif sample.name == "mongodb_pool_checkout_failures_total":
+                    key = "mongodb_checkout_failures"
+                    values[key] = values.get(key, 0) + sample.value
+                elif sample.name == "event_loop_lag_seconds":
+                    key = "event_loop_lag"
+                    values[key] = max(values.get(key, 0), sample.value)
+                elif sample.name == "http_requests_in_flight":
+                    key = "in_flight"
+                    values[key] = values.get(key, 0) + sample.value
+        server = self.server(name)
+        for key, value in values.items():
+            if key == "mongodb_checkout_failures":
+                server.setdefault(f"{key}_start", value)
+                server[key] = value - server[f"{key}_start"]
+            else:
+                self.peak(server, f"{key}_max", value)
+
+    async def run(self, interval: float = 1.0) -> None:
+        """
+        Sample until cancelled.
+
+        Args:
+            interval (float): The number of seconds between two samples.
+        """
+        while True:
+            samples = [self.sample_statistics()] + [
+                self.sample_metrics(name, url)
+                for name, url in self.replicas.items()
+            ]
+            for outcome in await asyncio.gather(
+                *samples, return_exceptions=True
+            ):
+                if isinstance(outcome, Exception):
+                    print(f"Sampling failed: {outcome!r}", file=sys.stderr)
+            await asyncio.sleep(interval)
+
+
+async def run_user(
+    index: int,
+    base_url: str,
+    deadline: float,
+    think_time: float,
+    session_actions: int,
+    measures: Dict[str, List[Tuple[float, int]]],
+) -> None:
+    """
+    Replay the sessions of a virtual user until the deadline.
+
+    Args:
+        index (int): The user number, which makes its email address.
+        base_url (str): The load balancer URL.
+        deadline (float): When to stop, on the `time.monotonic` clock.
+        think_time (float): The mean pause between two actions, in seconds.
+        session_actions (int): The number of actions before signing in again.
+        measures (Dict[str, List[Tuple[float, int]]]): The latency and status
+            of every request, by action.
+    """
+    email = f"user{index}@loadtest.example.com"
+    names = [name for name, _ in ACTIONS]
+    weights = [weight for _, weight in ACTIONS]
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+
+        async def request(
+            action: str, method: str, path: str, **kwargs: Any
+        ) -> Optional[httpx.Response]:
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+            except httpx.HTTPError:
+                measures.setdefault(action, []).append(
+                    (time.perf_counter() - started, 0)
+                )
+                return None
+            measures.setdefault(action, []).append(
+                (time.perf_counter() - started, response.status_code)
+            )
+            return response
+
+        while time.monotonic() < deadline:
+            login = await request(
+                "login",
+                "POST",
+                "/api/v1/nylas/exchange-mailbox-token",
+                json={"token": email},
+            )
+            token = None
+            if login is not None and login.status_code == 200:
+                token = login.json().get("token")
+            if token is None:
+                await asyncio.sleep(random.expovariate(1 / think_time))
+                continue
+            client.headers.update({"Authorization": token, "Email": email})
+            message_ids: List[str] = []
+            action = "inbox"
+            for _ in range(session_actions):
+                if time.monotonic() >= deadline:
+                    return
+                if action == "inbox" or not message_ids:
+                    inbox = await request(
+                        "inbox", "GET", "/api/v1/nylas/read-emails"
+                    )
+                    if inbox is not None and inbox.status_code == 200:
+                        message_ids = [
+                            message_id
+                            for thread in inbox.json()
+                            for message_id in thread.get("message_ids", [])
+                        ]
+                elif action == "open":
+                    await request(
+                        "open",
+                        "GET",
+                        "/api/v1/nylas/mail",
+                        params={"mailId": random.choice(message_ids)},
+                    )
+                elif action == "search":
+                    await request(
+                        "search",
+                        "GET",
+                        "/api/v1/nylas/search-emails",
+                        params={"search": random.choice(SEARCHES)},
+                    )
+                elif action == "send":
+                    await request(
+                        "send",
+                        "POST",
+                        "/api/v1/nylas/send-email",
+                        headers={"Idempotency-Key": str(uuid.uuid4())},
+                        json={
+                            "to": [
+                                {"name": "Grace", "email": "grace@example.org"}
+                            ],
+                            "cc": None,
+                            "bcc": None,
+                            "subject": "Load test",
+                            "message": "Sent by the load test.",
+                        },
+                    )
+                elif action == "execute-code":
+                    await request(
+                        "execute-code",
+                        "POST",
+                        "/api/v1/nylas/execute-code",
+                        headers={"Idempotency-Key": str(uuid.uuid4())},
+                        json={
+                            "code": random.choice(PROGRAMS),
+                            "language_id": "71",
+                        },
+                    )
+                await asyncio.sleep(random.expovariate(1 / think_time))
+                action = random.choices(names, weights)[0]
+
+
+async def run_load(
+    base_url: str,
+    stats_url: str,
+    replicas: Dict[str, str],
+    users: int,
+    duration: float,
+    ramp_up: float,
+    think_time: float,
+    session_actions: int,
+) -> Dict[str, Any]:
+    """
+    Run the load test.
+
+    Args:
+        base_url (str): The load balancer URL.
+        stats_url (str): The HAProxy statistics page.
+        replicas (Dict[str, str]): The replica URLs, by HAProxy server name.
+        users (int): The number of virtual users.
+        duration (float): The number of seconds the test lasts.
+        ramp_up (float): The number of seconds over which users are started.
+        think_time (float): The mean pause between two actions, in seconds.
+        session_actions (int): The number of actions before signing in again.
+
+    Returns:
+        Dict[str, Any]: The `actions` measures, and the `replicas` samples.
+    """
+    measures: Dict[str, List[Tuple[float, int]]] = {}
+    started = time.monotonic()
+    deadline = started + duration
+    async with httpx.AsyncClient(timeout=5) as monitor_client:
+        monitor = ReplicaMonitor(monitor_client, stats_url, replicas)
+        sampler = asyncio.create_task(monitor.run())
+        tasks = []
+        for index in range(users):
+            tasks.append(
+                asyncio.create_task(
+                    run_user(
+                        index,
+                        base_url,
+                        deadline,
+                        think_time,
+                        session_actions,
+                        measures,
+                    )
+                )
+            )
+            await asyncio.sleep(ramp_up / users)
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - started
+        sampler.cancel()
+        try:
+            # The counters as of the end of the test.
+            await monitor.sample_statistics()
+        except httpx.HTTPError as err:
+            print(f"Sampling failed: {err!r}", file=sys.stderr)
+
+    actions = {}
+    for action, samples in sorted(measures.items()):
+        latencies = [latency for latency, _ in samples]
+        actions[action] = {
+            "requests": len(samples),
+            "errors": sum(
+                1 for _, status in samples if not 200 <= status < 300
+            ),
+            "p50": harness.percentile(latencies, 0.5) * 1000,
+            "p99": harness.percentile(latencies, 0.99) * 1000,
+            "throughput": len(samples) / elapsed,
+        }
+    return {"actions": actions, "replicas": monitor.servers}
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    """
+    Print the load test report.
+
+    Args:
+        report (Dict[str, Any]): The result of `run_load`.
+    """
+    print(
+        f"{'action':<14} {'requests':>8} {'errors':>6} {'p50 ms':>8}"
+        f" {'p99 ms':>8} {'req/s':>8}"
+    )
+    for action, result in report["actions"].items():
+        print(
+            f"{action:<14} {result['requests']:>8} {result['errors']:>6}"
+            f" {result['p50']:>8.1f} {result['p99']:>8.1f}"
+            f" {result['throughput']:>8.1f}"
+        )
+    print()
+    print(
+        f"{'replica':<8} {'requests':>8} {'5xx':>5} {'retries':>7}"
+        f" {'sessions':>12} {'queue':>5} {'resp ms':>7} {'in flight':>9}"
+        f" {'mongo in use':>12} {'mongo wait':>10} {'loop lag ms':>11}"
+        f" {'down':>4}"
+    )
+    for name, server in sorted(report["replicas"].items()):
+        sessions = (
+            f"{server.get('scur_max', 0):.0f}/{server.get('slim', 0):.0f}"
+        )
+        print(
+            f"{name:<8} {server.get('stot', 0):>8.0f}"
+            f" {server.get('hrsp_5xx', 0):>5.0f}"
+            f" {server.get('wretr', 0) + server.get('wredis', 0):>7.0f}"
+            f" {sessions:>12} {server.get('qcur_max', 0):>5.0f}"
+            f" {server.get('rtime', 0):>7.0f}"
+            f" {server.get('in_flight_max', 0):>9.0f}"
+            f" {server.get('mongodb_in_use_max', 0):>12.0f}"
+            f" {server.get('mongodb_waiting_max', 0):>10.0f}"
+            f" {server.get('event_loop_lag_max', 0) * 1000:>11.0f}"
+            f" {server['down_samples']:>4}"
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Run the load test and print its report.
+
+    Args:
+        argv (Optional[List[str]]): The arguments, defaults to sys.argv.
+    """
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.loadtest")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=120)
+    parser.add_argument("--ramp-up", type=float, default=30)
+    parser.add_argument("--think-time", type=float, default=1.0)
+    parser.add_argument("--session-actions", type=int, default=20)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--stats-url", default="http://localhost:8404/stats")
+    parser.add_argument(
+        "--replica",
+        action="append",
+        default=[],
+        help="A replica to sample, as <HAProxy server name>=<URL>.",
+    )
+    parser.add_argument("--output", help="Write the report to a JSON file.")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(
+        run_load(
+            args.base_url,
+            args.stats_url,
+            dict(replica.split("=", 1) for replica in args.replica),
+            args.users,
+            args.duration,
+            args.ramp_up,
+            args.think_time,
+            args.session_actions,
+        )
+    )
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,424 @@
+"""📼 Benchmarks Recorder Module 🎙️
+
+This module records the Nylas API exchanges of a test account, for the Nylas fake of
+`benchmarks.fakes` to replay.
+
+The recorder is an HTTPS reverse proxy in front of the Nylas API. Start it, point a local
+server at it with `NYLAS_API_SERVER` and `REQUESTS_CA_BUNDLE`, sign in with the test
+account and use the app: every exchange is forwarded to the API and answered as is, and
+the recording is written out when the recorder stops. Only the latest exchange of each
+method, path and query is kept, with the time the API took to answer.
+
+The recording is sanitized, so that it can be committed:
+
+- the access and refresh tokens become `ACCESS_TOKEN`,
+- the account's email address becomes `ACCOUNT_EMAIL`, and the other addresses
+  `contact<n>@example.org`, the same one for the same address throughout,
+- the names of the account, the participants and the contacts are replaced,
+- the subjects, snippets, bodies and file names are masked letter by letter, which
+  keeps their markup and their size, unless `--keep-content` is given,
+- the credentials are dropped from the queries, only the `Content-Type` response header
+  is kept, and the request bodies are not stored.
+
+Usage:
+    python -m benchmarks.recorder [--port 8443] [--upstream https://api.nylas.com]
+        [--output recording.json] [--ca-file recorder-ca.pem] [--keep-content]
+
+Classes:
+    - Sanitizer: Removes the personal data and credentials of the exchanges.
+    - Recorder: The recorded exchanges.
+    - RecorderHandler: Forwards the requests to the API and records them.
+    - RecorderServer: The HTTPS reverse proxy recording the exchanges.
+
+Functions:
+    - main(argv: Optional[List[str]]) -> None: Record until interrupted.
+
+Dependencies:
+    - requests: For forwarding the requests to the Nylas API.
+
+"""
+
+import argparse
+import json
+import os
+import re
+import requests
+import signal
+import sys
+import threading
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+from urllib.parse import (
+    parse_qsl,
+    urlsplit,
+)
+
+from benchmarks import (
+    fakes,
+)
+
+# The query parameters and body fields holding credentials.
+SECRET_PARAMETERS = frozenset(
+    {"access_token", "client_id", "client_secret", "code", "refresh_token"}
+)
+TOKEN_FIELDS = frozenset({"access_token", "refresh_token"})
+# The body fields holding the content of the messages.
+CONTENT_FIELDS = frozenset({"subject", "snippet", "body", "filename"})
+# The request headers not forwarded to the API.
+HOP_HEADERS = frozenset(
+    {"host", "connection", "keep-alive", "content-length", "accept-encoding"}
+)
+
+EMAIL_ADDRESS = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+LETTER = re.compile(r"[^\W\d_]")
+MARKUP = re.compile(r"(<[^>]*>)")
+
+
+class Sanitizer:
+    """
+    Removes the personal data and credentials of the exchanges, replacing
+    each email address and name with the same pseudonym throughout.
+
+    Args:
+        keep_content (bool): Whether the subjects, snippets, bodies and file
+            names are kept as they are.
+    """
+
+    def __init__(self, keep_content: bool = False) -> None:
+        self.keep_content = keep_content
+        self.addresses: Dict[str, str] = {}
+        self.names: Dict[str, str] = {}
+
+    def address(self, address: str) -> str:
+        """
+        Get the pseudonym of an email address.
+
+        Args:
+            address (str): The email address.
+
+        Returns:
+            str: The pseudonym.
+        """
+        key = address.lower()
+        if key not in self.addresses:
+            if not self.addresses:
+                # The first address seen is the account's, on sign in.
+                self.addresses[key] = fakes.ACCOUNT_EMAIL
+            else:
+                self.addresses[key] = (
+                    f"contact{len(self.addresses)}@example.org"
+                )
+        return self.addresses[key]
+
+    def name(self, name: str) -> str:
+        """
+        Get the pseudonym of a name.
+
+        Args:
+            name (str): The name.
+
+        Returns:
+            str: The pseudonym.
+        """
+        if not name:
+            return name
+        if name not in self.names:
+            self.names[name] = f"Contact {len(self.names) + 1}"
+        return self.names[name]
+
+    def text(self, text: str) -> str:
+        """
+        Replace the email addresses of a text.
+
+        Args:
+            text (str): The text.
+
+        Returns:
+            str: The sanitized text.
+        """
+        return EMAIL_ADDRESS.sub(lambda match: self.address(match[0]), text)
+
+    def mask(self, text: str) -> str:
+        """
+        Mask the letters of a text, outside of its markup.
+
+        Args:
+            text (str): The text, e.g. an HTML body.
+
+        Returns:
+            str: The masked text, of the same length.
+        """
+        return "".join(
+            part if part.startswith("<") else LETTER.sub("x", part)
+            for part in MARKUP.split(self.text(text))
+        )
+
+    def body(self, value: Any, field: str = "") -> Any:
+        """
+        Sanitize a response body.
+
+        Args:
+            value (Any): The decoded JSON body, or a part of it.
+            field (str): The field holding the value.
+
+        Returns:
+            Any: The sanitized body.
+        """
+        if isinstance(value, list):
+            return [self.body(item, field) for item in value]
+        if isinstance(value, dict):
+            if isinstance(value.get("email_address"), str):
+                # The account address is seen before the others.
+                self.address(value["email_address"])
+            return {
+                key: self.field(key, item, value)
+                for key, item in value.items()
+            }
+        if isinstance(value, str):
+            if field in CONTENT_FIELDS and not self.keep_content:
+                if field == "filename":
+                    stem, extension = os.path.splitext(value)
+                    return self.mask(stem) + extension
+                return self.mask(value)
+            return self.text(value)
+        return value
+
+    def field(self, key: str, value: Any, parent: Dict[str, Any]) -> Any:
+        """
+        Sanitize a field of a response body.
+
+        Args:
+            key (str): The field name.
+            value (Any): The field value.
+            parent (Dict[str, Any]): The object holding the field.
+
+        Returns:
+            Any: The sanitized value.
+        """
+        if not isinstance(value, str):
+            return self.body(value, key)
+        if key in TOKEN_FIELDS:
+            return fakes.ACCESS_TOKEN
+        if key == "name" and (
+            "email" in parent or parent.get("object") == "account"
+        ):
+            return self.name(value)
+        if key in ("given_name", "middle_name", "surname", "nickname"):
+            return self.name(value)
+        return self.body(value, key)
+
+    def query(self, query: Dict[str, str]) -> Dict[str, str]:
+        """
+        Sanitize the query parameters of a request.
+
+        Args:
+            query (Dict[str, str]): The query parameters.
+
+        Returns:
+            Dict[str, str]: The parameters without credentials.
+        """
+        return {
+            name: self.text(value)
+            for name, value in query.items()
+            if name not in SECRET_PARAMETERS
+        }
+
+
+class Recorder:
+    """
+    The recorded exchanges, the latest one of each method, path and query.
+
+    Args:
+        sanitizer (Sanitizer): The sanitizer of the exchanges.
+    """
+
+    def __init__(self, sanitizer: Sanitizer) -> None:
+        self.sanitizer = sanitizer
+        self.exchanges: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def add(
+        self,
+        method: str,
+        path: str,
+        query: Dict[str, str],
+        response: requests.Response,
+    ) -> None:
+        """
+        Record an exchange. Responses that are not JSON are skipped.
+
+        Args:
+            method (str): The request method.
+            path (str): The request path.
+            query (Dict[str, str]): The query parameters.
+            response (requests.Response): The API response.
+        """
+        try:
+            body = response.json()
+        except ValueError:
+            return
+        with self._lock:
+            query = self.sanitizer.query(query)
+            exchange = {
+                "method": method,
+                "path": path.rstrip("/") or "/",
+                "query": query,
+                "status": response.status_code,
+                "headers": {
+                    "Content-Type": response.headers.get(
+                        "Content-Type", "application/json"
+                    )
+                },
+                "body": self.sanitizer.body(body),
+                "elapsed": round(response.elapsed.total_seconds(), 3),
+            }
+            key = (method, exchange["path"], json.dumps(query, sort_keys=True))
+            self.exchanges[key] = exchange
+
+    def save(self, path: str, server: str) -> int:
+        """
+        Write the recording out.
+
+        Args:
+            path (str): The JSON file.
+            server (str): The recorded API server.
+
+        Returns:
+            int: The number of exchanges written.
+        """
+        with self._lock:
+            exchanges = list(self.exchanges.values())
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(
+                {"server": server, "exchanges": exchanges}, file, indent=1
+            )
+        return len(exchanges)
+
+
+class RecorderHandler(fakes.JSONHandler):
+    """
+    Forwards the requests to the API and records the exchanges.
+    """
+
+    server: "RecorderServer"
+
+    def handle_request(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        content = self.rfile.read(length) if length else None
+        url = urlsplit(self.path)
+        headers = {
+            name: value
+            for name, value in self.headers.items()
+            if name.lower() not in HOP_HEADERS
+        }
+        try:
+            response = self.server.session.request(
+                self.command,
+                self.server.upstream + self.path,
+                data=content,
+                headers=headers,
+                timeout=60,
+            )
+        except requests.RequestException as err:
+            self.reply(502, {"message": repr(err), "type": "api_error"})
+            return
+        self.server.recorder.add(
+            self.command, url.path, dict(parse_qsl(url.query)), response
+        )
+        self.send_content(
+            response.status_code,
+            response.content,
+            {
+                "Content-Type": response.headers.get(
+                    "Content-Type", "application/json"
+                )
+            },
+        )
+
+    do_GET = do_POST = do_PUT = do_DELETE = handle_request
+
+
+class RecorderServer(fakes.FakeServer):
+    """
+    The HTTPS reverse proxy recording the exchanges with the API.
+
+    Args:
+        port (int): The port, 0 picks a free one.
+        upstream (str): The API server, e.g. "https://api.nylas.com".
+        recorder (Recorder): The recorded exchanges.
+        ca_file (str): Where to write the certificate the clients trust.
+        host (str): The address to bind to.
+    """
+
+    def __init__(
+        self,
+        port: int,
+        upstream: str,
+        recorder: Recorder,
+        ca_file: str,
+        host: str = "127.0.0.1",
+    ) -> None:
+        super().__init__(
+            "recorder",
+            port,
+            RecorderHandler,
+            tls=fakes.create_tls_context(ca_file),
+            host=host,
+        )
+        self.upstream = upstream.rstrip("/")
+        self.recorder = recorder
+        self.session = requests.Session()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Record until interrupted, then write the recording out.
+
+    Args:
+        argv (Optional[List[str]]): The arguments, defaults to sys.argv.
+    """
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.recorder")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8443)
+    parser.add_argument("--upstream", default="https://api.nylas.com")
+    parser.add_argument("--output", default="recording.json")
+    parser.add_argument("--ca-file", default="recorder-ca.pem")
+    parser.add_argument(
+        "--keep-content",
+        action="store_true",
+        help="Keep the subjects, snippets, bodies and file names.",
+    )
+    args = parser.parse_args(argv)
+
+    server = RecorderServer(
+        args.port,
+        args.upstream,
+        Recorder(Sanitizer(args.keep_content)),
+        args.ca_file,
+        host=args.host,
+    )
+    server.start()
+    print(f"Recording {args.upstream} on {server.url}.", flush=True)
+    print(
+        f"Run the server with NYLAS_API_SERVER={server.url} and "
+        f"REQUESTS_CA_BUNDLE={os.path.abspath(args.ca_file)}.",
+        flush=True,
+    )
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    try:
+        stopped.wait()
+    except KeyboardInterrupt:
+        pass
+    server.stop()
+    count = server.recorder.save(args.output, args.upstream)
+    print(f"Wrote {count} exchanges to {args.output}.", flush=True)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
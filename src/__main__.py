@@ -0,0 +1,7 @@
+"""Run the server with `python -m src`."""
+
+from src.main import (
+    serve,
+)
+
+serve()
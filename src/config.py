@@ -24,40 +24,221 @@ class Settings(BaseSettings):
         MONGODB_USERNAME (str) : MONGODB username.
         MONGODB_PASSWORD (str) : MONGODB password.
         MONGODB_DATABASE (str) : MONGODB database name.
+        MONGODB_URL (str): A full MongoDB URL ending with the database name, used instead of the
+            above when set.
+        MONGODB_MAX_POOL_SIZE (str): The number of MongoDB connections per process.
+        MONGODB_MIN_POOL_SIZE (str): The number of MongoDB connections kept open per process.
         DEBUG (str) : A variable used to separate testing env from production env.
         CORS_ORIGINS (str) : A string that contains comma separated urls for cors origins.
+        SERVER_MODE (str): "production", or "development" to run a single worker with reload.
+        HOST (str): The address the server binds to.
+        PORT (str): The port the server binds to.
+        WEB_CONCURRENCY (str): The number of worker processes, defaults to the number of CPUs.
+        SERVER_LOOP (str): The uvicorn event loop, "auto" uses uvloop when installed.
+        SERVER_HTTP (str): The uvicorn HTTP parser, "auto" uses httptools when installed.
+        SERVER_KEEP_ALIVE (str): The number of seconds idle keep-alive connections are kept open.
+        SERVER_BACKLOG (str): The maximum number of connections waiting to be accepted.
+        SERVER_MAX_REQUESTS (str): The number of requests a worker serves before being
+            replaced, 0 disables it.
+        SERVER_GUNICORN (str): "true" to pre-fork the workers with gunicorn, preloading the app.
+        FORWARDED_ALLOW_IPS (str): The comma separated load balancer addresses whose
+            X-Forwarded-* headers are trusted, "*" trusts every client.
         DETA_PROJECT_KEY (str) : A Deta project key.
+        STORAGE_BACKEND (str): The blob storage backend, "deta" or "local".
+        STORAGE_LOCAL_PATH (str): The directory of the local blob storage.
+        STORAGE_CACHE_PATH (str): The directory of the blob cache, defaults to the temporary directory.
+        STORAGE_CACHE_SIZE (str): The size of the blob cache in megabytes per process, 0 disables it.
+        PROFILE_IMAGE_MAX_SIZE (str): The maximum size of an uploaded profile image, in megabytes.
         NYLAS_SYSTEM_TOKEN (str) : A Nylas access token for sending email as system.
         OPENAI_API_KEY (str) : An openai api key for generating emails.
+        OPENAI_API_BASE (str): The OpenAI API base URL.
+        OPENAI_TIMEOUT (str): The number of seconds a generation attempt can take.
+        OPENAI_MAX_RETRIES (str): The number of retries of a failed generation.
+        OPENAI_MAX_CONCURRENT (str): The number of generations in flight at once per process.
+        OPENAI_REQUESTS_PER_MINUTE (str): The OpenAI request budget per process, 0 means unlimited.
+        OPENAI_TOKENS_PER_MINUTE (str): The OpenAI token budget per process, 0 means unlimited.
         RAPIDAPI_KEY (str): Rapid api key
+        JUDGE0_API_URL (str): The Judge0 API base URL.
+        CODE_EXECUTOR (str): The code execution backend, "judge0" or "local".
+        CODE_EXECUTOR_POOL_SIZE (str): The number of warm sandboxes of the local backend.
+        EXECUTION_CACHE_SIZE (str): The number of cached execution results, 0 disables the cache.
+        EXECUTION_CACHE_PERSIST (str): "true" to also store cached execution results in MongoDB.
+        EXECUTION_CACHE_TTL (str): The number of seconds a result stored in MongoDB is kept.
+        EXECUTION_MAX_CONCURRENT (str): The number of code executions running at once per process.
+        EXECUTION_MAX_PER_USER (str): The number of code executions a user can have in flight.
+        EXECUTION_MAX_QUEUE (str): The number of code executions allowed to wait for a slot.
+        EXECUTION_MAX_WAIT (str): The number of seconds a code execution can wait for a slot.
+        OUTBOX_WORKERS (str): The number of outbound email workers per process.
+        OUTBOX_ACCOUNT_RATE (str): The number of emails an account can send per minute per process.
+        OUTBOX_MAX_ATTEMPTS (str): The number of send attempts before an email is dead-lettered.
+        IDEMPOTENCY_TTL (str): The number of seconds an Idempotency-Key and its response are kept.
+        BACKGROUND_TASKS_MAX_CONCURRENT (str): The number of background tasks running at once per process.
+        SHUTDOWN_DRAIN_TIMEOUT (str): The number of seconds background tasks get to finish on shutdown.
+        LEADER_LEASE_TTL (str): The number of seconds the scheduler lease lasts without renewal.
+        TUTORIAL_STOCK_SIZE (str): The number of unseen tutorials kept per language.
+        TUTORIAL_REFILL_HOUR (str): The UTC hour the tutorial library is refilled at.
+        HEALTH_CACHE_TTL (str): The number of seconds a readiness probe result is reused.
+        HEALTH_MAX_MONGO_LATENCY (str): The slowest MongoDB ping not reported as degraded, in seconds.
+        HEALTH_MAX_LOOP_LAG (str): The largest event loop lag of a ready process, in seconds.
+        HEALTH_MAX_EXECUTION_QUEUE (str): The longest code execution queue of a ready process.
+        HEALTH_NYLAS_CRITICAL (str): "true" to fail readiness when the Nylas API is unreachable.
+        PROFILER_SAMPLE_RATE (str): The fraction of the requests profiled, 0 disables sampling.
+        PROFILER_TOKEN (str): The X-Profile header value profiling a request, empty disables it.
+        PROFILER_INTERVAL (str): The number of seconds between two samples of a profiled request.
+        PROFILER_MAX_CONCURRENT (str): The number of requests profiled at once per process.
+        PROFILER_TTL (str): The number of seconds a request profile is kept.
 
     Example:
         >>> MONGODB_HOST=svc-123456789.svc.MONGODB.com
         >>> MONGODB_USERNAME=admin
         >>> MONGODB_PASSWORD=51R0NGPO$$W0RD
         >>> MONGODB_DATABASE=shop
+        >>> MONGODB_URL=mongodb://mongo:27017/shop
+        >>> MONGODB_MAX_POOL_SIZE=30
+        >>> MONGODB_MIN_POOL_SIZE=30
         >>> DEBUG="" # "" means production, "test" means testing, "info" means development.
         >>> CORS_ORIGINS="https://app-name.herokuapp.com,http://app-name.pages.dev"
+        >>> SERVER_MODE=production
+        >>> HOST=0.0.0.0
+        >>> PORT=8000
+        >>> WEB_CONCURRENCY=4
+        >>> SERVER_LOOP=auto
+        >>> SERVER_HTTP=auto
+        >>> SERVER_KEEP_ALIVE=75
+        >>> SERVER_BACKLOG=2048
+        >>> SERVER_MAX_REQUESTS=10000
+        >>> SERVER_GUNICORN=true
+        >>> FORWARDED_ALLOW_IPS=172.18.0.2
         >>> DETA_PROJECT_KEY=12312dSDJHJSBA
+        >>> STORAGE_BACKEND=deta
+        >>> STORAGE_LOCAL_PATH=storage
+        >>> STORAGE_CACHE_PATH=/var/cache/code-inbox
+        >>> STORAGE_CACHE_SIZE=64
+        >>> PROFILE_IMAGE_MAX_SIZE=5
         >>> NYLAS_SYSTEM_TOKEN=12312dSDJHJSBA
         >>> OPENAI_API_KEY=12312dSDJHJSBA
+        >>> OPENAI_API_BASE=https://api.openai.com/v1
+        >>> OPENAI_TIMEOUT=60
+        >>> OPENAI_MAX_RETRIES=3
+        >>> OPENAI_MAX_CONCURRENT=4
+        >>> OPENAI_REQUESTS_PER_MINUTE=60
+        >>> OPENAI_TOKENS_PER_MINUTE=60000
         >>> RAPIDAPI_KEY=12312dSDJHJSBA
+        >>> JUDGE0_API_URL=https://judge0-ce.p.rapidapi.com
+        >>> CODE_EXECUTOR=local
+        >>> CODE_EXECUTOR_POOL_SIZE=4
+        >>> EXECUTION_CACHE_SIZE=1024
+        >>> EXECUTION_CACHE_PERSIST=true
+        >>> EXECUTION_CACHE_TTL=604800
+        >>> EXECUTION_MAX_CONCURRENT=16
+        >>> EXECUTION_MAX_PER_USER=2
+        >>> EXECUTION_MAX_QUEUE=64
+        >>> EXECUTION_MAX_WAIT=10
+        >>> OUTBOX_WORKERS=4
+        >>> OUTBOX_ACCOUNT_RATE=30
+        >>> OUTBOX_MAX_ATTEMPTS=5
+        >>> IDEMPOTENCY_TTL=86400
+        >>> BACKGROUND_TASKS_MAX_CONCURRENT=16
+        >>> SHUTDOWN_DRAIN_TIMEOUT=20
+        >>> LEADER_LEASE_TTL=30
+        >>> TUTORIAL_STOCK_SIZE=5
+        >>> TUTORIAL_REFILL_HOUR=3
+        >>> HEALTH_CACHE_TTL=2
+        >>> HEALTH_MAX_MONGO_LATENCY=0.5
+        >>> HEALTH_MAX_LOOP_LAG=0.5
+        >>> HEALTH_MAX_EXECUTION_QUEUE=48
+        >>> HEALTH_NYLAS_CRITICAL=true
+        >>> PROFILER_SAMPLE_RATE=0.001
+        >>> PROFILER_TOKEN=12312dSDJHJSBA
+        >>> PROFILER_INTERVAL=0.01
+        >>> PROFILER_MAX_CONCURRENT=2
+        >>> PROFILER_TTL=604800
     """
 
     MONGODB_HOST: str = os.getenv("MONGODB_HOST")  # type: ignore
     MONGODB_USERNAME: str = os.getenv("MONGODB_USERNAME")  # type: ignore
     MONGODB_PASSWORD: str = os.getenv("MONGODB_PASSWORD")  # type: ignore
     MONGODB_DATABASE: str = os.getenv("MONGODB_DATABASE")  # type: ignore
+    MONGODB_URL: str = os.getenv("MONGODB_URL", "")
+    MONGODB_MAX_POOL_SIZE: str = os.getenv("MONGODB_MAX_POOL_SIZE", "30")
+    MONGODB_MIN_POOL_SIZE: str = os.getenv("MONGODB_MIN_POOL_SIZE", "30")
     DEBUG: str = os.getenv("DEBUG")  # type: ignore
     CORS_ORIGINS: str = os.getenv("CORS_ORIGINS")  # type: ignore
+    SERVER_MODE: str = os.getenv("SERVER_MODE", "production")
+    HOST: str = os.getenv("HOST", "0.0.0.0")
+    PORT: str = os.getenv("PORT", "8000")
+    WEB_CONCURRENCY: str = os.getenv("WEB_CONCURRENCY", "")
+    SERVER_LOOP: str = os.getenv("SERVER_LOOP", "auto")
+    SERVER_HTTP: str = os.getenv("SERVER_HTTP", "auto")
+    SERVER_KEEP_ALIVE: str = os.getenv("SERVER_KEEP_ALIVE", "75")
+    SERVER_BACKLOG: str = os.getenv("SERVER_BACKLOG", "2048")
+    SERVER_MAX_REQUESTS: str = os.getenv("SERVER_MAX_REQUESTS", "0")
+    SERVER_GUNICORN: str = os.getenv("SERVER_GUNICORN", "")
+    FORWARDED_ALLOW_IPS: str = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
     DETA_PROJECT_KEY: str = os.getenv("DETA_PROJECT_KEY")  # type: ignore
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "deta")
+    STORAGE_LOCAL_PATH: str = os.getenv("STORAGE_LOCAL_PATH", "storage")
+    STORAGE_CACHE_PATH: str = os.getenv("STORAGE_CACHE_PATH", "")
+    STORAGE_CACHE_SIZE: str = os.getenv("STORAGE_CACHE_SIZE", "64")
+    PROFILE_IMAGE_MAX_SIZE: str = os.getenv("PROFILE_IMAGE_MAX_SIZE", "5")
     NYLAS_CLIENT_ID: str = os.getenv("NYLAS_CLIENT_ID")  # type: ignore
     NYLAS_CLIENT_SECRET: str = os.getenv("NYLAS_CLIENT_SECRET")  # type: ignore
     NYLAS_API_SERVER: str = os.getenv("NYLAS_API_SERVER")  # type: ignore
     CLIENT_URI: str = os.getenv("CLIENT_URI")  # type: ignore
     NYLAS_SYSTEM_TOKEN: str = os.getenv("NYLAS_SYSTEM_TOKEN")  # type: ignore
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY")  # type: ignore
+    OPENAI_API_BASE: str = os.getenv(
+        "OPENAI_API_BASE", "https://api.openai.com/v1"
+    )
+    OPENAI_TIMEOUT: str = os.getenv("OPENAI_TIMEOUT", "60")
+    OPENAI_MAX_RETRIES: str = os.getenv("OPENAI_MAX_RETRIES", "3")
+    OPENAI_MAX_CONCURRENT: str = os.getenv("OPENAI_MAX_CONCURRENT", "4")
+    OPENAI_REQUESTS_PER_MINUTE: str = os.getenv(
+        "OPENAI_REQUESTS_PER_MINUTE", "60"
+    )
+    OPENAI_TOKENS_PER_MINUTE: str = os.getenv(
+        "OPENAI_TOKENS_PER_MINUTE", "60000"
+    )
     RAPIDAPI_KEY: str = os.getenv("RAPIDAPI_KEY")  # type: ignore
+    JUDGE0_API_URL: str = os.getenv(
+        "JUDGE0_API_URL", "https://judge0-ce.p.rapidapi.com"
+    )
+    CODE_EXECUTOR: str = os.getenv("CODE_EXECUTOR", "judge0")
+    CODE_EXECUTOR_POOL_SIZE: str = os.getenv("CODE_EXECUTOR_POOL_SIZE", "4")
+    EXECUTION_CACHE_SIZE: str = os.getenv("EXECUTION_CACHE_SIZE", "1024")
+    EXECUTION_CACHE_PERSIST: str = os.getenv(
+        "EXECUTION_CACHE_PERSIST", "false"
+    )
+    EXECUTION_CACHE_TTL: str = os.getenv("EXECUTION_CACHE_TTL", "604800")
+    EXECUTION_MAX_CONCURRENT: str = os.getenv("EXECUTION_MAX_CONCURRENT", "16")
+    EXECUTION_MAX_PER_USER: str = os.getenv("EXECUTION_MAX_PER_USER", "2")
+    EXECUTION_MAX_QUEUE: str = os.getenv("EXECUTION_MAX_QUEUE", "64")
+    EXECUTION_MAX_WAIT: str = os.getenv("EXECUTION_MAX_WAIT", "10")
+    OUTBOX_WORKERS: str = os.getenv("OUTBOX_WORKERS", "4")
+    OUTBOX_ACCOUNT_RATE: str = os.getenv("OUTBOX_ACCOUNT_RATE", "30")
+    OUTBOX_MAX_ATTEMPTS: str = os.getenv("OUTBOX_MAX_ATTEMPTS", "5")
+    IDEMPOTENCY_TTL: str = os.getenv("IDEMPOTENCY_TTL", "86400")
+    BACKGROUND_TASKS_MAX_CONCURRENT: str = os.getenv(
+        "BACKGROUND_TASKS_MAX_CONCURRENT", "16"
+    )
+    SHUTDOWN_DRAIN_TIMEOUT: str = os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "20")
+    LEADER_LEASE_TTL: str = os.getenv("LEADER_LEASE_TTL", "30")
+    TUTORIAL_STOCK_SIZE: str = os.getenv("TUTORIAL_STOCK_SIZE", "5")
+    TUTORIAL_REFILL_HOUR: str = os.getenv("TUTORIAL_REFILL_HOUR", "3")
+    HEALTH_CACHE_TTL: str = os.getenv("HEALTH_CACHE_TTL", "2")
+    HEALTH_MAX_MONGO_LATENCY: str = os.getenv(
+        "HEALTH_MAX_MONGO_LATENCY", "0.5"
+    )
+    HEALTH_MAX_LOOP_LAG: str = os.getenv("HEALTH_MAX_LOOP_LAG", "0.5")
+    HEALTH_MAX_EXECUTION_QUEUE: str = os.getenv(
+        "HEALTH_MAX_EXECUTION_QUEUE", "48"
+    )
+    HEALTH_NYLAS_CRITICAL: str = os.getenv("HEALTH_NYLAS_CRITICAL", "")
+    PROFILER_SAMPLE_RATE: str = os.getenv("PROFILER_SAMPLE_RATE", "0")
+    PROFILER_TOKEN: str = os.getenv("PROFILER_TOKEN", "")
+    PROFILER_INTERVAL: str = os.getenv("PROFILER_INTERVAL", "0.01")
+    PROFILER_MAX_CONCURRENT: str = os.getenv("PROFILER_MAX_CONCURRENT", "2")
+    PROFILER_TTL: str = os.getenv("PROFILER_TTL", "604800")
 
     class Config:  # pylint: disable=R0903
         """
@@ -79,6 +260,8 @@ class Settings(BaseSettings):
             str: The assembled database URL.
         """
 
+        if self.MONGODB_URL:
+            return self.MONGODB_URL
         if self.DEBUG == "test":
             mongodb_database_url = (
                 "mongodb+srv://"
@@ -6,11 +6,17 @@ from fastapi import (
 from fastapi.middleware.cors import (
     CORSMiddleware,
 )
+from fastapi.responses import (
+    JSONResponse,
+    Response,
+)
 from functools import (
     lru_cache,
 )
 import logging
+import os
 from typing import (
+    Any,
     Dict,
 )
 import uvicorn
@@ -26,6 +32,9 @@ from src.users import (
 )
 from src.utils import (
     engine,
+    idempotency,
+    metrics,
+    profiler,
 )
 
 logger = logging.getLogger(__name__)
@@ -40,24 +49,6 @@ def get_app() -> FastAPI:
         FastAPI : a FastAPI app instance
     """
     app_settings = settings()
-    if app_settings.DEBUG == "info":
-        app = FastAPI(
-            docs_url="/docs",
-            redoc_url="/redocs",
-            title="Code Inbox Server",
-            description="The server side of Code Inbox.",
-            version="1.0",
-            openapi_url="/api/v1/openapi.json",
-        )
-    else:
-        app = FastAPI(
-            docs_url=None,
-            redoc_url=None,
-            title=None,
-            description=None,
-            version=None,
-            openapi_url=None,
-        )
     app = FastAPI(
         docs_url="/docs",
         redoc_url="/redocs",
@@ -76,21 +67,73 @@ def get_app() -> FastAPI:
 
     origins.extend(app_settings.cors_origins)
 
+    # Added first so that replayed responses still get the CORS headers.
+    app.add_middleware(idempotency.IdempotencyMiddleware)
     app.add_middleware(
         CORSMiddleware,
         allow_origins=origins,
         allow_methods=["*"],
         allow_headers=["*"],
     )
+    # Added last so that the profiles include the time spent in the others.
+    app.add_middleware(
+        profiler.ProfilerMiddleware,
+        sample_rate=float(app_settings.PROFILER_SAMPLE_RATE),
+        token=app_settings.PROFILER_TOKEN,
+        interval=float(app_settings.PROFILER_INTERVAL),
+        max_concurrent=int(app_settings.PROFILER_MAX_CONCURRENT),
+    )
 
     @app.on_event("startup")
     async def startup() -> None:
         logger.info("Connecting to MongoDB...")
         await engine.init_engine_app(app)
         logger.info("Connected to MongoDB!")
+        app.state.startup.log()
 
     @app.on_event("shutdown")
     async def shutdown() -> None:
+        logger.info("Draining the background tasks...")
+        try:
+            await app.state.tasks.drain(
+                float(app_settings.SHUTDOWN_DRAIN_TIMEOUT)
+            )
+        except Exception as err:
+            logger.error(repr(err))
+        logger.info("Stopping the scheduler...")
+        try:
+            await app.state.scheduler_lease.stop()
+            app.state.scheduler.shutdown(wait=False)
+        except Exception as err:
+            logger.error(repr(err))
+        logger.info("Stopping the outbound email workers...")
+        try:
+            await app.state.outbox.stop(
+                float(app_settings.SHUTDOWN_DRAIN_TIMEOUT)
+            )
+        except Exception as err:
+            logger.error(repr(err))
+        logger.info("Closing the OpenAI client...")
+        try:
+            await app.state.openai.close()
+        except Exception as err:
+            logger.error(repr(err))
+        logger.info("Closing the profile image storage...")
+        try:
+            await app.state.profile_images.close()
+        except Exception as err:
+            logger.error(repr(err))
+        logger.info("Stopping the health probes...")
+        try:
+            await app.state.loop_lag.stop()
+            await app.state.health.close()
+        except Exception as err:
+            logger.error(repr(err))
+        logger.info("Stopping the code executor...")
+        try:
+            await app.state.executor.close()
+        except Exception as err:
+            logger.error(repr(err))
         logger.info("Closing connection with MongoDB...")
         # bug: TypeError: object NoneType can't be used in 'await' expression
         try:
@@ -103,6 +146,22 @@ def get_app() -> FastAPI:
     async def root() -> Dict[str, str]:
         return {"message": "Welcome to Code Inbox Server."}
 
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics_endpoint() -> Response:
+        return metrics.metrics_response()
+
+    @app.get("/health/live")
+    async def liveness() -> Dict[str, str]:
+        return {"status": "ok"}
+
+    @app.get("/health/ready")
+    async def readiness() -> JSONResponse:
+        result = await app.state.health.readiness()
+        return JSONResponse(
+            result,
+            status_code=200 if app.state.health.is_ready(result) else 503,
+        )
+
     app.include_router(users_router.router, tags=["users"])
     app.include_router(nylas_router.router, tags=["nylas"])
 
@@ -114,20 +173,128 @@ code_app = get_app()
 
 def serve() -> None:
     """
-    A method that run a uvicorn command.
+    A method that runs the server.
+
+    In development, a single uvicorn worker reloads on code changes. In
+    production, `WEB_CONCURRENCY` workers are started without reload, either
+    by uvicorn or, with `SERVER_GUNICORN=true`, by gunicorn, which imports the
+    app once before forking.
     """
+    app_settings = settings()
+    metrics.clear_multiprocess_directory()
     try:
-        uvicorn.run(
-            "src.main:code_app",
-            host="0.0.0.0",
-            port=8000,
-            reload=True,
-            log_level="info",
-        )
+        if app_settings.SERVER_MODE == "development":
+            uvicorn.run(
+                "src.main:code_app",
+                host=app_settings.HOST,
+                port=int(app_settings.PORT),
+                reload=True,
+                log_level="info",
+            )
+        elif app_settings.SERVER_GUNICORN.lower() == "true":
+            serve_with_gunicorn()
+        else:
+            uvicorn.run(
+                "src.main:code_app",
+                host=app_settings.HOST,
+                port=int(app_settings.PORT),
+                workers=server_workers(),
+                log_level="info",
+                **server_options(),
+            )
     except Exception as err:
         logger.error(repr(err))
 
 
+def server_workers() -> int:
+    """
+    Get the number of worker processes.
+
+    Returns:
+        int: `WEB_CONCURRENCY`, or the number of CPUs.
+    """
+    return int(settings().WEB_CONCURRENCY or os.cpu_count() or 1)
+
+
+def server_options() -> Dict[str, Any]:
+    """
+    Get the uvicorn options of the production workers.
+
+    Returns:
+        Dict[str, Any]: The uvicorn configuration keyword arguments.
+    """
+    app_settings = settings()
+    return {
+        "loop": app_settings.SERVER_LOOP,
+        "http": app_settings.SERVER_HTTP,
+        "timeout_keep_alive": int(app_settings.SERVER_KEEP_ALIVE),
+        "backlog": int(app_settings.SERVER_BACKLOG),
+        "limit_max_requests": int(app_settings.SERVER_MAX_REQUESTS) or None,
+        # haproxy sits in front of the replicas.
+        "proxy_headers": True,
+        "forwarded_allow_ips": app_settings.FORWARDED_ALLOW_IPS,
+    }
+
+
+def serve_with_gunicorn() -> None:
+    """
+    Run the production workers under gunicorn, preloading the app in the
+    arbiter so the workers share its imported code.
+
+    Raises:
+        RuntimeError: If gunicorn is not installed.
+    """
+    try:
+        from gunicorn.app.base import (  # pylint: disable=C0415
+            BaseApplication,
+        )
+        from uvicorn.workers import (  # pylint: disable=C0415
+            UvicornWorker,
+        )
+    except ImportError as err:
+        raise RuntimeError(
+            "SERVER_GUNICORN=true requires gunicorn, "
+            "install it with `poetry install --extras gunicorn`."
+        ) from err
+
+    app_settings = settings()
+    options = server_options()
+    max_requests = options.pop("limit_max_requests") or 0
+
+    class Worker(UvicornWorker):
+        CONFIG_KWARGS = {
+            "loop": options["loop"],
+            "http": options["http"],
+            "proxy_headers": True,
+            "forwarded_allow_ips": options["forwarded_allow_ips"],
+        }
+
+    class Application(BaseApplication):
+        def load_config(self) -> None:
+            for name, value in {
+                "bind": f"{app_settings.HOST}:{app_settings.PORT}",
+                "workers": server_workers(),
+                "worker_class": Worker,
+                "preload_app": True,
+                "keepalive": options["timeout_keep_alive"],
+                "backlog": options["backlog"],
+                "max_requests": max_requests,
+                # Spread the restarts of workers started together.
+                "max_requests_jitter": max_requests // 10,
+                "graceful_timeout": int(app_settings.SHUTDOWN_DRAIN_TIMEOUT)
+                + 10,
+                "child_exit": lambda _, worker: metrics.mark_process_dead(
+                    worker.pid
+                ),
+            }.items():
+                self.cfg.set(name, value)
+
+        def load(self) -> FastAPI:
+            return code_app
+
+    Application().run()
+
+
 __all__ = [
     "serve",
     "code_app",
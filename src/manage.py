@@ -0,0 +1,97 @@
+"""🛠️ Management Commands Module 🧰
+
+This module contains one-off commands, run once per deployment instead of in every worker.
+
+Usage:
+    python -m src.manage register-app
+    python -m src.manage startup-report [--module src.main] [--top 15]
+
+Commands:
+    - register-app: Register the client URI as the redirect URI of the Nylas application.
+    - startup-report: Break down the import time of the server, per package.
+
+Dependencies:
+    - argparse: For parsing the command line.
+    - nylas.APIClient: For updating the Nylas application.
+    - src.config.settings: Application configuration settings.
+    - src.utils.startup: For timing the imports.
+
+"""
+
+import argparse
+import sys
+from typing import (
+    List,
+    Optional,
+)
+
+from nylas import (
+    APIClient,
+)
+from src.config import (
+    settings,
+)
+from src.utils import (
+    startup,
+)
+
+
+def register_app() -> None:
+    """
+    Register the client URI as the redirect URI of the Nylas application,
+    so the hosted authentication can redirect back to the client.
+    """
+    app_settings = settings()
+    client = APIClient(
+        app_settings.NYLAS_CLIENT_ID,
+        app_settings.NYLAS_CLIENT_SECRET,
+        api_server=app_settings.NYLAS_API_SERVER or "https://api.nylas.com",
+    )
+    client.update_application_details(redirect_uris=[app_settings.CLIENT_URI])
+    print(f"Registered {app_settings.CLIENT_URI} as the redirect URI.")
+
+
+def startup_report(module: str, top: int) -> None:
+    """
+    Print the import time of a module, per top-level package.
+
+    Args:
+        module (str): The imported module.
+        top (int): The number of packages listed.
+    """
+    timings = startup.measure_imports(module)
+    total = sum(seconds for _, seconds in timings)
+    print(f"Importing {module} took {total * 1000:.0f}ms")
+    for package, seconds in timings[:top]:
+        print(
+            f"  {package:<30} {seconds * 1000:8.1f}ms"
+            f" {seconds / total:6.1%}"
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Run a management command.
+
+    Args:
+        argv (Optional[List[str]]): The arguments, defaults to sys.argv.
+    """
+    parser = argparse.ArgumentParser(prog="python -m src.manage")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser(
+        "register-app", help="Register the Nylas redirect URI."
+    )
+    report = commands.add_parser(
+        "startup-report", help="Break down the server import time."
+    )
+    report.add_argument("--module", default="src.main")
+    report.add_argument("--top", type=int, default=15)
+    args = parser.parse_args(argv)
+    if args.command == "register-app":
+        register_app()
+    else:
+        startup_report(args.module, args.top)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
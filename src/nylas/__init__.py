@@ -5,8 +5,9 @@ Nylas package.
 from src.nylas import (
     crud,
     models,
+    outbox,
     router,
     schemas,
 )
 
-__all__ = ["crud", "models", "router", "schemas"]
+__all__ = ["crud", "models", "outbox", "router", "schemas"]
@@ -9,7 +9,7 @@ Dependencies:
     - odmantic.session: Database session.
     - pydantic: Data validation.
     - typing: Type hints.
-    - os: Operating System.
+    - src.nylas.outbox: The outbound email queue.
     - src.nylas.models: Nylas data models.
     - src.nylas.schemas: Nylas data schemas.
     - src.users.models: User data models.
@@ -34,7 +34,6 @@ from fastapi.encoders import (
 from odmantic.session import (
     AIOSession,
 )
-import os
 from pydantic import (
     EmailStr,
 )
@@ -44,11 +43,9 @@ from typing import (
     Optional,
 )
 
-from src.config import (
-    settings,
-)
 from src.nylas import (
     models as nylas_models,
+    outbox,
 )
 from src.users import (
     models as users_models,
@@ -212,62 +209,38 @@ async def find_existed_token(
         return None
 
 
-async def send_welcome_email(to: str) -> None:
+async def send_welcome_email(to: str, language: str) -> None:
     """
-    Send a welcome email to a specified recipient.
+    Queue a welcome email to a specified recipient.
 
     Args:
         to (str): The email address of the recipient.
+        language (str): The programming language chosen by the recipient.
 
-    This function sends a welcome email to a specified recipient using the Nylas API.
-    The email content is read from a static HTML file located in the "static" directory.
+    This function queues a welcome email to a specified recipient in the outbound
+    queue, which sends it with the system Nylas account.
+    The email content is rendered from the "welcome_email" template, compiled at startup.
 
     The email subject is set to "Welcome to Code Inbox 🚀", and the sender's email address
-    is retrieved from the Nylas account settings.
-
-    Note:
-    - Ensure that the HTML file for the welcome email is located in the "static" directory
-      and named "welcome_email.html".
-    - This function does not handle errors or exceptions related to sending the email.
+    is retrieved from the Nylas account settings when the email is sent.
 
     Example:
-        send_welcome_email("user@example.com")
+        send_welcome_email("user@example.com", "python")
     """
-    from src.main import (
+    from src.main import (  # pylint: disable=C0415
         code_app,
     )
 
-    # Store the initial access token
-    initial_token = code_app.state.nylas.access_token
-
-    # Set the Nylas access token to the system token
-    code_app.state.nylas.access_token = settings().NYLAS_SYSTEM_TOKEN
-
-    # Create a draft email
-    draft = code_app.state.nylas.drafts.create()
-
-    # Read the HTML content of the welcome email from a file
-    with open(
-        os.path.join(os.getcwd(), "static", "welcome_email.html"),
-        "r",
-        encoding="utf-8",
-    ) as file:
-        html_content = file.read()
-
-    # Set the email subject
-    draft["subject"] = "Welcome to Code Inbox 🚀"
-
-    # Set the recipient's email address
-    draft["to"] = [{"email": to}]
-
-    # Set the email body to the HTML content
-    draft["body"] = html_content
-
-    # Set the sender's email address from the Nylas account
-    draft["from"] = [{"email": code_app.state.nylas.account.email_address}]
-
-    # TODO: use draft.send_raw ???
-    draft.send()
+    html_content = code_app.state.templates.render(
+        "welcome_email", email=to, language=language
+    )
 
-    # Restore the initial access token
-    code_app.state.nylas.access_token = initial_token
+    await outbox.enqueue(
+        "system",
+        "system",
+        {
+            "subject": "Welcome to Code Inbox 🚀",
+            "to": [{"email": to}],
+            "body": html_content,
+        },
+    )
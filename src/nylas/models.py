@@ -1,9 +1,12 @@
 """🔑 Nylas Model Module
 
-This module defines the data model for Nylas access tokens.
+This module defines the data models for Nylas access tokens, code execution results and
+outbound emails.
 
 Classes:
     AccessToken: Represents an access token with user association.
+    CodeExecutionResult: Represents a cached code execution result.
+    OutboundEmail: Represents an email waiting in, or sent from, the outbound queue.
 """
 
 from bson import (
@@ -17,6 +20,8 @@ from odmantic import (
     Model,
 )
 from typing import (
+    Any,
+    Dict,
     List,
     Optional,
 )
@@ -41,3 +46,66 @@ class AccessToken(Model):
     tokens: List[str] = []
     creation_date: Optional[datetime] = Field(default_factory=datetime.utcnow)
     modified_date: Optional[datetime] = Field(default_factory=datetime.utcnow)
+
+
+class CodeExecutionResult(Model):
+    """The CodeExecutionResult model represents a cached code execution result.
+
+    Args:
+        Model (odmantic.Model): The base Odmantic model.
+
+    Attributes:
+        key (str): The content hash of the submission.
+        result (Dict[str, Any]): The Judge0-shaped execution result.
+        creation_date (Optional[datetime]): The creation date of the result
+            (default is the current UTC time).
+    """
+
+    key: str = Field(unique=True)
+    result: Dict[str, Any] = {}
+    creation_date: Optional[datetime] = Field(default_factory=datetime.utcnow)
+
+
+class OutboundEmail(Model):
+    """The OutboundEmail model represents an email in the outbound queue.
+
+    Args:
+        Model (odmantic.Model): The base Odmantic model.
+
+    Attributes:
+        kind (str): "send" and "reply" are sent with the user's access token,
+            "system" with the system token.
+        account (str): The sending account, which rate limits apply to.
+        owner (Optional[ObjectId]): The id of the user who queued the email.
+        access_token (Optional[str]): The token to send with, removed once
+            the email leaves the queue.
+        payload (Dict[str, Any]): The subject, recipients and body.
+        status (str): "queued", "sending", "sent" or "dead".
+        attempts (int): The number of delivery attempts so far.
+        next_attempt_at (datetime): When the email can be attempted next.
+        locked_until (Optional[datetime]): When the claim of a worker expires.
+        claim (Optional[str]): The token of the worker's claim.
+        last_error (str): The error of the last failed attempt.
+        message_id (Optional[str]): The id of the sent Nylas message.
+        creation_date (Optional[datetime]): When the email was queued
+            (default is the current UTC time).
+        modified_date (Optional[datetime]): The last status change
+            (default is the current UTC time).
+    """
+
+    kind: str
+    account: str
+    owner: Optional[ObjectId] = None
+    access_token: Optional[str] = None
+    payload: Dict[str, Any] = {}
+    status: str = Field(default="queued", index=True)
+    attempts: int = 0
+    next_attempt_at: datetime = Field(
+        default_factory=datetime.utcnow, index=True
+    )
+    locked_until: Optional[datetime] = None
+    claim: Optional[str] = None
+    last_error: str = ""
+    message_id: Optional[str] = None
+    creation_date: Optional[datetime] = Field(default_factory=datetime.utcnow)
+    modified_date: Optional[datetime] = Field(default_factory=datetime.utcnow)
@@ -0,0 +1,493 @@
+"""📤 Nylas Outbox Module 📮
+
+This module contains the durable outbound email queue.
+
+Emails are stored in MongoDB before anything is sent, so the endpoints answer right away
+and a crash or a Nylas outage does not lose messages. Every process runs a small pool of
+workers which atomically claim due emails, send them through Nylas in a thread pool and
+record the outcome. Sends are rate limited per sending account: workers do not claim the
+emails of an account that is out of budget, so a large fan-out from one account (e.g. the
+digests sent from the system account) waits in the queue instead of holding every worker.
+Transient failures are retried with exponential backoff, and emails that keep failing, or
+that Nylas rejects outright, are dead-lettered with their last error. A claim expires if
+its worker dies, so the email is picked up again by another worker: delivery is at least
+once. Every claim carries a token which the outcome must match, so a worker whose claim
+expired cannot overwrite the outcome of the worker that claimed the email after it.
+
+Classes:
+    - OutboxWorkerPool: Drains the queue.
+
+Functions:
+    - enqueue(kind, account, payload, access_token, owner) -> OutboundEmail: Queue an email.
+    - is_retryable(err: Exception) -> bool: Whether a failed send should be retried.
+    - system_sender(client: APIClient) -> str: The address of the system account.
+    - resolve_system_sender(client: APIClient) -> Optional[str]: Look it up without blocking.
+    - deliver(client, email, sender) -> Optional[str]: Send an email.
+
+Dependencies:
+    - asyncio: For the workers.
+    - motor.motor_asyncio.AsyncIOMotorCollection: For atomic claims.
+    - nylas.APIClient: For sending emails.
+    - src.nylas.models: The OutboundEmail model.
+    - src.utils.rate_limit: For the per-account rate limits.
+
+"""
+
+import asyncio
+from bson import (
+    ObjectId,
+)
+from datetime import (
+    datetime,
+    timedelta,
+)
+import logging
+from motor.motor_asyncio import (
+    AsyncIOMotorCollection,
+)
+from pymongo import (
+    ReturnDocument,
+)
+import random
+import requests
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+)
+import uuid
+
+from nylas import (
+    APIClient,
+)
+from nylas.client.errors import (
+    MessageRejectedError,
+    RateLimitError,
+)
+from src.nylas import (
+    models as nylas_models,
+)
+from src.utils import (
+    rate_limit,
+)
+
+logger = logging.getLogger(__name__)
+
+# The number of seconds a worker has to send a claimed email before another
+# worker can claim it again.
+CLAIM_TIMEOUT = 120
+
+# The number of seconds an idle worker waits before polling the queue again.
+POLL_INTERVAL = 2
+
+# The number of seconds the workers have to finish their sends when stopping.
+STOP_TIMEOUT = 10
+
+# The number of seconds to wait for the address of the system account.
+SENDER_TIMEOUT = 5
+
+# Upstream statuses worth retrying, anything else in 4xx is permanent.
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+async def enqueue(
+    kind: str,
+    account: str,
+    payload: Dict[str, Any],
+    access_token: Optional[str] = None,
+    owner: Optional[ObjectId] = None,
+) -> nylas_models.OutboundEmail:
+    """
+    Store an email in the outbound queue.
+
+    Args:
+        kind (str): "send", "reply" or "system".
+        account (str): The sending account.
+        payload (Dict[str, Any]): The subject, recipients and body.
+        access_token (Optional[str]): The token to send with, if not "system".
+        owner (Optional[ObjectId]): The id of the user queuing the email.
+
+    Returns:
+        nylas_models.OutboundEmail: The queued email.
+    """
+    from src.main import (  # pylint: disable=C0415
+        code_app,
+    )
+
+    email = await code_app.state.engine.save(
+        nylas_models.OutboundEmail(
+            kind=kind,
+            account=account,
+            payload=payload,
+            access_token=access_token,
+            owner=owner,
+        )
+    )
+    outbox = getattr(code_app.state, "outbox", None)
+    if outbox is not None:
+        outbox.notify()
+    return email
+
+
+def is_retryable(err: Exception) -> bool:
+    """
+    Whether a failed send should be retried.
+
+    Args:
+        err (Exception): The error raised by the send.
+
+    Returns:
+        bool: False for requests Nylas rejected outright.
+    """
+    if isinstance(err, MessageRejectedError):
+        return False
+    if isinstance(err, RateLimitError):
+        return True
+    response = getattr(err, "response", None)
+    if isinstance(err, requests.HTTPError) and response is not None:
+        return (
+            response.status_code >= 500
+            or response.status_code in RETRYABLE_STATUS_CODES
+        )
+    return isinstance(err, (requests.RequestException, OSError))
+
+
+def system_sender(client: APIClient) -> str:
+    """
+    Look up the address of the system account; blocks.
+
+    Args:
+        client (APIClient): A Nylas client holding the system token.
+
+    Returns:
+        str: The email address of the account.
+    """
+    return str(client.account.email_address)
+
+
+async def resolve_system_sender(
+    client: APIClient, timeout: float = SENDER_TIMEOUT
+) -> Optional[str]:
+    """
+    Look up the address of the system account in a thread pool.
+
+    Args:
+        client (APIClient): A Nylas client holding the system token.
+        timeout (float): The number of seconds to wait for Nylas.
+
+    Returns:
+        Optional[str]: The email address, None if Nylas did not answer.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        return await asyncio.wait_for(
+            loop.run_in_executor(None, system_sender, client), timeout
+        )
+    except Exception as err:  # pylint: disable=W0703
+        logger.warning("Failed to look up the system sender: %r", err)
+        return None
+
+
+def deliver(
+    client: APIClient, email: Dict[str, Any], sender: str
+) -> Optional[str]:
+    """
+    Send a queued email; blocks, so it runs in a thread pool.
+
+    Args:
+        client (APIClient): A Nylas client holding the sending token.
+        email (Dict[str, Any]): The queued email document.
+        sender (str): The address the email is sent from.
+
+    Returns:
+        Optional[str]: The id of the sent message.
+    """
+    payload = email["payload"]
+    if email["kind"] == "reply":
+        thread = client.threads.get(payload["thread_id"])
+        draft = thread.create_reply()
+        draft.body = payload["body"]
+        draft.cc = thread.cc
+        draft.bcc = thread.bcc
+        # The thread has no from_ attribute, so leave the sender out by hand.
+        draft.to = [
+            participant
+            for participant in thread.participants
+            if participant.get("email") != email["account"]
+        ]
+    else:
+        draft = client.drafts.create()
+        draft["subject"] = payload["subject"]
+        draft["to"] = payload["to"]
+        if payload.get("cc"):
+            draft["cc"] = payload["cc"]
+        if payload.get("bcc"):
+            draft["bcc"] = payload["bcc"]
+        draft["body"] = payload["body"]
+        draft["from"] = [{"email": sender}]
+    message = draft.send() or {}
+    return message.get("id")
+
+
+class OutboxWorkerPool:
+    """
+    Drains the outbound queue with a pool of workers.
+
+    Args:
+        collection (AsyncIOMotorCollection): The outbound emails collection.
+        client_factory (Callable[[Optional[str]], APIClient]): Builds a Nylas
+            client for an access token, None meaning the system token.
+        size (int): The number of workers.
+        per_account_per_minute (float): The number of emails an account can
+            send per minute from this process, 0 means unlimited.
+        max_attempts (int): The number of attempts before dead-lettering.
+        backoff (float): The base delay between attempts, in seconds.
+        max_backoff (float): The maximum delay between attempts, in seconds.
+        system_sender (Optional[str]): The address of the system account,
+            looked up on the first system email if None.
+    """
+
+    def __init__(
+        self,
+        collection: AsyncIOMotorCollection,
+        client_factory: Callable[[Optional[str]], APIClient],
+        size: int = 4,
+        per_account_per_minute: float = 30,
+        max_attempts: int = 5,
+        backoff: float = 5,
+        max_backoff: float = 600,
+        system_sender: Optional[str] = None,
+    ) -> None:
+        self.collection = collection
+        self.client_factory = client_factory
+        self.size = size
+        self.per_account_per_minute = per_account_per_minute
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.system_sender = system_sender
+        self.stats = {"sent": 0, "retried": 0, "dead": 0}
+        self._buckets: Dict[str, rate_limit.TokenBucket] = {}
+        self._wakeup = asyncio.Event()
+        self._tasks: List["asyncio.Task[None]"] = []
+        self._stopping = False
+
+    def notify(self) -> None:
+        """
+        Wake the idle workers up, e.g. after queuing an email.
+        """
+        self._wakeup.set()
+
+    def _bucket(self, account: str) -> rate_limit.TokenBucket:
+        if account not in self._buckets:
+            self._buckets[account] = rate_limit.TokenBucket(
+                self.per_account_per_minute
+            )
+        return self._buckets[account]
+
+    def retry_delay(self, attempts: int) -> float:
+        """
+        Compute the delay before the next attempt.
+
+        Args:
+            attempts (int): The number of attempts so far.
+
+        Returns:
+            float: The number of seconds, with jitter.
+        """
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempts - 1))
+        return random.uniform(delay / 2, delay)
+
+    def throttled_accounts(self) -> List[str]:
+        """
+        List the accounts that cannot send from this process right now.
+
+        Returns:
+            List[str]: The accounts whose bucket is empty.
+        """
+        return [
+            account
+            for account, bucket in self._buckets.items()
+            if bucket.wait_time(1) > 0
+        ]
+
+    async def claim(self) -> Optional[Dict[str, Any]]:
+        """
+        Atomically claim the next due email, including emails whose previous
+        claim expired, skipping the accounts that are out of budget. The claim
+        token is stored in the email's `claim` field.
+
+        Returns:
+            Optional[Dict[str, Any]]: The claimed email document, if any.
+        """
+        now = datetime.utcnow()
+        query: Dict[str, Any] = {
+            "$or": [
+                {"status": "queued", "next_attempt_at": {"$lte": now}},
+                {"status": "sending", "locked_until": {"$lt": now}},
+            ]
+        }
+        throttled = self.throttled_accounts()
+        if throttled:
+            query["account"] = {"$nin": throttled}
+        return await self.collection.find_one_and_update(
+            query,
+            {
+                "$set": {
+                    "status": "sending",
+                    "locked_until": now + timedelta(seconds=CLAIM_TIMEOUT),
+                    "claim": uuid.uuid4().hex,
+                    "modified_date": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("next_attempt_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def process(self, email: Dict[str, Any]) -> None:
+        """
+        Send a claimed email and record the outcome.
+
+        Args:
+            email (Dict[str, Any]): The claimed email document.
+        """
+        loop = asyncio.get_running_loop()
+        now = datetime.utcnow
+        # Only the outcome of the latest claim is recorded.
+        claimed = {"_id": email["_id"], "claim": email["claim"]}
+        wait = self._bucket(email["account"]).try_acquire(1)
+        if wait > 0:
+            # Another worker took the account's budget since the claim: give
+            # the email back, with its attempt, rather than wait for it here.
+            await self.collection.update_one(
+                claimed,
+                {
+                    "$set": {
+                        "status": "queued",
+                        "next_attempt_at": now() + timedelta(seconds=wait),
+                        "modified_date": now(),
+                    },
+                    "$inc": {"attempts": -1},
+                    "$unset": {"locked_until": "", "claim": ""},
+                },
+            )
+            return
+        try:
+            client = self.client_factory(email.get("access_token"))
+            sender = email["account"]
+            if email["kind"] == "system":
+                if self.system_sender is None:
+                    self.system_sender = await loop.run_in_executor(
+                        None, system_sender, client
+                    )
+                sender = self.system_sender
+            message_id = await loop.run_in_executor(
+                None, deliver, client, email, sender
+            )
+        except Exception as err:  # pylint: disable=W0703
+            error = repr(err)
+            if email["attempts"] >= self.max_attempts or not is_retryable(err):
+                logger.error(
+                    "Dead-lettering email %s: %s", email["_id"], error
+                )
+                self.stats["dead"] += 1
+                update: Dict[str, Any] = {
+                    "$set": {
+                        "status": "dead",
+                        "last_error": error,
+                        "modified_date": now(),
+                    },
+                    "$unset": {
+                        "access_token": "",
+                        "locked_until": "",
+                        "claim": "",
+                    },
+                }
+            else:
+                delay = self.retry_delay(email["attempts"])
+                logger.warning(
+                    "Retrying email %s in %.0fs: %s",
+                    email["_id"],
+                    delay,
+                    error,
+                )
+                self.stats["retried"] += 1
+                update = {
+                    "$set": {
+                        "status": "queued",
+                        "last_error": error,
+                        "next_attempt_at": now() + timedelta(seconds=delay),
+                        "modified_date": now(),
+                    },
+                    "$unset": {"locked_until": "", "claim": ""},
+                }
+        else:
+            self.stats["sent"] += 1
+            update = {
+                "$set": {
+                    "status": "sent",
+                    "message_id": message_id,
+                    "modified_date": now(),
+                },
+                "$unset": {
+                    "access_token": "",
+                    "locked_until": "",
+                    "claim": "",
+                },
+            }
+        await self.collection.update_one(claimed, update)
+
+    async def _work(self) -> None:
+        while not self._stopping:
+            try:
+                email = await self.claim()
+            except Exception as err:  # pylint: disable=W0703
+                logger.error(repr(err))
+                email = None
+            if email is None:
+                self._wakeup.clear()
+                if self._stopping:
+                    break
+                try:
+                    await asyncio.wait_for(
+                        self._wakeup.wait(), timeout=POLL_INTERVAL
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self.process(email)
+            except Exception as err:  # pylint: disable=W0703
+                # The claim expires and another attempt is made later.
+                logger.error(repr(err))
+
+    def start(self) -> None:
+        """
+        Start the workers in the background.
+        """
+        if not self._tasks:
+            self._stopping = False
+            self._tasks = [
+                asyncio.ensure_future(self._work()) for _ in range(self.size)
+            ]
+
+    async def stop(self, timeout: float = STOP_TIMEOUT) -> None:
+        """
+        Stop claiming emails and wait for the emails being sent, then stop the
+        workers. Emails still being sent after `timeout` are claimed again
+        once their claim expires.
+
+        Args:
+            timeout (float): The number of seconds to wait for the sends.
+        """
+        self._stopping = True
+        self.notify()
+        if self._tasks:
+            _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -1,12 +1,19 @@
 """Nylas router module."""
 
 import asyncio
+from bson import (
+    ObjectId,
+)
 from fastapi import (
     APIRouter,
     Depends,
+    Header,
     HTTPException,
+    Response,
+    status,
 )
 import httpx
+import logging
 from odmantic.session import (
     AIOSession,
 )
@@ -21,6 +28,8 @@ from src.config import (
 )
 from src.nylas import (
     crud as nylas_crud,
+    models as nylas_models,
+    outbox,
     schemas as nylas_schemas,
 )
 from src.users import (
@@ -28,18 +37,14 @@ from src.users import (
 )
 from src.utils import (
     dependencies,
+    executors,
+    judge0,
+    metrics,
 )
 
-router = APIRouter(prefix="/api/v1")
-
-JUDGE0_API_URL = "https://judge0-ce.p.rapidapi.com/submissions"
-
-headers = {
-    "X-RapidAPI-Key": settings().RAPIDAPI_KEY,
-    "Content-Type": "application/json",
-}
+logger = logging.getLogger(__name__)
 
-submission_status_dict = {}
+router = APIRouter(prefix="/api/v1", route_class=metrics.InstrumentedRoute)
 
 
 @router.post(
@@ -131,10 +136,30 @@ async def get_message(
     return message.as_json(enforce_read_only=False)
 
 
+def outbox_handle(email: nylas_models.OutboundEmail) -> Dict[str, Any]:
+    """
+    Describe a queued email to its sender.
+
+    Args:
+        email (nylas_models.OutboundEmail): The queued email.
+
+    Returns:
+        Dict[str, Any]: The email id, status, attempts and outcome.
+    """
+    return {
+        "id": str(email.id),
+        "status": email.status,
+        "attempts": email.attempts,
+        "last_error": email.last_error,
+        "message_id": email.message_id,
+        "creation_date": email.creation_date,
+    }
+
+
 @router.post(
     "/nylas/send-email",
     response_model=Dict[str, Any],
-    status_code=200,
+    status_code=status.HTTP_202_ACCEPTED,
     name="nylas:send-email",
 )
 async def send_email(
@@ -142,25 +167,59 @@ async def send_email(
     current_user: users_schemas.UserObjectSchema = Depends(
         dependencies.get_current_user
     ),
+    authorization: str = Header(None),
 ) -> Dict[str, Any]:
     """
-    Sends an email on behalf of the user using their access token.
+    Queues an email sent on behalf of the user using their access token.
+    """
+    payload: Dict[str, Any] = {
+        "subject": request_body.subject,
+        "to": [{"email": item.email} for item in request_body.to],
+        "body": request_body.message,
+    }
+    if request_body.cc:
+        payload["cc"] = [{"email": request_body.cc}]
+    if request_body.bcc:
+        payload["bcc"] = [{"email": request_body.bcc}]
+    email = await outbox.enqueue(
+        "send",
+        current_user.email,
+        payload,
+        access_token=authorization,
+        owner=ObjectId(current_user.id),
+    )
+    return outbox_handle(email)
+
+
+@router.get(
+    "/nylas/outbox/{email_id}",
+    response_model=Dict[str, Any],
+    status_code=200,
+    name="nylas:outbox",
+)
+async def get_outbound_email(
+    email_id: str,
+    current_user: users_schemas.UserObjectSchema = Depends(
+        dependencies.get_current_user
+    ),
+) -> Dict[str, Any]:
+    """
+    Get the status of an email queued by the user.
     """
     from src.main import (
         code_app,
     )
 
-    draft = code_app.state.nylas.drafts.create()
-    draft["subject"] = request_body.subject
-    draft["to"] = [{"email": item.email} for item in request_body.to]
-    if request_body.cc:
-        draft["cc"] = [{"email": request_body.cc}]
-    if request_body.bcc:
-        draft["bcc"] = [{"email": request_body.bcc}]
-    draft["body"] = request_body.message
-    draft["from"] = [{"email": current_user.email}]
-    message = draft.send()
-    return message
+    email = None
+    if ObjectId.is_valid(email_id):
+        email = await code_app.state.engine.find_one(
+            nylas_models.OutboundEmail,
+            nylas_models.OutboundEmail.id == ObjectId(email_id),
+            nylas_models.OutboundEmail.owner == ObjectId(current_user.id),
+        )
+    if email is None:
+        raise HTTPException(status_code=404, detail="Email not found")
+    return outbox_handle(email)
 
 
 @router.get(
@@ -257,7 +316,7 @@ async def update_folder(
 @router.post(
     "/nylas/reply-email",
     response_model=Dict[str, Any],
-    status_code=200,
+    status_code=status.HTTP_202_ACCEPTED,
     name="nylas:reply-email",
 )
 async def reply_email(
@@ -265,27 +324,19 @@ async def reply_email(
     current_user: users_schemas.UserObjectSchema = Depends(
         dependencies.get_current_user
     ),
+    authorization: str = Header(None),
 ) -> Dict[str, Any]:
     """
-    Sends a reply on behalf of the user using their access token.
+    Queues a reply sent on behalf of the user using their access token.
     """
-    from src.main import (
-        code_app,
+    email = await outbox.enqueue(
+        "reply",
+        current_user.email,
+        {"thread_id": request_body.thread_id, "body": request_body.body},
+        access_token=authorization,
+        owner=ObjectId(current_user.id),
     )
-
-    thread = code_app.state.nylas.threads.get(request_body.thread_id)
-    draft = thread.create_reply()
-    draft.body = request_body.body
-    draft.cc = thread.cc
-    draft.bcc = thread.bcc
-    # a hack to remove the current user from the to list cause thread has no from_ attribute
-    for participant in thread.participants:
-        if participant.get("email") == current_user.email:
-            thread.participants.remove(participant)
-    draft.to = thread.participants
-    # draft.from_ = [{'email': current_user.email}]
-    message = draft.send()
-    return message
+    return outbox_handle(email)
 
 
 @router.get(
@@ -346,6 +397,28 @@ async def search_emails(
     return res_json
 
 
+@router.get(
+    "/nylas/execute-code/queue",
+    response_model=Dict[str, Any],
+    status_code=200,
+    name="nylas:execute-code-queue",
+)
+async def execution_queue(
+    current_user: users_schemas.UserObjectSchema = Depends(
+        dependencies.get_current_user
+    ),
+) -> Dict[str, Any]:
+    """
+    Reports the code execution queue, and the position and estimated wait a
+    new execution of the current user would get.
+    """
+    from src.main import (
+        code_app,
+    )
+
+    return code_app.state.admission.snapshot(current_user.email)
+
+
 @router.post(
     "/nylas/execute-code",
     response_model=None,
@@ -354,65 +427,75 @@ async def search_emails(
 )
 async def execute_code(
     request_body: nylas_schemas.CodeExecutionSchema,
+    response: Response,
     current_user: users_schemas.UserObjectSchema = Depends(
         dependencies.get_current_user
     ),
 ) -> Any:
-    try:
-        payload = {
-            "source_code": request_body.code,
-            "language_id": int(request_body.language_id),
-            "stdin": "",
-            "expected_output": "",
-            "cpu_time_limit": 2,
-            "cpu_extra_time": 0.5,
-            "wall_time_limit": 5,
-            "memory_limit": 512000,
-        }
-
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                JUDGE0_API_URL,
-                json=payload,
-                headers=headers,
-            )
+    """
+    Runs a program with the configured code execution backend.
+    """
+    from src.main import (
+        code_app,
+    )
 
-        if response.status_code == 201:
-            submission_token = response.json()["token"]
-            submission_status_dict[submission_token] = "Running"
-            timeout = 60
-            start_time = asyncio.get_event_loop().time()
-            result = None
-            while submission_status_dict.get(submission_token) == "Running":
-                await asyncio.sleep(1)
-
-                if asyncio.get_event_loop().time() - start_time > timeout:
-                    submission_status_dict[submission_token] = "Timeout"
-                    break
-
-                async with httpx.AsyncClient() as client:
-                    new_response = await client.get(
-                        f"{JUDGE0_API_URL}/{submission_token}",
-                        headers=headers,
-                    )
-
-                if new_response.status_code == 200:
-                    print(new_response.json())
-                    submission_stdout = new_response.json()["stdout"]
-                    if submission_stdout:
-                        submission_status_dict[submission_token] = "Finished"
-                        result = new_response.json()
-                        break
-                else:
-                    return HTTPException(
-                        status_code=500, detail="Failed to retrieve result"
-                    )
-            return result
-        else:
-            return HTTPException(
-                status_code=500, detail="Code execution failed"
+    async with code_app.state.admission.slot(current_user.email) as slot:
+        response.headers.update(slot.headers)
+        try:
+            submission = judge0.build_submission(
+                request_body.code, int(request_body.language_id)
             )
+            return await code_app.state.executor.run(submission)
+        except Exception as e:
+            print(e)
+            return HTTPException(status_code=500, detail=str(e))
 
-    except Exception as e:
-        print(e)
-        return HTTPException(status_code=500, detail=str(e))
+
+@router.post(
+    "/nylas/execute-code/batch",
+    response_model=Dict[str, Any],
+    status_code=200,
+    name="nylas:execute-code-batch",
+)
+async def execute_code_batch(
+    request_body: nylas_schemas.BatchCodeExecutionSchema,
+    response: Response,
+    current_user: users_schemas.UserObjectSchema = Depends(
+        dependencies.get_current_user
+    ),
+) -> Dict[str, Any]:
+    """
+    Runs one program against several test cases as a single batch, with a
+    single polling loop on Judge0, then reports which cases passed.
+    """
+    from src.main import (
+        code_app,
+    )
+
+    test_cases = [test_case.dict() for test_case in request_body.test_cases]
+    submissions = [
+        judge0.build_submission(
+            request_body.code,
+            int(request_body.language_id),
+            test_case["stdin"],
+            test_case["expected_output"],
+        )
+        for test_case in test_cases
+    ]
+    async with code_app.state.admission.slot(current_user.email) as slot:
+        response.headers.update(slot.headers)
+        start_time = asyncio.get_event_loop().time()
+        try:
+            results = await code_app.state.executor.run_batch(submissions)
+        except executors.UnsupportedLanguageError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except (
+            executors.ExecutionError,
+            judge0.Judge0Error,
+            httpx.HTTPError,
+        ) as e:
+            logger.warning("Batch code execution failed: %r", e)
+            raise HTTPException(status_code=502, detail=str(e))
+    return judge0.summarize_batch(
+        test_cases, results, asyncio.get_event_loop().time() - start_time
+    )
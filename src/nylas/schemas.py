@@ -89,3 +89,26 @@ class ReplyEmailSchema(BaseModel):
 class CodeExecutionSchema(BaseModel):
     code: str = Field(..., description="code", example="print('hi')")
     language_id: str = Field(..., description="language id", example="71")
+
+
+class TestCaseSchema(BaseModel):
+    stdin: str = Field("", description="standard input", example="3\n")
+    expected_output: str = Field(
+        "", description="expected output", example="6\n"
+    )
+
+
+class BatchCodeExecutionSchema(BaseModel):
+    code: str = Field(
+        ..., description="code", example="print(int(input()) * 2)"
+    )
+    language_id: str = Field(
+        ..., description="language id", example="71", regex=r"^\d+$"
+    )
+    test_cases: List[TestCaseSchema] = Field(
+        ...,
+        description="test cases",
+        min_items=1,
+        max_items=20,
+        example=[{"stdin": "3\n", "expected_output": "6\n"}],
+    )
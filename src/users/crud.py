@@ -6,10 +6,12 @@ operations related to user data.
 Functions:
     - remove_token(user_id: ObjectId, token: str, session: AIOSession)
         -> None: Remove a token from a user's token list.
-    - update_profile_picture(email: EmailStr, file_name: str, session: AIOSession)
-        -> None: Update a user's profile picture.
+    - update_profile_picture(email: EmailStr, file_name: str, variants: Dict[str, str],
+        content_hash: str, session: AIOSession) -> None: Update a user's profile picture.
     - update_user_info(personal_info: users_schemas.PersonalInfo, current_user:
         users_schemas.UserObjectSchema, session: AIOSession) -> None: Update a user's personal information.
+    - get_completion_usage(since: datetime, session: AIOSession)
+        -> List[Dict[str, Any]]: Aggregate the OpenAI usage per purpose and model.
 
 Dependencies:
     - bson.ObjectId: For working with MongoDB ObjectIds.
@@ -37,6 +39,11 @@ from odmantic.session import (
 from pydantic import (
     EmailStr,
 )
+from typing import (
+    Any,
+    Dict,
+    List,
+)
 
 from src.nylas import (
     models as nylas_models,
@@ -76,7 +83,11 @@ async def remove_token(
 
 
 async def update_profile_picture(
-    email: EmailStr, file_name: str, session: AIOSession
+    email: EmailStr,
+    file_name: str,
+    variants: Dict[str, str],
+    content_hash: str,
+    session: AIOSession,
 ) -> None:
     """Update Profile Picture
 
@@ -85,12 +96,16 @@ async def update_profile_picture(
     Args:
         email (EmailStr): User's email address.
         file_name (str): Relative image file path stored on a Deta drive.
+        variants (Dict[str, str]): The ETags of the stored variants, by name.
+        content_hash (str): The SHA-256 of the uploaded image.
         session (AIOSession): An odmantic session object.
     """
     user = await session.find_one(
         users_models.User, users_models.User.email == email
     )
     user.profile_picture = file_name
+    user.profile_picture_variants = variants
+    user.profile_picture_hash = content_hash
     await session.save(user)
 
 
@@ -119,3 +134,42 @@ async def update_user_info(
         }
     )
     await session.save(current_user)
+
+
+async def get_completion_usage(
+    since: datetime, session: AIOSession
+) -> List[Dict[str, Any]]:
+    """Get Completion Usage
+
+    Aggregate the OpenAI completions recorded since a given date.
+
+    Args:
+        since (datetime): The start of the period.
+        session (AIOSession): An odmantic session object.
+
+    Returns:
+        List[Dict[str, Any]]: The requests, errors, tokens and latencies of
+            each purpose and model.
+    """
+    collection = session.engine.get_collection(users_models.CompletionUsage)
+    cursor = collection.aggregate(
+        [
+            {"$match": {"creation_date": {"$gte": since}}},
+            {
+                "$group": {
+                    "_id": {"purpose": "$purpose", "model": "$model"},
+                    "requests": {"$sum": 1},
+                    "errors": {"$sum": {"$cond": ["$success", 0, 1]}},
+                    "prompt_tokens": {"$sum": "$prompt_tokens"},
+                    "completion_tokens": {"$sum": "$completion_tokens"},
+                    "average_latency": {"$avg": "$latency"},
+                    "max_latency": {"$max": "$latency"},
+                    "throttled": {"$sum": "$throttled"},
+                }
+            },
+        ],
+        session=session.get_driver_session(),
+    )
+    return [
+        {**group.pop("_id"), **group} for group in await cursor.to_list(None)
+    ]
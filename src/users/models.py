@@ -6,6 +6,9 @@ Classes:
     - UserStatus (enum): Enumeration of user statuses (ACTIVE or DISABLED).
     - UserRole (enum): Enumeration of user roles (REGULAR or ADMIN).
     - User (odmantic.Model): Represents a user with various attributes.
+    - Tutorial (odmantic.Model): Represents a pre-generated algorithm tutorial.
+    - TutorialDelivery (odmantic.Model): Represents a tutorial sent to a user.
+    - CompletionUsage (odmantic.Model): Represents the usage of an OpenAI completion.
 
 Attributes:
     - __all__ (list): List of symbols exported by this module.
@@ -14,11 +17,15 @@ Dependencies:
     - datetime: For handling date and time.
     - enum: For defining enumerations.
     - odmantic: For defining data models.
+    - bson.ObjectId: For referencing documents.
     - pydantic.EmailStr: For validating email addresses.
-    - typing.Optional: For indicating optional fields.
+    - typing: For type hints.
 
 """
 
+from bson import (
+    ObjectId,
+)
 from datetime import (
     datetime,
 )
@@ -31,6 +38,7 @@ from pydantic import (
     EmailStr,
 )
 from typing import (
+    Dict,
     Optional,
 )
 
@@ -76,6 +84,8 @@ class User(Model):
         - bio (Optional[str]): User's bio.
         - email (EmailStr): User's email address.
         - profile_picture (Optional[str]): URL to the user's profile picture.
+        - profile_picture_variants (Dict[str, str]): ETags of the profile picture variants.
+        - profile_picture_hash (Optional[str]): SHA-256 of the uploaded profile picture.
         - phone_number (Optional[str]): User's phone number.
         - programming_language (Optional[str]): User's programming language.
         - calendar (Optional[str]): User's calendar ID.
@@ -95,6 +105,13 @@ class User(Model):
     profile_picture: Optional[str] = Field(
         default="", description="URL to the user's profile picture."
     )
+    profile_picture_variants: Dict[str, str] = Field(
+        default_factory=dict,
+        description="ETags of the user's profile picture variants, by name.",
+    )
+    profile_picture_hash: Optional[str] = Field(
+        default="", description="SHA-256 of the uploaded profile picture."
+    )
     phone_number: Optional[str] = Field(
         default="", description="User's phone number."
     )
@@ -126,8 +143,92 @@ class User(Model):
     )
 
 
+class Tutorial(Model):
+    """📚 Tutorial Model
+
+    This model represents an algorithm tutorial generated ahead of time.
+
+    Fields:
+        - language (str): Programming language of the code samples.
+        - topic (str): Normalized topic of the tutorial, used to avoid repeats.
+        - title (str): Title of the tutorial.
+        - html_content (str): The tutorial as an HTML document.
+        - creation_date (Optional[datetime]): Tutorial's creation date (auto-generated).
+
+    """
+
+    language: str = Field(index=True, description="Programming language.")
+    topic: str = Field(index=True, description="Normalized tutorial topic.")
+    title: str = Field(default="", description="Tutorial title.")
+    html_content: str = Field(description="The tutorial as an HTML document.")
+    creation_date: Optional[datetime] = Field(
+        default_factory=datetime.utcnow,
+        description="Tutorial's creation date.",
+    )
+
+
+class TutorialDelivery(Model):
+    """📨 TutorialDelivery Model
+
+    This model records a tutorial sent to a user.
+
+    Fields:
+        - email (EmailStr): Recipient's email address.
+        - language (str): Programming language of the tutorial.
+        - tutorial (ObjectId): Id of the sent tutorial.
+        - topic (str): Normalized topic of the sent tutorial.
+        - sent_date (Optional[datetime]): When the tutorial was sent (auto-generated).
+
+    """
+
+    email: EmailStr = Field(index=True, description="Recipient's email.")
+    language: str = Field(description="Programming language.")
+    tutorial: ObjectId = Field(description="Id of the sent tutorial.")
+    topic: str = Field(description="Normalized tutorial topic.")
+    sent_date: Optional[datetime] = Field(
+        default_factory=datetime.utcnow,
+        description="When the tutorial was sent.",
+    )
+
+
+class CompletionUsage(Model):
+    """🧮 CompletionUsage Model
+
+    This model records the usage and latency of an OpenAI completion.
+
+    Fields:
+        - model (str): The language model used.
+        - purpose (str): What the completion was for, e.g. "tutorial".
+        - language (str): Programming language of the generated content.
+        - prompt_tokens (int): Number of tokens in the prompt.
+        - completion_tokens (int): Number of tokens in the completion.
+        - latency (float): Seconds spent waiting for the API, retries included.
+        - throttled (float): Seconds spent waiting for the rate limiter.
+        - success (bool): Whether a completion was obtained.
+        - creation_date (Optional[datetime]): When the completion was requested (auto-generated).
+
+    """
+
+    model: str = Field(description="The language model used.")
+    purpose: str = Field(default="", description="What it was for.")
+    language: str = Field(default="", description="Programming language.")
+    prompt_tokens: int = Field(default=0, description="Prompt tokens.")
+    completion_tokens: int = Field(default=0, description="Completion tokens.")
+    latency: float = Field(default=0, description="API latency in seconds.")
+    throttled: float = Field(default=0, description="Rate limiter wait.")
+    success: bool = Field(default=True, description="Whether it succeeded.")
+    creation_date: Optional[datetime] = Field(
+        default_factory=datetime.utcnow,
+        index=True,
+        description="When the completion was requested.",
+    )
+
+
 __all__ = [
     "UserStatus",
     "UserRole",
     "User",
+    "Tutorial",
+    "TutorialDelivery",
+    "CompletionUsage",
 ]
@@ -5,12 +5,17 @@ This module defines the API routes related to user management in the application
 Classes and Functions:
     - router (APIRouter): FastAPI router for user-related routes.
     - logout (async function): Log out a user by removing their access token.
-    - upload_profile_image (async function): Upload a user's profile image to Deta Drive.
-    - get_profile_user_image (async function): Get a user's profile image from Deta Drive.
+    - upload_profile_image (async function): Upload a user's profile image variants.
+    - validate_profile_image (function): Reject uploads that are not images.
+    - get_profile_user_image (async function): Get a user's profile image variant, with HTTP caching.
     - update_personal_information (async function): Update a user's personal information.
+    - get_openai_usage (async function): Get the OpenAI usage, for admins.
+    - get_background_tasks (async function): Get the background task metrics, for admins.
+    - get_startup_report (async function): Get the startup timings, for admins.
+    - get_profiles (async function): List the request profiles, for admins.
+    - download_profile (async function): Download a request profile, for admins.
 
 Dependencies:
-    - Deta: For working with Deta Drive.
     - fastapi: For creating API routes.
     - odmantic.session: For database sessions.
     - typing: For type hints and annotations.
@@ -20,29 +25,37 @@ External Dependencies:
     - src.users.crud: User CRUD operations.
     - src.users.schemas: User-related Pydantic schemas.
     - src.utils.dependencies: Custom FastAPI dependencies.
+    - src.utils.digest: The algorithm emails sent from the tutorial library.
+    - src.utils.images: The profile image variants and responses.
+    - src.utils.metrics: The route latency metrics.
+    - src.utils.tasks: The background task supervisor.
+    - src.utils.uploads: The streaming upload parser.
 
 """
 
-from apscheduler.schedulers.background import (
-    BackgroundScheduler,
+import asyncio
+from bson import (
+    ObjectId,
 )
-from asyncio import (
-    ensure_future,
+from datetime import (
+    datetime,
+    timedelta,
 )
-from deta import Deta
 from fastapi import (
     APIRouter,
     Depends,
-    File,
-    UploadFile,
+    Request,
     responses,
 )
+import logging
 from odmantic.session import (
     AIOSession,
 )
 from typing import (
     Any,
     Dict,
+    List,
+    Optional,
     Union,
 )
 
@@ -54,22 +67,21 @@ from src.nylas import (
 )
 from src.users import (
     crud as users_crud,
+    models as users_models,
     schemas as users_schemas,
 )
 from src.utils import (
     dependencies,
+    digest,
+    images,
+    metrics,
+    tasks,
+    uploads,
 )
 
-router = APIRouter(prefix="/api/v1")
+logger = logging.getLogger(__name__)
 
-# initialize with a project key
-deta = Deta(settings().DETA_PROJECT_KEY)
-
-# create and use as many Drives as you want!
-profile_images = deta.Drive("profile-images")
-
-# Create a dictionary to store scheduler instances for each user
-user_schedulers = {}
+router = APIRouter(prefix="/api/v1", route_class=metrics.InstrumentedRoute)
 
 
 @router.post(
@@ -95,31 +107,110 @@ async def logout(
         return {"status_code": 400, "message": "Something went wrong!"}
 
 
+def validate_profile_image(prefix: bytes) -> None:
+    """
+    Reject uploads that do not start like an accepted image format.
+
+    Args:
+        prefix (bytes): The first bytes of the upload.
+
+    Raises:
+        uploads.UploadError: A 415 if the format is not accepted.
+    """
+    if images.detect_format(prefix) is None:
+        raise uploads.UploadError(
+            415, "Only PNG, JPEG, GIF and WebP images are accepted."
+        )
+
+
 @router.put(
     "/user/profile-image",
     response_model=None,
     status_code=200,
     name="user:profile-image",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "required": ["file"],
+                        "properties": {
+                            "file": {"type": "string", "format": "binary"}
+                        },
+                    }
+                }
+            },
+        }
+    },
 )
 async def upload_profile_image(
-    file: UploadFile = File(...),
+    request: Request,
     current_user: users_schemas.UserObjectSchema = Depends(
         dependencies.get_current_user
     ),
     session: AIOSession = Depends(dependencies.get_db_transactional_session),
-) -> Dict[str, Any]:
+) -> Union[responses.Response, Dict[str, Any]]:
     """
-    Upload an image to a Deta drive and associate it with the user's profile.
+    Receive an image as it streams, store its resized variants and associate
+    them with the user's profile. Re-uploading the current image is a no-op.
     """
     try:
-        file_name = "user/" + str(current_user.id) + "/" + "profile.png"
-        profile_images.put(file_name, file.file)
-        await users_crud.update_profile_picture(
-            email=current_user.email, file_name=file_name, session=session
+        from src.main import (
+            code_app,
         )
+
+        user_id = str(current_user.id)
+        try:
+            upload = await uploads.receive_upload(
+                request,
+                "file",
+                int(settings().PROFILE_IMAGE_MAX_SIZE) * 1024 * 1024,
+                validate_profile_image,
+            )
+        except uploads.UploadError as err:
+            return responses.JSONResponse(
+                {"status_code": err.status_code, "message": err.message},
+                status_code=err.status_code,
+            )
+        try:
+            etags = getattr(current_user, "profile_picture_variants", None)
+            if not etags or upload.sha256 != getattr(
+                current_user, "profile_picture_hash", None
+            ):
+                loop = asyncio.get_running_loop()
+                try:
+                    variants = await loop.run_in_executor(
+                        None, images.make_variants, upload.file
+                    )
+                except images.InvalidImage as err:
+                    return {"status_code": 400, "message": str(err)}
+                etags = {}
+                for variant, content in variants.items():
+                    await code_app.state.profile_images.put(
+                        images.variant_key(user_id, variant), content
+                    )
+                    etags[variant] = images.compute_etag(content)
+                await users_crud.update_profile_picture(
+                    email=current_user.email,
+                    file_name=images.variant_key(
+                        user_id, images.DEFAULT_VARIANT
+                    ),
+                    variants=etags,
+                    content_hash=upload.sha256,
+                    session=session,
+                )
+        finally:
+            upload.close()
         return {
             "status_code": 200,
-            "image": file_name,
+            "image": images.variant_key(user_id, images.DEFAULT_VARIANT),
+            "urls": {
+                variant: f"/api/v1/user/{user_id}/profile.png"
+                f"?size={variant}&v={etag}"
+                for variant, etag in etags.items()
+            },
         }
 
     except Exception as e:
@@ -135,14 +226,57 @@ async def upload_profile_image(
 )
 async def get_profile_user_image(
     user_id: str,
-) -> Union[responses.StreamingResponse, Dict[str, Any]]:
+    request: Request,
+    size: str = images.DEFAULT_VARIANT,
+    v: Optional[str] = None,
+    session: AIOSession = Depends(dependencies.get_db_autocommit_session),
+) -> Union[responses.Response, Dict[str, Any]]:
     """
-    Update a user's personal information.
+    Get a variant of a user's profile image, answering revalidations from
+    the stored ETags without fetching the image, and serving cached images
+    from the local disk.
     """
     try:
-        img = profile_images.get(f"user/{user_id}/profile.png")
-        return responses.StreamingResponse(
-            img.iter_chunks(), media_type="image/png"
+        from src.main import (
+            code_app,
+        )
+
+        if size not in images.VARIANTS:
+            return {"status_code": 400, "message": "Unknown image size!"}
+        user = await session.find_one(
+            users_models.User, users_models.User.id == ObjectId(user_id)
+        )
+        if user is None:
+            return responses.Response(status_code=404)
+        etag = user.profile_picture_variants.get(size)
+        versioned = etag is not None and v == etag
+        if etag is not None and images.not_modified(request, etag):
+            return images.image_response(request, b"", etag, versioned)
+        # Images uploaded before the variants existed only have the original.
+        key = (
+            images.variant_key(user_id, size)
+            if etag is not None
+            else f"user/{user_id}/profile.png"
+        )
+        profile_images = code_app.state.profile_images
+        if etag is not None and "range" not in request.headers:
+            # The local copy is checked against the stored ETag, so a stale
+            # copy is fetched again before serving anything.
+            path = await profile_images.local_path(key, etag)
+            if path is not None:
+                try:
+                    return images.file_response(path, etag, versioned)
+                except FileNotFoundError:
+                    # Evicted from the cache in the meantime.
+                    pass
+        content = await profile_images.get(key)
+        if content is None:
+            return responses.Response(status_code=404)
+        # The blob may be another version than the stored ETag while an
+        # upload is in progress, it is then served under its own ETag.
+        content_etag = images.compute_etag(content)
+        return images.image_response(
+            request, content, content_etag, versioned and content_etag == etag
         )
     except Exception:
         return {"status_code": 400, "message": "Something went wrong!"}
@@ -165,47 +299,8 @@ async def update_personal_information(
     An endpoint for updating users personel info.
     """
     try:
-        from src.main import (
-            code_app,
-        )
-
+        # The schedule's digest job picks up the new language and schedule.
         await users_crud.update_user_info(personal_info, current_user, session)
-        schedule = personal_info.schedule
-        language = personal_info.language
-        email = current_user.email
-        # Create a new scheduler for the user
-        scheduler = BackgroundScheduler()
-        user_schedulers[email] = scheduler
-        if schedule == "Every hour":
-            scheduler.add_job(
-                code_app.state.openai.send_algorithm_email,
-                "interval",
-                hours=1,
-                args=(email, language),
-            )
-        elif schedule == "Every day":
-            scheduler.add_job(
-                code_app.state.openai.send_algorithm_email,
-                "interval",
-                days=1,
-                args=(email, language),
-            )
-        elif schedule == "Every week":
-            scheduler.add_job(
-                code_app.state.openai.send_algorithm_email,
-                "interval",
-                weeks=1,
-                args=(email, language),
-            )
-        elif schedule == "Every month":
-            scheduler.add_job(
-                code_app.state.openai.send_algorithm_email,
-                "interval",
-                days=30,
-                args=(email, language),
-            )
-
-        scheduler.start()
         return {
             "status_code": 200,
             "message": "Your personal information has been updated successfully!",
@@ -238,60 +333,29 @@ async def update_language(
         email = current_user.email
         language = request_body.language
         schedule = request_body.schedule
-        if email in user_schedulers:
-            # Use the existing scheduler for the user
-            scheduler = user_schedulers[email]
-        else:
-            # Create a new scheduler for the user
-            scheduler = BackgroundScheduler()
-            user_schedulers[email] = scheduler
         if current_user.welcome == "not sent":
-            # send a welcome email in the background
-            ensure_future(nylas_crud.send_welcome_email(email))
-            # send an algorithm email in the background
-            ensure_future(
-                code_app.state.openai.async_send_algorithm_email(
-                    email, language
+            tasks_supervisor = code_app.state.tasks
+            try:
+                # send a welcome email in the background
+                tasks_supervisor.spawn(
+                    nylas_crud.send_welcome_email(email, language),
+                    "welcome-email",
                 )
-            )
+                # send the first tutorial of the library in the background
+                tasks_supervisor.spawn(
+                    digest.send_next_tutorial(email, language),
+                    "algorithm-email",
+                )
+            except tasks.TaskRejected as err:
+                logger.warning(repr(err))
         user_info = users_schemas.PersonalInfo(
             full_name=current_user.full_name,
             bio=current_user.bio,
             programming_language=language,
             schedule=schedule,
         )
+        # The schedule's digest job picks up the new language and schedule.
         await users_crud.update_user_info(user_info, current_user, session)
-
-        if schedule == "Every hour":
-            scheduler.add_job(
-                code_app.state.openai.send_algorithm_email,
-                "interval",
-                hours=1,
-                args=(email, language),
-            )
-        elif schedule == "Every day":
-            scheduler.add_job(
-                code_app.state.openai.send_algorithm_email,
-                "interval",
-                days=1,
-                args=(email, language),
-            )
-        elif schedule == "Every week":
-            scheduler.add_job(
-                code_app.state.openai.send_algorithm_email,
-                "interval",
-                weeks=1,
-                args=(email, language),
-            )
-        elif schedule == "Every month":
-            scheduler.add_job(
-                code_app.state.openai.send_algorithm_email,
-                "interval",
-                months=30,
-                args=(email, language),
-            )
-
-        scheduler.start()
         return {
             "status_code": 200,
             "message": "Your programming language has been updated successfully!",
@@ -299,3 +363,133 @@ async def update_language(
     except Exception as e:
         print(e)
         return {"status_code": 400, "message": "Something went wrong!"}
+
+
+@router.get(
+    "/admin/openai-usage",
+    response_model=Dict[str, Any],
+    status_code=200,
+    name="admin:openai-usage",
+)
+async def get_openai_usage(
+    hours: int = 24,
+    current_user: users_schemas.UserObjectSchema = Depends(
+        dependencies.get_admin_user
+    ),
+    session: AIOSession = Depends(dependencies.get_db_autocommit_session),
+) -> Dict[str, Any]:
+    """
+    Get the OpenAI usage of this process and of all processes over the last hours.
+    """
+    from src.main import (
+        code_app,
+    )
+
+    since = datetime.utcnow() - timedelta(hours=hours)
+    openai_api = code_app.state.openai
+    return {
+        "process": openai_api.usage,
+        "limits": {
+            "requests_per_minute": openai_api.requests_per_minute,
+            "tokens_per_minute": openai_api.tokens_per_minute,
+        },
+        "since": since,
+        "usage": await users_crud.get_completion_usage(since, session),
+    }
+
+
+@router.get(
+    "/admin/background-tasks",
+    response_model=Dict[str, Any],
+    status_code=200,
+    name="admin:background-tasks",
+)
+async def get_background_tasks(
+    current_user: users_schemas.UserObjectSchema = Depends(
+        dependencies.get_admin_user
+    ),
+) -> Dict[str, Any]:
+    """
+    Get the background task counters and recent errors of this process.
+    """
+    from src.main import (
+        code_app,
+    )
+
+    return code_app.state.tasks.snapshot()
+
+
+@router.get(
+    "/admin/startup",
+    response_model=Dict[str, Any],
+    status_code=200,
+    name="admin:startup",
+)
+async def get_startup_report(
+    current_user: users_schemas.UserObjectSchema = Depends(
+        dependencies.get_admin_user
+    ),
+) -> Dict[str, Any]:
+    """
+    Get the startup timings of this process.
+    """
+    from src.main import (
+        code_app,
+    )
+
+    return code_app.state.startup.report()
+
+
+@router.get(
+    "/admin/profiles",
+    response_model=List[Dict[str, Any]],
+    status_code=200,
+    name="admin:profiles",
+)
+async def get_profiles(
+    limit: int = 50,
+    current_user: users_schemas.UserObjectSchema = Depends(
+        dependencies.get_admin_user
+    ),
+) -> List[Dict[str, Any]]:
+    """
+    List the latest request profiles, of all the replicas.
+    """
+    from src.main import (
+        code_app,
+    )
+
+    return await code_app.state.profiles.list(min(max(limit, 1), 500))
+
+
+@router.get(
+    "/admin/profiles/{profile_id}",
+    response_class=responses.PlainTextResponse,
+    status_code=200,
+    name="admin:profile",
+)
+async def download_profile(
+    profile_id: str,
+    current_user: users_schemas.UserObjectSchema = Depends(
+        dependencies.get_admin_user
+    ),
+) -> responses.Response:
+    """
+    Download a request profile as collapsed stacks, for flamegraph.pl or
+    speedscope.
+    """
+    from src.main import (
+        code_app,
+    )
+
+    profile = await code_app.state.profiles.get(profile_id)
+    if profile is None:
+        return responses.Response(status_code=404)
+    return responses.PlainTextResponse(
+        profile["stacks"],
+        headers={
+            "Content-Disposition": (
+                f'attachment; filename="profile-{profile_id}.folded"'
+            )
+        },
+    )
@@ -3,9 +3,53 @@ utils package.
 """
 
 from src.utils import (
+    admission,
     dependencies,
+    digest,
     engine,
+    execution_cache,
+    executors,
+    health,
+    idempotency,
+    images,
+    judge0,
+    leader,
+    metrics,
     openai_api,
+    openai_client,
+    profiler,
+    rate_limit,
+    scheduler,
+    startup,
+    storage,
+    tasks,
+    templates,
+    tutorials,
+    uploads,
 )
 
-__all__ = ["dependencies", "engine", "openai_api"]
+__all__ = [
+    "admission",
+    "dependencies",
+    "digest",
+    "engine",
+    "execution_cache",
+    "executors",
+    "health",
+    "idempotency",
+    "images",
+    "judge0",
+    "leader",
+    "metrics",
+    "openai_api",
+    "openai_client",
+    "profiler",
+    "rate_limit",
+    "scheduler",
+    "startup",
+    "storage",
+    "tasks",
+    "templates",
+    "tutorials",
+    "uploads",
+]
@@ -0,0 +1,257 @@
+"""🚦 Utils Admission Module 🎟️
+
+This module contains the admission control used to bound concurrent code executions.
+
+A global semaphore caps the number of executions running at once, a per-user quota
+caps how many executions a single user can have running or queued, and callers that
+cannot start right away wait in a FIFO queue whose length and expected wait are bounded.
+Requests that would exceed any of these limits are rejected right away with a 429.
+
+Classes:
+    - AdmissionRejected: The HTTP 429 raised when a request is not admitted.
+    - Admission: The position and wait of an admitted request.
+    - AdmissionController: The semaphore, queue and per-user quotas.
+
+Dependencies:
+    - asyncio: For the semaphore.
+    - collections.deque: For the waiting queue.
+    - fastapi.HTTPException: For the 429 response.
+
+"""
+
+import asyncio
+from collections import (
+    deque,
+)
+from contextlib import (
+    asynccontextmanager,
+)
+from dataclasses import (
+    dataclass,
+)
+from fastapi import (
+    HTTPException,
+    status,
+)
+import math
+import time
+from typing import (
+    Any,
+    AsyncIterator,
+    Deque,
+    Dict,
+)
+
+
+class AdmissionRejected(HTTPException):
+    """
+    Raised when a request is not admitted, rendered as an HTTP 429.
+
+    Args:
+        message (str): Why the request was rejected.
+        position (int): The position the caller would have had in the queue.
+        estimated_wait (float): The estimated number of seconds before a slot frees up.
+    """
+
+    def __init__(
+        self, message: str, position: int, estimated_wait: float
+    ) -> None:
+        super().__init__(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail={
+                "message": message,
+                "position": position,
+                "estimated_wait": round(estimated_wait, 1),
+            },
+            headers={"Retry-After": str(max(1, math.ceil(estimated_wait)))},
+        )
+
+
+@dataclass
+class Admission:
+    """
+    The position and wait of an admitted request.
+
+    Attributes:
+        position (int): The position in the queue on arrival, 0 if it started right away.
+        waited (float): The number of seconds spent in the queue.
+    """
+
+    position: int = 0
+    waited: float = 0
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        """
+        Build the response headers describing the admission.
+
+        Returns:
+            Dict[str, str]: The queue position and wait headers.
+        """
+        return {
+            "X-Queue-Position": str(self.position),
+            "X-Queue-Wait": f"{self.waited:.3f}",
+        }
+
+
+class AdmissionController:
+    """
+    Bounds the number of concurrent executions globally and per user.
+
+    Args:
+        max_concurrent (int): The number of executions allowed to run at once.
+        max_per_user (int): The number of executions a user can have running or queued.
+        max_queue (int): The number of requests allowed to wait for a slot.
+        max_wait (float): The number of seconds a request is allowed to wait for a slot.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int,
+        max_per_user: int,
+        max_queue: int,
+        max_wait: float,
+    ) -> None:
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.running = 0
+        self.rejected = 0
+        # Exponentially weighted moving average of the execution duration.
+        self.average_duration = 2.0
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._queue: Deque[object] = deque()
+        self._per_user: Dict[str, int] = {}
+
+    @property
+    def queued(self) -> int:
+        """
+        The number of requests waiting for a slot.
+
+        Returns:
+            int: The queue length.
+        """
+        return len(self._queue)
+
+    def estimated_wait(self, position: int) -> float:
+        """
+        Estimate how long the request at a given queue position will wait.
+
+        Args:
+            position (int): The queue position, starting at 1.
+
+        Returns:
+            float: The estimated number of seconds.
+        """
+        if position <= 0:
+            return 0
+        return (
+            math.ceil(position / self.max_concurrent) * self.average_duration
+        )
+
+    def snapshot(self, user: str) -> Dict[str, Any]:
+        """
+        Describe the queue as seen by a given user.
+
+        Args:
+            user (str): The user key.
+
+        Returns:
+            Dict[str, Any]: The queue state and the wait a new request would face.
+        """
+        position = self._next_position()
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "max_concurrent": self.max_concurrent,
+            "user_in_flight": self._per_user.get(user, 0),
+            "user_quota": self.max_per_user,
+            "position": position,
+            "estimated_wait": round(self.estimated_wait(position), 1),
+        }
+
+    def _next_position(self) -> int:
+        # Requests waiting on the semaphore are counted from their arrival,
+        # before the event loop lets them take a free slot.
+        return max(0, self.running + self.queued + 1 - self.max_concurrent)
+
+    def _reject(self, message: str, position: int) -> AdmissionRejected:
+        self.rejected += 1
+        return AdmissionRejected(
+            message, position, self.estimated_wait(max(position, 1))
+        )
+
+    async def _acquire(self, timeout: float) -> bool:
+        # Before Python 3.12, `asyncio.wait_for` can time out after the
+        # semaphore was acquired and lose the permit, so the acquisition runs
+        # in a task that is only cancelled while it is still waiting.
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+            return True
+        acquire = asyncio.ensure_future(self._semaphore.acquire())
+        try:
+            await asyncio.wait({acquire}, timeout=timeout)
+        except BaseException:
+            if acquire.done() and not acquire.cancelled():
+                self._semaphore.release()
+            else:
+                acquire.cancel()
+            raise
+        if acquire.done():
+            return True
+        acquire.cancel()
+        return False
+
+    @asynccontextmanager
+    async def slot(self, user: str) -> AsyncIterator[Admission]:
+        """
+        Wait for an execution slot, or fail fast if the wait would be too long.
+
+        Args:
+            user (str): The user key the per-user quota applies to.
+
+        Raises:
+            AdmissionRejected: If the user is over quota, the queue is full, or
+                no slot frees up within `max_wait` seconds.
+
+        Yields:
+            Admission: The queue position and wait of the request.
+        """
+        if self._per_user.get(user, 0) >= self.max_per_user:
+            raise self._reject(
+                "You already have too many code executions in progress.", 0
+            )
+        position = self._next_position()
+        if position > self.max_queue or (
+            self.estimated_wait(position) > self.max_wait
+        ):
+            raise self._reject("The code execution queue is full.", position)
+
+        self._per_user[user] = self._per_user.get(user, 0) + 1
+        ticket = object()
+        self._queue.append(ticket)
+        arrival = time.monotonic()
+        try:
+            try:
+                acquired = await self._acquire(self.max_wait)
+            finally:
+                self._queue.remove(ticket)
+            if not acquired:
+                raise self._reject(
+                    "Timed out waiting for a code execution slot.", position
+                )
+            started = time.monotonic()
+            self.running += 1
+            try:
+                yield Admission(position=position, waited=started - arrival)
+            finally:
+                self.running -= 1
+                self._semaphore.release()
+                self.average_duration = 0.8 * self.average_duration + 0.2 * (
+                    time.monotonic() - started
+                )
+        finally:
+            self._per_user[user] -= 1
+            if not self._per_user[user]:
+                del self._per_user[user]
@@ -9,6 +9,7 @@ Functions:
         -> Optional[Dict[str, Any]]: Get the current user based on authorization headers.
     - get_db_autocommit_session() -> AsyncGenerator[AIOSession, None]:
         Create and get an autocommit database session.
+    - get_admin_user(current_user) -> Any: Get the current user if they are an admin.
 
 Dependencies:
     - odmantic.session.AIOSession: For asynchronous database sessions.
@@ -26,6 +27,7 @@ External Dependencies:
 """
 
 from fastapi import (
+    Depends,
     Header,
     HTTPException,
     status,
@@ -133,3 +135,30 @@ async def get_db_autocommit_session() -> AsyncGenerator[AIOSession, None]:
     finally:
         await session.end()
         code_app.state.nylas.access_token = None
+
+
+async def get_admin_user(current_user: Any = Depends(get_current_user)) -> Any:
+    """Get Admin User
+
+    Get the current user, making sure they are an admin.
+
+    Args:
+        current_user (Any): The current user.
+
+    Raises:
+        HTTPException: If the user is not an admin.
+
+    Returns:
+        Any: The user object.
+
+    """
+    from src.users import (  # pylint: disable=C0415
+        models as users_models,
+    )
+
+    if current_user.user_role != users_models.UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges are required!",
+        )
+    return current_user
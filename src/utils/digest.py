@@ -0,0 +1,224 @@
+"""📬 Utils Digest Module 🧵
+
+This module contains the pipeline sending the periodic algorithm emails.
+
+The users due for a given schedule are grouped by language, and for each of them the
+next tutorial of the pre-generated library (see `src.utils.tutorials`) they have not
+received yet is put in the outbound queue (see `src.nylas.outbox`). Nothing is generated at send time, so
+OpenAI latency and failures never delay the emails; users whose language has run out
+of unseen tutorials are skipped and reported so that a refill can be requested.
+
+The first email of a new user goes through the same path, see `send_next_tutorial`.
+
+Functions:
+    - group_recipients(users) -> Dict[str, List[str]]: Group users' emails by language.
+    - send_tutorial(email, language, tutorial): Queue a tutorial and record it.
+    - send_next_tutorial(email: str, language: str) -> bool: Send a user's next tutorial.
+    - send_algorithm_digest(schedule: str) -> Dict[str, int]: Run the pipeline for a schedule.
+
+Dependencies:
+    - asyncio: For concurrency.
+    - odmantic.query: For querying the send history.
+    - src.users.models: The User, Tutorial and TutorialDelivery models.
+    - src.utils.tutorials: For picking the next tutorial.
+
+"""
+
+import asyncio
+from collections import (
+    defaultdict,
+)
+import logging
+from odmantic import (
+    AIOEngine,
+    query,
+)
+from pydantic import (
+    EmailStr,
+)
+from typing import (
+    Dict,
+    Iterable,
+    List,
+    Set,
+)
+
+from src.users import (
+    models as users_models,
+)
+from src.utils import (
+    tutorials,
+)
+
+logger = logging.getLogger(__name__)
+
+# The number of emails queued at the same time.
+SEND_CONCURRENCY = 8
+
+
+def group_recipients(
+    users: Iterable[users_models.User],
+) -> Dict[str, List[str]]:
+    """
+    Group the users' email addresses by programming language.
+
+    Args:
+        users (Iterable[users_models.User]): The users due for an email.
+
+    Returns:
+        Dict[str, List[str]]: The email addresses of each language's users.
+    """
+    groups: Dict[str, List[str]] = defaultdict(list)
+    for user in users:
+        if user.programming_language:
+            groups[user.programming_language].append(user.email)
+    return dict(groups)
+
+
+async def _seen_topics(
+    engine: AIOEngine, emails: List[str]
+) -> Dict[str, Set[str]]:
+    """
+    Fetch the topics already sent to each of the users, in every language.
+
+    Args:
+        engine (AIOEngine): The database engine.
+        emails (List[str]): The users' email addresses.
+
+    Returns:
+        Dict[str, Set[str]]: The topics sent to each email address.
+    """
+    seen: Dict[str, Set[str]] = defaultdict(set)
+    if emails:
+        for delivery in await engine.find(
+            users_models.TutorialDelivery,
+            query.in_(users_models.TutorialDelivery.email, emails),
+        ):
+            seen[delivery.email].add(delivery.topic)
+    return seen
+
+
+async def _library(
+    engine: AIOEngine, language: str
+) -> List[users_models.Tutorial]:
+    """
+    Fetch the tutorials of a language, oldest first.
+
+    Args:
+        engine (AIOEngine): The database engine.
+        language (str): The programming language.
+
+    Returns:
+        List[users_models.Tutorial]: The language's tutorials.
+    """
+    return await engine.find(
+        users_models.Tutorial,
+        users_models.Tutorial.language == language,
+        sort=users_models.Tutorial.creation_date,
+    )
+
+
+async def send_tutorial(
+    email: str, language: str, tutorial: users_models.Tutorial
+) -> None:
+    """
+    Queue a tutorial for a user and record it in their send history.
+
+    Args:
+        email (str): The email address of the user.
+        language (str): The programming language of the user.
+        tutorial (users_models.Tutorial): The tutorial to send.
+    """
+    from src.main import (  # pylint: disable=C0415
+        code_app,
+    )
+
+    await code_app.state.openai.send_algorithm_email(
+        email, language, tutorial.html_content
+    )
+    await code_app.state.engine.save(
+        users_models.TutorialDelivery(
+            email=EmailStr(email),
+            language=language,
+            tutorial=tutorial.id,
+            topic=tutorial.topic,
+        )
+    )
+
+
+async def send_next_tutorial(email: str, language: str) -> bool:
+    """
+    Send a user the next tutorial of their language they have not received.
+
+    Args:
+        email (str): The email address of the user.
+        language (str): The programming language of the user.
+
+    Returns:
+        bool: Whether a tutorial was left to send.
+    """
+    from src.main import (  # pylint: disable=C0415
+        code_app,
+    )
+
+    engine = code_app.state.engine
+    seen = await _seen_topics(engine, [email])
+    tutorial = tutorials.pick_next(
+        await _library(engine, language), seen[email]
+    )
+    if tutorial is None:
+        logger.warning("No %s tutorial left for %s", language, email)
+        return False
+    await send_tutorial(email, language, tutorial)
+    return True
+
+
+async def send_algorithm_digest(schedule: str) -> Dict[str, int]:
+    """
+    Send the next unseen tutorial to every user of a schedule.
+
+    Args:
+        schedule (str): The schedule being run, e.g. "Every day".
+
+    Returns:
+        Dict[str, int]: The number of queued ("sent"), failed and skipped
+            emails.
+    """
+    from src.main import (  # pylint: disable=C0415
+        code_app,
+    )
+
+    engine = code_app.state.engine
+    users = await engine.find(
+        users_models.User, users_models.User.schedule == schedule
+    )
+    groups = group_recipients(users)
+    seen = await _seen_topics(
+        engine, [email for group in groups.values() for email in group]
+    )
+    send_slots = asyncio.Semaphore(SEND_CONCURRENCY)
+    stats = {"sent": 0, "failed": 0, "skipped": 0}
+
+    async def send(
+        email: str, language: str, tutorial: users_models.Tutorial
+    ) -> None:
+        async with send_slots:
+            try:
+                await send_tutorial(email, language, tutorial)
+                stats["sent"] += 1
+            except Exception as err:  # pylint: disable=W0703
+                logger.error("Failed to email %s: %r", email, err)
+                stats["failed"] += 1
+
+    sends = []
+    for language, group in groups.items():
+        library = await _library(engine, language)
+        for email in group:
+            tutorial = tutorials.pick_next(library, seen[email])
+            if tutorial is None:
+                stats["skipped"] += 1
+                continue
+            sends.append(send(email, language, tutorial))
+    await asyncio.gather(*sends)
+    logger.info("Algorithm digest %r: %s", schedule, stats)
+    return stats
@@ -11,10 +11,23 @@ Dependencies:
     - odmantic.AIOEngine: For asynchronous database engine.
     - src.config.settings: Application configuration settings.
     - nylas.APIClient: For Nylas API client.
+    - src.utils.executors: Code execution backends.
+    - src.utils.execution_cache: Code execution result cache.
+    - src.utils.admission: Code execution admission control.
+    - src.utils.scheduler: The shared algorithm email scheduler.
+    - src.nylas.outbox: The outbound email queue.
+    - src.utils.idempotency: The Idempotency-Key store.
+    - src.utils.tasks: The background task supervisor.
+    - src.utils.templates: The compiled email templates.
+    - src.utils.storage: The profile image storage.
+    - src.utils.startup: The startup timing report.
+    - src.utils.health: The readiness probes.
+    - src.utils.metrics: The MongoDB and Nylas metrics.
+    - src.utils.profiler: The request profile store.
 
 """
 
-
+import asyncio
 from fastapi import (
     FastAPI,
 )
@@ -24,6 +37,9 @@ from motor.motor_asyncio import (
 from odmantic import (
     AIOEngine,
 )
+from typing import (
+    Optional,
+)
 
 from nylas import (
     APIClient,
@@ -31,8 +47,24 @@ from nylas import (
 from src.config import (
     settings,
 )
+from src.nylas import (
+    models as nylas_models,
+    outbox,
+)
 from src.utils import (
+    admission,
+    execution_cache,
+    executors,
+    health,
+    idempotency,
+    metrics,
     openai_api,
+    profiler,
+    scheduler,
+    startup,
+    storage,
+    tasks,
+    templates,
 )
 
 
@@ -50,23 +82,153 @@ async def init_engine_app(app: FastAPI) -> None:
 
     """
     app_settings = settings()
+    timer = startup.StartupTimer()
 
     client = AsyncIOMotorClient(
-        app_settings.db_url, maxPoolSize=30, minPoolSize=30
+        app_settings.db_url,
+        maxPoolSize=int(app_settings.MONGODB_MAX_POOL_SIZE),
+        minPoolSize=int(app_settings.MONGODB_MIN_POOL_SIZE),
+        event_listeners=[
+            metrics.MongoCommandListener(),
+            metrics.MongoPoolListener(),
+        ],
     )
     database = client.get_default_database()
     assert database.name == app_settings.MONGODB_DATABASE
     engine = AIOEngine(client=client, database=app_settings.MONGODB_DATABASE)
     app.state.client = client
     app.state.engine = engine
+    app.state.tasks = tasks.TaskSupervisor(
+        max_concurrent=int(app_settings.BACKGROUND_TASKS_MAX_CONCURRENT)
+    )
+    app.state.idempotency = idempotency.IdempotencyStore(
+        database["idempotency_keys"],
+        ttl=float(app_settings.IDEMPOTENCY_TTL),
+        # A request holds its key for as long as a code execution can take:
+        # its wait for an admission slot, then the execution itself.
+        lock_timeout=float(app_settings.EXECUTION_MAX_WAIT)
+        + executors.EXECUTION_TIMEOUT,
+    )
+    await app.state.idempotency.configure()
+    app.state.profiles = profiler.ProfileStore(
+        database["profiles"], ttl=float(app_settings.PROFILER_TTL)
+    )
+    await app.state.profiles.configure()
+    timer.checkpoint("mongodb")
+    app.state.templates = templates.TemplateRegistry(templates.TEMPLATES_PATH)
+    app.state.templates.load()
+    timer.checkpoint("templates")
+    app.state.profile_images = storage.create_storage("profile-images")
+    await app.state.profile_images.start()
+    timer.checkpoint("storage")
     app.state.nylas = APIClient(
         app_settings.NYLAS_CLIENT_ID,
         app_settings.NYLAS_CLIENT_SECRET,
-        app_settings.NYLAS_API_SERVER,
+        api_server=app_settings.NYLAS_API_SERVER or "https://api.nylas.com",
     )
-    app.state.nylas.update_application_details(
-        redirect_uris=[app_settings.CLIENT_URI]
+    metrics.instrument_session(app.state.nylas.session, "nylas")
+    metrics.instrument_session(app.state.nylas.admin_session, "nylas")
+    # A dedicated client for the emails sent by the system.
+    app.state.nylas_system = APIClient(
+        app_settings.NYLAS_CLIENT_ID,
+        app_settings.NYLAS_CLIENT_SECRET,
+        access_token=app_settings.NYLAS_SYSTEM_TOKEN,
+        api_server=app_settings.NYLAS_API_SERVER or "https://api.nylas.com",
     )
+    metrics.instrument_session(app.state.nylas_system.session, "nylas")
+
+    def nylas_client(access_token: Optional[str]) -> APIClient:
+        if access_token is None:
+            return app.state.nylas_system
+        # One client per token, the shared client's token is never swapped.
+        user_client = APIClient(
+            app_settings.NYLAS_CLIENT_ID,
+            app_settings.NYLAS_CLIENT_SECRET,
+            access_token=access_token,
+            api_server=app_settings.NYLAS_API_SERVER
+            or "https://api.nylas.com",
+        )
+        metrics.instrument_session(user_client.session, "nylas")
+        return user_client
+
+    await engine.configure_database([nylas_models.OutboundEmail])
+    app.state.outbox = outbox.OutboxWorkerPool(
+        engine.get_collection(nylas_models.OutboundEmail),
+        nylas_client,
+        size=int(app_settings.OUTBOX_WORKERS),
+        per_account_per_minute=float(app_settings.OUTBOX_ACCOUNT_RATE),
+        max_attempts=int(app_settings.OUTBOX_MAX_ATTEMPTS),
+        system_sender=await outbox.resolve_system_sender(
+            app.state.nylas_system
+        ),
+    )
+    app.state.outbox.start()
+    timer.checkpoint("nylas")
     app.state.openai = openai_api.OpenAIAPI(
-        api_token=app_settings.OPENAI_API_KEY
+        api_token=app_settings.OPENAI_API_KEY,
+        api_base=app_settings.OPENAI_API_BASE,
+        timeout=float(app_settings.OPENAI_TIMEOUT),
+        max_retries=int(app_settings.OPENAI_MAX_RETRIES),
+        max_concurrent=int(app_settings.OPENAI_MAX_CONCURRENT),
+        requests_per_minute=float(app_settings.OPENAI_REQUESTS_PER_MINUTE),
+        tokens_per_minute=float(app_settings.OPENAI_TOKENS_PER_MINUTE),
+    )
+    app.state.executor = executors.create_executor()
+    if int(app_settings.EXECUTION_CACHE_SIZE) > 0:
+        persist = app_settings.EXECUTION_CACHE_PERSIST.lower() == "true"
+        cache = execution_cache.ExecutionCache(
+            int(app_settings.EXECUTION_CACHE_SIZE),
+            engine if persist else None,
+            ttl=float(app_settings.EXECUTION_CACHE_TTL),
+        )
+        if persist:
+            await engine.configure_database([nylas_models.CodeExecutionResult])
+            await cache.configure()
+        app.state.executor = execution_cache.CachedExecutor(
+            app.state.executor, cache
+        )
+    await app.state.executor.start()
+    timer.checkpoint("executor")
+    app.state.admission = admission.AdmissionController(
+        max_concurrent=int(app_settings.EXECUTION_MAX_CONCURRENT),
+        max_per_user=int(app_settings.EXECUTION_MAX_PER_USER),
+        max_queue=int(app_settings.EXECUTION_MAX_QUEUE),
+        max_wait=float(app_settings.EXECUTION_MAX_WAIT),
+    )
+    app.state.scheduler = scheduler.create_scheduler()
+    # The job store is synchronous, keep it off the event loop.
+    await asyncio.to_thread(app.state.scheduler.start, paused=True)
+    await asyncio.to_thread(
+        scheduler.schedule_algorithm_digests, app.state.scheduler
+    )
+    await asyncio.to_thread(
+        scheduler.schedule_tutorial_refill,
+        app.state.scheduler,
+        int(app_settings.TUTORIAL_REFILL_HOUR),
+    )
+    # Stocks the library of a fresh deployment; a no-op when it is full.
+    await asyncio.to_thread(
+        scheduler.request_tutorial_refill, app.state.scheduler
+    )
+    app.state.scheduler_lease = scheduler.create_scheduler_lease(
+        app.state.scheduler,
+        database["leases"],
+        float(app_settings.LEADER_LEASE_TTL),
+    )
+    app.state.scheduler_lease.start()
+    timer.checkpoint("scheduler")
+    app.state.loop_lag = health.LoopLagMonitor()
+    app.state.loop_lag.start()
+    app.state.health = health.HealthChecker(
+        client,
+        app_settings.NYLAS_API_SERVER or "https://api.nylas.com",
+        app.state.loop_lag,
+        app.state.admission,
+        cache_ttl=float(app_settings.HEALTH_CACHE_TTL),
+        max_mongo_latency=float(app_settings.HEALTH_MAX_MONGO_LATENCY),
+        max_loop_lag=float(app_settings.HEALTH_MAX_LOOP_LAG),
+        max_execution_queue=int(app_settings.HEALTH_MAX_EXECUTION_QUEUE),
+        nylas_critical=app_settings.HEALTH_NYLAS_CRITICAL.lower() == "true",
     )
+    timer.checkpoint("health")
+    app.state.startup = timer
@@ -0,0 +1,302 @@
+"""🗃️ Utils Execution Cache Module ⚡
+
+This module contains a content-addressed cache for code execution results.
+
+Submissions are hashed on everything that can change their result (the backend that
+runs them, language, source, stdin, expected output and resource limits). Deterministic
+successful runs are kept in a size-bounded in-memory LRU and, optionally, persisted in
+MongoDB, where a TTL index expires them, so that every replica and every restart can
+reuse them. The results of a batch are looked up in MongoDB with a single query.
+
+Classes:
+    - ExecutionCache: A size-bounded LRU of execution results with optional persistence.
+    - CachedExecutor: A code executor that serves cached results before calling a backend.
+
+Functions:
+    - submission_key(submission: Dict[str, Any], backend: str) -> str: Hash a submission.
+    - is_cacheable(submission: Dict[str, Any], result: Dict[str, Any]) -> bool:
+        Whether a result can be served again for the same submission.
+
+Dependencies:
+    - collections.OrderedDict: For the LRU.
+    - hashlib: For content hashing.
+    - odmantic: For the optional persistence.
+    - pymongo.errors.OperationFailure: For updating the TTL of an existing index.
+    - src.nylas.models: The CodeExecutionResult model.
+    - src.utils.executors: The executor interface.
+
+"""
+
+from collections import (
+    OrderedDict,
+)
+import copy
+import hashlib
+import json
+import logging
+from odmantic import (
+    AIOEngine,
+    query,
+)
+from pymongo.errors import (
+    OperationFailure,
+)
+import re
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+)
+
+from src.nylas import (
+    models as nylas_models,
+)
+from src.utils import (
+    executors,
+    judge0,
+)
+
+logger = logging.getLogger(__name__)
+
+SUBMISSION_KEY_FIELDS = (
+    "language_id",
+    "source_code",
+    "stdin",
+    "expected_output",
+    "cpu_time_limit",
+    "cpu_extra_time",
+    "wall_time_limit",
+    "memory_limit",
+    "max_processes_and_or_threads",
+)
+
+# Programs that read the clock or a random source may print something else
+# on the next run, so their results are never cached.
+NONDETERMINISTIC_SOURCE = re.compile(
+    r"\b(random|rand|srand|shuffle|uuid|urandom|secrets|time|datetime|"
+    r"clock|now|Date|RANDOM|SECONDS|getpid|environ)\b"
+)
+
+
+def submission_key(submission: Dict[str, Any], backend: str) -> str:
+    """
+    Compute the content hash of a submission.
+
+    Args:
+        submission (Dict[str, Any]): A Judge0 submission payload.
+        backend (str): The name of the backend running it, since backends
+            can word the same outcome differently.
+
+    Returns:
+        str: The hex encoded SHA-256 of the fields that affect the result.
+    """
+    content = json.dumps(
+        [backend]
+        + [str(submission.get(field, "")) for field in SUBMISSION_KEY_FIELDS]
+    )
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def is_cacheable(submission: Dict[str, Any], result: Dict[str, Any]) -> bool:
+    """
+    Whether a result can be served again for the same submission.
+
+    Args:
+        submission (Dict[str, Any]): A Judge0 submission payload.
+        result (Dict[str, Any]): The result of the submission.
+
+    Returns:
+        bool: True for accepted runs of programs that look deterministic.
+    """
+    status = result.get("status") or {}
+    if status.get("id") != judge0.JUDGE0_ACCEPTED_STATUS:
+        return False
+    source = submission.get("source_code") or ""
+    return not NONDETERMINISTIC_SOURCE.search(source)
+
+
+class ExecutionCache:
+    """
+    A size-bounded LRU of execution results with optional MongoDB persistence.
+
+    Args:
+        max_entries (int): The maximum number of results kept in memory.
+        engine (Optional[AIOEngine]): The engine used to persist results, if any.
+        ttl (float): The number of seconds a persisted result is kept.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        engine: Optional[AIOEngine] = None,
+        ttl: float = 604800,
+    ) -> None:
+        self.max_entries = max_entries
+        self.engine = engine
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def configure(self) -> None:
+        """
+        Create the TTL index expiring persisted results, or update its TTL.
+        """
+        if self.engine is None:
+            return
+        collection = self.engine.get_collection(
+            nylas_models.CodeExecutionResult
+        )
+        try:
+            await collection.create_index(
+                "creation_date", expireAfterSeconds=int(self.ttl)
+            )
+        except OperationFailure:
+            # The index exists with another TTL.
+            await collection.database.command(
+                "collMod",
+                collection.name,
+                index={
+                    "keyPattern": {"creation_date": 1},
+                    "expireAfterSeconds": int(self.ttl),
+                },
+            )
+
+    def _remember(self, key: str, result: Dict[str, Any]) -> None:
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look a result up in memory, then in MongoDB.
+
+        Args:
+            key (str): The submission key.
+
+        Returns:
+            Optional[Dict[str, Any]]: A copy of the cached result, if any.
+        """
+        return (await self.get_many([key]))[0]
+
+    async def get_many(
+        self, keys: Sequence[str]
+    ) -> List[Optional[Dict[str, Any]]]:
+        """
+        Look results up in memory, then the missing ones in MongoDB, with a
+        single query.
+
+        Args:
+            keys (Sequence[str]): The submission keys.
+
+        Returns:
+            List[Optional[Dict[str, Any]]]: A copy of the cached result of
+                each key, if any.
+        """
+        found: Dict[str, Dict[str, Any]] = {}
+        for key in keys:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                found[key] = self._entries[key]
+        missing = list({key for key in keys if key not in found})
+        if missing and self.engine is not None:
+            try:
+                stored = await self.engine.find(
+                    nylas_models.CodeExecutionResult,
+                    query.in_(nylas_models.CodeExecutionResult.key, missing),
+                )
+            except Exception as err:  # pylint: disable=W0703
+                logger.error(repr(err))
+                stored = []
+            for entry in stored:
+                found[entry.key] = entry.result
+                self._remember(entry.key, entry.result)
+        results: List[Optional[Dict[str, Any]]] = []
+        for key in keys:
+            result = found.get(key)
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                result = copy.deepcopy(result)
+            results.append(result)
+        return results
+
+    async def put(self, key: str, result: Dict[str, Any]) -> None:
+        """
+        Store a result in memory and, if enabled, in MongoDB.
+
+        Args:
+            key (str): The submission key.
+            result (Dict[str, Any]): The result to cache.
+        """
+        result = copy.deepcopy(result)
+        self._remember(key, result)
+        if self.engine is None:
+            return
+        try:
+            await self.engine.save(
+                nylas_models.CodeExecutionResult(key=key, result=result)
+            )
+        except Exception as err:  # pylint: disable=W0703
+            # Another replica may have stored the same key first.
+            logger.debug(repr(err))
+
+
+class CachedExecutor(executors.CodeExecutor):
+    """
+    A code executor that serves cached results before calling its backend.
+
+    Args:
+        backend (executors.CodeExecutor): The executor running cache misses.
+        cache (ExecutionCache): The result cache.
+    """
+
+    def __init__(
+        self, backend: executors.CodeExecutor, cache: ExecutionCache
+    ) -> None:
+        self.backend = backend
+        self.cache = cache
+        self.name = backend.name
+
+    def runner_name(self, submissions: Sequence[Dict[str, Any]]) -> str:
+        return self.backend.runner_name(submissions)
+
+    async def start(self) -> None:
+        await self.backend.start()
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+    async def run(self, submission: Dict[str, Any]) -> Dict[str, Any]:
+        return (await self.run_batch([submission]))[0]
+
+    async def run_batch(
+        self, submissions: Sequence[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        # Results are keyed by the backend that produces them, e.g. the
+        # fallback of a local executor for the languages it cannot run.
+        runner = self.backend.runner_name(submissions)
+        results = await self.cache.get_many(
+            [submission_key(submission, runner) for submission in submissions]
+        )
+        missing = [
+            index for index, result in enumerate(results) if result is None
+        ]
+        if missing:
+            batch = [submissions[index] for index in missing]
+            runner = self.backend.runner_name(batch)
+            fresh = await self.backend.run_batch(batch)
+            for index, result in zip(missing, fresh):
+                results[index] = result
+                if is_cacheable(submissions[index], result):
+                    await self.cache.put(
+                        submission_key(submissions[index], runner), result
+                    )
+        return [result for result in results if result is not None]
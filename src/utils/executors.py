@@ -0,0 +1,526 @@
+"""🏃 Utils Executors Module ⚙️
+
+This module defines the code execution backends used by the `execute-code` endpoints.
+
+Every backend takes Judge0 submission payloads (see `src.utils.judge0.build_submission`)
+and returns Judge0-shaped results, so the routes do not depend on the backend in use.
+
+Classes:
+    - CodeExecutor: The executor interface.
+    - Judge0Executor: Runs submissions on the RapidAPI Judge0 CE API.
+    - SandboxProcess: A warm sandbox worker process.
+    - SandboxPool: A pre-warmed pool of sandbox worker processes.
+    - LocalExecutor: Runs submissions in the local sandbox pool.
+
+Functions:
+    - sandbox_command() -> List[str]: Build the bubblewrap command of a sandbox worker.
+    - create_executor() -> CodeExecutor: Build the executor selected in the settings.
+
+Dependencies:
+    - asyncio: For subprocesses and concurrency.
+    - httpx: For asynchronous HTTP requests.
+    - src.config.settings: Application configuration settings.
+    - src.utils.judge0: Judge0 API helpers.
+    - src.utils.metrics: For the upstream latency metrics.
+
+"""
+
+from abc import (
+    ABC,
+    abstractmethod,
+)
+import asyncio
+import httpx
+import json
+import os
+import shutil
+import sys
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from src.config import (
+    settings,
+)
+from src.utils import (
+    judge0,
+    metrics,
+)
+
+SANDBOX_WORKER_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "sandbox_worker.py"
+)
+# Where the worker script is mounted inside the sandbox.
+SANDBOX_WORKER_MOUNT = "/sandbox/worker.py"
+# The user the sandboxes run as, inside them and, when the server runs as
+# root, outside them too: "nobody".
+SANDBOX_USER_ID = 65534
+
+# The number of seconds a batch of submissions has to complete on Judge0.
+EXECUTION_TIMEOUT = 60
+
+# Judge0 language id -> (file name, command). A `None` command means the
+# program runs inside the warm Python interpreter of the sandbox worker; the
+# other runtimes are started afresh for every job.
+LOCAL_LANGUAGES: Dict[int, Tuple[str, Optional[List[str]]]] = {
+    71: ("main.py", None),
+    63: ("main.js", ["node", "{file}"]),
+    46: ("main.sh", ["bash", "{file}"]),
+    72: ("main.rb", ["ruby", "{file}"]),
+}
+
+
+class ExecutionError(Exception):
+    """Raised when a backend fails to run a submission."""
+
+
+class UnsupportedLanguageError(ExecutionError):
+    """Raised when a backend cannot run the requested language."""
+
+
+def sandbox_command() -> List[str]:
+    """
+    Build the command running a sandbox worker under bubblewrap.
+
+    The worker gets its own user, PID, network, IPC and mount namespaces: it
+    runs as "nobody", only sees its own processes, has no network but its
+    own loopback, and only sees the system directories, the Python
+    installation and its own script, read only, and a private /tmp. The
+    server's files, environment and processes are out of its reach.
+
+    Raises:
+        ExecutionError: If bubblewrap is not installed.
+
+    Returns:
+        List[str]: The command.
+    """
+    bwrap = shutil.which("bwrap")
+    if bwrap is None:
+        raise ExecutionError(
+            "The local executor needs bubblewrap (bwrap) to isolate programs"
+        )
+    python = os.path.realpath(sys.executable)
+    command = [
+        bwrap,
+        "--unshare-all",
+        "--unshare-user",
+        "--uid",
+        str(SANDBOX_USER_ID),
+        "--gid",
+        str(SANDBOX_USER_ID),
+        "--die-with-parent",
+        "--new-session",
+        "--ro-bind",
+        "/usr",
+        "/usr",
+    ]
+    for path in ("/bin", "/sbin", "/lib", "/lib32", "/lib64"):
+        if os.path.islink(path):
+            command += ["--symlink", os.readlink(path), path]
+        elif os.path.isdir(path):
+            command += ["--ro-bind", path, path]
+    for path in ("/etc/alternatives", "/etc/ld.so.cache", "/etc/localtime"):
+        command += ["--ro-bind-try", path, path]
+    mounted = ["/usr/"]
+    for path in (sys.base_prefix, os.path.dirname(python)):
+        if not any((path + "/").startswith(root) for root in mounted):
+            command += ["--ro-bind", path, path]
+            mounted.append(path + "/")
+    return command + [
+        "--ro-bind",
+        SANDBOX_WORKER_PATH,
+        SANDBOX_WORKER_MOUNT,
+        "--proc",
+        "/proc",
+        "--dev",
+        "/dev",
+        "--tmpfs",
+        "/tmp",
+        "--chdir",
+        "/tmp",
+        "--",
+        python,
+        "-I",
+        SANDBOX_WORKER_MOUNT,
+    ]
+
+
+class CodeExecutor(ABC):
+    """
+    The interface shared by all code execution backends.
+
+    Attributes:
+        name (str): The backend name, as used in the settings.
+    """
+
+    name = ""
+
+    async def start(self) -> None:
+        """
+        Acquire the resources needed by the backend.
+        """
+
+    async def close(self) -> None:
+        """
+        Release the resources held by the backend.
+        """
+
+    @abstractmethod
+    async def run(self, submission: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Run a single submission.
+
+        Args:
+            submission (Dict[str, Any]): A Judge0 submission payload.
+
+        Returns:
+            Dict[str, Any]: A Judge0-shaped result.
+        """
+
+    def runner_name(self, submissions: Sequence[Dict[str, Any]]) -> str:
+        """
+        Name the backend that runs a batch of submissions.
+
+        Args:
+            submissions (Sequence[Dict[str, Any]]): Judge0 submission payloads.
+
+        Returns:
+            str: The backend name, e.g. the one of a fallback backend.
+        """
+        return self.name
+
+    async def run_batch(
+        self, submissions: Sequence[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Run several submissions.
+
+        Args:
+            submissions (Sequence[Dict[str, Any]]): Judge0 submission payloads.
+
+        Returns:
+            List[Dict[str, Any]]: The results, in the order of `submissions`.
+        """
+        return list(
+            await asyncio.gather(
+                *(self.run(submission) for submission in submissions)
+            )
+        )
+
+
+class Judge0Executor(CodeExecutor):
+    """
+    Runs submissions on the RapidAPI Judge0 CE API.
+
+    A single HTTP client is shared by all the submissions, and a single
+    submission is sent as a batch of one so that both paths share the same
+    polling loop.
+    """
+
+    name = "judge0"
+
+    def __init__(self, timeout: float = EXECUTION_TIMEOUT) -> None:
+        self.timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """
+        Return the shared HTTP client, creating it on first use.
+
+        Returns:
+            httpx.AsyncClient: The shared HTTP client.
+        """
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=10, transport=metrics.InstrumentedTransport("judge0")
+            )
+        return self._client
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def run(self, submission: Dict[str, Any]) -> Dict[str, Any]:
+        return (await self.run_batch([submission]))[0]
+
+    async def run_batch(
+        self, submissions: Sequence[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        tokens = await judge0.submit_batch(self.client, submissions)
+        return await judge0.poll_batch(self.client, tokens, self.timeout)
+
+
+class SandboxProcess:
+    """
+    A warm sandbox worker process running `sandbox_worker.py`.
+
+    The worker handles one job at a time; the pool guarantees exclusive use.
+    """
+
+    def __init__(self, process: asyncio.subprocess.Process) -> None:
+        self.process = process
+        self._killed = False
+
+    @classmethod
+    async def spawn(cls) -> "SandboxProcess":
+        """
+        Start a worker and wait until it is ready to accept jobs.
+
+        Raises:
+            ExecutionError: If the worker cannot be started.
+
+        Returns:
+            SandboxProcess: The started worker.
+        """
+        user: Dict[str, Any] = {}
+        if os.geteuid() == 0:
+            # Never map the sandbox to root, even inside its namespace.
+            user = {
+                "user": SANDBOX_USER_ID,
+                "group": SANDBOX_USER_ID,
+                "extra_groups": [],
+            }
+        process = await asyncio.create_subprocess_exec(
+            *sandbox_command(),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            # Submissions must not see the server's secrets.
+            env={
+                "PATH": os.environ.get("PATH", "/usr/bin:/bin"),
+                "LANG": "C.UTF-8",
+                "HOME": "/tmp",
+            },
+            limit=1024 * 1024,
+            **user,
+        )
+        assert process.stdout is not None
+        ready = await process.stdout.readline()
+        if ready.strip() != b"ready":
+            if process.returncode is None:
+                process.kill()
+            raise ExecutionError("Sandbox worker failed to start")
+        return cls(process)
+
+    @property
+    def alive(self) -> bool:
+        """
+        Whether the worker process is still running.
+
+        Returns:
+            bool: True if the worker is running.
+        """
+        return not self._killed and self.process.returncode is None
+
+    async def run(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Send a job to the worker and wait for its result.
+
+        Args:
+            job (Dict[str, Any]): The job to run.
+
+        Raises:
+            ExecutionError: If the worker dies or does not answer in time.
+
+        Returns:
+            Dict[str, Any]: A Judge0-shaped result.
+        """
+        assert self.process.stdin is not None
+        assert self.process.stdout is not None
+        self.process.stdin.write(json.dumps(job).encode("utf-8") + b"\n")
+        try:
+            await self.process.stdin.drain()
+            line = await asyncio.wait_for(
+                self.process.stdout.readline(),
+                timeout=float(job["wall_time_limit"]) + 5,
+            )
+        except (asyncio.TimeoutError, ConnectionError) as err:
+            self.kill()
+            raise ExecutionError("Sandbox worker is not responding") from err
+        except asyncio.CancelledError:
+            # The pending result would be read by the next job.
+            self.kill()
+            raise
+        if not line:
+            self.kill()
+            raise ExecutionError("Sandbox worker exited")
+        return json.loads(line)
+
+    def kill(self) -> None:
+        """
+        Kill the worker process.
+        """
+        if self.process.returncode is None:
+            self.process.kill()
+        self._killed = True
+
+    async def close(self) -> None:
+        """
+        Stop the worker by closing its stdin, killing it if needed.
+        """
+        if self.process.returncode is not None:
+            return
+        assert self.process.stdin is not None
+        self.process.stdin.close()
+        try:
+            await asyncio.wait_for(self.process.wait(), timeout=2)
+        except asyncio.TimeoutError:
+            self.kill()
+            await self.process.wait()
+
+
+class SandboxPool:
+    """
+    A pre-warmed pool of sandbox worker processes.
+
+    Each slot of the pool holds a worker, or None once its worker died and
+    could not be replaced: the next job taking the slot spawns a new one, so
+    the pool keeps its size, and a failing spawn fails that job instead of
+    leaving later jobs waiting for a worker forever.
+
+    Args:
+        size (int): The number of workers, i.e. the number of jobs that can
+            run at the same time.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self._idle: "asyncio.Queue[Optional[SandboxProcess]]" = asyncio.Queue()
+        self._workers: List[SandboxProcess] = []
+
+    async def start(self) -> None:
+        """
+        Spawn all the workers of the pool.
+        """
+        self._workers = list(
+            await asyncio.gather(
+                *(SandboxProcess.spawn() for _ in range(self.size))
+            )
+        )
+        for worker in self._workers:
+            self._idle.put_nowait(worker)
+
+    async def run(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Run a job on the next idle slot, spawning its worker if it died.
+
+        Args:
+            job (Dict[str, Any]): The job to run.
+
+        Raises:
+            ExecutionError: If the worker dies, or cannot be spawned.
+
+        Returns:
+            Dict[str, Any]: A Judge0-shaped result.
+        """
+        worker = await self._idle.get()
+        try:
+            if worker is None:
+                worker = await SandboxProcess.spawn()
+                self._workers.append(worker)
+            return await worker.run(job)
+        finally:
+            if worker is not None and not worker.alive:
+                self._workers.remove(worker)
+                worker = None
+            self._idle.put_nowait(worker)
+
+    async def close(self) -> None:
+        """
+        Stop all the workers of the pool.
+        """
+        await asyncio.gather(*(worker.close() for worker in self._workers))
+        self._workers = []
+
+
+class LocalExecutor(CodeExecutor):
+    """
+    Runs submissions in a pool of warm, bubblewrap-sandboxed local processes.
+
+    Args:
+        pool_size (int): The number of sandbox workers.
+        fallback (Optional[CodeExecutor]): The backend used for languages that
+            cannot run locally.
+    """
+
+    name = "local"
+
+    def __init__(
+        self, pool_size: int, fallback: Optional[CodeExecutor] = None
+    ) -> None:
+        self.pool = SandboxPool(pool_size)
+        self.fallback = fallback
+        self.languages = {
+            language_id: (file_name, command)
+            for language_id, (file_name, command) in LOCAL_LANGUAGES.items()
+            if command is None or shutil.which(command[0])
+        }
+
+    async def start(self) -> None:
+        await self.pool.start()
+        if self.fallback is not None:
+            await self.fallback.start()
+
+    async def close(self) -> None:
+        await self.pool.close()
+        if self.fallback is not None:
+            await self.fallback.close()
+
+    def _runs_locally(self, submissions: Sequence[Dict[str, Any]]) -> bool:
+        return all(
+            int(submission["language_id"]) in self.languages
+            for submission in submissions
+        )
+
+    def runner_name(self, submissions: Sequence[Dict[str, Any]]) -> str:
+        if self._runs_locally(submissions) or self.fallback is None:
+            return self.name
+        return self.fallback.runner_name(submissions)
+
+    def _job(self, submission: Dict[str, Any]) -> Dict[str, Any]:
+        file_name, command = self.languages[int(submission["language_id"])]
+        return dict(submission, file_name=file_name, command=command)
+
+    async def run(self, submission: Dict[str, Any]) -> Dict[str, Any]:
+        return (await self.run_batch([submission]))[0]
+
+    async def run_batch(
+        self, submissions: Sequence[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        if not self._runs_locally(submissions):
+            if self.fallback is None:
+                raise UnsupportedLanguageError(
+                    "This language is not supported by the local executor"
+                )
+            return await self.fallback.run_batch(submissions)
+        return list(
+            await asyncio.gather(
+                *(
+                    self.pool.run(self._job(submission))
+                    for submission in submissions
+                )
+            )
+        )
+
+
+def create_executor() -> CodeExecutor:
+    """
+    Build the code executor selected by the `CODE_EXECUTOR` setting.
+
+    Returns:
+        CodeExecutor: A Judge0 executor, or a local executor falling back to
+            Judge0 for the languages it cannot run.
+    """
+    app_settings = settings()
+    if app_settings.CODE_EXECUTOR == LocalExecutor.name:
+        return LocalExecutor(
+            int(app_settings.CODE_EXECUTOR_POOL_SIZE),
+            fallback=(Judge0Executor() if app_settings.RAPIDAPI_KEY else None),
+        )
+    return Judge0Executor()
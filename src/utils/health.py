@@ -0,0 +1,282 @@
+"""🩺 Utils Health Module 🚦
+
+This module contains the liveness and readiness probes.
+
+Liveness only tells that the event loop still answers. Readiness tells whether the
+process can serve traffic: its MongoDB pool answers a ping, the Nylas API is reachable,
+its event loop is not lagging and its code execution queue is not full.
+haproxy polls readiness every couple of seconds on every replica, so the probe result
+is cached for a short while and concurrent polls share a single probe; a poll never
+costs more than a dictionary lookup, however often it comes.
+
+The Nylas API is shared by every replica, so by default an outage is reported as
+degraded without failing readiness: taking every replica out of rotation would not
+make Nylas answer, and would stop the requests that do not need it. So is a slow
+MongoDB ping, the database being shared as well; only a failed or timed out ping fails
+readiness.
+
+Classes:
+    - LoopLagMonitor: Measures the event loop lag in the background.
+    - HealthChecker: Runs and caches the readiness probes.
+
+Dependencies:
+    - asyncio: For the lag monitor and the probe timeouts.
+    - httpx: For probing the Nylas API.
+    - motor: For pinging MongoDB.
+
+"""
+
+import asyncio
+import httpx
+import logging
+from motor.motor_asyncio import (
+    AsyncIOMotorClient,
+)
+import time
+from typing import (
+    Any,
+    Dict,
+    Optional,
+)
+
+from src.utils import (
+    admission,
+    metrics,
+)
+
+logger = logging.getLogger(__name__)
+
+OK = "ok"
+DEGRADED = "degraded"
+FAILING = "failing"
+
+
+class LoopLagMonitor:
+    """
+    Measures how late the event loop wakes up a task sleeping for a fixed
+    interval; a blocked or overloaded loop wakes it up late.
+
+    Args:
+        interval (float): The number of seconds between two measures.
+    """
+
+    def __init__(self, interval: float = 0.5) -> None:
+        self.interval = interval
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self._woke_up = time.perf_counter()
+        self._task: Optional[asyncio.Task] = None  # type: ignore
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self._woke_up = time.perf_counter()
+            self.lag = max(self._woke_up - started - self.interval, 0.0)
+            self.max_lag = max(self.max_lag, self.lag)
+            metrics.EVENT_LOOP_LAG.set(self.lag)
+
+    def start(self) -> None:
+        """
+        Start measuring.
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stop measuring.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    @property
+    def current(self) -> float:
+        """
+        The current lag: the last measure, or how overdue the next one is
+        when the loop was blocked since.
+
+        Returns:
+            float: The lag in seconds.
+        """
+        overdue = time.perf_counter() - self._woke_up - self.interval
+        return max(self.lag, overdue)
+
+
+class HealthChecker:
+    """
+    Runs and caches the readiness probes.
+
+    Args:
+        client (AsyncIOMotorClient): The MongoDB client.
+        nylas_api_server (str): The Nylas API URL.
+        monitor (LoopLagMonitor): The event loop lag monitor.
+        admission_controller (admission.AdmissionController): The code
+            execution admission control.
+        cache_ttl (float): The number of seconds a probe result is reused.
+        max_mongo_latency (float): The slowest MongoDB ping not reported as
+            degraded, in seconds.
+        max_loop_lag (float): The largest event loop lag, in seconds.
+        max_execution_queue (int): The longest code execution queue.
+        nylas_critical (bool): Whether a Nylas outage fails readiness.
+        timeout (float): The number of seconds a probe can take.
+    """
+
+    def __init__(
+        self,
+        client: AsyncIOMotorClient,
+        nylas_api_server: str,
+        monitor: LoopLagMonitor,
+        admission_controller: admission.AdmissionController,
+        cache_ttl: float = 2.0,
+        max_mongo_latency: float = 0.5,
+        max_loop_lag: float = 0.5,
+        max_execution_queue: int = 48,
+        nylas_critical: bool = False,
+        timeout: float = 2.0,
+    ) -> None:
+        self.client = client
+        self.nylas_api_server = nylas_api_server
+        self.monitor = monitor
+        self.admission = admission_controller
+        self.cache_ttl = cache_ttl
+        self.max_mongo_latency = max_mongo_latency
+        self.max_loop_lag = max_loop_lag
+        self.max_execution_queue = max_execution_queue
+        self.nylas_critical = nylas_critical
+        self.timeout = timeout
+        self._http = httpx.AsyncClient(timeout=timeout)
+        self._result: Optional[Dict[str, Any]] = None
+        self._checked_at = 0.0
+        self._probe: Optional[asyncio.Task] = None  # type: ignore
+
+    async def close(self) -> None:
+        """
+        Release the HTTP client.
+        """
+        await self._http.aclose()
+
+    async def _check_mongo(self) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(
+                self.client.admin.command("ping"), self.timeout
+            )
+        except Exception as err:  # pylint: disable=W0703
+            return {"status": FAILING, "error": repr(err)}
+        latency = time.perf_counter() - started
+        return {
+            "status": OK if latency <= self.max_mongo_latency else DEGRADED,
+            "latency": latency,
+        }
+
+    async def _check_nylas(self) -> Dict[str, Any]:
+        failed = FAILING if self.nylas_critical else DEGRADED
+        started = time.perf_counter()
+        try:
+            # Any HTTP answer proves the transport, authentication aside.
+            response = await self._http.head(self.nylas_api_server)
+        except httpx.HTTPError as err:
+            return {"status": failed, "error": repr(err)}
+        return {
+            "status": failed if response.status_code >= 500 else OK,
+            "latency": time.perf_counter() - started,
+        }
+
+    def _check_loop(self) -> Dict[str, Any]:
+        lag = self.monitor.current
+        return {
+            "status": OK if lag <= self.max_loop_lag else FAILING,
+            "lag": lag,
+            "max_lag": self.monitor.max_lag,
+        }
+
+    def _check_executions(self) -> Dict[str, Any]:
+        queued = self.admission.queued
+        return {
+            "status": OK if queued <= self.max_execution_queue else FAILING,
+            "queued": queued,
+            "running": self.admission.running,
+        }
+
+    async def _run_probes(self) -> Dict[str, Any]:
+        mongo, nylas = await asyncio.gather(
+            self._check_mongo(), self._check_nylas()
+        )
+        checks: Dict[str, Dict[str, Any]] = {
+            "mongodb": mongo,
+            "nylas": nylas,
+            "event_loop": self._check_loop(),
+            "executions": self._check_executions(),
+        }
+        statuses = {check["status"] for check in checks.values()}
+        status = (
+            FAILING
+            if FAILING in statuses
+            else DEGRADED if DEGRADED in statuses else OK
+        )
+        if status != OK:
+            logger.warning(
+                "Readiness %s: %s",
+                status,
+                ", ".join(
+                    name
+                    for name, check in checks.items()
+                    if check["status"] != OK
+                ),
+            )
+        return {"status": status, "checks": checks}
+
+    async def _refresh(self) -> Dict[str, Any]:
+        if self._probe is None:
+            self._probe = asyncio.create_task(self._run_probes())
+        probe = self._probe
+        try:
+            # Shielded, a disconnecting poller does not cancel the probe shared
+            # with the others.
+            result: Dict[str, Any] = await asyncio.shield(probe)
+            self._result = result
+            self._checked_at = time.monotonic()
+            return result
+        finally:
+            if self._probe is probe and probe.done():
+                self._probe = None
+
+    async def readiness(self) -> Dict[str, Any]:
+        """
+        Get the readiness of the process, probing at most once per
+        `cache_ttl` seconds.
+
+        Returns:
+            Dict[str, Any]: The overall status, "ok", "degraded" or
+                "failing", the status of each check and the age of the
+                result.
+        """
+        result = self._result
+        if (
+            result is None
+            or time.monotonic() - self._checked_at > self.cache_ttl
+        ):
+            result = await self._refresh()
+        return {
+            **result,
+            "age": time.monotonic() - self._checked_at,
+        }
+
+    @staticmethod
+    def is_ready(result: Dict[str, Any]) -> bool:
+        """
+        Whether a readiness result allows serving traffic.
+
+        Args:
+            result (Dict[str, Any]): The result of `readiness`.
+
+        Returns:
+            bool: False if any check is failing.
+        """
+        return bool(result["status"] != FAILING)
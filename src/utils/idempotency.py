@@ -0,0 +1,325 @@
+"""🔁 Utils Idempotency Module 🔑
+
+This module contains the `Idempotency-Key` support of the POST endpoints.
+
+A client (or the load balancer, when it retries) that sends the same `Idempotency-Key`
+twice gets the response of the first request instead of running it again. Keys are
+scoped by caller and path, stored with their response in a MongoDB collection whose
+TTL index removes them after a while, and bound to a fingerprint of the request body so
+a key cannot be reused for a different request. While the first request is running,
+duplicates get a 409 asking them to retry; if it failed with a 5xx, was turned away
+with a status worth retrying (408, 409 or 429, e.g. by the code execution admission
+control), or its process died, the key is released and the next attempt runs the
+request again.
+
+Classes:
+    - IdempotencyStore: The MongoDB collection of keys and responses.
+    - IdempotencyMiddleware: The ASGI middleware replaying responses.
+
+Dependencies:
+    - hashlib: For fingerprints.
+    - motor.motor_asyncio.AsyncIOMotorCollection: For the key collection.
+    - starlette: For the ASGI types and responses.
+
+"""
+
+from datetime import (
+    datetime,
+    timedelta,
+)
+import hashlib
+import logging
+from motor.motor_asyncio import (
+    AsyncIOMotorCollection,
+)
+from pymongo.errors import (
+    DuplicateKeyError,
+)
+from starlette.datastructures import (
+    Headers,
+)
+from starlette.responses import (
+    JSONResponse,
+    Response,
+)
+from starlette.types import (
+    ASGIApp,
+    Message,
+    Receive,
+    Scope,
+    Send,
+)
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "idempotency-key"
+REPLAYED_HEADER = "idempotent-replayed"
+
+# Response headers kept with a stored response.
+STORED_HEADERS = {
+    "content-type",
+    "location",
+    "retry-after",
+    "x-queue-position",
+    "x-queue-wait",
+}
+
+# The largest response body worth storing, in bytes.
+MAX_STORED_BODY = 1024 * 1024
+
+# Statuses asking the client to retry later, whose response is not stored.
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+class IdempotencyStore:
+    """
+    The MongoDB collection of idempotency keys and their responses.
+
+    Args:
+        collection (AsyncIOMotorCollection): The key collection.
+        ttl (float): The number of seconds a key is remembered.
+        lock_timeout (float): The number of seconds a running request holds
+            its key before another attempt can take it over.
+    """
+
+    def __init__(
+        self,
+        collection: AsyncIOMotorCollection,
+        ttl: float = 86400,
+        lock_timeout: float = 60,
+    ) -> None:
+        self.collection = collection
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.replayed = 0
+
+    async def configure(self) -> None:
+        """
+        Create the TTL index removing expired keys.
+        """
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def begin(
+        self, key: str, fingerprint: str
+    ) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """
+        Claim a key for a new request, or find what happened to it.
+
+        Args:
+            key (str): The scoped idempotency key.
+            fingerprint (str): The hash of the request.
+
+        Returns:
+            Tuple[str, Optional[Dict[str, Any]]]: "new" if the request should
+                run, "completed" with the stored document, "in_progress" or
+                "mismatch".
+        """
+        now = datetime.utcnow()
+        claim = {
+            "fingerprint": fingerprint,
+            "status": "in_progress",
+            "locked_until": now + timedelta(seconds=self.lock_timeout),
+            "expires_at": now + timedelta(seconds=self.ttl),
+        }
+        try:
+            await self.collection.insert_one({"_id": key, **claim})
+            return "new", None
+        except DuplicateKeyError:
+            pass
+        # Take over the key of a request whose process died.
+        taken = await self.collection.find_one_and_update(
+            {
+                "_id": key,
+                "fingerprint": fingerprint,
+                "status": "in_progress",
+                "locked_until": {"$lt": now},
+            },
+            {"$set": claim},
+        )
+        if taken is not None:
+            return "new", None
+        stored = await self.collection.find_one({"_id": key})
+        if stored is None:
+            # Released in the meantime, let the client retry.
+            return "in_progress", None
+        if stored["fingerprint"] != fingerprint:
+            return "mismatch", stored
+        return stored["status"], stored
+
+    async def complete(
+        self,
+        key: str,
+        status_code: int,
+        headers: List[Tuple[str, str]],
+        body: bytes,
+    ) -> None:
+        """
+        Store the response of a request.
+
+        Args:
+            key (str): The scoped idempotency key.
+            status_code (int): The response status.
+            headers (List[Tuple[str, str]]): The response headers to replay.
+            body (bytes): The response body.
+        """
+        await self.collection.update_one(
+            {"_id": key},
+            {
+                "$set": {
+                    "status": "completed",
+                    "status_code": status_code,
+                    "headers": headers,
+                    "body": body,
+                },
+                "$unset": {"locked_until": ""},
+            },
+        )
+
+    async def release(self, key: str) -> None:
+        """
+        Forget a key, so the next attempt runs the request again.
+
+        Args:
+            key (str): The scoped idempotency key.
+        """
+        await self.collection.delete_one({"_id": key, "status": "in_progress"})
+
+
+class IdempotencyMiddleware:
+    """
+    Replays the stored response of requests carrying a known `Idempotency-Key`.
+
+    The store is looked up on `app.state.idempotency` on every request, so
+    requests are passed through untouched until the application has started.
+
+    Args:
+        app (ASGIApp): The wrapped application.
+        methods (Tuple[str, ...]): The methods keys are honoured for.
+    """
+
+    def __init__(
+        self, app: ASGIApp, methods: Tuple[str, ...] = ("POST",)
+    ) -> None:
+        self.app = app
+        self.methods = methods
+
+    async def __call__(
+        self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        if scope["type"] != "http" or scope["method"] not in self.methods:
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        idempotency_key = headers.get(IDEMPOTENCY_HEADER)
+        store: Optional[IdempotencyStore] = getattr(
+            scope["app"].state, "idempotency", None
+        )
+        if not idempotency_key or store is None:
+            await self.app(scope, receive, send)
+            return
+
+        # Buffer the body to fingerprint it, then hand it over unchanged.
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+        body_replayed = False
+
+        async def replay_body() -> Message:
+            nonlocal body_replayed
+            if body_replayed:
+                # Later calls wait for the client to disconnect.
+                return await receive()
+            body_replayed = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        caller = headers.get("authorization") or headers.get("email") or ""
+        key = hashlib.sha256(
+            "\n".join(
+                (caller, scope["method"], scope["path"], idempotency_key)
+            ).encode("utf-8")
+        ).hexdigest()
+        fingerprint = hashlib.sha256(
+            scope.get("query_string", b"") + b"\n" + body
+        ).hexdigest()
+
+        try:
+            outcome, stored = await store.begin(key, fingerprint)
+        except Exception as err:  # pylint: disable=W0703
+            # Without the store the request runs as if it had no key.
+            logger.error(repr(err))
+            await self.app(scope, replay_body, send)
+            return
+
+        if outcome == "completed" and stored is not None:
+            store.replayed += 1
+            response: Response = Response(
+                content=stored["body"],
+                status_code=stored["status_code"],
+                headers={
+                    **dict(stored["headers"]),
+                    REPLAYED_HEADER: "true",
+                },
+            )
+            await response(scope, replay_body, send)
+            return
+        if outcome == "mismatch":
+            response = JSONResponse(
+                {
+                    "detail": "This Idempotency-Key was used for a "
+                    "different request."
+                },
+                status_code=422,
+            )
+            await response(scope, replay_body, send)
+            return
+        if outcome == "in_progress":
+            response = JSONResponse(
+                {"detail": "A request with this Idempotency-Key is running."},
+                status_code=409,
+                headers={"Retry-After": "1"},
+            )
+            await response(scope, replay_body, send)
+            return
+
+        status_code = 500
+        response_headers: List[Tuple[str, str]] = []
+        chunks: List[bytes] = []
+
+        async def capture(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                for name, value in message.get("headers", []):
+                    if name.decode("latin-1").lower() in STORED_HEADERS:
+                        response_headers.append(
+                            (name.decode("latin-1"), value.decode("latin-1"))
+                        )
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_body, capture)
+        except BaseException:
+            await store.release(key)
+            raise
+        content = b"".join(chunks)
+        if (
+            status_code >= 500
+            or status_code in RETRYABLE_STATUS_CODES
+            or len(content) > MAX_STORED_BODY
+        ):
+            await store.release(key)
+        else:
+            await store.complete(key, status_code, response_headers, content)
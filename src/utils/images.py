@@ -0,0 +1,312 @@
+"""🖼️ Utils Images Module 📐
+
+This module contains the profile image pipeline.
+
+Uploaded images are decoded once, cropped to a square and re-encoded into a few fixed
+sizes, so rendering an avatar never resizes anything nor sends the full upload. Each
+variant is identified by a strong ETag, the hash of its bytes, which the users store so
+that conditional requests are answered with a 304 without fetching the image. URLs that
+carry the ETag as a version are cached by browsers and proxies for a year; bare URLs are
+cached briefly and revalidated.
+
+Classes:
+    - InvalidImage: Raised when an upload is not a usable image.
+
+Functions:
+    - detect_format(prefix: bytes) -> Optional[str]: Detect an image format from its first bytes.
+    - make_variants(source) -> Dict[str, bytes]: Resize and re-encode an image.
+    - compute_etag(content: bytes) -> str: The strong ETag of a variant.
+    - variant_key(user_id: str, variant: str) -> str: The storage key of a variant.
+    - image_response(request, content, etag, versioned) -> Response: Serve an image.
+    - file_response(path, etag, versioned) -> Response: Serve an image from a file.
+    - not_modified(request: Request, etag: str) -> bool: Whether a revalidation can get a 304.
+
+Dependencies:
+    - PIL: For decoding, resizing and encoding images.
+    - hashlib: For the ETags.
+    - starlette: For the requests and responses.
+
+"""
+
+from PIL import (
+    Image,
+    ImageOps,
+    UnidentifiedImageError,
+)
+import hashlib
+from io import (
+    BytesIO,
+)
+import os
+import re
+from starlette.concurrency import (
+    run_in_threadpool,
+)
+from starlette.requests import (
+    Request,
+)
+from starlette.responses import (
+    Response,
+    StreamingResponse,
+)
+from typing import (
+    IO,
+    AsyncIterator,
+    Dict,
+    Optional,
+    Tuple,
+    Union,
+)
+
+# The side, in pixels, of each variant.
+VARIANTS = {
+    "small": 48,
+    "medium": 128,
+    "large": 512,
+}
+DEFAULT_VARIANT = "large"
+
+# Images above this many pixels are rejected before being decoded.
+MAX_PIXELS = 40_000_000
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, max-age=300"
+
+# The leading bytes of the accepted formats.
+SIGNATURES = {
+    b"\x89PNG\r\n\x1a\n": "PNG",
+    b"\xff\xd8\xff": "JPEG",
+    b"GIF87a": "GIF",
+    b"GIF89a": "GIF",
+}
+FORMATS = ["PNG", "JPEG", "GIF", "WEBP"]
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# The size of the chunks read when streaming a file.
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+class InvalidImage(Exception):
+    """
+    Raised when an upload is not an image, or is too large to decode.
+    """
+
+
+def detect_format(prefix: bytes) -> Optional[str]:
+    """
+    Detect the format of an image from its first bytes, before decoding it.
+
+    Args:
+        prefix (bytes): The first bytes of the file, at least 12.
+
+    Returns:
+        Optional[str]: One of `FORMATS`, or None if the format is not accepted.
+    """
+    for signature, image_format in SIGNATURES.items():
+        if prefix.startswith(signature):
+            return image_format
+    if prefix[:4] == b"RIFF" and prefix[8:12] == b"WEBP":
+        return "WEBP"
+    return None
+
+
+def make_variants(source: Union[bytes, IO[bytes]]) -> Dict[str, bytes]:
+    """
+    Crop an image to a square and encode it as a PNG of each variant size;
+    CPU bound, so it runs in a thread pool.
+
+    Args:
+        source (Union[bytes, IO[bytes]]): The uploaded image, or a file
+            holding it.
+
+    Raises:
+        InvalidImage: If the data cannot be decoded as an image.
+
+    Returns:
+        Dict[str, bytes]: The encoded variants, by name.
+    """
+    try:
+        if isinstance(source, bytes):
+            source = BytesIO(source)
+        with Image.open(source, formats=FORMATS) as opened:
+            if opened.width * opened.height > MAX_PIXELS:
+                raise InvalidImage("The image is too large.")
+            opened.load()
+            # Phones store the orientation apart from the pixels.
+            image = ImageOps.exif_transpose(opened)
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise InvalidImage("The file is not a valid image.")
+    variants = {}
+    for name, side in VARIANTS.items():
+        resized = ImageOps.fit(image, (side, side), Image.Resampling.LANCZOS)
+        output = BytesIO()
+        resized.save(output, format="PNG", optimize=True)
+        variants[name] = output.getvalue()
+    return variants
+
+
+def compute_etag(content: bytes) -> str:
+    """
+    Compute the strong ETag of an image, without the quotes.
+
+    Args:
+        content (bytes): The image.
+
+    Returns:
+        str: The truncated SHA-256 of the image.
+    """
+    return hashlib.sha256(content).hexdigest()[:32]
+
+
+def variant_key(user_id: str, variant: str) -> str:
+    """
+    Get the storage key of a user's profile image variant.
+
+    Args:
+        user_id (str): The user id.
+        variant (str): The variant name.
+
+    Returns:
+        str: The storage key.
+    """
+    return f"user/{user_id}/profile-{variant}.png"
+
+
+def _cache_headers(etag: str, versioned: bool) -> Dict[str, str]:
+    return {
+        "ETag": f'"{etag}"',
+        "Cache-Control": (
+            IMMUTABLE_CACHE_CONTROL if versioned else REVALIDATE_CACHE_CONTROL
+        ),
+        "Accept-Ranges": "bytes",
+    }
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    match = RANGE_PATTERN.match(header.strip())
+    if match is None or not any(match.groups()):
+        return None
+    start, end = match.groups()
+    if not start:
+        # A suffix range, the last N bytes.
+        first, last = max(size - int(end), 0), size - 1
+    else:
+        first = int(start)
+        last = size - 1 if not end else min(int(end), size - 1)
+    if first > last:
+        # E.g. "bytes=5-3", or a range past the end of the content.
+        return None
+    return first, last
+
+
+def image_response(
+    request: Request,
+    content: bytes,
+    etag: str,
+    versioned: bool,
+    media_type: str = "image/png",
+) -> Response:
+    """
+    Serve an image, honouring `If-None-Match` and single `Range` requests.
+
+    Args:
+        request (Request): The incoming request.
+        content (bytes): The image.
+        etag (str): The image's ETag, without the quotes.
+        versioned (bool): Whether the URL carries the ETag, making the
+            response cacheable forever.
+        media_type (str): The image content type.
+
+    Returns:
+        Response: A 200, 206, 304 or 416 response.
+    """
+    headers = _cache_headers(etag, versioned)
+    if not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range == f'"{etag}"'):
+        byte_range = _parse_range(range_header, len(content))
+        if byte_range is None:
+            return Response(
+                status_code=416,
+                headers={
+                    **headers,
+                    "Content-Range": f"bytes */{len(content)}",
+                },
+            )
+        start, end = byte_range
+        stop = end + 1
+        return Response(
+            content[start:stop],
+            status_code=206,
+            media_type=media_type,
+            headers={
+                **headers,
+                "Content-Range": f"bytes {start}-{end}/{len(content)}",
+            },
+        )
+    return Response(content, media_type=media_type, headers=headers)
+
+
+def file_response(
+    path: str, etag: str, versioned: bool, media_type: str = "image/png"
+) -> Response:
+    """
+    Serve an image from a local file, streaming it instead of reading it into
+    memory. Conditional and range requests go through `image_response`.
+
+    The file is opened before returning, so the response still streams it if
+    the file is unlinked in the meantime, e.g. when evicted from a cache. It
+    is not a zero-copy path: uvicorn has no ASGI sendfile extension, so the
+    file is read in `FILE_CHUNK_SIZE` chunks in the thread pool.
+
+    Args:
+        path (str): The image file.
+        etag (str): The image's ETag, without the quotes.
+        versioned (bool): Whether the URL carries the ETag.
+        media_type (str): The image content type.
+
+    Raises:
+        FileNotFoundError: If the file no longer exists.
+
+    Returns:
+        Response: A 200 response.
+    """
+    file = open(path, "rb")
+    size = os.fstat(file.fileno()).st_size
+
+    async def chunks() -> AsyncIterator[bytes]:
+        with file:
+            while True:
+                chunk = await run_in_threadpool(file.read, FILE_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+    return StreamingResponse(
+        chunks(),
+        media_type=media_type,
+        headers={
+            **_cache_headers(etag, versioned),
+            "Content-Length": str(size),
+        },
+    )
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    """
+    Whether the client already holds this version of the image.
+
+    Args:
+        request (Request): The incoming request.
+        etag (str): The image's ETag, without the quotes.
+
+    Returns:
+        bool: True if `If-None-Match` lists the ETag.
+    """
+    if_none_match = request.headers.get("if-none-match", "")
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return f'"{etag}"' in tags or "*" in tags
@@ -0,0 +1,231 @@
+"""⚖️ Utils Judge0 Module 🧪
+
+This module contains helpers for running code through the Judge0 CE API hosted on RapidAPI.
+
+Functions:
+    - judge0_headers() -> Dict[str, str]: Build the RapidAPI request headers.
+    - build_submission(code, language_id, stdin, expected_output) -> Dict[str, Any]:
+        Build a Judge0 submission payload with the default resource limits.
+    - submit_batch(client, submissions) -> List[str]: Create several submissions in one request.
+    - poll_batch(client, tokens) -> List[Dict[str, Any]]: Poll a batch of submissions until done.
+    - summarize_batch(test_cases, results, wall_time) -> Dict[str, Any]: Aggregate batch results.
+
+Dependencies:
+    - asyncio: For sleeping between polls.
+    - httpx: For asynchronous HTTP requests.
+    - src.config.settings: Application configuration settings.
+
+"""
+
+import asyncio
+import httpx
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+)
+
+from src.config import (
+    settings,
+)
+
+# Judge0 status ids: 1 "In Queue", 2 "Processing", 3 "Accepted",
+# anything above 3 is a final (failed) state.
+JUDGE0_PENDING_STATUSES = {1, 2}
+JUDGE0_ACCEPTED_STATUS = 3
+
+JUDGE0_RESULT_FIELDS = (
+    "token,stdout,stderr,compile_output,message,status,time,memory"
+)
+
+
+class Judge0Error(Exception):
+    """Raised when Judge0 rejects a submission or a status request."""
+
+
+def judge0_headers() -> Dict[str, str]:
+    """
+    Build the headers required by the RapidAPI Judge0 endpoints.
+
+    Returns:
+        Dict[str, str]: The request headers.
+    """
+    return {
+        "X-RapidAPI-Key": settings().RAPIDAPI_KEY,
+        "Content-Type": "application/json",
+    }
+
+
+def build_submission(
+    code: str,
+    language_id: int,
+    stdin: str = "",
+    expected_output: str = "",
+) -> Dict[str, Any]:
+    """
+    Build a Judge0 submission payload with the default resource limits.
+
+    Args:
+        code (str): The program source code.
+        language_id (int): The Judge0 language id.
+        stdin (str): The standard input fed to the program.
+        expected_output (str): The output the program is expected to print.
+
+    Returns:
+        Dict[str, Any]: A Judge0 submission payload.
+    """
+    return {
+        "source_code": code,
+        "language_id": int(language_id),
+        "stdin": stdin,
+        "expected_output": expected_output,
+        "cpu_time_limit": 2,
+        "cpu_extra_time": 0.5,
+        "wall_time_limit": 5,
+        "memory_limit": 512000,
+        "max_processes_and_or_threads": 60,
+    }
+
+
+async def submit_batch(
+    client: httpx.AsyncClient, submissions: Sequence[Dict[str, Any]]
+) -> List[str]:
+    """
+    Create several Judge0 submissions with a single request.
+
+    Args:
+        client (httpx.AsyncClient): The HTTP client to use.
+        submissions (Sequence[Dict[str, Any]]): Submission payloads.
+
+    Raises:
+        Judge0Error: If Judge0 rejects the batch or any of its submissions.
+
+    Returns:
+        List[str]: The submission tokens, in the order of `submissions`.
+    """
+    response = await client.post(
+        f"{settings().JUDGE0_API_URL}/submissions/batch",
+        params={"base64_encoded": "false"},
+        json={"submissions": list(submissions)},
+        headers=judge0_headers(),
+    )
+    if response.status_code != 201:
+        raise Judge0Error("Code execution failed")
+    tokens = []
+    for item in response.json():
+        if "token" not in item:
+            raise Judge0Error(f"Invalid submission: {item}")
+        tokens.append(item["token"])
+    return tokens
+
+
+def _is_pending(result: Optional[Dict[str, Any]]) -> bool:
+    return result is None or result["status"]["id"] in JUDGE0_PENDING_STATUSES
+
+
+async def poll_batch(
+    client: httpx.AsyncClient,
+    tokens: Sequence[str],
+    timeout: float = 60,
+    interval: float = 1,
+) -> List[Dict[str, Any]]:
+    """
+    Poll a batch of Judge0 submissions until all of them reach a final state.
+
+    Only the submissions that are still pending are requested on each round,
+    so the whole batch costs a single request per polling interval.
+
+    Args:
+        client (httpx.AsyncClient): The HTTP client to use.
+        tokens (Sequence[str]): The submission tokens.
+        timeout (float): The maximum number of seconds to wait.
+        interval (float): The number of seconds between two polls.
+
+    Raises:
+        Judge0Error: If Judge0 fails to report the status of the batch.
+
+    Returns:
+        List[Dict[str, Any]]: The latest known result of each submission, in
+            the order of `tokens`. Submissions still pending after `timeout`
+            keep their "In Queue" or "Processing" status.
+    """
+    results: Dict[str, Optional[Dict[str, Any]]] = {
+        token: None for token in tokens
+    }
+    pending = list(tokens)
+    loop = asyncio.get_event_loop()
+    deadline = loop.time() + timeout
+    while pending and loop.time() < deadline:
+        await asyncio.sleep(interval)
+        response = await client.get(
+            f"{settings().JUDGE0_API_URL}/submissions/batch",
+            params={
+                "tokens": ",".join(pending),
+                "base64_encoded": "false",
+                "fields": JUDGE0_RESULT_FIELDS,
+            },
+            headers=judge0_headers(),
+        )
+        if response.status_code != 200:
+            raise Judge0Error("Failed to retrieve result")
+        for submission in response.json()["submissions"]:
+            results[submission["token"]] = submission
+        pending = [token for token in pending if _is_pending(results[token])]
+    return [
+        results[token]
+        or {"token": token, "status": {"id": 1, "description": "In Queue"}}
+        for token in tokens
+    ]
+
+
+def summarize_batch(
+    test_cases: Sequence[Dict[str, str]],
+    results: Sequence[Dict[str, Any]],
+    wall_time: float,
+) -> Dict[str, Any]:
+    """
+    Aggregate the results of a batch into a pass/fail report.
+
+    Args:
+        test_cases (Sequence[Dict[str, str]]): The test cases, each one with
+            a `stdin` and an `expected_output` key.
+        results (Sequence[Dict[str, Any]]): The Judge0 result of each test case.
+        wall_time (float): The number of seconds the whole batch took.
+
+    Returns:
+        Dict[str, Any]: The aggregated report along with per test case results.
+    """
+    cases: List[Dict[str, Any]] = []
+    times: List[float] = []
+    memories: List[int] = []
+    for test_case, result in zip(test_cases, results):
+        status = result.get("status") or {}
+        times.append(float(result.get("time") or 0))
+        memories.append(int(result.get("memory") or 0))
+        cases.append(
+            {
+                "stdin": test_case["stdin"],
+                "expected_output": test_case["expected_output"],
+                "stdout": result.get("stdout"),
+                "stderr": result.get("stderr"),
+                "compile_output": result.get("compile_output"),
+                "status": status,
+                "time": times[-1],
+                "memory": memories[-1],
+                "passed": status.get("id") == JUDGE0_ACCEPTED_STATUS,
+            }
+        )
+    passed = sum(1 for case in cases if case["passed"])
+    return {
+        "total": len(cases),
+        "passed": passed,
+        "failed": len(cases) - passed,
+        "all_passed": passed == len(cases),
+        "time": round(sum(times), 3),
+        "max_time": max(times, default=0),
+        "max_memory": max(memories, default=0),
+        "wall_time": round(wall_time, 3),
+        "results": cases,
+    }
@@ -0,0 +1,166 @@
+"""👑 Utils Leader Module 🗳️
+
+This module contains a MongoDB lease used to elect a single leader across processes and replicas.
+
+Every process competes for the same lease document. The holder renews it periodically; when
+it stops renewing (crash, network partition, shutdown) the lease expires and another process
+takes it over. Renewal and takeover are a single atomic `find_one_and_update`, and the unique
+`_id` guarantees that at most one process holds a lease at a time. Expiry is computed and
+checked against the clock of the MongoDB server (`$$NOW`), never against the clocks of the
+replicas, so a replica whose clock drifts cannot take over a lease that is still held.
+
+Classes:
+    - LeaderLease: Acquires, renews and releases a named lease.
+
+Dependencies:
+    - asyncio: For the renewal task.
+    - motor.motor_asyncio.AsyncIOMotorCollection: For the lease collection.
+    - pymongo: For atomic upserts.
+
+"""
+
+import asyncio
+import logging
+from motor.motor_asyncio import (
+    AsyncIOMotorCollection,
+)
+import os
+from pymongo import (
+    ReturnDocument,
+)
+from pymongo.errors import (
+    DuplicateKeyError,
+)
+import socket
+from typing import (
+    Callable,
+    Optional,
+)
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLease:
+    """
+    A named lease in MongoDB, held by at most one process at a time.
+
+    Args:
+        collection (AsyncIOMotorCollection): The collection storing the leases.
+        name (str): The lease name, used as the document id.
+        ttl (float): The number of seconds a lease lasts without renewal.
+        on_elected (Optional[Callable[[], None]]): Called when this process
+            becomes the leader.
+        on_demoted (Optional[Callable[[], None]]): Called when this process
+            stops being the leader.
+        on_renewed (Optional[Callable[[], None]]): Called after every
+            successful renewal.
+    """
+
+    def __init__(
+        self,
+        collection: AsyncIOMotorCollection,
+        name: str,
+        ttl: float = 30,
+        on_elected: Optional[Callable[[], None]] = None,
+        on_demoted: Optional[Callable[[], None]] = None,
+        on_renewed: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self.collection = collection
+        self.name = name
+        self.ttl = ttl
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.on_renewed = on_renewed
+        self.holder = (
+            f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        )
+        self.is_leader = False
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    async def try_acquire(self) -> bool:
+        """
+        Take the lease if it is free or expired, or renew it if already held.
+
+        Returns:
+            bool: True if this process holds the lease.
+        """
+        try:
+            lease = await self.collection.find_one_and_update(
+                {
+                    "_id": self.name,
+                    "$or": [
+                        {"holder": self.holder},
+                        {"$expr": {"$lt": ["$expires_at", "$$NOW"]}},
+                    ],
+                },
+                # A pipeline update, so that $$NOW is the server's time.
+                [
+                    {
+                        "$set": {
+                            "holder": {"$literal": self.holder},
+                            "expires_at": {
+                                "$add": ["$$NOW", int(self.ttl * 1000)]
+                            },
+                            "renewed_at": "$$NOW",
+                        }
+                    }
+                ],
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # The lease exists and is held by another process.
+            return False
+        return bool(lease) and lease["holder"] == self.holder
+
+    def _set_leader(self, is_leader: bool) -> None:
+        if is_leader == self.is_leader:
+            return
+        self.is_leader = is_leader
+        logger.info(
+            "%s %s the %s lease",
+            self.holder,
+            "acquired" if is_leader else "lost",
+            self.name,
+        )
+        callback = self.on_elected if is_leader else self.on_demoted
+        if callback is not None:
+            callback()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                acquired = await self.try_acquire()
+            except Exception as err:  # pylint: disable=W0703
+                logger.error(repr(err))
+                acquired = False
+            self._set_leader(acquired)
+            if acquired and self.on_renewed is not None:
+                self.on_renewed()
+            await asyncio.sleep(self.ttl / 3)
+
+    def start(self) -> None:
+        """
+        Start competing for the lease in the background.
+        """
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stop renewing the lease and release it so another process can take
+        over right away.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.is_leader:
+            self._set_leader(False)
+            await self.collection.delete_one(
+                {"_id": self.name, "holder": self.holder}
+            )
@@ -0,0 +1,447 @@
+"""📈 Utils Metrics Module 📊
+
+This module contains the Prometheus metrics served on `/metrics`.
+
+Requests are timed per route name, e.g. `nylas:read-emails`, by the `InstrumentedRoute`
+class of the routers, which also counts the requests in flight. Outbound calls are timed
+per dependency at the transport level, so the call sites stay as they are: MongoDB
+through a pymongo command listener, Nylas through a `requests` adapter mounted on its
+sessions, OpenAI and Judge0 through an `httpx` transport, and Deta through `track`.
+Failed calls are observed in the same histograms with `outcome="error"`. The MongoDB
+connection pool is followed through a pymongo pool listener, the OpenAI token usage and
+rate limiter waits are counted by `OpenAIAPI`, and the event loop lag is set by the
+health lag monitor.
+
+Recording a sample is a dictionary lookup and a few additions under a lock. With
+several workers, set `PROMETHEUS_MULTIPROC_DIR` to an empty directory so that every
+worker writes its samples there and a scrape of any of them reports all of them.
+
+Classes:
+    - InstrumentedRoute: A FastAPI route recording its latency and requests in flight.
+    - InstrumentedTransport: An httpx transport recording upstream latency.
+    - InstrumentedAdapter: A requests adapter recording upstream latency.
+    - MongoCommandListener: Records the MongoDB command latency.
+    - MongoPoolListener: Follows the MongoDB connection pool.
+
+Functions:
+    - track(upstream: str, operation: str): Time a block calling a dependency.
+    - http_operation(method: str, url: str) -> str: The operation label of an HTTP call.
+    - instrument_session(session, upstream: str) -> None: Record the calls of a requests session.
+    - clear_multiprocess_directory() -> None: Empty the multiprocess directory before forking.
+    - mark_process_dead(pid: int) -> None: Drop the live gauges of a dead worker.
+    - metrics_response() -> Response: Render the metrics.
+
+Dependencies:
+    - prometheus_client: For the metrics and their exposition.
+    - pymongo.monitoring: For the MongoDB listeners.
+
+"""
+
+from contextlib import (
+    contextmanager,
+)
+from fastapi.exceptions import (
+    RequestValidationError,
+)
+from fastapi.routing import (
+    APIRoute,
+)
+import httpx
+import os
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from pymongo import (
+    monitoring,
+)
+import re
+from requests import (
+    PreparedRequest,
+    Response as HTTPResponse,
+    Session,
+)
+from requests.adapters import (
+    HTTPAdapter,
+)
+from starlette.requests import (
+    Request,
+)
+from starlette.responses import (
+    Response,
+)
+import time
+from typing import (
+    Any,
+    Callable,
+    Coroutine,
+    Dict,
+    Iterator,
+    Optional,
+    Tuple,
+    Union,
+)
+from urllib.parse import (
+    urlsplit,
+)
+
+MULTIPROC_DIR_VARIABLE = "PROMETHEUS_MULTIPROC_DIR"
+
+VERSION_SEGMENT = re.compile(r"^v\d+$")
+
+# From a cached lookup to a code generation.
+UPSTREAM_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling a request, until the response starts.",
+    ["route", "method", "status"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "Requests being handled.",
+    ["route"],
+    multiprocess_mode="livesum",
+)
+UPSTREAM_DURATION = Histogram(
+    "upstream_request_duration_seconds",
+    "Time spent waiting for a dependency.",
+    ["upstream", "operation", "outcome"],
+    buckets=UPSTREAM_BUCKETS,
+)
+MONGODB_POOL_CONNECTIONS = Gauge(
+    "mongodb_pool_connections",
+    "MongoDB connections, by state: open, in_use or waiting to check out.",
+    ["state"],
+    multiprocess_mode="livesum",
+)
+MONGODB_POOL_CHECKOUT_FAILURES = Counter(
+    "mongodb_pool_checkout_failures",
+    "MongoDB connection check outs that failed.",
+    ["reason"],
+)
+OPENAI_TOKENS = Counter(
+    "openai_tokens",
+    "OpenAI tokens used, by kind: prompt or completion.",
+    ["model", "kind"],
+)
+OPENAI_THROTTLED_SECONDS = Counter(
+    "openai_throttled_seconds",
+    "Time OpenAI completions waited for the rate limiter.",
+    ["model"],
+)
+EVENT_LOOP_LAG = Gauge(
+    "event_loop_lag_seconds",
+    "How late the event loop last woke up a sleeping task.",
+    multiprocess_mode="liveall",
+)
+
+
+@contextmanager
+def track(upstream: str, operation: str) -> Iterator[None]:
+    """
+    Time a block calling a dependency.
+
+    Args:
+        upstream (str): The dependency, e.g. "deta".
+        operation (str): The call, e.g. "get".
+
+    Yields:
+        None: The block runs, an exception counts as an error.
+    """
+    outcome = "error"
+    started = time.perf_counter()
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        UPSTREAM_DURATION.labels(upstream, operation, outcome).observe(
+            time.perf_counter() - started
+        )
+
+
+def http_operation(method: str, url: str) -> str:
+    """
+    Build the operation label of an HTTP call from its method and the first
+    segment of its path after any API version, which keeps ids out of the
+    labels.
+
+    Args:
+        method (str): The HTTP method.
+        url (str): The URL.
+
+    Returns:
+        str: The label, e.g. "GET /messages".
+    """
+    segments = urlsplit(url).path.strip("/").split("/")
+    if len(segments) > 1 and VERSION_SEGMENT.match(segments[0]):
+        segments.pop(0)
+    return f"{method} /{segments[0]}"
+
+
+class InstrumentedRoute(APIRoute):
+    """
+    A FastAPI route recording its latency and requests in flight under its
+    name, e.g. `nylas:read-emails`.
+    """
+
+    def get_route_handler(
+        self,
+    ) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+        in_flight = REQUESTS_IN_FLIGHT.labels(self.name)
+        name = self.name
+
+        async def instrumented_handler(request: Request) -> Response:
+            status = "500"
+            in_flight.inc()
+            started = time.perf_counter()
+            try:
+                response = await handler(request)
+                status = str(response.status_code)
+                return response
+            except RequestValidationError:
+                status = "422"
+                raise
+            except Exception as err:
+                # HTTPException is answered by the exception handlers.
+                status = str(getattr(err, "status_code", 500))
+                raise
+            finally:
+                in_flight.dec()
+                REQUEST_DURATION.labels(name, request.method, status).observe(
+                    time.perf_counter() - started
+                )
+
+        return instrumented_handler
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """
+    An httpx transport recording the latency of the calls to a dependency,
+    until their response headers are received.
+
+    Args:
+        upstream (str): The dependency, e.g. "openai".
+        transport (Optional[httpx.AsyncBaseTransport]): The wrapped transport.
+    """
+
+    def __init__(
+        self,
+        upstream: str,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        self.upstream = upstream
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(
+        self, request: httpx.Request
+    ) -> httpx.Response:
+        outcome = "error"
+        started = time.perf_counter()
+        try:
+            response = await self.transport.handle_async_request(request)
+            if response.status_code < 500:
+                outcome = "ok"
+            return response
+        finally:
+            UPSTREAM_DURATION.labels(
+                self.upstream,
+                http_operation(request.method, str(request.url)),
+                outcome,
+            ).observe(time.perf_counter() - started)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class InstrumentedAdapter(HTTPAdapter):
+    """
+    A requests adapter recording the latency of the calls to a dependency.
+
+    Args:
+        upstream (str): The dependency, e.g. "nylas".
+    """
+
+    def __init__(self, upstream: str) -> None:
+        super().__init__()
+        self.upstream = upstream
+
+    def send(
+        self,
+        request: PreparedRequest,
+        stream: bool = False,
+        timeout: Union[
+            None, float, Tuple[Optional[float], Optional[float]]
+        ] = None,
+        verify: Union[bool, str] = True,
+        cert: Union[None, str, Tuple[str, str]] = None,
+        proxies: Optional[Dict[str, str]] = None,
+    ) -> HTTPResponse:
+        outcome = "error"
+        started = time.perf_counter()
+        try:
+            response = super().send(
+                request, stream, timeout, verify, cert, proxies
+            )
+            if response.status_code < 500:
+                outcome = "ok"
+            return response
+        finally:
+            UPSTREAM_DURATION.labels(
+                self.upstream,
+                http_operation(request.method or "", request.url or ""),
+                outcome,
+            ).observe(time.perf_counter() - started)
+
+
+def instrument_session(session: Session, upstream: str) -> None:
+    """
+    Record the calls made through a requests session.
+
+    Args:
+        session (Session): The session, e.g. of a Nylas client.
+        upstream (str): The dependency.
+    """
+    adapter = InstrumentedAdapter(upstream)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """
+    Records the latency of the MongoDB commands, by command name.
+    """
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        pass
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        UPSTREAM_DURATION.labels("mongodb", event.command_name, "ok").observe(
+            event.duration_micros / 1_000_000
+        )
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        UPSTREAM_DURATION.labels(
+            "mongodb", event.command_name, "error"
+        ).observe(event.duration_micros / 1_000_000)
+
+
+class MongoPoolListener(monitoring.ConnectionPoolListener):
+    """
+    Follows the open, in use and awaited connections of the MongoDB pool.
+    """
+
+    def __init__(self) -> None:
+        self.open = MONGODB_POOL_CONNECTIONS.labels("open")
+        self.in_use = MONGODB_POOL_CONNECTIONS.labels("in_use")
+        self.waiting = MONGODB_POOL_CONNECTIONS.labels("waiting")
+
+    def pool_created(self, event: monitoring.PoolCreatedEvent) -> None:
+        pass
+
+    def pool_ready(self, event: monitoring.PoolReadyEvent) -> None:
+        pass
+
+    def pool_cleared(self, event: monitoring.PoolClearedEvent) -> None:
+        pass
+
+    def pool_closed(self, event: monitoring.PoolClosedEvent) -> None:
+        pass
+
+    def connection_created(
+        self, event: monitoring.ConnectionCreatedEvent
+    ) -> None:
+        self.open.inc()
+
+    def connection_ready(self, event: monitoring.ConnectionReadyEvent) -> None:
+        pass
+
+    def connection_closed(
+        self, event: monitoring.ConnectionClosedEvent
+    ) -> None:
+        self.open.dec()
+
+    def connection_check_out_started(
+        self, event: monitoring.ConnectionCheckOutStartedEvent
+    ) -> None:
+        self.waiting.inc()
+
+    def connection_check_out_failed(
+        self, event: monitoring.ConnectionCheckOutFailedEvent
+    ) -> None:
+        self.waiting.dec()
+        MONGODB_POOL_CHECKOUT_FAILURES.labels(event.reason).inc()
+
+    def connection_checked_out(
+        self, event: monitoring.ConnectionCheckedOutEvent
+    ) -> None:
+        self.waiting.dec()
+        self.in_use.inc()
+
+    def connection_checked_in(
+        self, event: monitoring.ConnectionCheckedInEvent
+    ) -> None:
+        self.in_use.dec()
+
+
+def clear_multiprocess_directory() -> None:
+    """
+    Remove the samples of the previous run from the multiprocess directory,
+    before the workers are started.
+    """
+    directory = os.environ.get(MULTIPROC_DIR_VARIABLE)
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    for entry in os.listdir(directory):
+        if entry.endswith(".db"):
+            os.unlink(os.path.join(directory, entry))
+
+
+def mark_process_dead(pid: int) -> None:
+    """
+    Drop the live gauges of a worker that exited.
+
+    Args:
+        pid (int): The worker process id.
+    """
+    if os.environ.get(MULTIPROC_DIR_VARIABLE):
+        multiprocess.mark_process_dead(pid)  # type: ignore[no-untyped-call]
+
+
+def metrics_response() -> Response:
+    """
+    Render the metrics of this process, or of all the workers in
+    multiprocess mode, in the Prometheus text format.
+
+    Returns:
+        Response: The metrics.
+    """
+    registry = REGISTRY
+    if os.environ.get(MULTIPROC_DIR_VARIABLE):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(  # type: ignore[no-untyped-call]
+            registry
+        )
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
@@ -1,12 +1,27 @@
 from dataclasses import (
     dataclass,
+    field,
+)
+import logging
+import time
+from typing import (
+    Any,
+    Dict,
+    Sequence,
 )
-import openai
 
-from src.config import (
-    settings,
+from src.users import (
+    models as users_models,
+)
+from src.utils import (
+    metrics,
+    openai_client,
+    rate_limit,
+    templates,
 )
 
+logger = logging.getLogger(__name__)
+
 
 @dataclass
 class OpenAIAPI:
@@ -22,13 +37,29 @@ class OpenAIAPI:
         frequency_penalty (float): The frequency penalty for text generation (default is 0).
         presence_penalty (float): The presence penalty for text generation (default is 0.6).
         stop (str): An optional stop sequence for text generation.
+        api_base (str): The OpenAI API base URL.
+        timeout (float): The number of seconds a generation attempt can take (default is 60).
+        max_retries (int): The number of retries of a failed generation (default is 3).
+        max_concurrent (int): The number of generations in flight at once (default is 4).
+        requests_per_minute (float): The request budget, 0 means unlimited (default is 0).
+        tokens_per_minute (float): The token budget, 0 means unlimited (default is 0).
+        usage (Dict[str, float]): The process-wide usage counters.
 
     Methods:
-        send_algorithm_email(to: str):
-            Sends an algorithm-related email to the specified recipient.
+        generate_algorithm_tutorial(language: str, avoid_topics: Sequence[str]):
+            Asynchronously generates an algorithm tutorial with code samples in a given language.
+
+        send_algorithm_email(to: str, language: str, html_content: str):
+            Queues an already generated algorithm tutorial for the specified recipient.
 
-        async_send_algorithm_email(to: str):
-            Asynchronously sends an algorithm-related email to the specified recipient.
+        async_send_algorithm_email(to: str, language: str):
+            Asynchronously generates and sends an algorithm-related email to the specified recipient.
+
+        close():
+            Closes the underlying HTTP client.
+
+        complete(params: Dict[str, Any], purpose: str, language: str):
+            Creates a rate limited chat completion and records its usage.
 
     Properties:
         _type (str):
@@ -44,15 +75,41 @@ class OpenAIAPI:
     presence_penalty: float = 0.6
     stop: str = ""
     prompt: str = ""
+    api_base: str = openai_client.OPENAI_API_BASE
+    timeout: float = 60
+    max_retries: int = 3
+    max_concurrent: int = 4
+    requests_per_minute: float = 0
+    tokens_per_minute: float = 0
+    client: openai_client.AsyncOpenAIClient = field(init=False, repr=False)
+    limiter: rate_limit.RateLimiter = field(init=False, repr=False)
+    usage: Dict[str, float] = field(init=False, repr=False)
 
     def __post_init__(self) -> None:
         """
-        Initializes the OpenAIAPI instance and sets the OpenAI API key.
+        Initializes the OpenAIAPI instance and its OpenAI client.
         Raises an exception if the API token is missing.
         """
         if self.api_token is None:
             raise Exception("OpenAI API key is required")
-        openai.api_key = self.api_token
+        self.client = openai_client.AsyncOpenAIClient(
+            self.api_token,
+            api_base=self.api_base,
+            timeout=self.timeout,
+            max_retries=self.max_retries,
+            max_concurrent=self.max_concurrent,
+        )
+        self.limiter = rate_limit.RateLimiter(
+            self.requests_per_minute, self.tokens_per_minute
+        )
+        self.usage = {
+            "requests": 0,
+            "errors": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "latency_seconds": 0.0,
+            "throttled_seconds": 0.0,
+        }
         self.prompt = """ # noqa: E501
             **Task Prompt:**
 
@@ -95,25 +152,25 @@ class OpenAIAPI:
             **Note:** Challenge yourself to explore a unique algorithmic topic each day. Your tutorial should serve as an educational resource catering to both beginners and those possessing some prior knowledge of algorithms. Also, make sure that your tutorial code samples are written in {programming_language}. Don't use any other programming language.
         """
 
-    def send_algorithm_email(self, to: str, language: str) -> None:
+    async def generate_algorithm_tutorial(
+        self, language: str, avoid_topics: Sequence[str] = ()
+    ) -> str:
         """
-        Sends an algorithm-related email to the specified recipient.
+        Generates an algorithm tutorial with code samples in a given language.
 
         Args:
-            to (str): The email address of the recipient.
+            language (str): The programming language of the code samples.
+            avoid_topics (Sequence[str]): Titles of already covered topics.
 
-        This method generates an algorithm tutorial email using the OpenAI API
-        and sends it to the specified recipient's email address.
+        Returns:
+            str: The tutorial as an HTML document.
         """
-        from src.main import (
-            code_app,
-        )
-
-        initial_token = code_app.state.nylas.access_token
-        openai.api_key = settings().OPENAI_API_KEY
-        code_app.state.nylas.access_token = settings().NYLAS_SYSTEM_TOKEN
-        draft = code_app.state.nylas.drafts.create()
-
+        prompt = self.prompt.replace("{programming_language}", language)
+        if avoid_topics:
+            prompt += (
+                "\n**Already Covered:** Do not write about any of the "
+                "following topics: " + "; ".join(avoid_topics) + "\n"
+            )
         params = {
             "model": self.model,
             "temperature": self.temperature,
@@ -124,22 +181,130 @@ class OpenAIAPI:
             "messages": [
                 {
                     "role": "system",
-                    "content": self.prompt.replace(
-                        "{programming_language}", language
-                    ),
+                    "content": prompt,
                 }
             ],
         }
 
-        response = openai.ChatCompletion.create(**params)
-        html_content = response["choices"][0]["message"]["content"]
-        draft["subject"] = "Your Daily Dose of Algorithms"
-        draft["to"] = [{"email": to}]
-        draft["body"] = html_content
-        draft["from"] = [{"email": code_app.state.nylas.account.email_address}]
-        draft.send()
-        code_app.state.nylas.access_token = initial_token
-        openai.api_key = ""
+        if self.stop:
+            params["stop"] = self.stop
+
+        response = await self.complete(params, "tutorial", language)
+        return response["choices"][0]["message"]["content"]
+
+    async def complete(
+        self, params: Dict[str, Any], purpose: str = "", language: str = ""
+    ) -> Dict[str, Any]:
+        """
+        Creates a rate limited chat completion and records its usage.
+
+        Args:
+            params (Dict[str, Any]): The chat completion request body.
+            purpose (str): What the completion is for, e.g. "tutorial".
+            language (str): The programming language of the generated content.
+
+        Returns:
+            Dict[str, Any]: The chat completion response.
+        """
+        # Roughly four characters per token, plus the whole completion budget.
+        prompt_size = sum(len(m["content"]) for m in params["messages"])
+        estimated_tokens = prompt_size // 4 + params.get("max_tokens", 0)
+        throttled = await self.limiter.acquire(estimated_tokens)
+        record = users_models.CompletionUsage(
+            model=params["model"],
+            purpose=purpose,
+            language=language,
+            throttled=throttled,
+        )
+        started = time.monotonic()
+        completed = False
+        try:
+            response = await self.client.chat_completion(**params)
+            completed = True
+            usage = response.get("usage") or {}
+            record.prompt_tokens = usage.get("prompt_tokens", 0)
+            record.completion_tokens = usage.get("completion_tokens", 0)
+            self.limiter.settle(
+                estimated_tokens,
+                record.prompt_tokens + record.completion_tokens,
+            )
+            return response
+        finally:
+            # Errors and cancellations alike leave `completed` unset.
+            record.success = completed
+            record.latency = time.monotonic() - started
+            await self._record_usage(record)
+
+    async def _record_usage(
+        self, record: users_models.CompletionUsage
+    ) -> None:
+        """
+        Adds a completion to the usage counters and stores it in MongoDB.
+
+        Args:
+            record (users_models.CompletionUsage): The completion usage.
+        """
+        from src.main import (
+            code_app,
+        )
+
+        self.usage["requests"] += 1
+        self.usage["errors"] += 0 if record.success else 1
+        self.usage["prompt_tokens"] += record.prompt_tokens
+        self.usage["completion_tokens"] += record.completion_tokens
+        self.usage["latency_seconds"] += record.latency
+        self.usage["throttled_seconds"] += record.throttled
+        metrics.OPENAI_TOKENS.labels(record.model, "prompt").inc(
+            record.prompt_tokens
+        )
+        metrics.OPENAI_TOKENS.labels(record.model, "completion").inc(
+            record.completion_tokens
+        )
+        metrics.OPENAI_THROTTLED_SECONDS.labels(record.model).inc(
+            record.throttled
+        )
+        try:
+            await code_app.state.engine.save(record)
+        except Exception as err:  # pylint: disable=W0703
+            logger.error(repr(err))
+
+    async def send_algorithm_email(
+        self, to: str, language: str, html_content: str
+    ) -> None:
+        """
+        Queues an already generated algorithm tutorial for the specified recipient.
+
+        Args:
+            to (str): The email address of the recipient.
+            language (str): The programming language of the code samples.
+            html_content (str): The tutorial as an HTML document.
+
+        The tutorial is embedded in the "algorithm_email" template, compiled at
+        startup, and sent with the system Nylas account by the outbound queue.
+        """
+        from src.main import (  # pylint: disable=C0415
+            code_app,
+        )
+        from src.nylas import (
+            outbox,
+        )
+
+        body = code_app.state.templates.render(
+            "algorithm_email",
+            email=to,
+            language=language,
+            tutorial=templates.extract_body(html_content),
+        )
+
+        await outbox.enqueue(
+            "system",
+            "system",
+            {
+                "subject": "Your Daily Dose of Algorithms",
+                "to": [{"email": to}],
+                "body": body,
+            },
+        )
 
     async def async_send_algorithm_email(self, to: str, language: str) -> None:
         """
@@ -147,9 +312,16 @@ class OpenAIAPI:
 
         Args:
             to (str): The email address of the recipient.
+            language (str): The programming language of the code samples.
 
         This method asynchronously generates an algorithm tutorial email using the
-        OpenAI API and sends it to the specified recipient's email address.
+        OpenAI API and queues it for the specified recipient's email address.
         """
+        html_content = await self.generate_algorithm_tutorial(language)
+        await self.send_algorithm_email(to, language, html_content)
 
-        self.send_algorithm_email(to, language)
+    async def close(self) -> None:
+        """
+        Closes the underlying HTTP client.
+        """
+        await self.client.close()
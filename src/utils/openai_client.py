@@ -0,0 +1,176 @@
+"""🤖 Utils OpenAI Client Module 🔌
+
+This module contains a minimal asynchronous client for the OpenAI chat completions API.
+
+Requests go through a shared `httpx.AsyncClient`, so generations never block the event
+loop. Every call has its own timeout, transient failures (timeouts, connection errors,
+429 and 5xx responses) are retried with exponential backoff and full jitter, and a
+semaphore caps the number of generations in flight. The API key is held by the client
+instead of being set globally on the `openai` module.
+
+Classes:
+    - OpenAIError: Raised when a completion cannot be obtained.
+    - AsyncOpenAIClient: Sends chat completion requests.
+
+Dependencies:
+    - asyncio: For the semaphore and backoff.
+    - httpx: For asynchronous HTTP requests.
+    - src.utils.metrics: For the upstream latency metrics.
+
+"""
+
+import asyncio
+import httpx
+import logging
+import random
+from typing import (
+    Any,
+    Dict,
+    Optional,
+)
+
+from src.utils import (
+    metrics,
+)
+
+logger = logging.getLogger(__name__)
+
+OPENAI_API_BASE = "https://api.openai.com/v1"
+
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class OpenAIError(Exception):
+    """
+    Raised when a completion cannot be obtained.
+
+    Args:
+        message (str): What went wrong.
+        status_code (Optional[int]): The HTTP status of the last response, if any.
+    """
+
+    def __init__(
+        self, message: str, status_code: Optional[int] = None
+    ) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class AsyncOpenAIClient:
+    """
+    An asynchronous client for the OpenAI chat completions API.
+
+    Args:
+        api_key (str): The OpenAI API key.
+        api_base (str): The API base URL.
+        timeout (float): The number of seconds a single attempt can take.
+        max_retries (int): The number of retries of a failed attempt.
+        max_concurrent (int): The number of requests in flight at once.
+        backoff (float): The base delay of the exponential backoff, in seconds.
+        max_backoff (float): The maximum delay between two attempts, in seconds.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        api_base: str = OPENAI_API_BASE,
+        timeout: float = 60,
+        max_retries: int = 3,
+        max_concurrent: int = 4,
+        backoff: float = 1,
+        max_backoff: float = 30,
+    ) -> None:
+        self.api_key = api_key
+        self.api_base = api_base.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """
+        The HTTP client, created on first use.
+
+        Returns:
+            httpx.AsyncClient: The shared HTTP client.
+        """
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.api_base,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                transport=metrics.InstrumentedTransport("openai"),
+            )
+        return self._client
+
+    async def close(self) -> None:
+        """
+        Close the HTTP client.
+        """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _delay(self, attempt: int, retry_after: Optional[str]) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_backoff)
+            except ValueError:
+                pass
+        # Full jitter: spreads out the retries of concurrent callers.
+        return random.uniform(
+            0, min(self.max_backoff, self.backoff * 2**attempt)
+        )
+
+    async def chat_completion(
+        self, timeout: Optional[float] = None, **params: Any
+    ) -> Dict[str, Any]:
+        """
+        Create a chat completion, retrying transient failures.
+
+        Args:
+            timeout (Optional[float]): Overrides the per-attempt timeout.
+            **params (Any): The request body, e.g. `model` and `messages`.
+
+        Raises:
+            OpenAIError: If the API rejects the request or every attempt fails.
+
+        Returns:
+            Dict[str, Any]: The decoded response, including `choices` and `usage`.
+        """
+        async with self._semaphore:
+            attempt = 0
+            while True:
+                status_code: Optional[int] = None
+                retry_after: Optional[str] = None
+                try:
+                    response = await self.client.post(
+                        "/chat/completions",
+                        json=params,
+                        timeout=timeout or self.timeout,
+                    )
+                    status_code = response.status_code
+                    if status_code < 400:
+                        return response.json()
+                    if status_code not in RETRY_STATUS_CODES:
+                        raise OpenAIError(response.text, status_code)
+                    retry_after = response.headers.get("Retry-After")
+                    error: Exception = OpenAIError(response.text, status_code)
+                except httpx.TransportError as err:
+                    error = err
+                if attempt >= self.max_retries:
+                    raise OpenAIError(
+                        f"OpenAI request failed after {attempt + 1} "
+                        f"attempts: {error!r}",
+                        status_code,
+                    )
+                delay = self._delay(attempt, retry_after)
+                logger.warning(
+                    "OpenAI request failed (%r), retrying in %.1fs",
+                    error,
+                    delay,
+                )
+                await asyncio.sleep(delay)
+                attempt += 1
@@ -0,0 +1,434 @@
+"""🔬 Utils Profiler Module 🔥
+
+This module contains the on-demand sampling profiler of live requests.
+
+`ProfilerMiddleware` profiles a random fraction of the requests, and the requests
+carrying the profiling token in the `X-Profile` header. While a profiled request runs, a
+sampler thread looks at the event loop every few milliseconds: when the request's task
+is running, it records the Python stack of the loop thread, and when it is suspended,
+the chain of coroutines it is awaiting, ending with a `[waiting]` frame. The profile is
+thus a wall-clock one, showing the time spent waiting on MongoDB or Nylas as well as the
+time spent computing. Endpoints running in the thread pool show as waiting on it.
+
+Profiles are stored in the collapsed stack format of `flamegraph.pl`, speedscope and
+most flamegraph viewers, in a MongoDB collection whose TTL index removes them after a
+while, and their id is sent in the `X-Profile-Id` response header. Unprofiled requests
+only pay for a random draw; the sampler thread only runs while a request is profiled,
+and the number of requests profiled at once is capped, so the profiler can be left
+enabled at a low sample rate.
+
+Classes:
+    - Profile: The samples of one request.
+    - Sampler: The sampler thread.
+    - ProfileStore: The MongoDB collection of profiles.
+    - ProfilerMiddleware: The ASGI middleware profiling requests.
+
+Functions:
+    - collapse(samples: Dict[Tuple[str, ...], int]) -> str: Render samples as collapsed stacks.
+
+Dependencies:
+    - asyncio: For finding the running task of the event loop.
+    - threading: For the sampler thread.
+    - motor.motor_asyncio.AsyncIOMotorCollection: For the profile collection.
+    - starlette: For the ASGI types.
+
+"""
+
+import asyncio
+from collections import (
+    Counter,
+)
+from datetime import (
+    datetime,
+    timedelta,
+)
+import hmac
+import logging
+from motor.motor_asyncio import (
+    AsyncIOMotorCollection,
+)
+import os
+import random
+from starlette.datastructures import (
+    Headers,
+)
+from starlette.types import (
+    ASGIApp,
+    Message,
+    Receive,
+    Scope,
+    Send,
+)
+import sys
+import threading
+import time
+from types import (
+    FrameType,
+)
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+import uuid
+
+from src.utils import (
+    tasks,
+)
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "x-profile"
+PROFILE_ID_HEADER = "x-profile-id"
+
+WAITING_FRAME = "[waiting]"
+
+# Path prefixes stripped from the frame names.
+PATH_PREFIXES = sorted(
+    {os.path.join(path, "") for path in sys.path if path}, key=len
+)[::-1]
+
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    path = code.co_filename
+    for prefix in PATH_PREFIXES:
+        if path.startswith(prefix):
+            start = len(prefix)
+            path = path[start:]
+            break
+    name = getattr(code, "co_qualname", code.co_name)
+    # ";" separates the frames of a collapsed stack.
+    return f"{name} ({path}:{code.co_firstlineno})".replace(";", ":")
+
+
+def _running_stack(frame: Optional[FrameType], root: Any) -> Tuple[str, ...]:
+    frames: List[FrameType] = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    # Drop the event loop frames below the task's coroutine.
+    for index, candidate in enumerate(frames):
+        if candidate.f_code is root:
+            frames = frames[index:]
+            break
+    return tuple(_frame_name(candidate) for candidate in frames)
+
+
+def _suspended_stack(coro: Any) -> Tuple[str, ...]:
+    names = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(
+            coro, "gi_frame", None
+        )
+        if frame is None:
+            break
+        names.append(_frame_name(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(
+            coro, "gi_yieldfrom", None
+        )
+    names.append(WAITING_FRAME)
+    return tuple(names)
+
+
+def collapse(samples: Dict[Tuple[str, ...], int]) -> str:
+    """
+    Render samples in the collapsed stack format, one stack per line,
+    outermost frame first, followed by its number of samples.
+
+    Args:
+        samples (Dict[Tuple[str, ...], int]): The samples, by stack.
+
+    Returns:
+        str: The collapsed stacks.
+    """
+    return "".join(
+        f"{';'.join(stack)} {count}\n"
+        for stack, count in sorted(samples.items())
+    )
+
+
+class Profile:
+    """
+    The samples of one request.
+
+    Args:
+        task (asyncio.Task): The task handling the request.
+        trigger (str): "sampled" or "header".
+        max_duration (float): The number of seconds the request is sampled.
+    """
+
+    def __init__(
+        self, task: "asyncio.Task[Any]", trigger: str, max_duration: float
+    ) -> None:
+        self.id = uuid.uuid4().hex
+        self.task = task
+        self.root = task.get_coro().cr_code  # type: ignore
+        self.trigger = trigger
+        self.started = time.perf_counter()
+        self.deadline = self.started + max_duration
+        self.samples: Dict[Tuple[str, ...], int] = Counter()
+
+
+class Sampler:
+    """
+    The sampler thread, sampling the profiled requests of an event loop.
+
+    The daemon thread is started with the first profile and sleeps while
+    there is none.
+
+    Args:
+        loop (asyncio.AbstractEventLoop): The event loop.
+        interval (float): The number of seconds between two samples.
+    """
+
+    def __init__(
+        self, loop: asyncio.AbstractEventLoop, interval: float = 0.01
+    ) -> None:
+        self.loop = loop
+        self.interval = interval
+        self.loop_thread = threading.get_ident()
+        self.profiles: Dict[str, Profile] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, profile: Profile) -> None:
+        """
+        Start sampling a request.
+
+        Args:
+            profile (Profile): The request's profile.
+        """
+        with self._lock:
+            self.profiles[profile.id] = profile
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="profiler-sampler", daemon=True
+            )
+            self._thread.start()
+        self._wake.set()
+
+    def remove(self, profile: Profile) -> None:
+        """
+        Stop sampling a request.
+
+        Args:
+            profile (Profile): The request's profile.
+        """
+        with self._lock:
+            self.profiles.pop(profile.id, None)
+
+    def _sample(self) -> None:
+        frame = sys._current_frames().get(  # pylint: disable=W0212
+            self.loop_thread
+        )
+        running = asyncio.current_task(self.loop)
+        now = time.perf_counter()
+        with self._lock:
+            for profile in self.profiles.values():
+                if now > profile.deadline:
+                    continue
+                if profile.task is running:
+                    stack = _running_stack(frame, profile.root)
+                else:
+                    stack = _suspended_stack(profile.task.get_coro())
+                profile.samples[stack] += 1
+
+    def _run(self) -> None:
+        while True:
+            if not self.profiles:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            time.sleep(self.interval)
+            try:
+                self._sample()
+            except Exception as err:  # pylint: disable=W0703
+                # A stack changing while it is walked is skipped.
+                logger.debug(repr(err))
+
+
+class ProfileStore:
+    """
+    The MongoDB collection of request profiles.
+
+    Args:
+        collection (AsyncIOMotorCollection): The profile collection.
+        ttl (float): The number of seconds a profile is kept.
+    """
+
+    def __init__(
+        self, collection: AsyncIOMotorCollection, ttl: float = 604800
+    ) -> None:
+        self.collection = collection
+        self.ttl = ttl
+
+    async def configure(self) -> None:
+        """
+        Create the TTL index removing expired profiles, and the index of the
+        listing.
+        """
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+        await self.collection.create_index("created_at")
+
+    async def save(self, document: Dict[str, Any]) -> None:
+        """
+        Store a profile.
+
+        Args:
+            document (Dict[str, Any]): The profile, with its `_id` and
+                collapsed `stacks`.
+        """
+        now = datetime.utcnow()
+        await self.collection.insert_one(
+            {
+                **document,
+                "created_at": now,
+                "expires_at": now + timedelta(seconds=self.ttl),
+            }
+        )
+
+    async def list(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        List the latest profiles, without their stacks.
+
+        Args:
+            limit (int): The number of profiles listed.
+
+        Returns:
+            List[Dict[str, Any]]: The profiles, latest first.
+        """
+        cursor = (
+            self.collection.find({}, {"stacks": 0, "expires_at": 0})
+            .sort("created_at", -1)
+            .limit(limit)
+        )
+        return [
+            {**document, "id": document.pop("_id")}
+            async for document in cursor
+        ]
+
+    async def get(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a profile.
+
+        Args:
+            profile_id (str): The profile id.
+
+        Returns:
+            Optional[Dict[str, Any]]: The profile, or None if it does not
+                exist or expired.
+        """
+        return await self.collection.find_one({"_id": profile_id})
+
+
+class ProfilerMiddleware:
+    """
+    Profiles a random fraction of the requests, and those carrying the
+    profiling token.
+
+    The store is looked up on `app.state.profiles` on every request, so
+    requests are passed through untouched until the application has started.
+
+    Args:
+        app (ASGIApp): The wrapped application.
+        sample_rate (float): The fraction of the requests profiled.
+        token (str): The `X-Profile` header value profiling a request, an
+            empty token disables the header.
+        interval (float): The number of seconds between two samples.
+        max_concurrent (int): The number of requests profiled at once.
+        max_duration (float): The number of seconds a request is sampled.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        sample_rate: float = 0.0,
+        token: str = "",
+        interval: float = 0.01,
+        max_concurrent: int = 2,
+        max_duration: float = 30.0,
+    ) -> None:
+        self.app = app
+        self.sample_rate = sample_rate
+        self.token = token
+        self.interval = interval
+        self.max_concurrent = max_concurrent
+        self.max_duration = max_duration
+        self.sampler: Optional[Sampler] = None
+
+    def _trigger(self, scope: Scope) -> Optional[str]:
+        if self.token:
+            header = Headers(scope=scope).get(PROFILE_HEADER)
+            if header is not None and hmac.compare_digest(
+                header.encode("utf-8"), self.token.encode("utf-8")
+            ):
+                return "header"
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    async def __call__(
+        self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        store: Optional[ProfileStore] = getattr(
+            scope["app"].state, "profiles", None
+        )
+        trigger = None if store is None else self._trigger(scope)
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+        if self.sampler is None:
+            self.sampler = Sampler(asyncio.get_running_loop(), self.interval)
+        if len(self.sampler.profiles) >= self.max_concurrent:
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(
+            asyncio.current_task(),  # type: ignore
+            trigger,
+            self.max_duration,
+        )
+        status_code = 500
+
+        async def send_with_id(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (PROFILE_ID_HEADER.encode("latin-1"), profile.id.encode()),
+                ]
+            await send(message)
+
+        self.sampler.add(profile)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            self.sampler.remove(profile)
+            document = {
+                "_id": profile.id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": getattr(scope.get("route"), "name", None),
+                "status_code": status_code,
+                "trigger": trigger,
+                "duration": time.perf_counter() - profile.started,
+                "interval": self.interval,
+                "samples": sum(profile.samples.values()),
+                "pid": os.getpid(),
+                "stacks": collapse(profile.samples),
+            }
+            try:
+                scope["app"].state.tasks.spawn(
+                    store.save(document), "profile"  # type: ignore
+                )
+            except tasks.TaskRejected as err:
+                logger.warning(repr(err))
@@ -0,0 +1,158 @@
+"""🪣 Utils Rate Limit Module ⏳
+
+This module contains the token buckets used to smooth bursts of OpenAI requests.
+
+A bucket refills continuously at its per-minute rate, up to a capacity of one minute
+of budget. Callers wait until the bucket holds what they need instead of failing, so a
+burst (e.g. every "Every hour" job firing at once) is spread over time rather than
+being turned into 429s by the API. Token counts are only known once a completion is
+back, so requests reserve an estimate which is settled against the actual usage.
+Callers that must not wait, such as the outbox workers, check the bucket instead.
+
+Classes:
+    - TokenBucket: A continuously refilled bucket with a per-minute rate.
+    - RateLimiter: Requests-per-minute and tokens-per-minute budgets.
+
+Dependencies:
+    - asyncio: For waiting and locking.
+
+"""
+
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    A continuously refilled bucket with a per-minute rate.
+
+    Args:
+        per_minute (float): The number of units added per minute, 0 disables the bucket.
+    """
+
+    def __init__(self, per_minute: float) -> None:
+        self.per_minute = per_minute
+        self.capacity = per_minute
+        self.level = per_minute
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(
+            self.capacity,
+            self.level + (now - self._updated) * self.per_minute / 60,
+        )
+        self._updated = now
+
+    async def acquire(self, amount: float) -> float:
+        """
+        Wait until the bucket holds `amount` units, then take them.
+
+        Requests larger than the capacity are let through once the bucket is
+        full, leaving it in debt.
+
+        Args:
+            amount (float): The number of units to take.
+
+        Returns:
+            float: The number of seconds spent waiting.
+        """
+        if self.per_minute <= 0:
+            return 0
+        started = time.monotonic()
+        # The lock makes waiters take their turn in arrival order.
+        async with self._lock:
+            needed = min(amount, self.capacity)
+            while True:
+                self._refill()
+                if self.level >= needed:
+                    break
+                await asyncio.sleep(
+                    (needed - self.level) * 60 / self.per_minute
+                )
+            self.level -= amount
+        return time.monotonic() - started
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Compute how long until the bucket holds `amount` units.
+
+        Args:
+            amount (float): The number of units needed.
+
+        Returns:
+            float: The number of seconds, 0 if the units are available now.
+        """
+        if self.per_minute <= 0:
+            return 0
+        self._refill()
+        needed = min(amount, self.capacity)
+        return max(0.0, (needed - self.level) * 60 / self.per_minute)
+
+    def try_acquire(self, amount: float) -> float:
+        """
+        Take `amount` units if the bucket holds them, without waiting.
+
+        Args:
+            amount (float): The number of units to take.
+
+        Returns:
+            float: 0 if the units were taken, otherwise the number of seconds
+                until the bucket holds them.
+        """
+        wait = self.wait_time(amount)
+        if wait == 0 and self.per_minute > 0:
+            self.level -= amount
+        return wait
+
+    def adjust(self, amount: float) -> None:
+        """
+        Take (or give back, if negative) units without waiting.
+
+        Args:
+            amount (float): The number of units to take.
+        """
+        if self.per_minute <= 0:
+            return
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute budgets.
+
+    Args:
+        requests_per_minute (float): The request budget, 0 means unlimited.
+        tokens_per_minute (float): The token budget, 0 means unlimited.
+    """
+
+    def __init__(
+        self, requests_per_minute: float, tokens_per_minute: float
+    ) -> None:
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    async def acquire(self, estimated_tokens: int) -> float:
+        """
+        Wait for one request and the estimated tokens.
+
+        Args:
+            estimated_tokens (int): The number of tokens the request may use.
+
+        Returns:
+            float: The number of seconds spent waiting.
+        """
+        waited = await self.requests.acquire(1)
+        return waited + await self.tokens.acquire(estimated_tokens)
+
+    def settle(self, estimated_tokens: int, used_tokens: int) -> None:
+        """
+        Correct the token budget once the actual usage is known.
+
+        Args:
+            estimated_tokens (int): The number of tokens reserved.
+            used_tokens (int): The number of tokens actually used.
+        """
+        self.tokens.adjust(used_tokens - estimated_tokens)
@@ -0,0 +1,381 @@
+"""🧰 Utils Sandbox Worker Module 🔒
+
+A standalone worker process used by the local code executor.
+
+The worker is spawned once by `src.utils.executors.SandboxPool` and kept warm.
+It reads one JSON job per line from stdin, forks a child for every job, applies
+the CPU, memory, file size and process count rlimits inside the child, runs the
+program and writes one Judge0-shaped JSON result per line to stdout.
+
+The worker itself runs under bubblewrap (see `src.utils.executors.sandbox_command`),
+in its own user, PID, network and mount namespaces, so the rlimits only bound
+the resources a job uses: what it can see and reach is bounded by the sandbox.
+
+Python jobs run inside the forked interpreter, so they skip the interpreter
+start-up and the imports that were already made by the worker. Only Python is
+warm: jobs for other languages `exec` a fresh runtime from the forked child, and
+pay its start-up on every job.
+
+A job is bounded by its wall time limit from start to finish: its process group
+is killed once the limit is over, even if it closed its output early.
+
+Note:
+    This file is executed directly by path and must only import the standard
+    library, so that a worker does not pay for importing the `src` package.
+"""
+
+import importlib
+import json
+import math
+import os
+import resource
+import selectors
+import signal
+import sys
+import tempfile
+import time
+import traceback
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+# Modules commonly used by submissions, imported once by the worker so that
+# forked children get them for free.
+PRELOADED_MODULES = (
+    "bisect",
+    "collections",
+    "functools",
+    "heapq",
+    "itertools",
+    "re",
+)
+
+OUTPUT_LIMIT = 64 * 1024
+
+SIGNAL_STATUSES: Dict[int, Tuple[int, str]] = {
+    signal.SIGSEGV: (7, "Runtime Error (SIGSEGV)"),
+    signal.SIGXFSZ: (8, "Runtime Error (SIGXFSZ)"),
+    signal.SIGFPE: (9, "Runtime Error (SIGFPE)"),
+    signal.SIGABRT: (10, "Runtime Error (SIGABRT)"),
+}
+
+
+def _apply_limits(job: Dict[str, Any]) -> None:
+    """
+    Apply the job's resource limits to the current (child) process.
+
+    Args:
+        job (Dict[str, Any]): The job being run.
+    """
+    cpu_limit = math.ceil(job["cpu_time_limit"] + job["cpu_extra_time"])
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_limit, cpu_limit + 1))
+    memory_limit = int(job["memory_limit"]) * 1024
+    # Runtimes such as node reserve far more address space than they use,
+    # so only the interpreter we control gets an address space limit.
+    memory_resource = (
+        resource.RLIMIT_DATA if job["command"] else resource.RLIMIT_AS
+    )
+    resource.setrlimit(memory_resource, (memory_limit, memory_limit))
+    resource.setrlimit(
+        resource.RLIMIT_FSIZE, (OUTPUT_LIMIT * 16, OUTPUT_LIMIT * 16)
+    )
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    # Counted per user namespace, so only the sandbox's own processes count.
+    process_limit = int(job.get("max_processes_and_or_threads") or 60)
+    resource.setrlimit(resource.RLIMIT_NPROC, (process_limit, process_limit))
+
+
+def _run_python(source: str) -> int:
+    """
+    Run Python source code inside the current (forked) interpreter.
+
+    Args:
+        source (str): The program source code.
+
+    Returns:
+        int: The exit status of the program.
+    """
+    sys.stdin = open(0, "r", encoding="utf-8", closefd=False)
+    sys.stdout = open(1, "w", encoding="utf-8", closefd=False)
+    sys.stderr = open(2, "w", encoding="utf-8", closefd=False)
+    status = 0
+    try:
+        code = compile(source, "main.py", "exec")
+        exec(code, {"__name__": "__main__", "__builtins__": __builtins__})
+    except SystemExit as exit_:
+        if isinstance(exit_.code, int):
+            status = exit_.code
+        elif exit_.code is not None:
+            print(exit_.code, file=sys.stderr)
+            status = 1
+    except BaseException as err:  # pylint: disable=W0703
+        # Drop the worker's own frame from the traceback.
+        frames = err.__traceback__
+        traceback.print_exception(
+            type(err), err, frames.tb_next if frames is not None else None
+        )
+        status = 1
+    finally:
+        for stream in (sys.stdout, sys.stderr):
+            try:
+                stream.flush()
+            except Exception:  # pylint: disable=W0703
+                pass
+    return status
+
+
+def _run_child(
+    job: Dict[str, Any], fds: List[int], workdir: str
+) -> None:  # pragma: no cover - runs in the forked child
+    """
+    Set up the forked child and run the job. Never returns.
+
+    Args:
+        job (Dict[str, Any]): The job being run.
+        fds (List[int]): The child's stdin, stdout and stderr descriptors.
+        workdir (str): A scratch directory for the program.
+    """
+    status = 127
+    try:
+        os.setsid()
+        signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+        os.closerange(3, 256)
+        os.chdir(workdir)
+        _apply_limits(job)
+        if job["command"]:
+            os.execvp(job["command"][0], job["command"])
+        status = _run_python(job["source_code"])
+    finally:
+        os._exit(status)
+
+
+def _kill(pid: int) -> None:
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def _wait(pid: int, deadline: float) -> Tuple[int, Any, bool]:
+    """
+    Wait for a child to exit, killing its process group at the deadline.
+
+    Args:
+        pid (int): The child process id.
+        deadline (float): The `time.monotonic()` the child must exit by.
+
+    Returns:
+        Tuple[int, Any, bool]: The wait status, the resource usage, and
+            whether the child was killed for running past the deadline.
+    """
+    delay = 0.001
+    while True:
+        waited, status, usage = os.wait4(pid, os.WNOHANG)
+        if waited:
+            return status, usage, False
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            _kill(pid)
+            _, status, usage = os.wait4(pid, 0)
+            return status, usage, True
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, 0.05)
+
+
+def _communicate(
+    pid: int, stdin: bytes, fds: List[int], wall_time_limit: float
+) -> Dict[str, Any]:
+    """
+    Feed stdin to a child and collect its output until it exits or times out.
+
+    Args:
+        pid (int): The child process id.
+        stdin (bytes): The data to write to the child's stdin.
+        fds (List[int]): The parent ends of the stdin, stdout and stderr pipes.
+        wall_time_limit (float): The maximum number of seconds to wait.
+
+    Returns:
+        Dict[str, Any]: The collected output, exit status, and resource usage.
+    """
+    stdin_fd, stdout_fd, stderr_fd = fds
+    outputs = {stdout_fd: bytearray(), stderr_fd: bytearray()}
+    selector = selectors.DefaultSelector()
+    for fd in outputs:
+        selector.register(fd, selectors.EVENT_READ)
+    if stdin:
+        os.set_blocking(stdin_fd, False)
+        selector.register(stdin_fd, selectors.EVENT_WRITE)
+    else:
+        os.close(stdin_fd)
+    start = time.monotonic()
+    deadline = start + wall_time_limit
+    offset = 0
+    while selector.get_map():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        for key, _ in selector.select(remaining):
+            fd = key.fd
+            if fd == stdin_fd:
+                end = offset + 65536
+                try:
+                    offset += os.write(fd, stdin[offset:end])
+                except (BrokenPipeError, BlockingIOError):
+                    offset = len(stdin)
+                if offset >= len(stdin):
+                    selector.unregister(fd)
+                    os.close(fd)
+                continue
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                selector.unregister(fd)
+                continue
+            room = OUTPUT_LIMIT - len(outputs[fd])
+            if room > 0:
+                outputs[fd].extend(chunk[:room])
+    for key in list(selector.get_map().values()):
+        selector.unregister(key.fd)
+        if key.fd == stdin_fd:
+            os.close(key.fd)
+    selector.close()
+    for fd in outputs:
+        os.close(fd)
+    # The child may have closed its output and still be running.
+    status, usage, timed_out = _wait(pid, deadline)
+    return {
+        "stdout": outputs[stdout_fd].decode("utf-8", "replace"),
+        "stderr": outputs[stderr_fd].decode("utf-8", "replace"),
+        "status": status,
+        "timed_out": timed_out,
+        "cpu_time": usage.ru_utime + usage.ru_stime,
+        "wall_time": time.monotonic() - start,
+        "memory": usage.ru_maxrss,
+    }
+
+
+def _status(job: Dict[str, Any], run: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Map the outcome of a run to a Judge0 status.
+
+    Args:
+        job (Dict[str, Any]): The job that was run.
+        run (Dict[str, Any]): The outcome returned by `_communicate`.
+
+    Returns:
+        Dict[str, Any]: A Judge0 status with an `id` and a `description`.
+    """
+    status = run["status"]
+    cpu_limit = job["cpu_time_limit"] + job["cpu_extra_time"]
+    if os.WIFSIGNALED(status):
+        signum = os.WTERMSIG(status)
+        if (
+            run["timed_out"]
+            or signum == signal.SIGXCPU
+            or (signum == signal.SIGKILL and run["cpu_time"] >= cpu_limit)
+        ):
+            return {"id": 5, "description": "Time Limit Exceeded"}
+        status_id, description = SIGNAL_STATUSES.get(
+            signum, (12, "Runtime Error (Other)")
+        )
+        return {"id": status_id, "description": description}
+    if os.WEXITSTATUS(status) != 0:
+        return {"id": 11, "description": "Runtime Error (NZEC)"}
+    expected_output = job.get("expected_output") or ""
+    if expected_output and (
+        run["stdout"].rstrip() != expected_output.rstrip()
+    ):
+        return {"id": 4, "description": "Wrong Answer"}
+    return {"id": 3, "description": "Accepted"}
+
+
+def run_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Run a single job in a forked, resource limited child.
+
+    Args:
+        job (Dict[str, Any]): A Judge0 submission payload extended with a
+            `command` (None for Python) and a `file_name`.
+
+    Returns:
+        Dict[str, Any]: A Judge0-shaped result.
+    """
+    with tempfile.TemporaryDirectory(prefix="sandbox-") as workdir:
+        command: Optional[List[str]] = None
+        if job["command"]:
+            path = os.path.join(workdir, job["file_name"])
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(job["source_code"])
+            command = [part.format(file=path) for part in job["command"]]
+        job = dict(job, command=command)
+        stdin_r, stdin_w = os.pipe()
+        stdout_r, stdout_w = os.pipe()
+        stderr_r, stderr_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover - forked child
+            for fd in (stdin_w, stdout_r, stderr_r):
+                os.close(fd)
+            _run_child(job, [stdin_r, stdout_w, stderr_w], workdir)
+        for fd in (stdin_r, stdout_w, stderr_w):
+            os.close(fd)
+        run = _communicate(
+            pid,
+            (job.get("stdin") or "").encode("utf-8"),
+            [stdin_w, stdout_r, stderr_r],
+            float(job["wall_time_limit"]),
+        )
+    status = run["status"]
+    return {
+        "stdout": run["stdout"] or None,
+        "stderr": run["stderr"] or None,
+        "compile_output": None,
+        "message": None,
+        "exit_code": (
+            os.WEXITSTATUS(status) if os.WIFEXITED(status) else None
+        ),
+        "exit_signal": (
+            os.WTERMSIG(status) if os.WIFSIGNALED(status) else None
+        ),
+        "status": _status(job, run),
+        "time": f"{run['cpu_time']:.3f}",
+        "wall_time": f"{run['wall_time']:.3f}",
+        "memory": run["memory"],
+    }
+
+
+def main() -> None:
+    """
+    Serve jobs from stdin until it is closed.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for name in PRELOADED_MODULES:
+        importlib.import_module(name)
+    sys.stdout.write("ready\n")
+    sys.stdout.flush()
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            result = run_job(json.loads(line))
+        except Exception as err:  # pylint: disable=W0703
+            result = {
+                "stdout": None,
+                "stderr": None,
+                "compile_output": None,
+                "message": repr(err),
+                "status": {"id": 13, "description": "Internal Error"},
+                "time": None,
+                "memory": None,
+            }
+        sys.stdout.write(json.dumps(result) + "\n")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
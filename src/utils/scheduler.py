@@ -0,0 +1,323 @@
+"""⏰ Utils Scheduler Module 📅
+
+This module contains the process-wide scheduler that sends the periodic algorithm emails.
+
+A single scheduler runs its jobs on the application event loop and stores them in
+MongoDB, so the number of threads does not grow with the number of users and the jobs
+survive restarts. The MongoDB job store is synchronous, so the scheduler only uses it
+from a dedicated thread (see `ThreadedStoreScheduler`), and the functions adding or
+listing jobs must be called from a thread too, e.g. with `asyncio.to_thread`.
+
+There is one digest job per schedule ("Every hour", "Every day", ...), which emails
+every user on that schedule through `src.utils.digest`, so changing a user's language
+or schedule only needs to update the user. A daily off-peak job keeps the tutorial
+library stocked (see `src.utils.tutorials`), and a digest that runs out of tutorials
+requests an extra refill right away.
+
+Every process starts its scheduler paused: it can add and replace jobs in the shared job
+store, but only the process holding the "scheduler" lease (see `src.utils.leader`) runs
+them, so each due job fires once across all workers and replicas.
+
+Classes:
+    - LoopExecutor: Runs the jobs on the event loop, whatever the submitting thread.
+    - ThreadedStoreScheduler: An AsyncIOScheduler using its job store from a thread.
+
+Functions:
+    - create_scheduler() -> AsyncIOScheduler: Build the scheduler and its job store.
+    - create_scheduler_lease(scheduler, collection, ttl) -> LeaderLease:
+        Build the lease that resumes the scheduler of the elected process.
+    - digest_job_id(schedule: str) -> str: The job id of a schedule's digest.
+    - schedule_algorithm_digests(scheduler) -> None: Register the digest jobs.
+    - send_algorithm_digest(schedule: str) -> None: The scheduled job.
+    - schedule_tutorial_refill(scheduler, hour: int) -> None: Register the daily refill.
+    - request_tutorial_refill(scheduler) -> None: Refill the library as soon as possible.
+    - refill_tutorial_library() -> None: The refill job.
+
+Dependencies:
+    - asyncio: For the event loop the jobs run on.
+    - apscheduler: For scheduling jobs.
+    - concurrent.futures.ThreadPoolExecutor: For the job store thread.
+    - pymongo.MongoClient: For the job store.
+    - src.config.settings: Application configuration settings.
+    - src.utils.leader: For electing the process that runs the jobs.
+    - src.utils.digest: For sending the algorithm emails.
+    - src.utils.tutorials: For refilling the tutorial library.
+
+"""
+
+from apscheduler.executors.asyncio import (
+    AsyncIOExecutor,
+)
+from apscheduler.jobstores.base import (
+    ConflictingIdError,
+    JobLookupError,
+)
+from apscheduler.jobstores.mongodb import (
+    MongoDBJobStore,
+)
+from apscheduler.schedulers.asyncio import (
+    AsyncIOScheduler,
+)
+from apscheduler.schedulers.base import (
+    STATE_STOPPED,
+    BaseScheduler,
+)
+import asyncio
+from concurrent.futures import (
+    ThreadPoolExecutor,
+)
+from motor.motor_asyncio import (
+    AsyncIOMotorCollection,
+)
+from pymongo import (
+    MongoClient,
+)
+from typing import (
+    Any,
+    Dict,
+    Optional,
+)
+
+from src.config import (
+    settings,
+)
+from src.utils import (
+    digest,
+    leader,
+    tutorials,
+)
+
+TUTORIAL_REFILL_JOB_ID = "tutorial-refill"
+
+# User schedule -> keyword arguments of the interval trigger.
+SCHEDULE_INTERVALS: Dict[str, Dict[str, int]] = {
+    "Every hour": {"hours": 1},
+    "Every day": {"days": 1},
+    "Every week": {"weeks": 1},
+    "Every month": {"days": 30},
+}
+
+
+class LoopExecutor(AsyncIOExecutor):
+    """
+    Runs the jobs on the scheduler's event loop, whatever the thread that
+    found them due.
+    """
+
+    def _do_submit_job(self, job: Any, run_times: Any) -> None:
+        self._eventloop.call_soon_threadsafe(
+            super()._do_submit_job, job, run_times
+        )
+
+
+class ThreadedStoreScheduler(AsyncIOScheduler):
+    """
+    An AsyncIOScheduler that only uses its job store from a dedicated thread.
+
+    Looking for due jobs reads and updates the job store; the jobs found
+    are handed back to the event loop, which also keeps the timer of the
+    next wake up. Wake ups requested while a look up runs are merged into
+    one more look up.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._store_thread = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="scheduler"
+        )
+        self._processing: Optional["asyncio.Future[Optional[float]]"] = None
+        self._wakeup_pending = False
+
+    def wakeup(self) -> None:
+        self._eventloop.call_soon_threadsafe(self._process_in_thread)
+
+    def _process_in_thread(self) -> None:
+        self._stop_timer()
+        if self.state == STATE_STOPPED:
+            return
+        if self._processing is not None:
+            self._wakeup_pending = True
+            return
+        self._processing = self._eventloop.run_in_executor(
+            self._store_thread, self._process_jobs
+        )
+        self._processing.add_done_callback(self._processed)
+
+    def _processed(self, future: "asyncio.Future[Optional[float]]") -> None:
+        self._processing = None
+        if self._wakeup_pending:
+            self._wakeup_pending = False
+            self._process_in_thread()
+        elif not future.cancelled() and future.exception() is None:
+            self._start_timer(future.result())
+
+    def shutdown(self, wait: bool = True) -> None:
+        BaseScheduler.shutdown(self, wait)
+        self._eventloop.call_soon_threadsafe(self._stop_timer)
+        self._store_thread.shutdown(wait=False)
+
+    def _create_default_executor(self) -> LoopExecutor:
+        return LoopExecutor()
+
+
+def create_scheduler() -> AsyncIOScheduler:
+    """
+    Build the process-wide scheduler backed by a MongoDB job store. Must be
+    called from the event loop the jobs run on.
+
+    Returns:
+        AsyncIOScheduler: The scheduler, not started yet.
+    """
+    app_settings = settings()
+    job_store = MongoDBJobStore(
+        database=app_settings.MONGODB_DATABASE,
+        collection="scheduled_jobs",
+        client=MongoClient(app_settings.db_url),
+    )
+    return ThreadedStoreScheduler(
+        event_loop=asyncio.get_event_loop(),
+        jobstores={"default": job_store},
+        job_defaults={
+            "coalesce": True,
+            "max_instances": 1,
+            "misfire_grace_time": 3600,
+        },
+    )
+
+
+def create_scheduler_lease(
+    scheduler: AsyncIOScheduler,
+    collection: AsyncIOMotorCollection,
+    ttl: float,
+) -> leader.LeaderLease:
+    """
+    Build the lease deciding which process runs the scheduled jobs.
+
+    The elected process resumes its scheduler, and wakes it up on every
+    renewal so that jobs added by other processes are picked up promptly.
+
+    Args:
+        scheduler (AsyncIOScheduler): The scheduler, started paused.
+        collection (AsyncIOMotorCollection): The collection storing the leases.
+        ttl (float): The number of seconds a lease lasts without renewal.
+
+    Returns:
+        leader.LeaderLease: The lease, not started yet.
+    """
+    return leader.LeaderLease(
+        collection,
+        "scheduler",
+        ttl=ttl,
+        on_elected=scheduler.resume,
+        on_demoted=scheduler.pause,
+        on_renewed=scheduler.wakeup,
+    )
+
+
+def digest_job_id(schedule: str) -> str:
+    """
+    Build the job id of a schedule's algorithm digest.
+
+    Args:
+        schedule (str): The schedule, e.g. "Every day".
+
+    Returns:
+        str: The job id.
+    """
+    return "algorithm-digest:" + schedule.lower().replace(" ", "-")
+
+
+def schedule_algorithm_digests(scheduler: AsyncIOScheduler) -> None:
+    """
+    Make sure every schedule has its digest job.
+
+    Existing jobs are kept as they are, so that restarts do not push their
+    next run back. The per-user jobs of the previous design are removed.
+
+    Args:
+        scheduler (AsyncIOScheduler): The process-wide scheduler.
+    """
+    for job in scheduler.get_jobs():
+        if job.id.startswith("algorithm-email:"):
+            try:
+                job.remove()
+            except JobLookupError:
+                pass
+    for schedule, interval in SCHEDULE_INTERVALS.items():
+        try:
+            scheduler.add_job(
+                send_algorithm_digest,
+                "interval",
+                id=digest_job_id(schedule),
+                args=(schedule,),
+                **interval,
+            )
+        except ConflictingIdError:
+            # Already registered by this or another process.
+            pass
+
+
+async def send_algorithm_digest(schedule: str) -> None:
+    """
+    Send the algorithm emails of a schedule; the function run by the jobs.
+
+    Args:
+        schedule (str): The schedule, e.g. "Every day".
+    """
+    from src.main import (  # pylint: disable=C0415
+        code_app,
+    )
+
+    if not code_app.state.scheduler_lease.is_leader:
+        # The lease was lost after the job became due.
+        return
+    stats = await digest.send_algorithm_digest(schedule)
+    if stats["skipped"]:
+        await asyncio.to_thread(
+            request_tutorial_refill, code_app.state.scheduler
+        )
+
+
+def schedule_tutorial_refill(scheduler: AsyncIOScheduler, hour: int) -> None:
+    """
+    Register the daily job refilling the tutorial library.
+
+    Args:
+        scheduler (AsyncIOScheduler): The process-wide scheduler.
+        hour (int): The UTC hour the library is refilled at.
+    """
+    scheduler.add_job(
+        refill_tutorial_library,
+        "cron",
+        id=TUTORIAL_REFILL_JOB_ID,
+        hour=hour,
+        timezone="UTC",
+        replace_existing=True,
+    )
+
+
+def request_tutorial_refill(scheduler: AsyncIOScheduler) -> None:
+    """
+    Refill the tutorial library as soon as the leader picks the job up.
+
+    Args:
+        scheduler (AsyncIOScheduler): The process-wide scheduler.
+    """
+    scheduler.add_job(
+        refill_tutorial_library,
+        id=TUTORIAL_REFILL_JOB_ID + ":now",
+        replace_existing=True,
+    )
+
+
+async def refill_tutorial_library() -> None:
+    """
+    Top up the tutorial library; the function run by the refill jobs.
+    """
+    from src.main import (  # pylint: disable=C0415
+        code_app,
+    )
+
+    if not code_app.state.scheduler_lease.is_leader:
+        return
+    await tutorials.refill_library(int(settings().TUTORIAL_STOCK_SIZE))
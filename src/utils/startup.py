@@ -0,0 +1,175 @@
+"""⏱️ Utils Startup Module 🚦
+
+This module contains the startup timing report.
+
+Every worker times the steps of its startup and logs them in one line once it is ready,
+next to the time it spent before that, i.e. starting the interpreter and importing the
+application. The report is also kept on `app.state.startup` for the admin endpoint. For
+a breakdown of the import time, `measure_imports` imports the application in a fresh
+interpreter with `-X importtime` and sums the time spent in each top-level package; it
+backs the `python -m src.manage startup-report` command.
+
+Classes:
+    - StartupTimer: Times the steps of a worker's startup.
+
+Functions:
+    - process_age() -> Optional[float]: The number of seconds since the process started.
+    - parse_importtime(output: str) -> List[Tuple[str, float]]: Sum `-X importtime` per package.
+    - measure_imports(module: str) -> List[Tuple[str, float]]: Time the imports of a module.
+
+Dependencies:
+    - subprocess: For importing in a fresh interpreter.
+    - time: For the timings.
+
+"""
+
+from collections import (
+    defaultdict,
+)
+import logging
+import os
+import subprocess
+import sys
+import time
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def process_age() -> Optional[float]:
+    """
+    Get the number of seconds since the process started, from `/proc`.
+
+    Returns:
+        Optional[float]: The process age, or None where `/proc` is missing.
+    """
+    try:
+        with open("/proc/self/stat", "r", encoding="utf-8") as file:
+            # The command name may hold spaces, the fields follow its ")".
+            fields = file.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime", "r", encoding="utf-8") as file:
+            uptime = float(file.read().split()[0])
+        started = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+        return max(uptime - started, 0.0)
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+class StartupTimer:
+    """
+    Times the steps of a worker's startup.
+
+    Each call to `checkpoint` records the time elapsed since the previous
+    one, so the steps of `init_engine_app` are timed without nesting its
+    body in blocks.
+    """
+
+    def __init__(self) -> None:
+        self.before_init = process_age()
+        self.steps: Dict[str, float] = {}
+        self._started = self._last = time.perf_counter()
+
+    def checkpoint(self, step: str) -> None:
+        """
+        Record the time spent since the previous checkpoint.
+
+        Args:
+            step (str): The name of the step that just ended.
+        """
+        now = time.perf_counter()
+        self.steps[step] = now - self._last
+        self._last = now
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Describe the startup.
+
+        Returns:
+            Dict[str, Any]: The seconds spent before the initialization
+                (interpreter and imports), in each step and in total.
+        """
+        init = self._last - self._started
+        return {
+            "before_init": self.before_init,
+            "init": init,
+            "steps": dict(self.steps),
+            "total": (
+                None if self.before_init is None else self.before_init + init
+            ),
+        }
+
+    def log(self) -> None:
+        """
+        Log the report in one line.
+        """
+        report = self.report()
+        steps = ", ".join(
+            f"{step} {seconds * 1000:.0f}ms"
+            for step, seconds in report["steps"].items()
+        )
+        logger.info(
+            "Worker %d ready: %s before init, %.0fms init (%s)",
+            os.getpid(),
+            (
+                "?"
+                if report["before_init"] is None
+                else f"{report['before_init'] * 1000:.0f}ms"
+            ),
+            report["init"] * 1000,
+            steps,
+        )
+
+
+def parse_importtime(output: str) -> List[Tuple[str, float]]:
+    """
+    Sum the self time of the `-X importtime` lines per top-level package.
+
+    Args:
+        output (str): The standard error of `python -X importtime`.
+
+    Returns:
+        List[Tuple[str, float]]: The packages and their import time in
+            seconds, slowest first.
+    """
+    totals: Dict[str, float] = defaultdict(float)
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line.split(":", 1)[1].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            # The header line.
+            continue
+        package = fields[2].strip().split(".")[0]
+        totals[package] += int(fields[0]) / 1_000_000
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def measure_imports(module: str = "src.main") -> List[Tuple[str, float]]:
+    """
+    Import a module in a fresh interpreter and time the imports.
+
+    Args:
+        module (str): The module to import.
+
+    Raises:
+        RuntimeError: If the import fails.
+
+    Returns:
+        List[Tuple[str, float]]: The packages and their import time in
+            seconds, slowest first.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return parse_importtime(result.stderr)
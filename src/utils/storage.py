@@ -0,0 +1,433 @@
+"""🗄️ Utils Storage Module 📦
+
+This module contains the blob storage backends, used for the profile images.
+
+The routes only see the `BlobStorage` interface: `DetaStorage` keeps blobs on a Deta
+Drive, running the blocking SDK calls in a thread pool, and `LocalStorage` keeps them in
+a local directory, which makes an offline stand-in for development and benchmarks. The
+remote backend is wrapped in a `CachedStorage`, a read-through, size-bounded LRU cache on
+the local disk: hot blobs are served straight from a file, so the server streams them
+from the page cache instead of making a Drive round trip. Cached files are named after
+the hash of their content, so identical blobs share a file and a file never changes
+once written.
+
+Classes:
+    - BlobStorage: The storage interface.
+    - DetaStorage: Blobs on a Deta Drive.
+    - LocalStorage: Blobs in a local directory.
+    - CachedStorage: A local disk LRU cache in front of another backend.
+
+Functions:
+    - create_storage(drive: str) -> BlobStorage: Build the storage selected in the settings.
+
+Dependencies:
+    - asyncio: For running blocking calls in a thread pool.
+    - collections.OrderedDict: For the LRU index.
+    - deta: For Deta Drive.
+    - src.config.settings: Application configuration settings.
+    - src.utils.metrics: For the Deta latency metrics.
+
+"""
+
+from abc import (
+    ABC,
+    abstractmethod,
+)
+import asyncio
+from collections import (
+    OrderedDict,
+)
+from deta import (
+    Deta,
+)
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
+
+from src.config import (
+    settings,
+)
+from src.utils import (
+    metrics,
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+async def _run_blocking(func: Callable[..., T], *args: Any) -> T:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, func, *args)
+
+
+def _write_atomically(path: str, content: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    handle, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(handle, "wb") as file:
+            file.write(content)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as file:
+        return file.read()
+
+
+class BlobStorage(ABC):
+    """
+    The interface shared by all blob storage backends.
+
+    Attributes:
+        name (str): The backend name, as used in the settings.
+    """
+
+    name = ""
+
+    async def start(self) -> None:
+        """
+        Acquire the resources needed by the backend.
+        """
+
+    async def close(self) -> None:
+        """
+        Release the resources held by the backend.
+        """
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        """
+        Read a blob.
+
+        Args:
+            key (str): The blob key, e.g. "user/<id>/profile-large.png".
+
+        Returns:
+            Optional[bytes]: The blob, or None if it does not exist.
+        """
+
+    @abstractmethod
+    async def put(self, key: str, content: bytes) -> None:
+        """
+        Write a blob, replacing the previous one.
+
+        Args:
+            key (str): The blob key.
+            content (bytes): The blob.
+        """
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        """
+        Delete a blob, if it exists.
+
+        Args:
+            key (str): The blob key.
+        """
+
+    async def local_path(
+        self, key: str, version: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        Get a local file holding a blob, to serve it without reading it into
+        memory.
+
+        Args:
+            key (str): The blob key.
+            version (Optional[str]): A prefix of the SHA-256 hex digest of the
+                expected blob, e.g. its ETag. Backends keeping copies of the
+                blobs check them against it.
+
+        Returns:
+            Optional[str]: The file path, or None if the blob does not exist,
+                is not the expected version or the backend has no local copy.
+        """
+        return None
+
+
+class DetaStorage(BlobStorage):
+    """
+    Blobs on a Deta Drive. The Deta client is only built on first use.
+
+    Args:
+        project_key (str): The Deta project key.
+        drive (str): The drive name.
+    """
+
+    name = "deta"
+
+    def __init__(self, project_key: str, drive: str) -> None:
+        self.project_key = project_key
+        self.drive_name = drive
+        self._drive: Any = None
+
+    @property
+    def drive(self) -> Any:
+        """
+        The Deta Drive client, built on first use.
+
+        Returns:
+            deta.Drive: The drive client.
+        """
+        if self._drive is None:
+            self._drive = Deta(self.project_key).Drive(self.drive_name)
+        return self._drive
+
+    def _get(self, key: str) -> Optional[bytes]:
+        body = self.drive.get(key)
+        if body is None:
+            return None
+        try:
+            return body.read()
+        finally:
+            body.close()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        with metrics.track("deta", "get"):
+            return await _run_blocking(self._get, key)
+
+    async def put(self, key: str, content: bytes) -> None:
+        with metrics.track("deta", "put"):
+            await _run_blocking(self.drive.put, key, content)
+
+    async def delete(self, key: str) -> None:
+        with metrics.track("deta", "delete"):
+            await _run_blocking(self.drive.delete, key)
+
+
+class LocalStorage(BlobStorage):
+    """
+    Blobs in a local directory.
+
+    Args:
+        root (str): The directory holding the blobs.
+    """
+
+    name = "local"
+
+    def __init__(self, root: str) -> None:
+        self.root = os.path.abspath(root)
+
+    def path(self, key: str) -> str:
+        """
+        Get the file path of a blob.
+
+        Args:
+            key (str): The blob key.
+
+        Raises:
+            ValueError: If the key points outside of the root directory.
+
+        Returns:
+            str: The file path.
+        """
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid blob key: {key!r}")
+        return path
+
+    async def start(self) -> None:
+        os.makedirs(self.root, exist_ok=True)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        try:
+            return await _run_blocking(_read, self.path(key))
+        except FileNotFoundError:
+            return None
+
+    async def put(self, key: str, content: bytes) -> None:
+        await _run_blocking(_write_atomically, self.path(key), content)
+
+    async def delete(self, key: str) -> None:
+        try:
+            await _run_blocking(os.unlink, self.path(key))
+        except FileNotFoundError:
+            pass
+
+    async def local_path(
+        self, key: str, version: Optional[str] = None
+    ) -> Optional[str]:
+        path = self.path(key)
+        return path if os.path.isfile(path) else None
+
+
+class CachedStorage(BlobStorage):
+    """
+    A read-through, size-bounded LRU cache on the local disk in front of
+    another backend.
+
+    Every process caches in its own subdirectory of `directory`, removed when
+    it closes; the subdirectories of processes that died are removed when the
+    next one starts.
+
+    Args:
+        backend (BlobStorage): The cached backend.
+        directory (str): The cache directory.
+        max_bytes (int): The total size of the cached blobs.
+    """
+
+    def __init__(
+        self, backend: BlobStorage, directory: str, max_bytes: int
+    ) -> None:
+        self.backend = backend
+        self.name = backend.name
+        self.directory = os.path.join(os.path.abspath(directory), "")
+        self.process_directory = os.path.join(self.directory, str(os.getpid()))
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        # key -> (content hash, size), least recently used first.
+        self._index: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()
+        # content hash -> keys, a file is removed with its last key.
+        self._files: Dict[str, Set[str]] = {}
+
+    def _remove_dead_directories(self) -> None:
+        for entry in os.listdir(self.directory):
+            if not entry.isdigit() or int(entry) == os.getpid():
+                continue
+            try:
+                os.kill(int(entry), 0)
+            except ProcessLookupError:
+                shutil.rmtree(
+                    os.path.join(self.directory, entry), ignore_errors=True
+                )
+            except PermissionError:
+                pass
+
+    async def start(self) -> None:
+        await self.backend.start()
+        os.makedirs(self.process_directory, exist_ok=True)
+        await _run_blocking(self._remove_dead_directories)
+
+    async def close(self) -> None:
+        await self.backend.close()
+        await _run_blocking(
+            lambda: shutil.rmtree(self.process_directory, ignore_errors=True)
+        )
+        self._index.clear()
+        self._files.clear()
+        self.size = 0
+
+    def _file(self, digest: str) -> str:
+        return os.path.join(self.process_directory, digest)
+
+    def _forget(self, key: str) -> None:
+        digest, size = self._index.pop(key)
+        keys = self._files[digest]
+        keys.discard(key)
+        if not keys:
+            del self._files[digest]
+            self.size -= size
+            try:
+                os.unlink(self._file(digest))
+            except FileNotFoundError:
+                pass
+
+    async def _store(self, key: str, content: bytes) -> str:
+        if key in self._index:
+            self._forget(key)
+        digest = hashlib.sha256(content).hexdigest()
+        if digest not in self._files:
+            await _run_blocking(_write_atomically, self._file(digest), content)
+            self._files[digest] = set()
+            self.size += len(content)
+        self._files[digest].add(key)
+        self._index[key] = (digest, len(content))
+        while self.size > self.max_bytes and len(self._index) > 1:
+            self.stats["evictions"] += 1
+            self._forget(next(iter(self._index)))
+        return self._file(digest)
+
+    async def _cached_path(
+        self, key: str, version: Optional[str] = None
+    ) -> Optional[str]:
+        # Another process may have replaced the blob since it was cached here,
+        # so a copy that is not the expected version is fetched again.
+        if key in self._index:
+            digest = self._index[key][0]
+            path = self._file(digest)
+            if (
+                version is None or digest.startswith(version)
+            ) and os.path.isfile(path):
+                self._index.move_to_end(key)
+                self.stats["hits"] += 1
+                return path
+            self._forget(key)
+        self.stats["misses"] += 1
+        content = await self.backend.get(key)
+        if content is None or len(content) > self.max_bytes:
+            return None
+        path = await self._store(key, content)
+        if version is not None and not self._index[key][0].startswith(version):
+            return None
+        return path
+
+    async def get(self, key: str) -> Optional[bytes]:
+        path = await self._cached_path(key)
+        if path is None:
+            return await self.backend.get(key)
+        try:
+            return await _run_blocking(_read, path)
+        except FileNotFoundError:
+            return await self.backend.get(key)
+
+    async def put(self, key: str, content: bytes) -> None:
+        await self.backend.put(key, content)
+        if len(content) <= self.max_bytes:
+            await self._store(key, content)
+
+    async def delete(self, key: str) -> None:
+        await self.backend.delete(key)
+        if key in self._index:
+            self._forget(key)
+
+    async def local_path(
+        self, key: str, version: Optional[str] = None
+    ) -> Optional[str]:
+        return await self._cached_path(key, version)
+
+
+def create_storage(drive: str) -> BlobStorage:
+    """
+    Build the blob storage selected by the `STORAGE_BACKEND` setting.
+
+    Args:
+        drive (str): The drive, or subdirectory, holding the blobs.
+
+    Returns:
+        BlobStorage: A Deta storage behind a local disk cache, unless the
+            cache is disabled, or a local storage.
+    """
+    app_settings = settings()
+    if app_settings.STORAGE_BACKEND == LocalStorage.name:
+        return LocalStorage(
+            os.path.join(app_settings.STORAGE_LOCAL_PATH, drive)
+        )
+    storage: BlobStorage = DetaStorage(app_settings.DETA_PROJECT_KEY, drive)
+    cache_size = int(app_settings.STORAGE_CACHE_SIZE) * 1024 * 1024
+    if cache_size > 0:
+        storage = CachedStorage(
+            storage,
+            os.path.join(
+                app_settings.STORAGE_CACHE_PATH or tempfile.gettempdir(),
+                "code-inbox-cache",
+                drive,
+            ),
+            cache_size,
+        )
+    return storage
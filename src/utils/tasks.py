@@ -0,0 +1,177 @@
+"""🧵 Utils Tasks Module 🛟
+
+This module contains the supervisor of the background tasks started by requests.
+
+Instead of bare `asyncio.ensure_future` calls, request handlers hand their background
+work to the application's `TaskSupervisor`. It bounds how many tasks run at once and how
+many can wait, logs and counts failures instead of losing them, and on shutdown lets the
+running tasks finish within a deadline before cancelling the rest.
+
+Classes:
+    - TaskRejected: Raised when a task cannot be accepted.
+    - TaskSupervisor: Runs, tracks and drains background tasks.
+
+Dependencies:
+    - asyncio: For tasks and the semaphore.
+    - collections.deque: For the recent errors.
+
+"""
+
+import asyncio
+from collections import (
+    deque,
+)
+from datetime import (
+    datetime,
+)
+import logging
+from typing import (
+    Any,
+    Awaitable,
+    Deque,
+    Dict,
+    Set,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class TaskRejected(Exception):
+    """
+    Raised when a task cannot be accepted, because the supervisor is full or
+    shutting down.
+    """
+
+
+class TaskSupervisor:
+    """
+    Runs, tracks and drains background tasks.
+
+    Args:
+        max_concurrent (int): The number of tasks running at once.
+        max_pending (int): The number of tasks running or waiting to run.
+        max_errors (int): The number of recent errors kept for inspection.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 16,
+        max_pending: int = 1000,
+        max_errors: int = 20,
+    ) -> None:
+        self.max_concurrent = max_concurrent
+        self.max_pending = max_pending
+        self.running = 0
+        self.closing = False
+        self.stats = {
+            "spawned": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "cancelled": 0,
+            "rejected": 0,
+        }
+        self.errors: Deque[Dict[str, Any]] = deque(maxlen=max_errors)
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._tasks: Set["asyncio.Task[None]"] = set()
+
+    @property
+    def pending(self) -> int:
+        """
+        The number of tasks running or waiting to run.
+
+        Returns:
+            int: The number of tracked tasks.
+        """
+        return len(self._tasks)
+
+    def spawn(self, coro: Awaitable[Any], name: str) -> "asyncio.Task[None]":
+        """
+        Run a coroutine in the background.
+
+        Args:
+            coro (Awaitable[Any]): The coroutine to run.
+            name (str): A name identifying the kind of task in logs and stats.
+
+        Raises:
+            TaskRejected: If the supervisor is full or shutting down.
+
+        Returns:
+            asyncio.Task[None]: The supervised task.
+        """
+        if self.closing or self.pending >= self.max_pending:
+            self.stats["rejected"] += 1
+            # Avoid the "coroutine was never awaited" warning.
+            getattr(coro, "close", lambda: None)()
+            raise TaskRejected(f"Cannot accept background task {name!r}")
+        self.stats["spawned"] += 1
+        task = asyncio.ensure_future(self._run(coro, name))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _run(self, coro: Awaitable[Any], name: str) -> None:
+        try:
+            async with self._semaphore:
+                self.running += 1
+                try:
+                    await coro
+                finally:
+                    self.running -= 1
+        except asyncio.CancelledError:
+            self.stats["cancelled"] += 1
+            logger.warning("Background task %r was cancelled", name)
+            raise
+        except Exception as err:  # pylint: disable=W0703
+            self.stats["failed"] += 1
+            self.errors.append(
+                {"task": name, "error": repr(err), "time": datetime.utcnow()}
+            )
+            logger.exception("Background task %r failed", name)
+        else:
+            self.stats["succeeded"] += 1
+        finally:
+            # Coroutines cancelled before they started were never awaited.
+            getattr(coro, "close", lambda: None)()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Describe the supervisor for metrics.
+
+        Returns:
+            Dict[str, Any]: The counters, the running and pending tasks, and
+                the recent errors.
+        """
+        return {
+            **self.stats,
+            "running": self.running,
+            "pending": self.pending,
+            "max_concurrent": self.max_concurrent,
+            "max_pending": self.max_pending,
+            "recent_errors": list(self.errors),
+        }
+
+    async def drain(self, timeout: float) -> int:
+        """
+        Stop accepting tasks and wait for the tracked ones, cancelling those
+        still unfinished after `timeout` seconds.
+
+        Args:
+            timeout (float): The deadline, in seconds.
+
+        Returns:
+            int: The number of tasks that had to be cancelled.
+        """
+        self.closing = True
+        if not self._tasks:
+            return 0
+        _, unfinished = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in unfinished:
+            task.cancel()
+        if unfinished:
+            await asyncio.wait(unfinished)
+            logger.warning(
+                "Cancelled %d background tasks after %ss",
+                len(unfinished),
+                timeout,
+            )
+        return len(unfinished)
@@ -0,0 +1,371 @@
+"""🎨 Utils Templates Module 📝
+
+This module contains the email template engine.
+
+Templates are HTML files with `{{ variable }}` placeholders, HTML-escaped on render, and
+`{{ variable|safe }}` placeholders inserted as is. They are loaded and compiled once, at
+startup: the CSS rules of their `<style>` blocks that email clients would otherwise drop
+are inlined into the `style` attribute of the matching elements, and the result is split
+into literal chunks and placeholders. Rendering a template for a user only joins these
+chunks with the user's variables, without touching the disk or parsing anything.
+
+Only simple selectors (`tag`, `.class`, `#id` and their combinations) are inlined; rules
+with other selectors, pseudo-classes or at-rules are kept in the `<style>` block.
+
+Classes:
+    - TemplateError: Raised for unknown templates or missing variables.
+    - CompiledTemplate: A template split into literals and placeholders.
+    - TemplateRegistry: Loads, compiles and renders the templates of a directory.
+
+Functions:
+    - inline_css(document: str) -> str: Inline the CSS of a document.
+    - compile_template(source: str) -> CompiledTemplate: Compile a template.
+    - extract_body(document: str) -> str: The content of a document's body.
+
+Dependencies:
+    - html.parser: For rewriting the elements.
+    - re: For parsing the stylesheets and placeholders.
+
+"""
+
+import html
+from html.parser import (
+    HTMLParser,
+)
+import logging
+import os
+import re
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+logger = logging.getLogger(__name__)
+
+# The static directory next to the src package, whatever the working directory.
+TEMPLATES_PATH = os.path.join(
+    os.path.dirname(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    ),
+    "static",
+)
+
+PLACEHOLDER_PATTERN = re.compile(r"\{\{\s*(\w+)\s*(\|\s*safe\s*)?\}\}")
+STYLE_PATTERN = re.compile(
+    r"<style[^>]*>(.*?)</style>", re.IGNORECASE | re.DOTALL
+)
+BODY_PATTERN = re.compile(r"<body[^>]*>(.*)</body>", re.IGNORECASE | re.DOTALL)
+COMMENT_PATTERN = re.compile(r"/\*.*?\*/", re.DOTALL)
+SIMPLE_SELECTOR_PATTERN = re.compile(
+    r"^([a-zA-Z][a-zA-Z0-9]*)?((?:[.#][-\w]+)*)$"
+)
+
+# (ids, classes, tags) specificity, source order, declarations.
+Rule = Tuple[Tuple[int, int, int], int, str, List[str], Optional[str], str]
+
+
+class TemplateError(Exception):
+    """
+    Raised for unknown templates or missing variables.
+    """
+
+
+def _parse_stylesheet(css: str) -> Tuple[List[Rule], str]:
+    """
+    Split a stylesheet into inlinable rules and the rules to keep.
+
+    Args:
+        css (str): The content of a `<style>` block.
+
+    Returns:
+        Tuple[List[Rule], str]: The inlinable rules and the remaining CSS.
+    """
+    css = COMMENT_PATTERN.sub("", css)
+    rules: List[Rule] = []
+    leftover: List[str] = []
+    position = 0
+    while True:
+        start = css.find("{", position)
+        if start == -1:
+            break
+        prelude = css[position:start].strip()
+        # Find the matching brace, at-rules may nest blocks.
+        depth, end = 1, start + 1
+        while end < len(css) and depth:
+            depth += {"{": 1, "}": -1}.get(css[end], 0)
+            end += 1
+        # Without the braces.
+        first, last = start + 1, end - 1
+        block = css[first:last].strip()
+        position = end
+        if prelude.startswith("@"):
+            leftover.append(f"{prelude} {{{block}}}")
+            continue
+        for selector in (part.strip() for part in prelude.split(",")):
+            match = SIMPLE_SELECTOR_PATTERN.match(selector)
+            if not selector or match is None:
+                leftover.append(f"{selector} {{{block}}}")
+                continue
+            tag, qualifiers = match.group(1), match.group(2)
+            element_id = None
+            classes: List[str] = []
+            for qualifier in re.findall(r"[.#][-\w]+", qualifiers):
+                if qualifier[0] == "#":
+                    element_id = qualifier[1:]
+                else:
+                    classes.append(qualifier[1:])
+            specificity = (
+                int(element_id is not None),
+                len(classes),
+                int(bool(tag)),
+            )
+            rules.append(
+                (
+                    specificity,
+                    len(rules),
+                    (tag or "").lower(),
+                    classes,
+                    element_id,
+                    block,
+                )
+            )
+    return rules, "\n".join(leftover)
+
+
+def _parse_declarations(block: str) -> Dict[str, str]:
+    declarations: Dict[str, str] = {}
+    for declaration in block.split(";"):
+        name, _, value = declaration.partition(":")
+        if name.strip() and value.strip():
+            declarations[name.strip().lower()] = value.strip()
+    return declarations
+
+
+class _CSSInliner(HTMLParser):
+    """
+    Rewrites a document, adding the matching rules to the elements' styles.
+    """
+
+    def __init__(self, rules: List[Rule]) -> None:
+        super().__init__(convert_charrefs=False)
+        self.rules = rules
+        self.output: List[str] = []
+
+    def _tag(
+        self, tag: str, attrs: List[Tuple[str, Optional[str]]], closed: bool
+    ) -> str:
+        attributes = dict(attrs)
+        classes = set((attributes.get("class") or "").split())
+        matching = sorted(
+            rule
+            for rule in self.rules
+            if (not rule[2] or rule[2] == tag)
+            and set(rule[3]) <= classes
+            and (rule[4] is None or rule[4] == attributes.get("id"))
+        )
+        text = self.get_starttag_text() or ""
+        if not matching:
+            return text
+        declarations: Dict[str, str] = {}
+        for rule in matching:
+            declarations.update(_parse_declarations(rule[5]))
+        # Inline styles written by hand win over the stylesheet.
+        declarations.update(_parse_declarations(attributes.get("style") or ""))
+        attributes["style"] = "; ".join(
+            f"{name}: {value}" for name, value in declarations.items()
+        )
+        rendered = "".join(
+            f" {name}" if value is None else f' {name}="{html.escape(value)}"'
+            for name, value in attributes.items()
+        )
+        return f"<{tag}{rendered}{' /' if closed else ''}>"
+
+    def handle_starttag(
+        self, tag: str, attrs: List[Tuple[str, Optional[str]]]
+    ) -> None:
+        self.output.append(self._tag(tag, attrs, False))
+
+    def handle_startendtag(
+        self, tag: str, attrs: List[Tuple[str, Optional[str]]]
+    ) -> None:
+        self.output.append(self._tag(tag, attrs, True))
+
+    def handle_endtag(self, tag: str) -> None:
+        self.output.append(f"</{tag}>")
+
+    def handle_data(self, data: str) -> None:
+        self.output.append(data)
+
+    def handle_entityref(self, name: str) -> None:
+        self.output.append(f"&{name};")
+
+    def handle_charref(self, name: str) -> None:
+        self.output.append(f"&#{name};")
+
+    def handle_comment(self, data: str) -> None:
+        self.output.append(f"<!--{data}-->")
+
+    def handle_decl(self, decl: str) -> None:
+        self.output.append(f"<!{decl}>")
+
+    def handle_pi(self, data: str) -> None:
+        self.output.append(f"<?{data}>")
+
+
+def inline_css(document: str) -> str:
+    """
+    Inline the rules of a document's `<style>` blocks into its elements.
+
+    Args:
+        document (str): The HTML document.
+
+    Returns:
+        str: The document with inlined styles, keeping in `<style>` only the
+            rules that cannot be inlined.
+    """
+    rules: List[Rule] = []
+
+    def strip_style(match: "re.Match[str]") -> str:
+        inlinable, leftover = _parse_stylesheet(match.group(1))
+        for rule in inlinable:
+            rules.append(rule[:1] + (len(rules),) + rule[2:])
+        return f"<style>\n{leftover}\n</style>" if leftover else ""
+
+    document = STYLE_PATTERN.sub(strip_style, document)
+    if not rules:
+        return document
+    inliner = _CSSInliner(rules)
+    inliner.feed(document)
+    inliner.close()
+    return "".join(inliner.output)
+
+
+class CompiledTemplate:
+    """
+    A template split into literal chunks and placeholders.
+
+    Args:
+        parts (List[Union[str, Tuple[str, bool]]]): Literal chunks, and
+            (variable, escape) pairs for placeholders.
+    """
+
+    def __init__(self, parts: List[Union[str, Tuple[str, bool]]]) -> None:
+        self.parts = parts
+        self.variables = {part[0] for part in parts if isinstance(part, tuple)}
+
+    def render(self, **variables: Any) -> str:
+        """
+        Render the template.
+
+        Args:
+            **variables (Any): The values of the placeholders.
+
+        Raises:
+            TemplateError: If a placeholder has no value.
+
+        Returns:
+            str: The rendered document.
+        """
+        missing = self.variables - variables.keys()
+        if missing:
+            raise TemplateError(f"Missing variables: {sorted(missing)}")
+        return "".join(
+            (
+                part
+                if isinstance(part, str)
+                else (
+                    html.escape(str(variables[part[0]]))
+                    if part[1]
+                    else str(variables[part[0]])
+                )
+            )
+            for part in self.parts
+        )
+
+
+def compile_template(source: str) -> CompiledTemplate:
+    """
+    Inline the CSS of a template and split it into literals and placeholders.
+
+    Args:
+        source (str): The template source.
+
+    Returns:
+        CompiledTemplate: The compiled template.
+    """
+    document = inline_css(source)
+    parts: List[Union[str, Tuple[str, bool]]] = []
+    position = 0
+    for match in PLACEHOLDER_PATTERN.finditer(document):
+        stop = match.start()
+        if stop > position:
+            parts.append(document[position:stop])
+        parts.append((match.group(1), match.group(2) is None))
+        position = match.end()
+    if position < len(document):
+        parts.append(document[position:])
+    return CompiledTemplate(parts)
+
+
+def extract_body(document: str) -> str:
+    """
+    Get the content of a document's `<body>`, to embed it in a template.
+
+    Args:
+        document (str): An HTML document or fragment.
+
+    Returns:
+        str: The body content, or the document itself if it has no body.
+    """
+    match = BODY_PATTERN.search(document)
+    return match.group(1) if match else document
+
+
+class TemplateRegistry:
+    """
+    Loads, compiles and renders the templates of a directory.
+
+    Args:
+        directory (str): The directory holding the `.html` templates.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self.templates: Dict[str, CompiledTemplate] = {}
+
+    def load(self) -> None:
+        """
+        Compile every `.html` template of the directory.
+        """
+        for file_name in sorted(os.listdir(self.directory)):
+            if not file_name.endswith(".html"):
+                continue
+            with open(
+                os.path.join(self.directory, file_name), "r", encoding="utf-8"
+            ) as file:
+                self.templates[file_name[:-5]] = compile_template(file.read())
+        logger.info("Compiled %d email templates", len(self.templates))
+
+    def render(self, name: str, **variables: Any) -> str:
+        """
+        Render a compiled template.
+
+        Args:
+            name (str): The template name, i.e. its file name without `.html`.
+            **variables (Any): The values of the placeholders.
+
+        Raises:
+            TemplateError: If the template does not exist or a variable is
+                missing.
+
+        Returns:
+            str: The rendered document.
+        """
+        template = self.templates.get(name)
+        if template is None:
+            raise TemplateError(f"Unknown template: {name}")
+        return template.render(**variables)
@@ -0,0 +1,215 @@
+"""📚 Utils Tutorials Module 🔁
+
+This module contains the library of pre-generated algorithm tutorials.
+
+Tutorials are generated ahead of time, off-peak and in batches, and stored in MongoDB
+per programming language. Every tutorial sent to a user is recorded, so that sending
+an algorithm email only needs to pick the oldest tutorial whose topic the user has not
+received yet: delivery never waits on OpenAI, and a slow or failing OpenAI only
+delays the next refill.
+
+The send history is not keyed by language: a tutorial teaches an algorithm, its code
+samples are secondary, so a user who switches languages is not sent the algorithms
+they have already received again.
+
+Functions:
+    - extract_title(html_content: str) -> str: The title of a tutorial.
+    - normalize_topic(title: str) -> str: The topic key used to avoid repeats.
+    - pick_next(tutorials, seen_topics) -> Optional[Tutorial]: The next unseen tutorial.
+    - refill_library(stock_size: int) -> Dict[str, int]: Top up every language's stock.
+
+Dependencies:
+    - asyncio: For concurrency.
+    - odmantic.query: For querying the send history.
+    - src.users.models: The User, Tutorial and TutorialDelivery models.
+
+"""
+
+import asyncio
+import html
+import logging
+from odmantic import (
+    query,
+)
+import re
+from typing import (
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+)
+
+from src.users import (
+    models as users_models,
+)
+
+logger = logging.getLogger(__name__)
+
+# The number of languages whose tutorials are generated at the same time.
+GENERATION_CONCURRENCY = 2
+
+# The number of covered titles listed in the prompt to steer away from them.
+MAX_AVOIDED_TOPICS = 50
+
+TITLE_PATTERN = re.compile(
+    r"<(title|h1)[^>]*>(.*?)</\1>", re.IGNORECASE | re.DOTALL
+)
+TAG_PATTERN = re.compile(r"<[^>]+>")
+
+
+def extract_title(html_content: str) -> str:
+    """
+    Extract the title of a tutorial from its `<title>` or first `<h1>`.
+
+    Args:
+        html_content (str): The tutorial as an HTML document.
+
+    Returns:
+        str: The title, or an empty string if there is none.
+    """
+    match = TITLE_PATTERN.search(html_content)
+    if match is None:
+        return ""
+    title = html.unescape(TAG_PATTERN.sub("", match.group(2)))
+    return " ".join(title.split())
+
+
+def normalize_topic(title: str) -> str:
+    """
+    Build the key deciding whether two tutorials cover the same topic.
+
+    Args:
+        title (str): The tutorial title.
+
+    Returns:
+        str: The lower-cased title without punctuation.
+    """
+    return " ".join(re.sub(r"[^a-z0-9+#]+", " ", title.lower()).split())
+
+
+def pick_next(
+    tutorials: Iterable[users_models.Tutorial], seen_topics: Set[str]
+) -> Optional[users_models.Tutorial]:
+    """
+    Pick the oldest tutorial whose topic has not been sent yet.
+
+    Args:
+        tutorials (Iterable[users_models.Tutorial]): The language's tutorials,
+            oldest first.
+        seen_topics (Set[str]): The topics already sent to the user, in any
+            language.
+
+    Returns:
+        Optional[users_models.Tutorial]: The tutorial, if any is left.
+    """
+    for tutorial in tutorials:
+        if tutorial.topic not in seen_topics:
+            return tutorial
+    return None
+
+
+async def _unseen_stock(language: str, topics: Set[str]) -> int:
+    """
+    Count the tutorials left for the user of a language who has seen the most.
+
+    Args:
+        language (str): The programming language.
+        topics (Set[str]): The topics of the language's tutorials.
+
+    Returns:
+        int: The smallest number of unseen tutorials among the language's users.
+    """
+    from src.main import (  # pylint: disable=C0415
+        code_app,
+    )
+
+    engine = code_app.state.engine
+    emails = [
+        user.email
+        for user in await engine.find(
+            users_models.User,
+            users_models.User.programming_language == language,
+        )
+    ]
+    if not emails:
+        return len(topics)
+    # The topics received in other languages count as seen as well.
+    seen: Dict[str, Set[str]] = {email: set() for email in emails}
+    for delivery in await engine.find(
+        users_models.TutorialDelivery,
+        query.in_(users_models.TutorialDelivery.email, emails),
+    ):
+        seen[delivery.email].add(delivery.topic)
+    return min(len(topics - user_topics) for user_topics in seen.values())
+
+
+async def refill_library(stock_size: int) -> Dict[str, int]:
+    """
+    Generate tutorials until every user has `stock_size` unseen tutorials.
+
+    Only the languages users have picked are stocked. Tutorials whose topic is
+    already in the library are dropped.
+
+    Args:
+        stock_size (int): The number of unseen tutorials to keep per language.
+
+    Returns:
+        Dict[str, int]: The number of generated, duplicate and failed tutorials.
+    """
+    from src.main import (  # pylint: disable=C0415
+        code_app,
+    )
+
+    engine = code_app.state.engine
+    generate = code_app.state.openai.generate_algorithm_tutorial
+    languages = await engine.get_collection(users_models.User).distinct(
+        "programming_language"
+    )
+    generation_slots = asyncio.Semaphore(GENERATION_CONCURRENCY)
+    stats = {"generated": 0, "duplicates": 0, "failed": 0}
+
+    async def refill(language: str) -> None:
+        tutorials = await engine.find(
+            users_models.Tutorial, users_models.Tutorial.language == language
+        )
+        topics = {tutorial.topic for tutorial in tutorials}
+        titles: List[str] = [tutorial.title for tutorial in tutorials]
+        missing = stock_size - await _unseen_stock(language, topics)
+        async with generation_slots:
+            for _ in range(max(0, missing)):
+                try:
+                    html_content = await generate(
+                        language, titles[-MAX_AVOIDED_TOPICS:]
+                    )
+                except Exception as err:  # pylint: disable=W0703
+                    logger.error(
+                        "Failed to generate a %s tutorial: %r", language, err
+                    )
+                    stats["failed"] += 1
+                    # Leave the rest of the batch to the next refill.
+                    return
+                title = extract_title(html_content)
+                topic = normalize_topic(title) or normalize_topic(
+                    html_content[:200]
+                )
+                if topic in topics:
+                    stats["duplicates"] += 1
+                    continue
+                await engine.save(
+                    users_models.Tutorial(
+                        language=language,
+                        topic=topic,
+                        title=title,
+                        html_content=html_content,
+                    )
+                )
+                topics.add(topic)
+                titles.append(title)
+                stats["generated"] += 1
+
+    await asyncio.gather(
+        *(refill(language) for language in languages if language)
+    )
+    logger.info("Tutorial library refill: %s", stats)
+    return stats
@@ -0,0 +1,245 @@
+"""📥 Utils Uploads Module 🌊
+
+This module contains the streaming file upload parser.
+
+FastAPI's `UploadFile` only reaches a handler once the whole multipart body has been
+received and spooled, whatever its size. `receive_upload` instead parses the request
+body as it arrives: the file is hashed and its size checked chunk by chunk, its first
+bytes are validated as soon as they are received, and an upload announcing or reaching
+more than the maximum size is rejected right away, without reading the rest. Chunks are
+spooled to a temporary file, written in a thread pool once it rolls over to disk, so
+neither memory nor the event loop is held by a large upload.
+
+Classes:
+    - UploadError: Raised for rejected uploads, with the HTTP status to answer.
+    - Upload: A received file, with its size and hash.
+
+Functions:
+    - receive_upload(request, field, max_bytes, validate) -> Upload: Receive a file.
+
+Dependencies:
+    - hashlib: For hashing the file as it streams.
+    - multipart: The python-multipart streaming parser.
+    - starlette: For the request stream and the thread pool.
+
+"""
+
+from dataclasses import (
+    dataclass,
+)
+import hashlib
+from multipart.multipart import (
+    MultipartParser,
+    parse_options_header,
+)
+from starlette.concurrency import (
+    run_in_threadpool,
+)
+from starlette.requests import (
+    Request,
+)
+from tempfile import (
+    SpooledTemporaryFile,
+)
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+)
+
+# The size a spooled upload is kept in memory up to, in bytes.
+SPOOL_MAX_SIZE = 1024 * 1024
+
+# The number of leading bytes handed to the validation callback.
+VALIDATION_PREFIX_SIZE = 16
+
+
+class UploadError(Exception):
+    """
+    Raised when an upload is rejected.
+
+    Args:
+        status_code (int): The HTTP status to answer with.
+        message (str): The reason.
+    """
+
+    def __init__(self, status_code: int, message: str) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+@dataclass
+class Upload:
+    """
+    A received file.
+
+    Attributes:
+        file (SpooledTemporaryFile): The file content, rewound.
+        size (int): The size, in bytes.
+        sha256 (str): The hex SHA-256 of the content.
+        filename (str): The file name given by the client.
+    """
+
+    file: Any
+    size: int
+    sha256: str
+    filename: str
+
+    def read(self) -> bytes:
+        """
+        Read the whole file; blocks, so it runs in a thread pool.
+
+        Returns:
+            bytes: The file content.
+        """
+        self.file.seek(0)
+        return self.file.read()
+
+    def close(self) -> None:
+        """
+        Remove the spooled file.
+        """
+        self.file.close()
+
+
+class _PartCollector:
+    """
+    Callbacks of the multipart parser, queuing the chunks of one field.
+    """
+
+    def __init__(self, field: str) -> None:
+        self.field = field
+        self.header_field = b""
+        self.header_value = b""
+        self.disposition = b""
+        self.in_field = False
+        self.found = False
+        self.filename = ""
+        self.chunks: List[bytes] = []
+
+    def on_part_begin(self) -> None:
+        self.disposition = b""
+        self.in_field = False
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self.header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self.header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        if self.header_field.lower() == b"content-disposition":
+            self.disposition = self.header_value
+        self.header_field = b""
+        self.header_value = b""
+
+    def on_headers_finished(self) -> None:
+        _, options = parse_options_header(self.disposition)
+        name = options.get(b"name", b"").decode("latin-1")
+        # Only the first part of the field is kept.
+        self.in_field = name == self.field and not self.found
+        if self.in_field:
+            self.found = True
+            self.filename = options.get(b"filename", b"").decode(
+                "utf-8", "replace"
+            )
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self.in_field:
+            self.chunks.append(data[start:end])
+
+    def on_part_end(self) -> None:
+        self.in_field = False
+
+    def callbacks(self) -> Dict[str, Callable[..., None]]:
+        return {
+            name: getattr(self, name)
+            for name in (
+                "on_part_begin",
+                "on_header_field",
+                "on_header_value",
+                "on_header_end",
+                "on_headers_finished",
+                "on_part_data",
+                "on_part_end",
+            )
+        }
+
+
+async def receive_upload(
+    request: Request,
+    field: str,
+    max_bytes: int,
+    validate: Optional[Callable[[bytes], None]] = None,
+) -> Upload:
+    """
+    Receive a file field of a multipart request, as it streams.
+
+    Args:
+        request (Request): The incoming request, whose body was not read.
+        field (str): The form field holding the file.
+        max_bytes (int): The maximum file size, in bytes.
+        validate (Optional[Callable[[bytes], None]]): Called with the first
+            bytes of the file, raises `UploadError` to reject it.
+
+    Raises:
+        UploadError: 413 if the file is too large, 400 if the request is not
+            a multipart form holding the field, or what `validate` raises.
+
+    Returns:
+        Upload: The received file; the caller closes it.
+    """
+    content_type, options = parse_options_header(
+        request.headers.get("content-type", "")
+    )
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise UploadError(400, "Expected a multipart/form-data upload.")
+    # The form overhead is small, a body well above the limit is rejected
+    # before it is read.
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > max_bytes + 16384:
+        raise UploadError(413, "The file is too large.")
+
+    collector = _PartCollector(field)
+    parser = MultipartParser(options[b"boundary"], collector.callbacks())
+    spooled = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    digest = hashlib.sha256()
+    size = 0
+    prefix = b""
+    validated = validate is None
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for data in collector.chunks:
+                size += len(data)
+                if size > max_bytes:
+                    raise UploadError(413, "The file is too large.")
+                digest.update(data)
+                if not validated:
+                    prefix += data[: VALIDATION_PREFIX_SIZE - len(prefix)]
+                    if len(prefix) >= VALIDATION_PREFIX_SIZE:
+                        validate(prefix)  # type: ignore
+                        validated = True
+                if getattr(spooled, "_rolled", False):
+                    await run_in_threadpool(spooled.write, data)
+                else:
+                    spooled.write(data)
+            collector.chunks.clear()
+        parser.finalize()
+        if not collector.found:
+            raise UploadError(400, f"Missing the {field!r} file field.")
+        if not validated:
+            validate(prefix)  # type: ignore
+        spooled.seek(0)
+    except BaseException:
+        spooled.close()
+        raise
+    return Upload(
+        file=spooled,
+        size=size,
+        sha256=digest.hexdigest(),
+        filename=collector.filename,
+    )
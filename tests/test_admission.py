@@ -0,0 +1,146 @@
+"""🧪 Admission Tests 🚦
+
+Tests of the code execution admission control: per-user quotas, queue
+rejection and wait timeouts, which must give every permit back.
+
+"""
+
+import pytest
+
+import asyncio
+
+from src.utils.admission import (
+    AdmissionController,
+    AdmissionRejected,
+)
+
+
+def make_controller(**kwargs) -> AdmissionController:
+    options = {
+        "max_concurrent": 1,
+        "max_per_user": 5,
+        "max_queue": 5,
+        "max_wait": 5.0,
+    }
+    options.update(kwargs)
+    return AdmissionController(**options)
+
+
+def test_admits_right_away_when_a_slot_is_free() -> None:
+    async def run() -> None:
+        controller = make_controller()
+        async with controller.slot("alice") as admission:
+            assert admission.position == 0
+            assert controller.running == 1
+        assert controller.running == 0
+        assert not controller._semaphore.locked()
+
+    asyncio.run(run())
+
+
+def test_rejects_users_over_their_quota() -> None:
+    async def run() -> None:
+        controller = make_controller(max_concurrent=2, max_per_user=1)
+        async with controller.slot("alice"):
+            with pytest.raises(AdmissionRejected) as rejected:
+                async with controller.slot("alice"):
+                    pass
+            async with controller.slot("bob"):
+                pass
+        assert rejected.value.status_code == 429
+        assert controller.rejected == 1
+
+    asyncio.run(run())
+
+
+def test_rejects_when_the_queue_is_full() -> None:
+    async def run() -> None:
+        controller = make_controller(max_queue=0)
+        async with controller.slot("alice"):
+            with pytest.raises(AdmissionRejected) as rejected:
+                async with controller.slot("bob"):
+                    pass
+        assert rejected.value.detail["position"] == 1
+        assert "Retry-After" in rejected.value.headers
+
+    asyncio.run(run())
+
+
+def test_rejects_when_the_expected_wait_is_too_long() -> None:
+    async def run() -> None:
+        controller = make_controller(max_wait=1.0)
+        controller.average_duration = 10.0
+        async with controller.slot("alice"):
+            with pytest.raises(AdmissionRejected):
+                async with controller.slot("bob"):
+                    pass
+        assert controller.queued == 0
+
+    asyncio.run(run())
+
+
+def test_times_out_without_losing_the_permit() -> None:
+    async def run() -> None:
+        controller = make_controller(max_wait=0.05)
+        controller.average_duration = 0.01
+        async with controller.slot("alice"):
+            with pytest.raises(AdmissionRejected) as rejected:
+                async with controller.slot("bob"):
+                    pass
+            assert controller.queued == 0
+        assert "Timed out" in rejected.value.detail["message"]
+        assert controller._semaphore._value == 1
+        async with controller.slot("bob"):
+            pass
+
+    asyncio.run(run())
+
+
+def test_waits_for_a_slot_in_the_queue() -> None:
+    async def run() -> None:
+        controller = make_controller()
+        controller.average_duration = 0.01
+        release = asyncio.Event()
+
+        async def hold() -> None:
+            async with controller.slot("alice"):
+                await release.wait()
+
+        holder = asyncio.ensure_future(hold())
+        await asyncio.sleep(0)
+
+        async def wait() -> int:
+            async with controller.slot("bob") as admission:
+                return admission.position
+
+        waiter = asyncio.ensure_future(wait())
+        await asyncio.sleep(0)
+        assert controller.queued == 1
+        release.set()
+        assert await waiter == 1
+        await holder
+        assert controller._semaphore._value == 1
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiters_give_their_place_back() -> None:
+    async def run() -> None:
+        controller = make_controller()
+        controller.average_duration = 0.01
+
+        async def wait() -> None:
+            async with controller.slot("bob"):
+                pass
+
+        async with controller.slot("alice"):
+            waiter = asyncio.ensure_future(wait())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+        assert controller.queued == 0
+        assert controller._semaphore._value == 1
+        assert controller.snapshot("bob")["user_in_flight"] == 0
+
+    asyncio.run(run())
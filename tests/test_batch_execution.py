@@ -0,0 +1,189 @@
+"""🧪 Batch Execution Tests 🧮
+
+Tests of the batch code execution route: the pass/fail report, the
+validation of the request and the errors of the executor.
+
+"""
+
+import pytest
+
+from starlette.testclient import (
+    TestClient,
+)
+from types import (
+    SimpleNamespace,
+)
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+)
+
+from src.main import (
+    code_app,
+)
+from src.utils import (
+    dependencies,
+    executors,
+    judge0,
+)
+from src.utils.admission import (
+    AdmissionController,
+)
+
+URL = "/api/v1/nylas/execute-code/batch"
+
+
+class FakeExecutor:
+    """
+    Doubles its input, like the example program, or fails with `error`.
+    """
+
+    def __init__(self, error: Optional[Exception] = None) -> None:
+        self.error = error
+        self.batches: List[List[Dict[str, Any]]] = []
+
+    async def run_batch(
+        self, submissions: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        self.batches.append(submissions)
+        if self.error is not None:
+            raise self.error
+        return [
+            {
+                "stdout": f"{int(submission['stdin']) * 2}\n",
+                "status": {"id": judge0.JUDGE0_ACCEPTED_STATUS},
+                "time": "0.01",
+                "memory": 1024,
+            }
+            for submission in submissions
+        ]
+
+
+@pytest.fixture
+def client(monkeypatch: pytest.MonkeyPatch) -> Iterator[TestClient]:
+    monkeypatch.setattr(
+        code_app.state,
+        "admission",
+        AdmissionController(4, 2, 10, 5.0),
+        raising=False,
+    )
+    code_app.dependency_overrides[dependencies.get_current_user] = (
+        lambda: SimpleNamespace(email="user@example.com")
+    )
+    try:
+        yield TestClient(code_app)
+    finally:
+        code_app.dependency_overrides.clear()
+
+
+def use_executor(
+    monkeypatch: pytest.MonkeyPatch, executor: FakeExecutor
+) -> FakeExecutor:
+    monkeypatch.setattr(code_app.state, "executor", executor, raising=False)
+    return executor
+
+
+def batch(*cases: Dict[str, str], language_id: str = "71") -> Dict[str, Any]:
+    return {
+        "code": "print(int(input()) * 2)",
+        "language_id": language_id,
+        "test_cases": list(cases),
+    }
+
+
+def test_reports_passed_and_failed_cases(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    executor = use_executor(monkeypatch, FakeExecutor())
+    response = client.post(
+        URL,
+        json=batch(
+            {"stdin": "3\n", "expected_output": "6\n"},
+            {"stdin": "4\n", "expected_output": "9\n"},
+        ),
+    )
+    assert response.status_code == 200
+    report = response.json()
+    assert report["total"] == 2
+    # The executor reports "Accepted", the expected outputs are sent along.
+    assert [case["expected_output"] for case in report["results"]] == [
+        "6\n",
+        "9\n",
+    ]
+    assert report["max_memory"] == 1024
+    assert len(executor.batches) == 1
+    assert executor.batches[0][1]["expected_output"] == "9\n"
+    assert executor.batches[0][0]["language_id"] == 71
+    assert "X-Queue-Position" in response.headers
+
+
+@pytest.mark.parametrize("language_id", ["python", "71a", ""])
+def test_rejects_non_numeric_language_ids(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch, language_id: str
+) -> None:
+    executor = use_executor(monkeypatch, FakeExecutor())
+    response = client.post(
+        URL, json=batch({"stdin": "1\n"}, language_id=language_id)
+    )
+    assert response.status_code == 422
+    assert executor.batches == []
+
+
+def test_rejects_empty_and_oversized_batches(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    use_executor(monkeypatch, FakeExecutor())
+    assert client.post(URL, json=batch()).status_code == 422
+    too_many = [{"stdin": "1\n"}] * 21
+    assert client.post(URL, json=batch(*too_many)).status_code == 422
+
+
+def test_rejects_unsupported_languages(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    use_executor(
+        monkeypatch,
+        FakeExecutor(executors.UnsupportedLanguageError("No language 99")),
+    )
+    response = client.post(URL, json=batch({"stdin": "1\n"}))
+    assert response.status_code == 400
+
+
+def test_reports_executor_failures_as_bad_gateway(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    use_executor(
+        monkeypatch, FakeExecutor(judge0.Judge0Error("Failed to submit"))
+    )
+    response = client.post(URL, json=batch({"stdin": "1\n"}))
+    assert response.status_code == 502
+    assert response.json()["detail"] == "Failed to submit"
+
+
+def test_summarize_batch() -> None:
+    report = judge0.summarize_batch(
+        [
+            {"stdin": "1", "expected_output": "2"},
+            {"stdin": "2", "expected_output": "4"},
+        ],
+        [
+            {
+                "status": {"id": judge0.JUDGE0_ACCEPTED_STATUS},
+                "time": "0.5",
+                "memory": 10,
+            },
+            {"status": {"id": 4}, "time": None, "memory": None},
+        ],
+        1.23456,
+    )
+    assert report["passed"] == 1
+    assert report["failed"] == 1
+    assert report["all_passed"] is False
+    assert report["time"] == 0.5
+    assert report["max_time"] == 0.5
+    assert report["max_memory"] == 10
+    assert report["wall_time"] == 1.235
+    assert report["results"][1]["passed"] is False
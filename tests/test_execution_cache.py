@@ -0,0 +1,215 @@
+"""🧪 Execution Cache Tests ⚡
+
+Tests of the code execution result cache: hits and misses, the programs and
+results that are never cached, the backend part of the keys and the MongoDB
+persistence.
+
+"""
+
+import pytest
+
+import asyncio
+from mongomock_motor import (
+    AsyncMongoMockClient,
+)
+from odmantic import (
+    AIOEngine,
+)
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+)
+
+from src.nylas.models import (
+    CodeExecutionResult,
+)
+from src.utils import (
+    executors,
+    judge0,
+)
+from src.utils.execution_cache import (
+    CachedExecutor,
+    ExecutionCache,
+    submission_key,
+)
+
+ACCEPTED = {"id": judge0.JUDGE0_ACCEPTED_STATUS, "description": "Accepted"}
+
+
+class FakeBackend(executors.CodeExecutor):
+    """
+    Echoes the stdin of the submissions and counts them.
+    """
+
+    def __init__(
+        self, name: str = "judge0", status: Optional[Dict[str, Any]] = None
+    ) -> None:
+        self.name = name
+        self.status = status or ACCEPTED
+        self.runs: List[Dict[str, Any]] = []
+
+    async def run(self, submission: Dict[str, Any]) -> Dict[str, Any]:
+        self.runs.append(submission)
+        return {"stdout": submission["stdin"], "status": dict(self.status)}
+
+
+def cached(
+    backend: executors.CodeExecutor, engine: Optional[AIOEngine] = None
+) -> CachedExecutor:
+    return CachedExecutor(backend, ExecutionCache(100, engine))
+
+
+def test_serves_repeated_submissions_from_the_cache() -> None:
+    async def run() -> None:
+        backend = FakeBackend()
+        executor = cached(backend)
+        submission = judge0.build_submission("print(input())", 71, "1\n")
+        first = await executor.run(submission)
+        second = await executor.run(dict(submission))
+        assert first == second == {"stdout": "1\n", "status": ACCEPTED}
+        assert len(backend.runs) == 1
+        assert (executor.cache.hits, executor.cache.misses) == (1, 1)
+        # Another input is another submission.
+        await executor.run(judge0.build_submission("print(input())", 71, "2"))
+        assert len(backend.runs) == 2
+
+    asyncio.run(run())
+
+
+def test_cached_results_are_copies() -> None:
+    async def run() -> None:
+        executor = cached(FakeBackend())
+        submission = judge0.build_submission("print(1)", 71, "1\n")
+        (await executor.run(submission))["stdout"] = "changed"
+        assert (await executor.run(submission))["stdout"] == "1\n"
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        "import random\nprint(random.random())",
+        "import time\nprint(time.time())",
+        "console.log(Date.now())",
+        "echo $RANDOM",
+    ],
+)
+def test_never_caches_nondeterministic_programs(code: str) -> None:
+    async def run() -> None:
+        backend = FakeBackend()
+        executor = cached(backend)
+        submission = judge0.build_submission(code, 71)
+        await executor.run(submission)
+        await executor.run(submission)
+        assert len(backend.runs) == 2
+        assert len(executor.cache) == 0
+
+    asyncio.run(run())
+
+
+def test_never_caches_failed_runs() -> None:
+    async def run() -> None:
+        backend = FakeBackend(status={"id": 5, "description": "Time Limit"})
+        executor = cached(backend)
+        submission = judge0.build_submission("while True: pass", 71)
+        await executor.run(submission)
+        await executor.run(submission)
+        assert len(backend.runs) == 2
+
+    asyncio.run(run())
+
+
+def test_runs_only_the_missing_submissions_of_a_batch() -> None:
+    async def run() -> None:
+        backend = FakeBackend()
+        executor = cached(backend)
+        submissions = [
+            judge0.build_submission("print(input())", 71, str(number))
+            for number in range(3)
+        ]
+        await executor.run(submissions[1])
+        results = await executor.run_batch(submissions)
+        assert [result["stdout"] for result in results] == ["0", "1", "2"]
+        assert [run["stdin"] for run in backend.runs] == ["1", "0", "2"]
+
+    asyncio.run(run())
+
+
+def test_keys_depend_on_the_backend() -> None:
+    submission = judge0.build_submission("print(1)", 71)
+    assert submission_key(submission, "local") != submission_key(
+        submission, "judge0"
+    )
+
+
+def test_keys_results_by_the_backend_that_produced_them() -> None:
+    async def run() -> None:
+        fallback = FakeBackend("judge0")
+        local = executors.LocalExecutor(1, fallback=fallback)
+        local.languages = {71: ("main.py", None)}
+        executor = cached(local)
+        # Language 62 cannot run locally, the fallback runs it.
+        submission = judge0.build_submission("print(1)", 62)
+        assert local.runner_name([submission]) == "judge0"
+        await executor.run(submission)
+        assert executor.cache._entries.keys() == {
+            submission_key(submission, "judge0")
+        }
+        await executor.run(submission)
+        assert len(fallback.runs) == 1
+
+    asyncio.run(run())
+
+
+def test_persisted_results_are_fetched_in_a_single_query() -> None:
+    async def run() -> None:
+        engine = AIOEngine(client=AsyncMongoMockClient(), database="test")
+        submissions = [
+            judge0.build_submission("print(input())", 71, str(number))
+            for number in range(3)
+        ]
+        # Results stored by another replica.
+        await engine.get_collection(CodeExecutionResult).insert_many(
+            [
+                CodeExecutionResult(
+                    key=submission_key(submission, "judge0"),
+                    result={"stdout": submission["stdin"], "status": ACCEPTED},
+                ).doc()
+                for submission in submissions
+            ]
+        )
+        queries: List[Any] = []
+        find = engine.find
+
+        def counting_find(*args: Any, **kwargs: Any) -> Any:
+            queries.append(args)
+            return find(*args, **kwargs)
+
+        engine.find = counting_find  # type: ignore
+        backend = FakeBackend()
+        executor = cached(backend, engine)
+        results = await executor.run_batch(submissions)
+        assert [result["stdout"] for result in results] == ["0", "1", "2"]
+        assert backend.runs == []
+        assert len(queries) == 1
+        # They are kept in memory from then on.
+        await executor.run_batch(submissions)
+        assert len(queries) == 1
+
+    asyncio.run(run())
+
+
+def test_configures_the_ttl_index() -> None:
+    async def run() -> None:
+        engine = AIOEngine(client=AsyncMongoMockClient(), database="test")
+        await ExecutionCache(10, engine, ttl=60).configure()
+        collection = engine.get_collection(CodeExecutionResult)
+        indexes = await collection.index_information()
+        assert any(
+            index.get("expireAfterSeconds") == 60 for index in indexes.values()
+        )
+
+    asyncio.run(run())
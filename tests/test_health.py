@@ -0,0 +1,86 @@
+"""🧪 Health Tests 🩺
+
+Tests of the readiness probe: the status reported for a slow or failing
+MongoDB and whether it takes the process out of rotation.
+
+"""
+
+import pytest
+
+import asyncio
+from types import (
+    SimpleNamespace,
+)
+from typing import (
+    Any,
+    Dict,
+    Optional,
+)
+
+from src.utils import (
+    health,
+)
+
+
+class FakeAdmin:
+    """
+    Answers pings after a delay, or fails them.
+    """
+
+    def __init__(
+        self, delay: float = 0.0, error: Optional[Exception] = None
+    ) -> None:
+        self.delay = delay
+        self.error = error
+
+    async def command(self, name: str) -> Dict[str, Any]:
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return {"ok": 1}
+
+
+def readiness(admin: FakeAdmin, **kwargs: Any) -> Dict[str, Any]:
+    async def run() -> Dict[str, Any]:
+        checker = health.HealthChecker(
+            SimpleNamespace(admin=admin),
+            "http://nylas.invalid",
+            health.LoopLagMonitor(),
+            SimpleNamespace(queued=0, running=0),  # type: ignore[arg-type]
+            **kwargs,
+        )
+
+        async def check_nylas() -> Dict[str, Any]:
+            return {"status": health.OK}
+
+        checker._check_nylas = check_nylas  # type: ignore[method-assign]
+        try:
+            return await checker.readiness()
+        finally:
+            await checker.close()
+
+    return asyncio.run(run())
+
+
+def test_a_fast_ping_is_ok() -> None:
+    result = readiness(FakeAdmin())
+    assert result["status"] == health.OK
+    assert health.HealthChecker.is_ready(result)
+
+
+def test_a_slow_ping_is_only_degraded() -> None:
+    result = readiness(FakeAdmin(delay=0.1), max_mongo_latency=0.05)
+    assert result["checks"]["mongodb"]["status"] == health.DEGRADED
+    assert result["status"] == health.DEGRADED
+    assert health.HealthChecker.is_ready(result)
+
+
+@pytest.mark.parametrize(
+    "admin",
+    [FakeAdmin(error=RuntimeError("down")), FakeAdmin(delay=1)],
+    ids=["error", "timeout"],
+)
+def test_a_failed_ping_fails_readiness(admin: FakeAdmin) -> None:
+    result = readiness(admin, timeout=0.1)
+    assert result["checks"]["mongodb"]["status"] == health.FAILING
+    assert not health.HealthChecker.is_ready(result)
@@ -0,0 +1,155 @@
+"""🧪 Idempotency Tests 🔑
+
+Tests of the `Idempotency-Key` middleware: replays, conflicting reuses of a key
+and keys released after a failure or a request turned away, against an
+in-memory MongoDB.
+
+"""
+
+import pytest
+
+from mongomock_motor import (
+    AsyncMongoMockClient,
+)
+from starlette.applications import (
+    Starlette,
+)
+from starlette.requests import (
+    Request,
+)
+from starlette.responses import (
+    JSONResponse,
+)
+from starlette.routing import (
+    Route,
+)
+from starlette.testclient import (
+    TestClient,
+)
+from typing import (
+    Dict,
+    Iterator,
+    Tuple,
+)
+
+from src.utils.idempotency import (
+    REPLAYED_HEADER,
+    IdempotencyMiddleware,
+    IdempotencyStore,
+)
+
+
+@pytest.fixture
+def app() -> Iterator[Tuple[TestClient, Dict[str, int]]]:
+    calls = {"items": 0, "failures": 0, "rejections": 0}
+
+    async def create_item(request: Request) -> JSONResponse:
+        calls["items"] += 1
+        return JSONResponse(
+            {"id": calls["items"], "body": (await request.body()).decode()},
+            status_code=201,
+        )
+
+    async def fail(request: Request) -> JSONResponse:
+        calls["failures"] += 1
+        return JSONResponse({"detail": "Down"}, status_code=503)
+
+    async def reject(request: Request) -> JSONResponse:
+        calls["rejections"] += 1
+        status_code = int(request.query_params["status"])
+        return JSONResponse({"detail": "Busy"}, status_code=status_code)
+
+    application = Starlette(
+        routes=[
+            Route("/items", create_item, methods=["POST"]),
+            Route("/fail", fail, methods=["POST"]),
+            Route("/reject", reject, methods=["POST"]),
+        ]
+    )
+    application.add_middleware(IdempotencyMiddleware)
+    application.state.idempotency = IdempotencyStore(
+        AsyncMongoMockClient()["test"]["idempotency_keys"]
+    )
+    with TestClient(application) as client:
+        yield client, calls
+
+
+def test_replays_the_first_response(app) -> None:
+    client, calls = app
+    headers = {"Idempotency-Key": "one"}
+    first = client.post("/items", content=b"a", headers=headers)
+    second = client.post("/items", content=b"a", headers=headers)
+    assert first.status_code == second.status_code == 201
+    assert second.json() == first.json()
+    assert second.headers[REPLAYED_HEADER] == "true"
+    assert REPLAYED_HEADER not in first.headers
+    assert calls["items"] == 1
+
+
+def test_keys_are_scoped_by_caller(app) -> None:
+    client, calls = app
+    client.post("/items", headers={"Idempotency-Key": "one", "email": "a"})
+    client.post("/items", headers={"Idempotency-Key": "one", "email": "b"})
+    assert calls["items"] == 2
+
+
+def test_rejects_a_key_reused_for_another_request(app) -> None:
+    client, calls = app
+    headers = {"Idempotency-Key": "one"}
+    client.post("/items", content=b"a", headers=headers)
+    response = client.post("/items", content=b"b", headers=headers)
+    assert response.status_code == 422
+    assert calls["items"] == 1
+
+
+def test_conflicts_with_a_running_request(app) -> None:
+    client, calls = app
+    store = client.app.state.idempotency
+    client.post("/items", headers={"Idempotency-Key": "one"})
+    # Make the stored key look like its request is still running.
+    key = client.portal.call(store.collection.find_one, {})["_id"]
+    client.portal.call(
+        store.collection.update_one,
+        {"_id": key},
+        {"$set": {"status": "in_progress"}},
+    )
+    response = client.post("/items", headers={"Idempotency-Key": "one"})
+    assert response.status_code == 409
+    assert response.headers["Retry-After"] == "1"
+    assert calls["items"] == 1
+
+
+def test_releases_the_key_of_a_failed_request(app) -> None:
+    client, calls = app
+    headers = {"Idempotency-Key": "one"}
+    assert client.post("/fail", headers=headers).status_code == 503
+    assert client.post("/fail", headers=headers).status_code == 503
+    assert calls["failures"] == 2
+
+
+@pytest.mark.parametrize("status_code", [408, 409, 429])
+def test_releases_the_key_of_a_rejected_request(app, status_code) -> None:
+    client, calls = app
+    headers = {"Idempotency-Key": "one"}
+    url = f"/reject?status={status_code}"
+    assert client.post(url, headers=headers).status_code == status_code
+    response = client.post(url, headers=headers)
+    assert response.status_code == status_code
+    assert REPLAYED_HEADER not in response.headers
+    assert calls["rejections"] == 2
+
+
+def test_stores_the_response_of_a_client_error(app) -> None:
+    client, calls = app
+    headers = {"Idempotency-Key": "one"}
+    client.post("/reject?status=400", headers=headers)
+    response = client.post("/reject?status=400", headers=headers)
+    assert response.headers[REPLAYED_HEADER] == "true"
+    assert calls["rejections"] == 1
+
+
+def test_requests_without_a_key_always_run(app) -> None:
+    client, calls = app
+    client.post("/items")
+    client.post("/items")
+    assert calls["items"] == 2
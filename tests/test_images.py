@@ -0,0 +1,131 @@
+"""🧪 Images Tests 📐
+
+Tests of the profile image responses: byte ranges, revalidation and the
+responses streamed from files.
+
+"""
+
+import pytest
+
+import asyncio
+import os
+from starlette.requests import (
+    Request,
+)
+from typing import (
+    Dict,
+    Optional,
+    Tuple,
+)
+
+from src.utils import (
+    images,
+)
+
+ETAG = "0123456789abcdef0123456789abcdef"
+
+
+def make_request(headers: Dict[str, str]) -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": "/",
+            "headers": [
+                (name.lower().encode(), value.encode())
+                for name, value in headers.items()
+            ],
+        }
+    )
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("bytes=0-99", (0, 99)),
+        ("bytes=10-", (10, 999)),
+        ("bytes=-100", (900, 999)),
+        ("bytes=-5000", (0, 999)),
+        ("bytes=500-5000", (500, 999)),
+        (" bytes=1-2 ", (1, 2)),
+        ("bytes=-", None),
+        ("bytes=5-3", None),
+        ("bytes=1000-", None),
+        ("bytes=-0", None),
+        ("bytes=0-1,5-6", None),
+        ("items=0-1", None),
+        ("", None),
+    ],
+)
+def test_parse_range(header: str, expected: Optional[Tuple[int, int]]) -> None:
+    assert images._parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize(
+    "if_none_match, expected",
+    [
+        (f'"{ETAG}"', True),
+        (f'W/"{ETAG}"', True),
+        (f'"other", "{ETAG}"', True),
+        ("*", True),
+        ('"other"', False),
+        (ETAG, False),
+        (None, False),
+    ],
+)
+def test_not_modified(if_none_match: Optional[str], expected: bool) -> None:
+    headers = {} if if_none_match is None else {"If-None-Match": if_none_match}
+    assert images.not_modified(make_request(headers), ETAG) is expected
+
+
+def test_image_response_serves_ranges() -> None:
+    content = bytes(range(10))
+    response = images.image_response(
+        make_request({"Range": "bytes=2-4"}), content, ETAG, False
+    )
+    assert response.status_code == 206
+    assert response.body == content[2:5]
+    assert response.headers["Content-Range"] == "bytes 2-4/10"
+    unsatisfiable = images.image_response(
+        make_request({"Range": "bytes=20-"}), content, ETAG, False
+    )
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers["Content-Range"] == "bytes */10"
+    reversed_range = images.image_response(
+        make_request({"Range": "bytes=4-2"}), content, ETAG, False
+    )
+    assert reversed_range.status_code == 416
+    # A range for another version gets the whole image.
+    stale = images.image_response(
+        make_request({"Range": "bytes=2-4", "If-Range": '"other"'}),
+        content,
+        ETAG,
+        False,
+    )
+    assert stale.status_code == 200
+    assert stale.body == content
+
+
+def test_image_response_answers_revalidations() -> None:
+    response = images.image_response(
+        make_request({"If-None-Match": f'"{ETAG}"'}), b"image", ETAG, True
+    )
+    assert response.status_code == 304
+    assert response.body == b""
+    assert response.headers["Cache-Control"] == images.IMMUTABLE_CACHE_CONTROL
+
+
+def test_file_response_survives_the_file_being_removed(tmp_path) -> None:
+    path = tmp_path / "image.png"
+    path.write_bytes(b"image")
+    response = images.file_response(str(path), ETAG, False)
+    os.unlink(path)
+
+    async def read() -> bytes:
+        return b"".join([chunk async for chunk in response.body_iterator])
+
+    assert asyncio.run(read()) == b"image"
+    assert response.headers["Content-Length"] == "5"
+    assert response.headers["Cache-Control"] == images.REVALIDATE_CACHE_CONTROL
+    with pytest.raises(FileNotFoundError):
+        images.file_response(str(path), ETAG, False)
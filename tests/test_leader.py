@@ -0,0 +1,211 @@
+"""🧪 Leader Tests 🗳️
+
+Tests of the MongoDB lease electing the scheduler leader: exclusive holding,
+renewal, takeover once expired and release on shutdown.
+
+mongomock cannot evaluate the server time (`$$NOW`) the leases rely on, so the
+tests run on a small stand-in evaluating the lease queries on a server clock
+they move forward, and also on a real MongoDB when `MONGODB_TEST_URL` is set.
+
+"""
+
+import pytest
+
+import asyncio
+from datetime import (
+    datetime,
+    timedelta,
+)
+import os
+from pymongo.errors import (
+    DuplicateKeyError,
+)
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+)
+import uuid
+
+from src.utils.leader import (
+    LeaderLease,
+)
+
+TTL = 0.6
+
+
+class FakeLeaseCollection:
+    """
+    Evaluates the queries of `LeaderLease` like MongoDB does, on a server
+    clock that runs `offset` ahead of the local one.
+    """
+
+    def __init__(self) -> None:
+        self.documents: Dict[str, Dict[str, Any]] = {}
+        self.offset = timedelta()
+
+    def now(self) -> datetime:
+        return datetime.utcnow() + self.offset
+
+    def _matches(self, document: Dict[str, Any], condition: Any) -> bool:
+        if "$expr" in condition:
+            field, variable = condition["$expr"]["$lt"]
+            assert variable == "$$NOW"
+            return bool(document[field.lstrip("$")] < self.now())
+        return all(
+            document.get(key) == value for key, value in condition.items()
+        )
+
+    def _evaluate(self, expression: Any) -> Any:
+        if expression == "$$NOW":
+            return self.now()
+        if isinstance(expression, dict) and "$literal" in expression:
+            return expression["$literal"]
+        if isinstance(expression, dict) and "$add" in expression:
+            start, milliseconds = expression["$add"]
+            return self._evaluate(start) + timedelta(milliseconds=milliseconds)
+        return expression
+
+    async def find_one_and_update(
+        self,
+        query: Dict[str, Any],
+        pipeline: List[Dict[str, Any]],
+        upsert: bool = False,
+        **kwargs: Any,
+    ) -> Optional[Dict[str, Any]]:
+        document = self.documents.get(query["_id"])
+        if document is None:
+            if not upsert:
+                return None
+            document = {"_id": query["_id"]}
+        elif not any(
+            self._matches(document, condition) for condition in query["$or"]
+        ):
+            if upsert:
+                raise DuplicateKeyError("E11000 duplicate key error")
+            return None
+        for stage in pipeline:
+            for field, expression in stage["$set"].items():
+                document[field] = self._evaluate(expression)
+        self.documents[query["_id"]] = document
+        return dict(document)
+
+    async def delete_one(self, query: Dict[str, Any]) -> None:
+        document = self.documents.get(query["_id"])
+        if document is not None and self._matches(document, query):
+            del self.documents[query["_id"]]
+
+
+Test = Callable[[Any, Callable[[float], Awaitable[None]]], Awaitable[None]]
+
+
+@pytest.fixture(params=["fake", "mongodb"])
+def run(request: pytest.FixtureRequest) -> Callable[[Test], None]:
+    url = os.getenv("MONGODB_TEST_URL")
+    if request.param == "mongodb" and not url:
+        pytest.skip("MONGODB_TEST_URL is not set")
+
+    def run_test(test: Test) -> None:
+        async def main() -> None:
+            if request.param == "fake":
+                collection: Any = FakeLeaseCollection()
+
+                async def advance(seconds: float) -> None:
+                    collection.offset += timedelta(seconds=seconds)
+
+                await test(collection, advance)
+                return
+            from motor.motor_asyncio import (  # pylint: disable=C0415
+                AsyncIOMotorClient,
+            )
+
+            client: Any = AsyncIOMotorClient(url)
+            collection = client.get_default_database("test")[
+                f"leases_{uuid.uuid4().hex}"
+            ]
+
+            async def wait(seconds: float) -> None:
+                await asyncio.sleep(seconds)
+
+            try:
+                await test(collection, wait)
+            finally:
+                await collection.drop()
+                client.close()
+
+        asyncio.run(main())
+
+    return run_test
+
+
+def test_only_one_process_holds_the_lease(run) -> None:
+    async def test(collection: Any, advance: Any) -> None:
+        first = LeaderLease(collection, "scheduler", ttl=TTL)
+        second = LeaderLease(collection, "scheduler", ttl=TTL)
+        assert await first.try_acquire()
+        assert not await second.try_acquire()
+        # Renewing keeps the lease past its first expiry.
+        for _ in range(3):
+            await advance(TTL / 2)
+            assert await first.try_acquire()
+            assert not await second.try_acquire()
+
+    run(test)
+
+
+def test_an_expired_lease_is_taken_over(run) -> None:
+    async def test(collection: Any, advance: Any) -> None:
+        first = LeaderLease(collection, "scheduler", ttl=TTL)
+        second = LeaderLease(collection, "scheduler", ttl=TTL)
+        assert await first.try_acquire()
+        await advance(TTL * 1.5)
+        assert await second.try_acquire()
+        # The former holder cannot renew a lease it lost.
+        assert not await first.try_acquire()
+
+    run(test)
+
+
+def test_leases_are_independent(run) -> None:
+    async def test(collection: Any, advance: Any) -> None:
+        scheduler = LeaderLease(collection, "scheduler", ttl=TTL)
+        refill = LeaderLease(collection, "refill", ttl=TTL)
+        assert await scheduler.try_acquire()
+        assert await refill.try_acquire()
+
+    run(test)
+
+
+def test_elects_demotes_and_releases(run) -> None:
+    async def test(collection: Any, advance: Any) -> None:
+        events: List[str] = []
+        first = LeaderLease(
+            collection,
+            "scheduler",
+            ttl=TTL,
+            on_elected=lambda: events.append("first elected"),
+            on_demoted=lambda: events.append("first demoted"),
+        )
+        second = LeaderLease(
+            collection,
+            "scheduler",
+            ttl=TTL,
+            on_elected=lambda: events.append("second elected"),
+        )
+        first.start()
+        await asyncio.sleep(0.05)
+        second.start()
+        await asyncio.sleep(TTL)
+        assert first.is_leader and not second.is_leader
+        # Stopping releases the lease, the other process takes it over
+        # without waiting for it to expire.
+        await first.stop()
+        await asyncio.sleep(TTL / 3 + 0.1)
+        assert second.is_leader
+        await second.stop()
+        assert events == ["first elected", "first demoted", "second elected"]
+
+    run(test)
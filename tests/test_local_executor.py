@@ -0,0 +1,217 @@
+"""🧪 Local Executor Tests 🔒
+
+Tests of the local code executor: the limits enforced by the sandbox worker,
+the bubblewrap command and the respawning of dead workers.
+
+The worker is run directly, outside of bubblewrap, which is not needed to
+check the limits it applies itself.
+
+"""
+
+import pytest
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    List,
+)
+
+from src.utils import (
+    executors,
+    judge0,
+)
+
+
+class Worker:
+    """
+    A sandbox worker process, fed one job at a time.
+    """
+
+    def __init__(self) -> None:
+        self.process = subprocess.Popen(
+            [sys.executable, "-I", executors.SANDBOX_WORKER_PATH],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        assert self.process.stdout is not None
+        assert self.process.stdout.readline().strip() == "ready"
+
+    def run(self, code: str, **limits: Any) -> Dict[str, Any]:
+        file_name, command = executors.LOCAL_LANGUAGES[71]
+        job = dict(
+            judge0.build_submission(code, 71),
+            file_name=file_name,
+            command=command,
+            **limits,
+        )
+        assert self.process.stdin is not None
+        assert self.process.stdout is not None
+        self.process.stdin.write(json.dumps(job) + "\n")
+        self.process.stdin.flush()
+        return json.loads(self.process.stdout.readline())
+
+    def close(self) -> None:
+        assert self.process.stdin is not None
+        self.process.stdin.close()
+        self.process.wait(timeout=5)
+
+
+@pytest.fixture(scope="module")
+def worker() -> Iterator[Worker]:
+    worker = Worker()
+    yield worker
+    worker.close()
+
+
+def test_runs_programs(worker: Worker) -> None:
+    result = worker.run("print(input()[::-1])", stdin="abc\n")
+    assert result["status"]["id"] == 3
+    assert result["stdout"] == "cba\n"
+    assert result["exit_code"] == 0
+
+
+def test_checks_the_expected_output(worker: Worker) -> None:
+    result = worker.run("print(2)", expected_output="3\n")
+    assert result["status"] == {"id": 4, "description": "Wrong Answer"}
+
+
+def test_reports_runtime_errors(worker: Worker) -> None:
+    result = worker.run("raise ValueError('boom')")
+    assert result["status"]["id"] == 11
+    assert "ValueError: boom" in result["stderr"]
+    # The worker's own frames are left out of the traceback.
+    assert "sandbox_worker" not in result["stderr"]
+
+
+def test_enforces_the_cpu_time_limit(worker: Worker) -> None:
+    result = worker.run(
+        "while True:\n    pass", cpu_time_limit=0.5, cpu_extra_time=0
+    )
+    assert result["status"]["id"] == 5
+    assert float(result["time"]) < 3
+
+
+def test_enforces_the_wall_time_limit(worker: Worker) -> None:
+    started = time.monotonic()
+    result = worker.run("import time\ntime.sleep(30)", wall_time_limit=0.5)
+    assert result["status"]["id"] == 5
+    assert time.monotonic() - started < 5
+
+
+def test_enforces_the_wall_time_limit_after_output_closes(
+    worker: Worker,
+) -> None:
+    started = time.monotonic()
+    result = worker.run(
+        "import os, time\nos.close(1)\nos.close(2)\ntime.sleep(30)",
+        wall_time_limit=0.5,
+    )
+    assert result["status"]["id"] == 5
+    assert time.monotonic() - started < 5
+
+
+def test_enforces_the_memory_limit(worker: Worker) -> None:
+    result = worker.run(
+        "data = bytearray(256 * 1024 * 1024)", memory_limit=64000
+    )
+    assert result["status"]["id"] == 11
+    assert "MemoryError" in result["stderr"]
+
+
+def test_truncates_the_output(worker: Worker) -> None:
+    result = worker.run("print('x' * 200000)")
+    assert len(result["stdout"]) == 64 * 1024
+
+
+def test_keeps_serving_after_a_job_fails(worker: Worker) -> None:
+    worker.run("import os\nos.abort()")
+    assert worker.run("print(1)")["stdout"] == "1\n"
+
+
+def test_sandbox_command_requires_bubblewrap(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(executors.shutil, "which", lambda name: None)
+    with pytest.raises(executors.ExecutionError):
+        executors.sandbox_command()
+
+
+def test_sandbox_command_isolates_the_worker(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(
+        executors.shutil, "which", lambda name: f"/usr/bin/{name}"
+    )
+    command = executors.sandbox_command()
+    assert command[0] == "/usr/bin/bwrap"
+    assert "--unshare-all" in command
+    assert command[command.index("--uid") + 1] == "65534"
+    assert command[-1] == executors.SANDBOX_WORKER_MOUNT
+    # The server's files are not mounted, only the worker script is.
+    mounts = [
+        command[index + 1]
+        for index, part in enumerate(command)
+        if part in ("--ro-bind", "--bind")
+    ]
+    assert executors.SANDBOX_WORKER_PATH in mounts
+    repository = os.path.dirname(os.path.dirname(executors.__file__))
+    for mount in mounts:
+        if mount != executors.SANDBOX_WORKER_PATH:
+            assert not (repository + "/").startswith(mount.rstrip("/") + "/")
+
+
+class FakeProcess:
+    def __init__(self, results: List[Dict[str, Any]]) -> None:
+        self.results = results
+        self.alive = True
+
+    async def run(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        if not self.results:
+            self.alive = False
+            raise executors.ExecutionError("Sandbox worker exited")
+        return self.results.pop(0)
+
+    async def close(self) -> None:
+        pass
+
+
+def test_pool_respawns_dead_workers_lazily(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    spawned: List[FakeProcess] = []
+    failures = [1]
+
+    async def spawn() -> FakeProcess:
+        if len(spawned) == 1 and failures:
+            failures.pop()
+            raise executors.ExecutionError("Sandbox worker failed to start")
+        spawned.append(FakeProcess([{"status": {"id": 3}}]))
+        return spawned[-1]
+
+    monkeypatch.setattr(executors.SandboxProcess, "spawn", spawn)
+
+    async def run() -> None:
+        pool = executors.SandboxPool(1)
+        await pool.start()
+        assert (await pool.run({}))["status"]["id"] == 3
+        # The worker dies on this job, and is not replaced right away.
+        with pytest.raises(executors.ExecutionError):
+            await pool.run({})
+        # Replacing it fails once, which fails this job only.
+        with pytest.raises(executors.ExecutionError):
+            await asyncio.wait_for(pool.run({}), timeout=1)
+        assert (await asyncio.wait_for(pool.run({}), timeout=1))["status"][
+            "id"
+        ] == 3
+        assert len(spawned) == 2
+        await pool.close()
+
+    asyncio.run(run())
@@ -0,0 +1,199 @@
+"""🧪 OpenAI Limiter Tests 🪣
+
+Tests of the OpenAI rate limiting: the token buckets, the settlement of the
+estimated tokens and the usage recorded for every completion, cancelled ones
+included.
+
+"""
+
+import pytest
+
+import asyncio
+from prometheus_client import (
+    REGISTRY,
+)
+import time
+from types import (
+    SimpleNamespace,
+)
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+)
+
+from src.main import (
+    code_app,
+)
+from src.users import (
+    models as users_models,
+)
+from src.utils import (
+    openai_api,
+    rate_limit,
+)
+
+MODEL = "test-model"
+
+
+def test_a_disabled_bucket_never_waits() -> None:
+    async def run() -> None:
+        bucket = rate_limit.TokenBucket(0)
+        assert await bucket.acquire(10**9) == 0
+        assert bucket.try_acquire(10**9) == 0
+
+    asyncio.run(run())
+
+
+def test_waits_for_the_bucket_to_refill() -> None:
+    async def run() -> None:
+        # Ten units a second.
+        bucket = rate_limit.TokenBucket(600)
+        assert await bucket.acquire(600) < 0.05
+        started = time.monotonic()
+        waited = await bucket.acquire(2)
+        assert 0.15 < waited < 0.5
+        assert time.monotonic() - started >= waited
+
+    asyncio.run(run())
+
+
+def test_oversized_requests_leave_the_bucket_in_debt() -> None:
+    async def run() -> None:
+        bucket = rate_limit.TokenBucket(600)
+        assert await bucket.acquire(1200) < 0.05
+        assert bucket.level <= -599
+        assert bucket.try_acquire(1) > 50
+
+    asyncio.run(run())
+
+
+def test_try_acquire_takes_nothing_when_short() -> None:
+    bucket = rate_limit.TokenBucket(60)
+    assert bucket.try_acquire(60) == 0
+    wait = bucket.try_acquire(1)
+    assert 0.9 < wait <= 1
+    # Nothing was taken, the wait does not grow.
+    assert bucket.try_acquire(1) <= wait
+
+
+def test_settles_the_estimated_tokens() -> None:
+    async def run() -> None:
+        limiter = rate_limit.RateLimiter(0, 1000)
+        await limiter.acquire(800)
+        limiter.settle(800, 100)
+        # The 700 unused tokens are given back.
+        assert limiter.tokens.try_acquire(800) == 0
+
+    asyncio.run(run())
+
+
+class FakeClient:
+    """
+    Answers completions with a fixed usage, fails or never answers.
+    """
+
+    def __init__(self, error: Optional[Exception] = None) -> None:
+        self.error = error
+        self.hang = False
+
+    async def chat_completion(self, **params: Any) -> Dict[str, Any]:
+        if self.hang:
+            await asyncio.Event().wait()
+        if self.error is not None:
+            raise self.error
+        return {
+            "choices": [{"message": {"content": "<h1>Quicksort</h1>"}}],
+            "usage": {"prompt_tokens": 30, "completion_tokens": 12},
+        }
+
+
+class FakeEngine:
+    def __init__(self) -> None:
+        self.saved: List[Any] = []
+
+    async def save(self, instance: Any) -> Any:
+        self.saved.append(instance)
+        return instance
+
+
+@pytest.fixture
+def api(monkeypatch: pytest.MonkeyPatch) -> SimpleNamespace:
+    engine = FakeEngine()
+    monkeypatch.setattr(code_app.state, "engine", engine, raising=False)
+    client = FakeClient()
+    instance = openai_api.OpenAIAPI("token", model=MODEL, max_tokens=100)
+    instance.client = client  # type: ignore[assignment]
+    return SimpleNamespace(openai=instance, client=client, engine=engine)
+
+
+def sample(name: str, **labels: str) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_records_the_usage_of_completions(api: SimpleNamespace) -> None:
+    prompt = sample("openai_tokens_total", model=MODEL, kind="prompt")
+    completion = sample("openai_tokens_total", model=MODEL, kind="completion")
+    html_content = asyncio.run(
+        api.openai.generate_algorithm_tutorial("python")
+    )
+    assert html_content == "<h1>Quicksort</h1>"
+    (record,) = api.engine.saved
+    assert isinstance(record, users_models.CompletionUsage)
+    assert record.success
+    assert (record.prompt_tokens, record.completion_tokens) == (30, 12)
+    assert api.openai.usage["requests"] == 1
+    assert api.openai.usage["errors"] == 0
+    assert sample("openai_tokens_total", model=MODEL, kind="prompt") == (
+        prompt + 30
+    )
+    assert sample("openai_tokens_total", model=MODEL, kind="completion") == (
+        completion + 12
+    )
+
+
+def test_records_failed_completions(api: SimpleNamespace) -> None:
+    api.client.error = RuntimeError("boom")
+    with pytest.raises(RuntimeError):
+        asyncio.run(api.openai.generate_algorithm_tutorial("python"))
+    (record,) = api.engine.saved
+    assert not record.success
+    assert api.openai.usage["errors"] == 1
+
+
+def test_records_cancelled_completions_as_failures(
+    api: SimpleNamespace,
+) -> None:
+    api.client.hang = True
+
+    async def run() -> None:
+        task = asyncio.ensure_future(
+            api.openai.generate_algorithm_tutorial("python")
+        )
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    (record,) = api.engine.saved
+    assert not record.success
+    assert api.openai.usage["errors"] == 1
+
+
+def test_exports_the_throttled_time(api: SimpleNamespace) -> None:
+    throttled = sample("openai_throttled_seconds_total", model=MODEL)
+    # An empty bucket of one request a second, the completion waits.
+    api.openai.limiter = rate_limit.RateLimiter(60, 0)
+    api.openai.limiter.requests.level = 0
+
+    async def run() -> None:
+        await api.openai.generate_algorithm_tutorial("python")
+
+    asyncio.run(run())
+    (record,) = api.engine.saved
+    assert 0.5 < record.throttled < 2
+    assert sample("openai_throttled_seconds_total", model=MODEL) == (
+        pytest.approx(throttled + record.throttled)
+    )
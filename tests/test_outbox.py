@@ -0,0 +1,369 @@
+"""🧪 Outbox Tests 📮
+
+Tests of the outbound email queue: retries with backoff, dead-lettering, the
+per-account rate limits, the claim tokens, the system sender and stopping the
+workers, against an in-memory MongoDB.
+
+"""
+
+import pytest
+
+import asyncio
+from datetime import (
+    datetime,
+    timedelta,
+)
+from mongomock_motor import (
+    AsyncMongoMockClient,
+)
+import requests
+import threading
+import time
+from types import (
+    SimpleNamespace,
+)
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+)
+
+from nylas.client.errors import (
+    MessageRejectedError,
+)
+from src.nylas import (
+    outbox,
+)
+
+
+def make_pool(**kwargs) -> outbox.OutboxWorkerPool:
+    collection = AsyncMongoMockClient()["test"]["outbound_emails"]
+    options = {"per_account_per_minute": 0, "backoff": 1, "max_attempts": 3}
+    options.update(kwargs)
+    return outbox.OutboxWorkerPool(collection, lambda token: None, **options)
+
+
+async def queue_email(
+    pool: outbox.OutboxWorkerPool,
+    account: str = "me@example.com",
+    kind: str = "send",
+) -> Any:
+    result = await pool.collection.insert_one(
+        {
+            "kind": kind,
+            "account": account,
+            "payload": {"subject": "Hi", "to": [], "body": ""},
+            "access_token": "token",
+            "status": "queued",
+            "attempts": 0,
+            "next_attempt_at": datetime.utcnow() - timedelta(seconds=1),
+        }
+    )
+    return result.inserted_id
+
+
+def failing_deliver(err: Exception):
+    def deliver(
+        client: Any, email: Dict[str, Any], sender: str
+    ) -> Optional[str]:
+        raise err
+
+    return deliver
+
+
+def http_error(status_code: int) -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.HTTPError(response=response)
+
+
+@pytest.mark.parametrize(
+    "err, retryable",
+    [
+        (requests.ConnectionError(), True),
+        (http_error(503), True),
+        (http_error(429), True),
+        (http_error(400), False),
+        (MessageRejectedError(), False),
+        (ValueError(), False),
+    ],
+)
+def test_is_retryable(err: Exception, retryable: bool) -> None:
+    assert outbox.is_retryable(err) is retryable
+
+
+def test_sends_a_claimed_email(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(
+        outbox, "deliver", lambda client, email, sender: "message"
+    )
+
+    async def run() -> None:
+        pool = make_pool()
+        email_id = await queue_email(pool)
+        await pool.process(await pool.claim())
+        email = await pool.collection.find_one({"_id": email_id})
+        assert email["status"] == "sent"
+        assert email["message_id"] == "message"
+        assert "access_token" not in email
+        assert "claim" not in email
+        assert await pool.claim() is None
+
+    asyncio.run(run())
+
+
+def test_retries_transient_failures(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(
+        outbox, "deliver", failing_deliver(requests.ConnectionError("down"))
+    )
+
+    async def run() -> None:
+        pool = make_pool()
+        email_id = await queue_email(pool)
+        await pool.process(await pool.claim())
+        email = await pool.collection.find_one({"_id": email_id})
+        assert email["status"] == "queued"
+        assert email["attempts"] == 1
+        assert "down" in email["last_error"]
+        assert email["next_attempt_at"] > datetime.utcnow()
+        assert pool.stats["retried"] == 1
+        # Not due until the backoff is over.
+        assert await pool.claim() is None
+
+    asyncio.run(run())
+
+
+def test_dead_letters_after_the_last_attempt(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(
+        outbox, "deliver", failing_deliver(requests.ConnectionError())
+    )
+
+    async def run() -> None:
+        pool = make_pool(max_attempts=2)
+        email_id = await queue_email(pool)
+        for _ in range(2):
+            await pool.collection.update_one(
+                {"_id": email_id},
+                {"$set": {"next_attempt_at": datetime.utcnow()}},
+            )
+            await pool.process(await pool.claim())
+        email = await pool.collection.find_one({"_id": email_id})
+        assert email["status"] == "dead"
+        assert email["attempts"] == 2
+        assert "access_token" not in email
+        assert pool.stats == {"sent": 0, "retried": 1, "dead": 1}
+
+    asyncio.run(run())
+
+
+def test_dead_letters_rejected_emails(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(
+        outbox, "deliver", failing_deliver(MessageRejectedError())
+    )
+
+    async def run() -> None:
+        pool = make_pool()
+        email_id = await queue_email(pool)
+        await pool.process(await pool.claim())
+        email = await pool.collection.find_one({"_id": email_id})
+        assert email["status"] == "dead"
+        assert email["attempts"] == 1
+
+    asyncio.run(run())
+
+
+def test_skips_throttled_accounts(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(
+        outbox, "deliver", lambda client, email, sender: "message"
+    )
+
+    async def run() -> None:
+        pool = make_pool(per_account_per_minute=1)
+        await queue_email(pool, "system@example.com")
+        await queue_email(pool, "system@example.com")
+        await pool.process(await pool.claim())
+        assert pool.throttled_accounts() == ["system@example.com"]
+        assert await pool.claim() is None
+        user_email = await queue_email(pool, "user@example.com")
+        claimed = await pool.claim()
+        assert claimed["_id"] == user_email
+
+    asyncio.run(run())
+
+
+def test_requeues_emails_claimed_over_budget() -> None:
+    async def run() -> None:
+        pool = make_pool(per_account_per_minute=1)
+        email_id = await queue_email(pool)
+        email = await pool.claim()
+        # Another worker spent the budget since the claim.
+        pool._bucket(email["account"]).try_acquire(1)
+        await pool.process(email)
+        email = await pool.collection.find_one({"_id": email_id})
+        assert email["status"] == "queued"
+        assert email["attempts"] == 0
+        assert email["next_attempt_at"] > datetime.utcnow()
+        assert "locked_until" not in email
+
+    asyncio.run(run())
+
+
+def test_stale_claims_do_not_overwrite_the_outcome(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(
+        outbox, "deliver", failing_deliver(requests.ConnectionError())
+    )
+
+    async def run() -> None:
+        pool = make_pool()
+        email_id = await queue_email(pool)
+        stale = await pool.claim()
+        # The first worker stalls past its claim, another one claims the
+        # email again.
+        await pool.collection.update_one(
+            {"_id": email_id},
+            {
+                "$set": {
+                    "locked_until": datetime.utcnow() - timedelta(seconds=1)
+                }
+            },
+        )
+        latest = await pool.claim()
+        assert latest["claim"] != stale["claim"]
+        await pool.process(stale)
+        email = await pool.collection.find_one({"_id": email_id})
+        assert email["status"] == "sending"
+        assert email["claim"] == latest["claim"]
+        # Giving an email back over budget matches the claim as well.
+        pool.per_account_per_minute = 1
+        pool._bucket(stale["account"]).try_acquire(1)
+        await pool.process(stale)
+        email = await pool.collection.find_one({"_id": email_id})
+        assert email["status"] == "sending"
+        assert email["attempts"] == 2
+
+    asyncio.run(run())
+
+
+class FakeSystemClient:
+    """
+    Counts the lookups of the system account's address.
+    """
+
+    def __init__(self) -> None:
+        self.lookups = 0
+
+    @property
+    def account(self) -> SimpleNamespace:
+        self.lookups += 1
+        return SimpleNamespace(email_address="system@example.com")
+
+
+def test_looks_the_system_sender_up_once(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    senders: List[str] = []
+
+    def deliver(client: Any, email: Dict[str, Any], sender: str) -> str:
+        senders.append(sender)
+        return "message"
+
+    monkeypatch.setattr(outbox, "deliver", deliver)
+
+    async def run() -> None:
+        client = FakeSystemClient()
+        pool = make_pool()
+        pool.client_factory = lambda token: client
+        for _ in range(2):
+            await queue_email(pool, "system", kind="system")
+            await pool.process(await pool.claim())
+        await queue_email(pool, "me@example.com")
+        await pool.process(await pool.claim())
+        assert senders == [
+            "system@example.com",
+            "system@example.com",
+            "me@example.com",
+        ]
+        assert client.lookups == 1
+
+    asyncio.run(run())
+
+
+def test_resolves_the_system_sender_when_built() -> None:
+    async def run() -> None:
+        client = FakeSystemClient()
+        assert await outbox.resolve_system_sender(client) == (
+            "system@example.com"
+        )
+
+        class Unreachable:
+            @property
+            def account(self) -> Any:
+                raise requests.ConnectionError("down")
+
+        assert await outbox.resolve_system_sender(Unreachable()) is None
+
+    asyncio.run(run())
+
+
+def test_stop_waits_for_the_emails_being_sent(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    sending = threading.Event()
+
+    def deliver(client: Any, email: Dict[str, Any], sender: str) -> str:
+        sending.set()
+        time.sleep(0.2)
+        return "message"
+
+    monkeypatch.setattr(outbox, "deliver", deliver)
+
+    async def run() -> None:
+        pool = make_pool(size=2)
+        email_id = await queue_email(pool)
+        pool.start()
+        while not sending.is_set():
+            await asyncio.sleep(0.01)
+        await queue_email(pool)
+        await pool.stop(timeout=5)
+        email = await pool.collection.find_one({"_id": email_id})
+        assert email["status"] == "sent"
+        # Nothing else was claimed once stopping.
+        queued = await pool.collection.count_documents({"status": "queued"})
+        assert queued == 1
+
+    asyncio.run(run())
+
+
+def test_stop_gives_up_on_slow_sends(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    sending = threading.Event()
+
+    def deliver(client: Any, email: Dict[str, Any], sender: str) -> str:
+        sending.set()
+        time.sleep(0.5)
+        return "message"
+
+    monkeypatch.setattr(outbox, "deliver", deliver)
+
+    async def run() -> None:
+        pool = make_pool(size=1)
+        email_id = await queue_email(pool)
+        pool.start()
+        while not sending.is_set():
+            await asyncio.sleep(0.01)
+        started = time.monotonic()
+        await pool.stop(timeout=0.05)
+        assert time.monotonic() - started < 0.4
+        # The claim expires and the email is sent again later.
+        email = await pool.collection.find_one({"_id": email_id})
+        assert email["status"] == "sending"
+        assert email["locked_until"] > datetime.utcnow()
+
+    asyncio.run(run())
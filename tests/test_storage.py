@@ -0,0 +1,128 @@
+"""🧪 Storage Tests 📦
+
+Tests of the local disk cache in front of the blob storage: invalidation on
+writes, deletes and re-uploads made by other processes, and eviction.
+
+"""
+
+import asyncio
+import hashlib
+import os
+
+from src.utils.storage import (
+    CachedStorage,
+    LocalStorage,
+)
+
+
+def version(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()[:32]
+
+
+def cached_storage(tmp_path, max_bytes: int = 1024) -> CachedStorage:
+    return CachedStorage(
+        LocalStorage(str(tmp_path / "blobs")),
+        str(tmp_path / "cache"),
+        max_bytes,
+    )
+
+
+def run(storage: CachedStorage, test) -> None:
+    async def main() -> None:
+        await storage.start()
+        try:
+            await test()
+        finally:
+            await storage.close()
+
+    asyncio.run(main())
+
+
+def test_serves_hits_from_the_cache(tmp_path) -> None:
+    storage = cached_storage(tmp_path)
+
+    async def test() -> None:
+        await storage.backend.put("key", b"one")
+        assert await storage.get("key") == b"one"
+        assert await storage.get("key") == b"one"
+        path = await storage.local_path("key", version(b"one"))
+        assert path.startswith(storage.process_directory)
+        assert storage.stats["misses"] == 1
+        assert storage.stats["hits"] == 2
+
+    run(storage, test)
+
+
+def test_writes_and_deletes_invalidate_the_cache(tmp_path) -> None:
+    storage = cached_storage(tmp_path)
+
+    async def test() -> None:
+        await storage.put("key", b"one")
+        old_path = await storage.local_path("key")
+        await storage.put("key", b"two")
+        assert await storage.get("key") == b"two"
+        assert not os.path.exists(old_path)
+        await storage.delete("key")
+        assert await storage.get("key") is None
+        assert await storage.local_path("key") is None
+        assert storage.size == 0
+
+    run(storage, test)
+
+
+def test_refetches_blobs_replaced_by_another_process(tmp_path) -> None:
+    storage = cached_storage(tmp_path)
+
+    async def test() -> None:
+        await storage.put("key", b"one")
+        # Another worker or replica uploads a new version.
+        await storage.backend.put("key", b"two")
+        path = await storage.local_path("key", version(b"two"))
+        with open(path, "rb") as file:
+            assert file.read() == b"two"
+        assert await storage.get("key") == b"two"
+
+    run(storage, test)
+
+
+def test_does_not_serve_another_version(tmp_path) -> None:
+    storage = cached_storage(tmp_path)
+
+    async def test() -> None:
+        await storage.put("key", b"two")
+        assert await storage.local_path("key", version(b"one")) is None
+        # What the backend holds is still cached and readable.
+        assert await storage.get("key") == b"two"
+
+    run(storage, test)
+
+
+def test_evicts_the_least_recently_used_blobs(tmp_path) -> None:
+    storage = cached_storage(tmp_path, max_bytes=8)
+
+    async def test() -> None:
+        await storage.put("a", b"aaaa")
+        await storage.put("b", b"bbbb")
+        await storage.get("a")
+        await storage.put("c", b"cccc")
+        assert list(storage._index) == ["a", "c"]
+        assert storage.size == 8
+        assert storage.stats["evictions"] == 1
+        # Evicted blobs are still read from the backend.
+        assert await storage.get("b") == b"bbbb"
+
+    run(storage, test)
+
+
+def test_identical_blobs_share_a_file(tmp_path) -> None:
+    storage = cached_storage(tmp_path)
+
+    async def test() -> None:
+        await storage.put("a", b"same")
+        await storage.put("b", b"same")
+        assert await storage.local_path("a") == await storage.local_path("b")
+        assert storage.size == 4
+        await storage.delete("a")
+        assert os.path.exists(await storage.local_path("b"))
+
+    run(storage, test)
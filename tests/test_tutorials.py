@@ -0,0 +1,229 @@
+"""🧪 Tutorials Tests 📚
+
+Tests of the tutorial library: the choice of the next unseen tutorial, the
+send history recorded for every email, the digest and the refill of the
+library.
+
+"""
+
+import pytest
+
+import asyncio
+from mongomock_motor import (
+    AsyncMongoMockClient,
+)
+from odmantic import (
+    AIOEngine,
+)
+from types import (
+    SimpleNamespace,
+)
+from typing import (
+    Any,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from src.main import (
+    code_app,
+)
+from src.users import (
+    models as users_models,
+)
+from src.utils import (
+    digest,
+    tutorials,
+)
+
+
+class Session:
+    """
+    A session accepted and ignored, mongomock has none.
+    """
+
+    async def __aenter__(self) -> "Session":
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        pass
+
+    async def end_session(self) -> None:
+        pass
+
+
+class Client(AsyncMongoMockClient):
+    async def start_session(self, *args: Any, **kwargs: Any) -> Session:
+        return Session()
+
+
+class FakeOpenAI:
+    """
+    Records the queued emails and generates numbered tutorials.
+    """
+
+    def __init__(self) -> None:
+        self.emails: List[Tuple[str, str, str]] = []
+        self.generated = 0
+
+    async def send_algorithm_email(
+        self, to: str, language: str, html_content: str
+    ) -> None:
+        self.emails.append((to, language, html_content))
+
+    async def generate_algorithm_tutorial(
+        self, language: str, avoid: Optional[List[str]] = None
+    ) -> str:
+        self.generated += 1
+        return f"<h1>Algorithm {self.generated}</h1>"
+
+
+@pytest.fixture
+def app(monkeypatch: pytest.MonkeyPatch) -> Iterator[SimpleNamespace]:
+    import mongomock  # pylint: disable=C0415
+
+    # mongomock has no sessions: the operations run outside of them.
+    mongomock.ignore_feature("session")
+    engine = AIOEngine(client=Client(), database="test")
+    openai = FakeOpenAI()
+    monkeypatch.setattr(code_app.state, "engine", engine, raising=False)
+    monkeypatch.setattr(code_app.state, "openai", openai, raising=False)
+    try:
+        yield SimpleNamespace(engine=engine, openai=openai)
+    finally:
+        mongomock.warn_on_feature("session")
+
+
+async def add_tutorials(
+    engine: AIOEngine, language: str, *topics: str
+) -> List[users_models.Tutorial]:
+    library = []
+    for topic in topics:
+        library.append(
+            await engine.save(
+                users_models.Tutorial(
+                    language=language,
+                    topic=topic,
+                    title=topic.title(),
+                    html_content=f"<h1>{topic}</h1>",
+                )
+            )
+        )
+    return library
+
+
+async def history(engine: AIOEngine, email: str) -> List[str]:
+    deliveries = await engine.find(
+        users_models.TutorialDelivery,
+        users_models.TutorialDelivery.email == email,
+        sort=users_models.TutorialDelivery.sent_date,
+    )
+    return [delivery.topic for delivery in deliveries]
+
+
+def test_picks_the_oldest_unseen_tutorial() -> None:
+    library = [
+        users_models.Tutorial(language="python", topic=topic, html_content="")
+        for topic in ("binary search", "quicksort", "dijkstra")
+    ]
+    assert tutorials.pick_next(library, set()) is library[0]
+    assert tutorials.pick_next(library, {"binary search"}) is library[1]
+    assert tutorials.pick_next(library, {"binary search", "quicksort"}) is (
+        library[2]
+    )
+    assert tutorials.pick_next(library, {t.topic for t in library}) is None
+
+
+def test_normalizes_topics() -> None:
+    title = tutorials.extract_title(
+        "<html><title>Binary  <b>Search</b> &amp; Trees!</title></html>"
+    )
+    assert title == "Binary Search & Trees!"
+    assert tutorials.normalize_topic(title) == "binary search trees"
+    assert tutorials.normalize_topic("C++ & C#") == "c++ c#"
+
+
+def test_sends_each_tutorial_once(app: SimpleNamespace) -> None:
+    async def run() -> None:
+        await add_tutorials(app.engine, "python", "quicksort", "dijkstra")
+        email = "ada@example.com"
+        assert await digest.send_next_tutorial(email, "python")
+        assert await digest.send_next_tutorial(email, "python")
+        assert not await digest.send_next_tutorial(email, "python")
+        assert [sent[2] for sent in app.openai.emails] == [
+            "<h1>quicksort</h1>",
+            "<h1>dijkstra</h1>",
+        ]
+        assert await history(app.engine, email) == ["quicksort", "dijkstra"]
+
+    asyncio.run(run())
+
+
+def test_topics_seen_in_another_language_are_skipped(
+    app: SimpleNamespace,
+) -> None:
+    async def run() -> None:
+        await add_tutorials(app.engine, "python", "quicksort")
+        await add_tutorials(app.engine, "rust", "quicksort", "dijkstra")
+        email = "ada@example.com"
+        await digest.send_next_tutorial(email, "python")
+        # The user switches to Rust.
+        await digest.send_next_tutorial(email, "rust")
+        assert app.openai.emails[-1] == (email, "rust", "<h1>dijkstra</h1>")
+
+    asyncio.run(run())
+
+
+def test_digest_sends_to_the_users_of_the_schedule(
+    app: SimpleNamespace,
+) -> None:
+    async def run() -> None:
+        await add_tutorials(app.engine, "python", "quicksort")
+        for email, language, schedule in [
+            ("ada@example.com", "python", "Every day"),
+            ("alan@example.com", "python", "Every day"),
+            ("grace@example.com", "go", "Every day"),
+            ("linus@example.com", "python", "Every week"),
+        ]:
+            await app.engine.save(
+                users_models.User(
+                    email=email,
+                    programming_language=language,
+                    schedule=schedule,
+                )
+            )
+        # Alan already received the only Python tutorial.
+        await digest.send_next_tutorial("alan@example.com", "python")
+        app.openai.emails.clear()
+        stats = await digest.send_algorithm_digest("Every day")
+        assert stats == {"sent": 1, "failed": 0, "skipped": 2}
+        assert [sent[0] for sent in app.openai.emails] == ["ada@example.com"]
+        assert await history(app.engine, "ada@example.com") == ["quicksort"]
+
+    asyncio.run(run())
+
+
+def test_refill_tops_up_the_unseen_stock(app: SimpleNamespace) -> None:
+    async def run() -> None:
+        await app.engine.save(
+            users_models.User(
+                email="ada@example.com", programming_language="rust"
+            )
+        )
+        await add_tutorials(app.engine, "python", "algorithm 1")
+        await add_tutorials(app.engine, "rust", "algorithm 1")
+        await digest.send_next_tutorial("ada@example.com", "python")
+        # The Rust tutorial covers a topic Ada received in Python, no unseen
+        # tutorial is left.
+        stats = await tutorials.refill_library(2)
+        assert stats == {"generated": 1, "duplicates": 1, "failed": 0}
+        library = await app.engine.find(
+            users_models.Tutorial, users_models.Tutorial.language == "rust"
+        )
+        assert {tutorial.topic for tutorial in library} == {
+            "algorithm 1",
+            "algorithm 2",
+        }
+
+    asyncio.run(run())
@@ -0,0 +1,149 @@
+"""🧪 Uploads Tests 🌊
+
+Tests of the streaming upload parser: size limits, validation of the first
+bytes and malformed forms.
+
+"""
+
+import pytest
+
+import asyncio
+import hashlib
+from starlette.requests import (
+    Request,
+)
+from typing import (
+    Dict,
+    List,
+    Optional,
+)
+
+from src.utils.uploads import (
+    VALIDATION_PREFIX_SIZE,
+    Upload,
+    UploadError,
+    receive_upload,
+)
+
+BOUNDARY = "boundary"
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(100))
+
+
+def make_form(field: str, content: bytes) -> bytes:
+    return (
+        (
+            f"--{BOUNDARY}\r\n"
+            f'Content-Disposition: form-data; name="{field}"; '
+            'filename="image.png"\r\n'
+            "Content-Type: image/png\r\n\r\n"
+        ).encode()
+        + content
+        + f"\r\n--{BOUNDARY}--\r\n".encode()
+    )
+
+
+def make_request(
+    body: bytes,
+    chunk_size: int = 7,
+    headers: Optional[Dict[str, str]] = None,
+) -> Request:
+    if headers is None:
+        headers = {"content-type": f"multipart/form-data; boundary={BOUNDARY}"}
+    chunks: List[bytes] = []
+    for start in range(0, len(body), chunk_size):
+        end = start + chunk_size
+        chunks.append(body[start:end])
+
+    async def receive() -> Dict[str, object]:
+        chunk = chunks.pop(0) if chunks else b""
+        return {
+            "type": "http.request",
+            "body": chunk,
+            "more_body": bool(chunks),
+        }
+
+    return Request(
+        {
+            "type": "http",
+            "method": "PUT",
+            "path": "/",
+            "headers": [
+                (name.encode(), value.encode())
+                for name, value in headers.items()
+            ],
+        },
+        receive,
+    )
+
+
+def validate_png(prefix: bytes) -> None:
+    if not prefix.startswith(b"\x89PNG"):
+        raise UploadError(415, "Not a PNG.")
+
+
+def receive(request: Request, max_bytes: int = 1024, **kwargs) -> Upload:
+    return asyncio.run(receive_upload(request, "file", max_bytes, **kwargs))
+
+
+def test_receives_the_file() -> None:
+    upload = receive(
+        make_request(make_form("file", PNG)), validate=validate_png
+    )
+    try:
+        assert upload.size == len(PNG)
+        assert upload.sha256 == hashlib.sha256(PNG).hexdigest()
+        assert upload.filename == "image.png"
+        assert upload.read() == PNG
+    finally:
+        upload.close()
+
+
+def test_rejects_files_over_the_size_limit() -> None:
+    with pytest.raises(UploadError) as rejected:
+        receive(make_request(make_form("file", PNG)), max_bytes=len(PNG) - 1)
+    assert rejected.value.status_code == 413
+
+
+def test_rejects_announced_sizes_over_the_limit_before_reading() -> None:
+    request = make_request(
+        b"",
+        headers={
+            "content-type": f"multipart/form-data; boundary={BOUNDARY}",
+            "content-length": str(10**9),
+        },
+    )
+    with pytest.raises(UploadError) as rejected:
+        receive(request)
+    assert rejected.value.status_code == 413
+
+
+def test_rejects_files_failing_validation() -> None:
+    content = b"GIF89a" + bytes(100)
+    with pytest.raises(UploadError) as rejected:
+        receive(
+            make_request(make_form("file", content)), validate=validate_png
+        )
+    assert rejected.value.status_code == 415
+
+
+def test_validates_files_shorter_than_the_prefix() -> None:
+    content = b"GIF"
+    assert len(content) < VALIDATION_PREFIX_SIZE
+    with pytest.raises(UploadError) as rejected:
+        receive(
+            make_request(make_form("file", content)), validate=validate_png
+        )
+    assert rejected.value.status_code == 415
+
+
+def test_rejects_forms_without_the_field() -> None:
+    with pytest.raises(UploadError) as rejected:
+        receive(make_request(make_form("other", PNG)))
+    assert rejected.value.status_code == 400
+
+
+def test_rejects_requests_that_are_not_forms() -> None:
+    request = make_request(PNG, headers={"content-type": "image/png"})
+    with pytest.raises(UploadError) as rejected:
+        receive(request)
+    assert rejected.value.status_code == 400